@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Address clustering with the common-input-ownership heuristic
+All addresses spent together as inputs of one transaction are assumed to share an
+owner. The job streams bridge_transaction_inputs in transaction_key order, merges
+each transaction's input addresses in an array-backed union-find (union by rank,
+path compression) and writes dim_address.address_cluster_id back in bulk.
+
+The parent/rank arrays are memory-mapped .npy files indexed by address_key, so
+memory stays bounded however many inputs are streamed, and they persist between
+runs: each run only reads transactions after the last one it processed and merges
+them into the existing clusters. The cluster id is the smallest address_key in the
+cluster, so it does not depend on merge order.
+
+The tables come from schema.sql; neither the trade warehouse built by
+schema_matched_etl.py nor the trades source carries transaction inputs, so the job
+exits with a message when --db points at either of them.
+
+Usage:
+    python address_clustering.py run --db data/bitcoin_dw.db
+    python address_clustering.py run --db data/bitcoin_dw.db --full
+    python address_clustering.py stats --db data/bitcoin_dw.db
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+STATE_DIR = 'data/address_clusters'
+STATE_FILE = 'state.json'
+INPUT_CHUNK = 1_000_000
+WRITE_CHUNK = 500_000
+
+INPUTS_TABLE = 'bridge_transaction_inputs'
+ADDRESS_TABLE = 'dim_address'
+
+
+def _open_array(path, size, dtype, fill):
+    """Memory-mapped array of at least size elements; new tail elements get fill(index)"""
+    if os.path.exists(path):
+        array = np.load(path, mmap_mode='r+')
+        if len(array) >= size:
+            return array
+        old = array
+        tmp_path = path + '.grow.npy'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(size,))
+        for start in range(0, len(old), WRITE_CHUNK):
+            end = min(start + WRITE_CHUNK, len(old))
+            grown[start:end] = old[start:end]
+        grown[len(old):] = fill(np.arange(len(old), size))
+        grown.flush()
+        del old, grown, array
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r+')
+
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(size,))
+    for start in range(0, size, WRITE_CHUNK):
+        array[start:start + WRITE_CHUNK] = fill(np.arange(start, min(start + WRITE_CHUNK, size)))
+    return array
+
+
+class UnionFind:
+    """Disjoint sets over 0..size-1 backed by memory-mapped parent/rank arrays"""
+
+    def __init__(self, state_dir, size):
+        os.makedirs(state_dir, exist_ok=True)
+        self.parent = _open_array(os.path.join(state_dir, 'parent.npy'), size, np.int32, lambda idx: idx)
+        self.rank = _open_array(os.path.join(state_dir, 'rank.npy'), size, np.uint8, lambda idx: 0)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def find(self, nodes):
+        """Roots of nodes; the queried nodes are compressed to point straight at their root"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        roots = self.parent[nodes].astype(np.int64)
+        while True:
+            above = self.parent[roots]
+            if np.array_equal(above, roots):
+                break
+            roots = above.astype(np.int64)
+        self.parent[nodes] = roots
+        return roots
+
+    def union_pairs(self, a, b):
+        """Merge the sets of each (a[i], b[i]) pair; returns how many sets were merged
+
+        Each round links every distinct child root to one parent root. Roots are
+        ordered by (rank, -index) before the round, so links always point up that
+        order and a round can never create a cycle.
+        """
+        a = np.asarray(a, dtype=np.int64)
+        b = np.asarray(b, dtype=np.int64)
+        merged = 0
+        while len(a):
+            ra, rb = self.find(a), self.find(b)
+            pending = ra != rb
+            if not pending.any():
+                break
+            a, b, ra, rb = a[pending], b[pending], ra[pending], rb[pending]
+
+            rank_a, rank_b = self.rank[ra], self.rank[rb]
+            a_is_parent = (rank_a > rank_b) | ((rank_a == rank_b) & (ra < rb))
+            parent = np.where(a_is_parent, ra, rb)
+            child = np.where(a_is_parent, rb, ra)
+
+            # A root can only take one parent per round; the rest retry next round
+            child, first = np.unique(child, return_index=True)
+            parent = parent[first]
+            self.parent[child] = parent
+            # A parent that takes several equal-rank children still grows by one rank
+            ties = self.rank[child] == self.rank[parent]
+            np.maximum.at(self.rank, parent[ties], self.rank[child[ties]] + 1)
+            merged += len(child)
+        return merged
+
+    def flush(self):
+        self.parent.flush()
+        self.rank.flush()
+
+
+def _transaction_anchors(tx, addr, carry):
+    """First input address of each row's transaction; carry=(tx, address) continues the previous chunk"""
+    starts = np.r_[True, tx[1:] != tx[:-1]]
+    first_row = np.maximum.accumulate(np.where(starts, np.arange(len(tx)), 0))
+    anchors = addr[first_row]
+    if carry is not None:
+        anchors[tx == carry[0]] = carry[1]
+    return anchors
+
+
+def load_state(state_dir):
+    path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {'last_transaction_key': None, 'inputs_processed': 0, 'merges': 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state_dir, state):
+    path = os.path.join(state_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def check_tables(conn):
+    """Raise when the database does not implement the schema.sql address tables"""
+    names = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"))}
+    missing = [t for t in (INPUTS_TABLE, ADDRESS_TABLE) if t not in names]
+    if missing:
+        raise RuntimeError(f"{', '.join(missing)} not found. The trade warehouse and trades source have no "
+                           f"transaction inputs; point --db at a database created from schema.sql "
+                           f"with {INPUTS_TABLE} loaded")
+
+
+def merge_inputs(conn, uf, after_transaction_key=None, chunk_size=INPUT_CHUNK):
+    """Stream inputs after a transaction_key into the union-find; returns (last_key, inputs, merges)"""
+    where = "WHERE transaction_key > :after" if after_transaction_key is not None else ""
+    sql = (f"SELECT transaction_key, address_key FROM {INPUTS_TABLE} {where} "
+           f"ORDER BY transaction_key, input_index")
+    params = {'after': after_transaction_key} if after_transaction_key is not None else {}
+
+    carry, last_key, inputs, merges = None, after_transaction_key, 0, 0
+    for chunk in pd.read_sql(text(sql), conn, params=params, chunksize=chunk_size):
+        chunk = chunk.dropna()
+        if chunk.empty:
+            continue
+        tx = chunk['transaction_key'].to_numpy(dtype=np.int64)
+        addr = chunk['address_key'].to_numpy(dtype=np.int64)
+        anchors = _transaction_anchors(tx, addr, carry)
+        link = anchors != addr
+        merges += uf.union_pairs(anchors[link], addr[link])
+        carry = (tx[-1], anchors[-1])
+        last_key = int(tx[-1])
+        inputs += len(chunk)
+        logger.info(f"   🔗 {inputs:,} inputs streamed, {merges:,} merges")
+    return last_key, inputs, merges
+
+
+def cluster_ids(uf, state_dir):
+    """Smallest address_key per cluster for every address, as a memory-mapped array"""
+    size = len(uf)
+    smallest = np.lib.format.open_memmap(os.path.join(state_dir, 'smallest.tmp.npy'), mode='w+',
+                                         dtype=np.int32, shape=(size,))
+    smallest[:] = np.iinfo(np.int32).max
+    roots = np.lib.format.open_memmap(os.path.join(state_dir, 'roots.tmp.npy'), mode='w+',
+                                      dtype=np.int32, shape=(size,))
+    for start in range(0, size, WRITE_CHUNK):
+        keys = np.arange(start, min(start + WRITE_CHUNK, size))
+        roots[start:start + len(keys)] = uf.find(keys)
+        np.minimum.at(smallest, roots[start:start + len(keys)], keys.astype(np.int32))
+    for start in range(0, size, WRITE_CHUNK):
+        roots[start:start + WRITE_CHUNK] = smallest[roots[start:start + WRITE_CHUNK]]
+    del smallest
+    os.remove(os.path.join(state_dir, 'smallest.tmp.npy'))
+    return roots
+
+
+def write_clusters(conn, ids):
+    """Write cluster ids that differ from dim_address back in bulk; returns rows updated"""
+    conn.execute(text("DROP TABLE IF EXISTS temp.cluster_updates"))
+    conn.execute(text("CREATE TEMP TABLE cluster_updates (address_key INTEGER PRIMARY KEY, cluster_id INTEGER)"))
+    for start in range(0, len(ids), WRITE_CHUNK):
+        stored = pd.read_sql(text(
+            f"SELECT address_key, address_cluster_id FROM {ADDRESS_TABLE} "
+            f"WHERE address_key >= :lo AND address_key < :hi"), conn,
+            params={'lo': start, 'hi': start + WRITE_CHUNK})
+        keys = stored['address_key'].to_numpy(dtype=np.int64)
+        new = ids[keys]
+        current = stored['address_cluster_id'].fillna(-1).to_numpy(dtype=np.int64)
+        changed = new != current
+        if changed.any():
+            conn.execute(text("INSERT INTO temp.cluster_updates VALUES (:k, :c)"),
+                         [{'k': k, 'c': c} for k, c in zip(keys[changed].tolist(), new[changed].tolist())])
+
+    updated = conn.execute(text(f"""
+        UPDATE {ADDRESS_TABLE} SET address_cluster_id = u.cluster_id
+        FROM temp.cluster_updates u WHERE {ADDRESS_TABLE}.address_key = u.address_key""")).rowcount
+    conn.execute(text("DROP TABLE temp.cluster_updates"))
+    return updated
+
+
+def run(conn, state_dir=STATE_DIR, full=False, chunk_size=INPUT_CHUNK):
+    """Merge new inputs into the clusters and write changed cluster ids; returns the run summary"""
+    check_tables(conn)
+    if full and os.path.isdir(state_dir):
+        shutil.rmtree(state_dir)
+    state = load_state(state_dir)
+
+    max_key = conn.execute(text(f"SELECT COALESCE(MAX(address_key), 0) FROM {ADDRESS_TABLE}")).scalar()
+    uf = UnionFind(state_dir, int(max_key) + 1)
+
+    start = time.perf_counter()
+    last_key, inputs, merges = merge_inputs(conn, uf, state['last_transaction_key'], chunk_size)
+    uf.flush()
+    merge_seconds = time.perf_counter() - start
+
+    ids = cluster_ids(uf, state_dir)
+    updated = write_clusters(conn, ids)
+    del ids
+    os.remove(os.path.join(state_dir, 'roots.tmp.npy'))
+
+    state.update({'last_transaction_key': last_key,
+                  'inputs_processed': state['inputs_processed'] + inputs,
+                  'merges': state['merges'] + merges})
+    save_state(state_dir, state)
+    return {'inputs': inputs, 'merges': merges, 'updated': updated, 'addresses': len(uf),
+            'merge_seconds': merge_seconds, 'last_transaction_key': last_key}
+
+
+def main():
+    # --db/--state-dir are accepted before or after the subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', default=argparse.SUPPRESS, help='Database with dim_address and bridge_transaction_inputs')
+    common.add_argument('--state-dir', default=argparse.SUPPRESS)
+    parser = argparse.ArgumentParser(description="Cluster addresses by common-input ownership")
+    parser.add_argument('--db', default=DB_PATH, help='Database with dim_address and bridge_transaction_inputs')
+    parser.add_argument('--state-dir', default=STATE_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', parents=[common], help='Merge new transactions and write cluster ids')
+    run_parser.add_argument('--full', action='store_true', help='Discard saved state and recluster everything')
+    run_parser.add_argument('--chunk-size', type=int, default=INPUT_CHUNK)
+    stats = sub.add_parser('stats', parents=[common], help='Show the largest clusters')
+    stats.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.db):
+        print(f"❌ Database file not found: {args.db}")
+        return 1
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    try:
+        if args.command == 'run':
+            print("🧩 Clustering addresses by common-input ownership...")
+            with engine.begin() as conn:
+                summary = run(conn, args.state_dir, args.full, args.chunk_size)
+            rate = summary['inputs'] / summary['merge_seconds'] if summary['merge_seconds'] else 0
+            print(f"✅ {summary['inputs']:,} new inputs ({rate:,.0f}/sec), {summary['merges']:,} merges, "
+                  f"{summary['updated']:,} cluster ids written; "
+                  f"processed through transaction_key {summary['last_transaction_key']}")
+            return 0
+
+        with engine.connect() as conn:
+            check_tables(conn)
+            top = pd.read_sql(text(
+                f"SELECT address_cluster_id AS ClusterID, COUNT(*) AS Addresses FROM {ADDRESS_TABLE} "
+                f"WHERE address_cluster_id IS NOT NULL GROUP BY address_cluster_id "
+                f"ORDER BY Addresses DESC LIMIT :n"), conn, params={'n': args.top})
+            clusters = conn.execute(text(
+                f"SELECT COUNT(DISTINCT address_cluster_id) FROM {ADDRESS_TABLE}")).scalar()
+        state = load_state(args.state_dir)
+        print(f"🧩 {clusters:,} clusters; {state['inputs_processed']:,} inputs processed through "
+              f"transaction_key {state['last_transaction_key']}")
+        print(top.to_string(index=False))
+        return 0
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Robust-density anomaly model for TransactionAnalysis.AnomalyScore
+A trade is described by a few per-trade and per-wallet features (log volume, log
+size, price against the day's market close, volume against the wallet's usual
+volume, wallet activity). The model is fit offline on a sample of the warehouse:
+features are centred on their medians and scaled by their MAD, and a covariance
+of the clipped robust z-scores gives each trade a Mahalanobis distance. Distances
+are turned into tail probabilities with quantiles of the training distances, and
+
+    AnomalyScore = -25 * log10(tail probability)    (clipped to 0-100)
+
+so each 25 points is ten times rarer: 25 is the top 10% of training trades, 50 the
+top 1%, 75 the top 0.1%. Trades flagged by a suspicious rule never score below 50.
+
+Models are saved as versioned artifacts in a directory that belongs to one warehouse
+(data/models/bitcoin_unified_dw/anomaly_model_v<N>.npz, shared with its staging
+rebuilds), loaded once per process, and registered in the warehouse's AnomalyModels
+table. A benchmark or test warehouse therefore never supplies production's model. Every
+TransactionAnalysis row records the ModelVersion that scored it (NULL when no model
+was available). Scoring is pure NumPy over whole batches: the target is at least
+1,000,000 trades/sec for backfills and 1,000-trade micro-batches in under 5 ms.
+
+Usage:
+    python anomaly_model.py train --sample 1000000
+    python anomaly_model.py show
+    python anomaly_model.py bench --rows 1000000 --batch-size 1000
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import rule_engine
+import warehouse_swap
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+MODEL_DIR = 'models'
+DEFAULT_SAMPLE = 1_000_000
+SUSPICIOUS_FLOOR = 50.0
+Z_CLIP = 8.0
+
+# Throughput targets checked by `bench`
+BACKFILL_TARGET = 1_000_000     # trades/sec over one large batch
+MICRO_BATCH_TARGET_MS = 5.0     # per 1,000-trade micro-batch
+
+FEATURES = ['log_volume', 'log_size', 'price_vs_market', 'volume_vs_wallet', 'wallet_activity']
+
+MODEL_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS AnomalyModels (
+        ModelVersion INTEGER PRIMARY KEY,
+        TrainedAt TIMESTAMP,
+        TrainingRows INTEGER,
+        Features TEXT,
+        ArtifactPath TEXT
+    )""",
+]
+
+# Tail probabilities the training distances are summarised at (1 down to 1e-6)
+TAIL_GRID = np.logspace(0, -6, 121)
+
+_ARTIFACT = re.compile(r'anomaly_model_v(\d+)\.npz$')
+
+
+class AnomalyModel:
+    """Fitted robust-density model; score() maps a fact chunk to 0-100"""
+
+    def __init__(self, center, scale, precision, thresholds, tail_probs, wallet_keys, wallet_volume,
+                 wallet_activity, version=None, trained_at=None, training_rows=0):
+        self.center = center
+        self.scale = scale
+        self.precision = precision
+        self.thresholds = thresholds
+        self.log_tail = np.log10(tail_probs)
+        self.wallet_keys = wallet_keys
+        self.wallet_volume = wallet_volume
+        self.wallet_activity = wallet_activity
+        self.version = version
+        self.trained_at = trained_at
+        self.training_rows = training_rows
+        # Market closes per warehouse: one loaded model can score for several in a process
+        self._closes = {}
+
+    def features(self, frame, closes=None):
+        """(rows, len(FEATURES)) float matrix; NaN where a feature is unknown
+
+        frame needs VolumeQuoteCents, SizeBaseSat, PriceCents, WalletKey and
+        MarketDateKey; closes is the market close in cents indexed by MarketDateKey.
+        """
+        volume = np.log1p(_floats(frame['VolumeQuoteCents']))
+        size = np.log1p(_floats(frame['SizeBaseSat']))
+        price = np.log(_floats(frame['PriceCents']))
+
+        market = np.full(len(frame), np.nan)
+        if closes is not None:
+            keys = _floats(frame['MarketDateKey'])
+            known = ~np.isnan(keys) & (keys >= 0) & (keys < len(closes))
+            market[known] = closes[keys[known].astype(np.int64)]
+
+        # Wallets unseen at training time get no wallet baseline and zero activity
+        wallet_volume = np.full(len(frame), np.nan)
+        activity = np.zeros(len(frame))
+        keys = _floats(frame['WalletKey'])
+        if len(self.wallet_keys):
+            valid = ~np.isnan(keys)
+            pos = np.searchsorted(self.wallet_keys, keys[valid].astype(np.int64))
+            pos = np.minimum(pos, len(self.wallet_keys) - 1)
+            found = np.zeros(len(frame), dtype=bool)
+            found[valid] = self.wallet_keys[pos] == keys[valid]
+            matched = pos[found[valid]]
+            wallet_volume[found] = self.wallet_volume[matched]
+            activity[found] = self.wallet_activity[matched]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.column_stack([volume, size, price - np.log(market), volume - wallet_volume, activity])
+
+    def distances(self, features):
+        """Squared Mahalanobis distance of robust z-scores; unknown features count as typical"""
+        z = (features - self.center) / self.scale
+        z = np.clip(np.nan_to_num(z, nan=0.0, posinf=Z_CLIP, neginf=-Z_CLIP), -Z_CLIP, Z_CLIP)
+        return np.einsum('ij,ij->i', z @ self.precision, z)
+
+    def score_features(self, features):
+        log_tail = np.interp(self.distances(features), self.thresholds, self.log_tail)
+        return np.clip(-25.0 * log_tail, 0.0, 100.0)
+
+    def score(self, frame, closes=None):
+        return self.score_features(self.features(frame, closes))
+
+    def score_trades(self, conn, frame):
+        """score() with market closes read from DimMarket once per warehouse and re-read when new days appear"""
+        warehouse = str(conn.engine.url)
+        if len(frame):
+            keys = _floats(frame['MarketDateKey'])
+            high = np.nanmax(keys) if not np.isnan(keys).all() else -1
+            closes = self._closes.get(warehouse)
+            if closes is None or high >= len(closes):
+                self._closes[warehouse] = market_closes(conn)
+        return self.score(frame, self._closes.get(warehouse))
+
+
+def _floats(column):
+    """Float64 values of a (possibly nullable) column, NaN for missing"""
+    return pd.to_numeric(pd.Series(column), errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def market_closes(conn):
+    """Market close in cents indexed by MarketDateKey (NaN where unknown)"""
+    market = pd.read_sql(text(
+        "SELECT MarketDateKey, btc_usd_price_close FROM DimMarket WHERE MarketDateKey IS NOT NULL"), conn)
+    closes = np.full(int(market['MarketDateKey'].max()) + 1 if len(market) else 0, np.nan)
+    closes[market['MarketDateKey'].to_numpy(dtype=np.int64)] = (
+        pd.to_numeric(market['btc_usd_price_close'], errors='coerce').to_numpy(dtype=np.float64) * 100)
+    return closes
+
+
+def training_frame(conn, sample=DEFAULT_SAMPLE):
+    """Every n-th fact row, so about `sample` trades spread over the whole warehouse"""
+    rows = conn.execute(text("SELECT COUNT(*) FROM FactTransactions")).scalar()
+    step = max(1, -(-rows // sample)) if sample else 1
+    return pd.read_sql(text(
+        "SELECT WalletKey, MarketDateKey, PriceCents, VolumeQuoteCents, SizeBaseSat FROM FactTransactions "
+        "WHERE TransactionFactSK % :step = 0"), conn, params={'step': step})
+
+
+def fit(frame, wallet_counts, closes):
+    """Fit an AnomalyModel on a training frame
+
+    wallet_counts maps WalletKey -> trades in the warehouse (the activity feature);
+    the wallet volume baseline is the median log volume of the wallet's sampled trades.
+    """
+    volume = np.log1p(_floats(frame['VolumeQuoteCents']))
+    wallets = pd.DataFrame({'WalletKey': frame['WalletKey'], 'volume': volume}).dropna()
+    baseline = wallets.groupby('WalletKey')['volume'].median()
+    counts = wallet_counts.reindex(baseline.index.union(wallet_counts.index)).fillna(0)
+    baseline = baseline.reindex(counts.index)
+
+    model = AnomalyModel(
+        center=np.zeros(len(FEATURES)), scale=np.ones(len(FEATURES)), precision=np.eye(len(FEATURES)),
+        thresholds=np.zeros(len(TAIL_GRID)), tail_probs=TAIL_GRID,
+        wallet_keys=counts.index.to_numpy(dtype=np.int64),
+        wallet_volume=baseline.to_numpy(dtype=np.float64),
+        wallet_activity=np.log1p(counts.to_numpy(dtype=np.float64)),
+        training_rows=len(frame))
+    features = model.features(frame, closes)
+
+    center = np.nanmedian(features, axis=0)
+    mad = np.nanmedian(np.abs(features - center), axis=0) * 1.4826
+    spread = np.nanstd(features, axis=0)
+    # Features with no spread (e.g. every wallet seen once) must not divide by zero
+    scale = np.where(mad > 0, mad, np.where(spread > 0, spread, 1.0))
+    model.center = np.nan_to_num(center)
+    model.scale = scale
+
+    z = np.clip(np.nan_to_num((features - model.center) / model.scale), -Z_CLIP, Z_CLIP)
+    covariance = z.T @ z / max(1, len(z)) + np.eye(len(FEATURES)) * 1e-6
+    model.precision = np.linalg.pinv(covariance)
+
+    # Distances at each tail probability the sample can resolve; thresholds must rise
+    distances = model.distances(features)
+    tail = TAIL_GRID[TAIL_GRID >= 1.0 / max(1, len(distances))]
+    model.thresholds = np.maximum.accumulate(np.quantile(distances, 1.0 - tail)) if len(distances) else np.zeros(len(tail))
+    model.log_tail = np.log10(tail)
+    return model
+
+
+def train(conn, sample=DEFAULT_SAMPLE):
+    """Fit a model on the warehouse's FactTransactions"""
+    frame = training_frame(conn, sample)
+    counts = pd.read_sql(text(
+        "SELECT WalletKey, COUNT(*) AS Trades FROM FactTransactions WHERE WalletKey IS NOT NULL GROUP BY WalletKey"),
+        conn).set_index('WalletKey')['Trades']
+    model = fit(frame, counts, market_closes(conn))
+    model.trained_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+    return model
+
+
+def model_dir_for(db_path):
+    """Model directory that belongs to a warehouse file; its staging build uses the live one's"""
+    name = os.path.splitext(os.path.basename(warehouse_swap.live_path(db_path)))[0]
+    return os.path.join(os.path.dirname(db_path) or '.', MODEL_DIR, name)
+
+
+def artifact_path(version, model_dir=MODEL_DIR):
+    return os.path.join(model_dir, f'anomaly_model_v{version}.npz')
+
+
+def latest_version(model_dir=MODEL_DIR):
+    versions = [int(m.group(1)) for m in map(_ARTIFACT.search, glob.glob(os.path.join(model_dir, '*.npz'))) if m]
+    return max(versions, default=None)
+
+
+def save_model(model, model_dir=MODEL_DIR):
+    """Write the model as the next version; returns the artifact path"""
+    os.makedirs(model_dir, exist_ok=True)
+    model.version = (latest_version(model_dir) or 0) + 1
+    path = artifact_path(model.version, model_dir)
+    meta = {'version': model.version, 'trained_at': model.trained_at, 'training_rows': model.training_rows,
+            'features': FEATURES}
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, meta=np.array(json.dumps(meta)), center=model.center, scale=model.scale,
+             precision=model.precision, thresholds=model.thresholds, tail_probs=10 ** model.log_tail,
+             wallet_keys=model.wallet_keys, wallet_volume=model.wallet_volume,
+             wallet_activity=model.wallet_activity)
+    # Readers only ever see complete artifacts
+    os.replace(tmp, path)
+    return path
+
+
+# Loaded models by artifact path, so each process reads an artifact once
+_loaded = {}
+
+
+def load_model(version=None, model_dir=MODEL_DIR):
+    """The given (default: latest) model version, or None when no model has been trained"""
+    if version is None:
+        version = latest_version(model_dir)
+        if version is None:
+            return None
+    path = artifact_path(version, model_dir)
+    if path not in _loaded:
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['features'] != FEATURES:
+                raise ValueError(f"{path} was trained on features {meta['features']}, expected {FEATURES}")
+            _loaded[path] = AnomalyModel(
+                data['center'], data['scale'], data['precision'], data['thresholds'], data['tail_probs'],
+                data['wallet_keys'], data['wallet_volume'], data['wallet_activity'],
+                version=meta['version'], trained_at=meta['trained_at'], training_rows=meta['training_rows'])
+    return _loaded[path]
+
+
+def create_model_tables(conn):
+    """AnomalyModels registry, and the ModelVersion column on older TransactionAnalysis tables"""
+    for stmt in MODEL_TABLES_SQL:
+        conn.execute(text(stmt))
+    columns = [row[1] for row in conn.execute(text("PRAGMA table_info(TransactionAnalysis)"))]
+    if columns and 'ModelVersion' not in columns:
+        conn.execute(text("ALTER TABLE TransactionAnalysis ADD COLUMN ModelVersion INTEGER"))
+
+
+def register_model(conn, model, model_dir=MODEL_DIR):
+    create_model_tables(conn)
+    conn.execute(text(
+        "INSERT OR REPLACE INTO AnomalyModels (ModelVersion, TrainedAt, TrainingRows, Features, ArtifactPath) "
+        "VALUES (:v, :at, :rows, :features, :path)"),
+        {'v': model.version, 'at': model.trained_at, 'rows': model.training_rows,
+         'features': ','.join(FEATURES), 'path': artifact_path(model.version, model_dir)})
+
+
+def anomaly_scores(conn, model, frame, suspicious):
+    """AnomalyScore and ModelVersion for a fact chunk
+
+    Without a model, scores fall back to random draws (50-100 suspicious, 0-30
+    otherwise) and ModelVersion is NULL.
+    """
+    rows = len(frame)
+    if model is None:
+        scores = np.where(suspicious, 50 + np.random.uniform(0, 50, rows), np.random.uniform(0, 30, rows))
+        return scores, pd.array([None] * rows, dtype='Int64')
+    scores = model.score_trades(conn, frame)
+    scores = np.where(suspicious, np.maximum(scores, SUSPICIOUS_FLOOR), scores)
+    return scores, pd.array(np.full(rows, model.version), dtype='Int64')
+
+
+def benchmark(model, rows, batch_size, repeats=3):
+    """Best-of-N backfill trades/sec and micro-batch latency on a synthetic chunk"""
+    frame = rule_engine.synthetic_chunk(rows)
+    frame['MarketDateKey'] = np.random.default_rng(7).integers(1, 31, rows)
+    closes = np.full(32, 4_000_000.0)
+    backfill = min(_timed(lambda: model.score(frame, closes)) for _ in range(repeats))
+    batches = [frame.iloc[i:i + batch_size] for i in range(0, min(rows, batch_size * 200), batch_size)]
+    per_batch = min(_timed(lambda: [model.score(b, closes) for b in batches]) for _ in range(repeats)) / len(batches)
+    return {'backfill_rows_per_sec': rows / backfill, 'batch_ms': per_batch * 1000,
+            'batch_rows_per_sec': batch_size / per_batch}
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train, inspect and benchmark the anomaly model")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--model-dir', help="Model directory (default: the warehouse's own)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    train_cmd = sub.add_parser('train', help='Fit a new model version on the warehouse')
+    train_cmd.add_argument('--sample', type=int, default=DEFAULT_SAMPLE, help='Trades to fit on')
+    sub.add_parser('show', help='List model versions and the score distribution')
+    bench = sub.add_parser('bench', help='Check scoring throughput against the targets')
+    bench.add_argument('--rows', type=int, default=1_000_000)
+    bench.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args.model_dir = args.model_dir or model_dir_for(args.db)
+    engine = create_engine(f'sqlite:///{args.db}') if os.path.exists(args.db) else None
+
+    if args.command == 'train':
+        if engine is None:
+            print(f"❌ Warehouse not found: {args.db}")
+            return 1
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            model = train(conn, args.sample)
+            path = save_model(model, args.model_dir)
+            register_model(conn, model, args.model_dir)
+        print(f"✅ Trained anomaly model v{model.version} on {model.training_rows:,} trades "
+              f"in {time.perf_counter() - start:.2f}s -> {path}")
+        print("   Rescore existing trades with: python rescore_analysis.py")
+        return 0
+
+    if args.command == 'show':
+        version = latest_version(args.model_dir)
+        print(f"🧠 Latest model: {'v' + str(version) if version else 'none (AnomalyScore is random)'}")
+        if engine is not None:
+            with engine.connect() as conn:
+                create_model_tables(conn)
+                conn.commit()
+                print(pd.read_sql(text("SELECT * FROM AnomalyModels ORDER BY ModelVersion"), conn).to_string(index=False))
+                print(pd.read_sql(text(
+                    "SELECT ModelVersion, COUNT(*) AS Trades, ROUND(AVG(AnomalyScore), 1) AS AvgScore, "
+                    "SUM(AnomalyScore >= 50) AS Score50Plus FROM TransactionAnalysis GROUP BY ModelVersion"),
+                    conn).to_string(index=False))
+        return 0
+
+    model = load_model(model_dir=args.model_dir)
+    if model is None:
+        # No trained model: fit one on synthetic trades, which times the same code path
+        frame = rule_engine.synthetic_chunk(100_000, seed=1)
+        frame['MarketDateKey'] = 1
+        model = fit(frame, frame['WalletKey'].value_counts(), np.full(2, 4_000_000.0))
+    result = benchmark(model, args.rows, args.batch_size)
+    backfill_ok = result['backfill_rows_per_sec'] >= BACKFILL_TARGET
+    batch_ok = result['batch_ms'] <= MICRO_BATCH_TARGET_MS * args.batch_size / 1000
+    print(f"⏱️ Anomaly model scoring ({len(FEATURES)} features)")
+    print(f"   {'✅' if backfill_ok else '❌'} backfill   : {result['backfill_rows_per_sec']:>12,.0f} trades/sec "
+          f"(target {BACKFILL_TARGET:,})")
+    print(f"   {'✅' if batch_ok else '❌'} micro-batch: {result['batch_ms']:>12.2f} ms per {args.batch_size:,} trades "
+          f"({result['batch_rows_per_sec']:,.0f} trades/sec, target {MICRO_BATCH_TARGET_MS} ms per 1,000)")
+    return 0 if backfill_ok and batch_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
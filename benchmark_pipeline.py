@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the ETL pipeline and dashboard loaders
+Builds synthetic source databases at several scales, runs every schema_matched_etl.py
+stage against them and times the updated_dashboard.py loaders on the resulting warehouse.
+
+Usage:
+    python benchmark_pipeline.py                               # 1e4, 1e6 and 1e8 trades
+    python benchmark_pipeline.py --scales 1e4 1e5 --skip-dashboard
+    python benchmark_pipeline.py --scales 1e4 --baseline benchmarks/results/benchmark_<run_id>.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from etl_run_report import RunReport, diff_reports
+
+logger = logging.getLogger(__name__)
+
+BENCH_DIR = 'benchmarks'
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+DEFAULT_SCALES = [10_000, 1_000_000, 100_000_000]
+
+# Trades are generated and written in chunks so very large scales stay in bounded memory
+GENERATE_CHUNK = 1_000_000
+
+DASHBOARD_LOADERS = [
+    'load_summary_stats',
+    'load_daily_summary',
+    'load_transaction_analysis',
+    'load_wallet_counts',
+]
+
+ENTITY_TYPES = ['exchange', 'individual', 'merchant', 'mixer', 'mining_pool', None]
+ABUSE_CATEGORIES = ['ransomware', 'scam', 'darknet_market', 'blackmail']
+
+
+def _scale_shape(n_trades):
+    """Dimension sizes that grow with the number of trades"""
+    days = int(np.clip(n_trades // 50_000, 30, 3650))
+    wallets = int(np.clip(n_trades // 100, 500, 2_000_000))
+    return days, wallets
+
+
+def build_source_databases(directory, n_trades, seed=42):
+    """Create the four source databases expected by the ETL; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    days, n_wallets = _scale_shape(n_trades)
+    start = pd.Timestamp('2023-01-01')
+
+    sources = {
+        'time': os.path.join(directory, 'time_data.db'),
+        'market': os.path.join(directory, 'dim_market.db'),
+        'wallet': os.path.join(directory, 'dim_wallet.db'),
+        'transactions': os.path.join(directory, 'bitcoin_dw.db'),
+    }
+    for path in sources.values():
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Hourly time dimension
+    hours = pd.date_range(start, periods=days * 24, freq='h')
+    with sqlite3.connect(sources['time']) as conn:
+        pd.DataFrame({
+            'timestamp': hours.strftime('%Y-%m-%d %H:%M:%S'),
+            'year': hours.year,
+            'month': hours.month,
+            'day': hours.day,
+            'weekday': hours.day_name(),
+            'hour': hours.hour,
+        }).to_sql('dim_time', conn, index=False)
+
+    # Daily market dimension following a random walk
+    dates = pd.date_range(start, periods=days, freq='D')
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.02, days)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    with sqlite3.connect(sources['market']) as conn:
+        pd.DataFrame({
+            'date': dates.strftime('%Y-%m-%d'),
+            'btc_usd_price_open': open_.round(2),
+            'btc_usd_price_close': close.round(2),
+            'volume_usd': rng.uniform(1e9, 5e10, days).round(2),
+            'market_cap_usd': (close * 19_000_000).round(2),
+        }).to_sql('dim_market', conn, index=False)
+
+    # Wallet dimension with a small share of reported abuse
+    abuse = rng.random(n_wallets) < 0.03
+    with sqlite3.connect(sources['wallet']) as conn:
+        pd.DataFrame({
+            'wallet_address': [f"bc1qbench{i:012d}" for i in range(n_wallets)],
+            'first_seen_timestamp': (start - pd.to_timedelta(rng.integers(0, 1000, n_wallets), unit='D')).strftime('%Y-%m-%d %H:%M:%S'),
+            'last_seen_timestamp': (start + pd.to_timedelta(rng.integers(0, days, n_wallets), unit='D')).strftime('%Y-%m-%d %H:%M:%S'),
+            'transaction_count': rng.integers(1, 5000, n_wallets),
+            'total_received_satoshi': rng.integers(0, 10**11, n_wallets),
+            'total_sent_satoshi': rng.integers(0, 10**11, n_wallets),
+            'final_balance_satoshi': rng.integers(0, 10**10, n_wallets),
+            'label_source': 'benchmark',
+            'entity_tag': None,
+            'entity_type': rng.choice(np.array(ENTITY_TYPES, dtype=object), n_wallets),
+            'is_reported_abuse': abuse.astype(int),
+            'abuse_category': np.where(abuse, rng.choice(ABUSE_CATEGORIES, n_wallets), None),
+        }).to_sql('dim_wallet', conn, index=False)
+
+    # Trades, in timestamp order, written chunk by chunk
+    t0_ms = int(start.value // 1_000_000)
+    span_ms = days * 86_400_000
+    with sqlite3.connect(sources['transactions']) as conn:
+        for offset in range(0, n_trades, GENERATE_CHUNK):
+            size = min(GENERATE_CHUNK, n_trades - offset)
+            day_idx = np.minimum((np.arange(offset, offset + size) * days) // n_trades, days - 1)
+            price = (close[day_idx] * (1 + rng.normal(0, 0.005, size))).round(2)
+            base = rng.lognormal(-3, 1.5, size).round(8)
+            # A few round-number trades so the suspicious rules have something to hit
+            round_mask = rng.random(size) < 0.01
+            price[round_mask] = np.round(price[round_mask], -2)
+            timestamps = t0_ms + (np.arange(offset, offset + size) * span_ms) // n_trades
+            pd.DataFrame({
+                'trade_id': np.arange(offset + 1, offset + size + 1),
+                'side': rng.choice(['buy', 'sell'], size),
+                'price': price,
+                'volume(quote)': (price * base).round(8),
+                'size(base)': base,
+                'timestamp': timestamps,
+            }).to_sql('fact_transactions', conn, index=False, if_exists='append')
+
+    return sources
+
+
+def run_etl_benchmark(sources, dw_path, trace_memory=True):
+    """Run every ETL step against the given sources; returns the run report dict"""
+    import anomaly_model
+    import schema_matched_etl as etl
+
+    # The benchmark warehouse trains its own model; drop the last run's so every run trains from scratch
+    shutil.rmtree(anomaly_model.model_dir_for(dw_path), ignore_errors=True)
+    report = RunReport('benchmark_etl', trace_memory=trace_memory)
+    with report.stage('schema'):
+        dw_engine = etl.create_data_warehouse_with_your_schema(dw_path)
+    if dw_engine is None:
+        report.finish('failed')
+        return report.to_dict()
+
+    ok = etl.load_your_data(dw_engine, report, sources=sources, time_limit=None, fact_limit=None)
+    if ok:
+        with report.stage('views'):
+            ok = etl.create_analytical_views(dw_engine)
+    dw_engine.dispose()
+
+    report.finish('success' if ok else 'failed')
+    return report.to_dict()
+
+
+def run_dashboard_benchmark(dw_path, repeats=3):
+    """Time each dashboard loader cold (cache cleared) and warm (cache hit)"""
+    try:
+        import updated_dashboard as dashboard
+    except ImportError as e:
+        logger.warning(f"⚠️ Dashboard loaders skipped: {e}")
+        return {}
+
+    # FACT_CACHE_DIR is derived from DW_PATH at import; engines and the fact cache are cache_resource
+    dashboard.DW_PATH = dw_path
+    dashboard.FACT_CACHE_DIR = dashboard.fact_cache.cache_dir_for(dw_path)
+    dashboard.st.cache_resource.clear()
+
+    results = {}
+    for name in DASHBOARD_LOADERS:
+        loader = getattr(dashboard, name)
+        cold = []
+        for _ in range(repeats):
+            # Some loaders are uncached wrappers over cached helpers, so clear every cached result
+            dashboard.st.cache_data.clear()
+            start = time.perf_counter()
+            data = loader()
+            cold.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loader()
+        warm = time.perf_counter() - start
+
+        results[name] = {
+            'cold_seconds': round(min(cold), 6),
+            'cold_seconds_median': round(float(np.median(cold)), 6),
+            'warm_seconds': round(warm, 6),
+            'rows': len(data) if hasattr(data, '__len__') else None,
+        }
+    return results
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """Flag ETL stages and loaders that regressed against a baseline result file"""
+    regressions = []
+    base_scales = {s['n_trades']: s for s in baseline['scales']}
+
+    for scale in results['scales']:
+        base = base_scales.get(scale['n_trades'])
+        if base is None:
+            continue
+
+        for row in diff_reports(base['etl'], scale['etl'], threshold=threshold):
+            if row['regressions']:
+                regressions.append((scale['n_trades'], f"etl:{row['name']}", ', '.join(row['regressions'])))
+
+        for name, timing in scale['loaders'].items():
+            old = base['loaders'].get(name)
+            if old and old['cold_seconds'] and timing['cold_seconds'] > old['cold_seconds'] * (1 + threshold) \
+                    and timing['cold_seconds'] - old['cold_seconds'] > 0.01:
+                change = timing['cold_seconds'] / old['cold_seconds'] - 1
+                regressions.append((scale['n_trades'], f"loader:{name}", f"cold {change * 100:+.1f}%"))
+
+    return regressions
+
+
+def print_summary(results):
+    print(f"\n📊 BENCHMARK RESULTS ({results['run_id']})")
+    print("=" * 60)
+    for scale in results['scales']:
+        print(f"\n₿ {scale['n_trades']:,} trades  (sources built in {scale['build_seconds']:.1f}s)")
+        print(f"   {'ETL stage':<28} {'Seconds':>10} {'Rows/s':>14} {'Peak MB':>9}")
+        for s in scale['etl']['stages']:
+            rps = f"{s['rows_per_sec']:,.0f}" if s['rows_per_sec'] else '-'
+            peak = f"{s['peak_memory_mb']:.1f}" if s['peak_memory_mb'] is not None else '-'
+            print(f"   {s['name']:<28} {s['seconds']:>10.3f} {rps:>14} {peak:>9}")
+        for name, timing in scale['loaders'].items():
+            print(f"   {name:<28} cold {timing['cold_seconds']:.4f}s  warm {timing['warm_seconds']:.4f}s  rows {timing['rows']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ETL pipeline and dashboard loaders")
+    parser.add_argument('--scales', nargs='+', type=float, default=DEFAULT_SCALES,
+                        help='Trade counts to benchmark, e.g. 1e4 1e6 1e8')
+    parser.add_argument('--repeats', type=int, default=3, help='Cold runs per dashboard loader')
+    parser.add_argument('--skip-dashboard', action='store_true', help='Only benchmark the ETL')
+    parser.add_argument('--no-memory', action='store_true', help='Disable tracemalloc (less overhead)')
+    parser.add_argument('--reuse-sources', action='store_true',
+                        help='Reuse previously generated source databases for a scale')
+    parser.add_argument('--baseline', help='Earlier result file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Regression threshold (default 0.25)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    print("🏁 BITCOIN DSS BENCHMARK SUITE")
+    print("=" * 40)
+
+    results = {
+        'run_id': datetime.now().strftime('%Y%m%d_%H%M%S'),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': _environment(),
+        'scales': [],
+    }
+
+    for scale in args.scales:
+        n_trades = int(scale)
+        scale_dir = os.path.join(DATA_DIR, str(n_trades))
+        print(f"\n🏗️ Building {n_trades:,}-trade warehouse in {scale_dir}...")
+
+        start = time.perf_counter()
+        source_path = os.path.join(scale_dir, 'bitcoin_dw.db')
+        if args.reuse_sources and os.path.exists(source_path):
+            sources = {
+                'time': os.path.join(scale_dir, 'time_data.db'),
+                'market': os.path.join(scale_dir, 'dim_market.db'),
+                'wallet': os.path.join(scale_dir, 'dim_wallet.db'),
+                'transactions': source_path,
+            }
+        else:
+            sources = build_source_databases(scale_dir, n_trades)
+        build_seconds = time.perf_counter() - start
+
+        dw_path = os.path.join(scale_dir, 'bitcoin_unified_dw.db')
+        print("   ⏱️ Running ETL stages...")
+        etl_report = run_etl_benchmark(sources, dw_path, trace_memory=not args.no_memory)
+        print(f"   ✅ ETL {etl_report['status']} in {etl_report['total_seconds']:.2f}s")
+
+        loaders = {}
+        if not args.skip_dashboard and etl_report['status'] == 'success':
+            print("   ⏱️ Timing dashboard loaders...")
+            loaders = run_dashboard_benchmark(dw_path, repeats=args.repeats)
+
+        results['scales'].append({
+            'n_trades': n_trades,
+            'build_seconds': round(build_seconds, 3),
+            'warehouse_mb': round(os.path.getsize(dw_path) / (1024 * 1024), 2) if os.path.exists(dw_path) else None,
+            'etl': etl_report,
+            'loaders': loaders,
+        })
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    out_path = os.path.join(RESULTS_DIR, f"benchmark_{results['run_id']}.json")
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+
+    print_summary(results)
+    print(f"\n💾 Results saved to {out_path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regression(s) against {args.baseline}:")
+            for n_trades, name, detail in regressions:
+                print(f"   ❌ {n_trades:,} trades - {name}: {detail}")
+            return 1
+        print(f"\n✅ No regressions against {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,47 @@
 #!/usr/bin/env python3
 """
 Check database schema and identify issues
+
+--fast never scans a table. Row counts come from metadata the ETL keeps (LoadStats,
+FactPartitions; TransactionAnalysis holds one row per loaded trade) or from
+sqlite_stat1, and sizes from the page counts. The ETL, stream batches, archiving,
+partition drops and dedup migrations re-run a sampled ANALYZE after writing, so the
+sqlite_stat1 estimates track deletes as well as loads. Views are compiled with
+EXPLAIN and probed for one row under a deadline. Independent checks
+run concurrently on read-only connections, each with its own timeout, so a check is
+cheap on a production-size warehouse and does not hold up dashboard readers.
+
+Usage:
+    python check_database_schema.py
+    python check_database_schema.py --fast --timeout 2
 """
 
+import argparse
 import sqlite3
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+FAST_TIMEOUT = 2.0
+FAST_WORKERS = 4
 
-def check_database_schema():
+# Tables/views the dashboard expects
+EXPECTED_OBJECTS = {
+    'FactTransactions': 'table',
+    'DimWallet': 'table', 
+    'TransactionAnalysis': 'table',
+    'DailySummary': 'table',
+    'WalletExposure': 'table',
+    'vw_DailySummary': 'view',
+    'vw_TransactionAnalysis': 'view',
+    'vw_WalletRisk': 'view',
+    'vw_MarketPerformance': 'view'
+}
+
+def check_database_schema(db_path=DB_PATH):
     """Check the actual database schema"""
-    db_path = 'data/bitcoin_unified_dw.db'
     
     if not os.path.exists(db_path):
         print(f"❌ Database file not found: {db_path}")
@@ -33,16 +65,7 @@ def check_database_schema():
         print(f"👁️ Views: {views}")
         
         # Check specific tables/views the dashboard expects
-        expected_objects = {
-            'FactTransactions': 'table',
-            'DimWallet': 'table', 
-            'TransactionAnalysis': 'table',
-            'DailySummary': 'table',
-            'vw_DailySummary': 'view',
-            'vw_TransactionAnalysis': 'view',
-            'vw_WalletRisk': 'view',
-            'vw_MarketPerformance': 'view'
-        }
+        expected_objects = EXPECTED_OBJECTS
         
         print(f"\n🎯 CHECKING EXPECTED OBJECTS")
         print("=" * 35)
@@ -101,8 +124,181 @@ def check_database_schema():
         print(f"❌ Database error: {e}")
         return False
 
-if __name__ == "__main__":
-    if check_database_schema():
+def _connect_ro(db_path, timeout):
+    """Read-only connection whose statements are interrupted once the timeout passes"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=timeout, check_same_thread=False)
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10_000)
+    return conn
+
+def _timed_out(error):
+    return isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error)
+
+def _objects(conn):
+    return dict(conn.execute("SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')").fetchall())
+
+def fast_check_objects(db_path, timeout):
+    """Expected tables and views are present"""
+    conn = _connect_ro(db_path, timeout)
+    try:
+        objects = _objects(conn)
+    finally:
+        conn.close()
+    lines, ok = [], True
+    for name, kind in EXPECTED_OBJECTS.items():
+        # A partitioned warehouse serves FactTransactions as a view over its partitions
+        if objects.get(name) == kind or (name == 'FactTransactions' and name in objects):
+            lines.append(f"✅ {name} ({kind}) - Found")
+        else:
+            lines.append(f"❌ {name} ({kind}) - Missing")
+            ok = False
+    return ('ok' if ok else 'error'), lines
+
+def metadata_row_counts(conn):
+    """{table: (rows, source)} from sqlite_stat1 and the ETL's own bookkeeping; nothing is scanned"""
+    counts = {}
+    objects = _objects(conn)
+    if 'sqlite_stat1' in objects:
+        # The first number of every stat row is the table's row count (sampled when analysis_limit is set)
+        for table, _, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+            rows = int(stat.split()[0])
+            if rows > counts.get(table, (-1,))[0]:
+                counts[table] = (rows, 'sqlite_stat1 ~')
+    # Exact counts the ETL maintains as it writes win over the estimates
+    if 'FactPartitions' in objects:
+        for name, rows in conn.execute("SELECT PartitionName, RowCount FROM FactPartitions"):
+            counts[name] = (int(rows), 'FactPartitions')
+    if 'LoadStats' in objects:
+        rows = conn.execute("SELECT SUM(Rows) FROM LoadStats WHERE Side = 'loaded'").fetchone()[0]
+        if rows is not None:
+            counts['FactTransactions'] = (int(rows), 'LoadStats')
+            # Every writer scores each trade it loads and deletes its row with the trade;
+            # warehouse_validation.py's analysis_coverage check holds it to that
+            if 'TransactionAnalysis' in objects:
+                counts['TransactionAnalysis'] = (int(rows), 'LoadStats, one per trade')
+    return counts
+
+def fast_check_counts(db_path, timeout):
+    """Row counts from metadata; tables without any fall back to MAX(rowid), a b-tree seek"""
+    conn = _connect_ro(db_path, timeout)
+    try:
+        counts = metadata_row_counts(conn)
+        tables = [name for name, kind in _objects(conn).items() if kind == 'table' and not name.startswith('sqlite_')]
+        lines = []
+        for table in sorted(set(tables) | set(counts)):
+            if table in counts:
+                rows, source = counts[table]
+                lines.append(f"{table}: {rows:,} records ({source})")
+                continue
+            try:
+                high = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0]
+                lines.append(f"{table}: <= {high or 0:,} records (max rowid)")
+            except sqlite3.OperationalError as e:
+                lines.append(f"{table}: unknown ({e})")
+    finally:
+        conn.close()
+    return 'ok', lines
+
+def fast_check_size(db_path, timeout):
+    conn = _connect_ro(db_path, timeout)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    mb = 1024 * 1024
+    return 'ok', [f"File: {os.path.getsize(db_path) / mb:,.1f} MB",
+                  f"Pages: {pages:,} x {page_size:,} B ({free:,} free, {free * page_size / mb:,.1f} MB reclaimable)"]
+
+def fast_check_structure(db_path, timeout):
+    conn = _connect_ro(db_path, timeout)
+    try:
+        columns = conn.execute("PRAGMA table_info(FactTransactions)").fetchall()
+    finally:
+        conn.close()
+    if not columns:
+        return 'error', ["FactTransactions not found"]
+    return 'ok', [f"{col[1]} ({col[2]})" for col in columns]
+
+def fast_check_view(db_path, timeout, view):
+    """Compile the view with EXPLAIN, then fetch one row before the deadline"""
+    conn = _connect_ro(db_path, timeout)
+    try:
+        try:
+            conn.execute(f"EXPLAIN SELECT * FROM {view}").fetchall()
+        except sqlite3.Error as e:
+            return 'error', [f"does not compile: {e}"]
+        start = time.perf_counter()
+        try:
+            row = conn.execute(f"SELECT * FROM {view} LIMIT 1").fetchone()
+        except sqlite3.Error as e:
+            if _timed_out(e):
+                return 'timeout', [f"compiles; first row not ready within {timeout:g}s"]
+            return 'error', [f"probe failed: {e}"]
+        found = 'first row' if row is not None else 'no rows'
+        return 'ok', [f"compiles; {found} in {(time.perf_counter() - start) * 1000:.0f} ms"]
+    finally:
+        conn.close()
+
+def fast_check_database_schema(db_path=DB_PATH, timeout=FAST_TIMEOUT, workers=FAST_WORKERS):
+    """Metadata-only schema check; independent checks run concurrently with per-check timeouts"""
+    if not os.path.exists(db_path):
+        print(f"❌ Database file not found: {db_path}")
+        return False
+    
+    conn = _connect_ro(db_path, timeout)
+    try:
+        views = [name for name, kind in _objects(conn).items() if kind == 'view']
+    finally:
+        conn.close()
+    
+    checks = [('🎯 EXPECTED OBJECTS', fast_check_objects, ()),
+              ('📋 FactTransactions Structure', fast_check_structure, ()),
+              ('📈 DATA COUNTS (metadata)', fast_check_counts, ()),
+              ('💾 SIZE', fast_check_size, ())]
+    checks += [(f'👁️ {view}', fast_check_view, (view,)) for view in sorted(views)]
+    
+    print("⚡ FAST DATABASE SCHEMA ANALYSIS")
+    print("=" * 40)
+    icons = {'ok': '✅', 'timeout': '⏱️', 'error': '❌'}
+    failed = False
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [(title, pool.submit(check, db_path, timeout, *args)) for title, check, args in checks]
+        for title, future in futures:
+            try:
+                # The connection's own deadline interrupts the check; this only guards the wait
+                status, lines = future.result(timeout=timeout + 1)
+            except TimeoutError:
+                status, lines = 'timeout', [f"no result within {timeout:g}s"]
+            except Exception as e:
+                status, lines = ('timeout' if _timed_out(e) else 'error'), [str(e)]
+            failed = failed or status == 'error'
+            print(f"\n{icons[status]} {title}")
+            for line in lines:
+                print(f"   {line}")
+    print(f"\n⏱️ Checked in {time.perf_counter() - started:.2f}s")
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the warehouse schema the dashboard expects")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--fast', action='store_true',
+                        help='Read counts from metadata, probe views under a deadline, run checks concurrently')
+    parser.add_argument('--timeout', type=float, default=FAST_TIMEOUT, help='Seconds allowed per check (--fast)')
+    parser.add_argument('--workers', type=int, default=FAST_WORKERS, help='Concurrent checks (--fast)')
+    args = parser.parse_args()
+    
+    if args.fast:
+        ok = fast_check_database_schema(args.db, args.timeout, args.workers)
+    else:
+        ok = check_database_schema(args.db)
+    if ok:
         print(f"\n🎉 Database schema is compatible with dashboard!")
     else:
         print(f"\n⚠️ Database schema issues found. Dashboard may have limited functionality.")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+DAG-based ETL orchestrator
+Runs the warehouse build as a graph of stages instead of one sequential transaction:
+
+    schema          -> dim_time, dim_market, dim_wallet, views
+    facts.load      (after the three dimensions) -> analysis.score
+    facts.load, analysis.score -> daily_summary, risk_cube, quantile_sketches
+    facts.load      -> wallet_sketches, wallet_leaders
+    aggregates      -> validate (after views) -> fact_cache, taint
+
+A thread pool runs every stage whose dependencies are done, so source extraction
+for the three dimensions overlaps. SQLite has a single writer, so the parts of a
+stage that write take the warehouse write lock; reads do not.
+
+Each stage has a fingerprint over its inputs (source file size and mtime, limits,
+rule config, model version, DDL) and its dependencies' fingerprints, recorded in
+EtlStageState once the stage succeeds. A stage is skipped when its fingerprint is
+unchanged and no upstream stage re-runs. Each run reports its critical path: the
+chain of stages that bounded wall time.
+
+facts.load goes through the batch ETL's chunked loader: source trades after the
+'facts' checkpoint are loaded and scored one committed chunk at a time, so a
+changed source appends its new rows and trades on archived days are not loaded
+again. analysis.score re-runs only for its own inputs (rules, watchlist, model)
+and rescores the warehouse in committed, checkpointed SK ranges. The aggregate
+stages refresh only the days whose facts or scores changed, so the summaries of
+archived days are never lost.
+
+Loaded facts carry dimension keys, so a run that re-runs a dimension, forces
+facts.load or includes the schema stage (a first build, a DDL change, --force all)
+rebuilds every table. It runs against the staging file and is published with
+warehouse_swap.publish(), so readers keep the live warehouse until the new build
+passes its checks. The rebuild loads every source trade hot again and starts with
+an empty archive catalog. A failed staged run leaves the live warehouse untouched,
+and the next run resumes from the stages and checkpoints the staging file recorded.
+
+Usage:
+    python etl_orchestrator.py
+    python etl_orchestrator.py --workers 4 --force dim_wallet
+    python etl_orchestrator.py --dry-run
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import anomaly_model
+import fact_cache
+import fact_partitions
+import quantile_sketches
+import rescore_analysis
+import risk_cube
+import rule_engine
+import schema_matched_etl as etl
+import taint_propagation
+import wallet_leaders
+import wallet_screening
+import wallet_sketches
+import warehouse_swap
+from etl_run_report import RunReport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+BUSY_TIMEOUT_SECONDS = 60
+DIMENSION_STAGES = {'dim_time', 'dim_market', 'dim_wallet'}
+# Trades rescored per committed chunk by analysis.score
+SCORE_CHUNK = etl.FACT_CHUNK_SIZE
+
+STATE_SQL = """CREATE TABLE IF NOT EXISTS EtlStageState (
+    StageName VARCHAR(50) PRIMARY KEY,
+    Fingerprint VARCHAR(64) NOT NULL,
+    CompletedAt TIMESTAMP,
+    Seconds REAL,
+    RowsOut INTEGER
+)"""
+
+
+class Stage:
+    """One node of the pipeline DAG
+
+    run(ctx) does the work and returns the rows it produced (or None). inputs(ctx)
+    returns the JSON-able external inputs that make up the stage's fingerprint.
+    In-memory stages (cached=False) leave their output in ctx.data, so they are never
+    recorded and only run for a dependent. refingerprint stages produce one of their
+    own inputs (e.g. a trained model), so their fingerprint is taken after they run.
+    Stages with follows_upstream=False keep up with upstream re-runs by themselves
+    (facts.load scores what it appends), so only their own inputs or --force re-run
+    them and their fingerprint leaves out their dependencies'.
+    """
+
+    def __init__(self, name, run, deps=(), inputs=None, cached=True, refingerprint=False, follows_upstream=True):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = inputs or (lambda ctx: {})
+        self.cached = cached
+        self.refingerprint = refingerprint
+        self.follows_upstream = follows_upstream
+
+
+class Context:
+    """Shared state for one run: the engine, run options and in-memory stage outputs"""
+
+    def __init__(self, db_path, sources, time_limit, fact_limit, partition_grain, rules_path):
+        self.db_path = db_path
+        self.sources = sources
+        self.time_limit = time_limit
+        self.fact_limit = fact_limit
+        self.partition_grain = partition_grain
+        self.rules_path = rules_path
+        self.data = {}
+        # Planned stage fingerprints, set by run_pipeline
+        self.fingerprints = {}
+        self._write_lock = threading.Lock()
+        self.engine = None
+        self.connect()
+
+    def connect(self):
+        if self.engine is not None:
+            self.engine.dispose()
+        self.engine = create_engine(f'sqlite:///{self.db_path}', connect_args={'timeout': BUSY_TIMEOUT_SECONDS})
+
+    @contextmanager
+    def writer(self):
+        """The warehouse write lock and a transaction; commit on exit"""
+        with self._write_lock:
+            with self.engine.begin() as conn:
+                yield conn
+
+
+def _file_stamp(path):
+    """Size and mtime of an input file (None when missing)"""
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _code_hash(fn):
+    return hashlib.sha1(inspect.getsource(fn).encode()).hexdigest()
+
+
+def _fingerprint(stage, inputs, dep_fingerprints):
+    if not stage.follows_upstream:
+        dep_fingerprints = []
+    payload = json.dumps({'stage': stage.name, 'inputs': inputs, 'deps': dep_fingerprints},
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+# --- Stages -------------------------------------------------------------------
+
+def _run_schema(ctx):
+    ctx.engine.dispose()
+    if etl.create_data_warehouse_with_your_schema(ctx.db_path) is None:
+        raise RuntimeError("Schema creation failed")
+    ctx.connect()
+    with ctx.writer() as conn:
+        conn.execute(text(STATE_SQL))
+
+
+def _clear_table(conn, table):
+    """Empty a table a re-running stage owns, restarting its AUTOINCREMENT keys"""
+    conn.execute(text(f"DELETE FROM {table}"))
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :t"), {'t': table})
+
+
+def _dimension_stage(table, extract, transform):
+    def run(ctx):
+        source_df = extract(ctx)
+        with ctx.writer() as conn:
+            _clear_table(conn, table)
+            mapped = transform(conn, source_df)
+            mapped.to_sql(table, conn, if_exists='append', index=False)
+        logger.info(f"   ✅ {table}: {len(mapped):,} records")
+        return len(mapped)
+    return run
+
+
+def _run_facts_load(ctx):
+    # Appends the source rows after the 'facts' checkpoint; replacing loaded trades is a staged rebuild
+    with ctx._write_lock:
+        facts = etl.load_facts(ctx.engine, source_db=ctx.sources['transactions'], fact_limit=ctx.fact_limit,
+                               partition_grain=ctx.partition_grain, rules_path=ctx.rules_path, append=True)
+    ctx.data['facts_days'] = facts['days']
+    ctx.data['facts_from_empty'] = facts['from_empty']
+    logger.info(f"   ✅ FactTransactions: {facts['loaded']:,} new records over {len(facts['days']):,} day(s)")
+    for name, hits in facts['rule_hits'].items():
+        logger.info(f"   🚩 {name}: {hits:,} hits")
+    return facts['loaded']
+
+
+def _warm_rescore(conn, rule_set, source_db, after, first_ts):
+    """Replay trades scored just before SK after through the window rules, discarding the result"""
+    window = rescore_analysis.warmup_ms(rule_set)
+    if not window or not after:
+        return 0
+    replayed = 0
+    for frame in rescore_analysis.read_trades(conn, where="WHERE ft.TransactionFactSK <= :after "
+                                              "AND TradeTimestampMs >= :since", source_db=source_db,
+                                              params={'after': after, 'since': first_ts - window}):
+        rule_set.evaluate(frame)
+        replayed += len(frame)
+    return replayed
+
+
+def _run_analysis_score(ctx):
+    if ctx.data.get('facts_from_empty'):
+        logger.info("   ⏭️ Every trade was scored as it loaded")
+        return 0
+    # Rules, watchlist or model changed: rescore the warehouse in SK order, one committed chunk at a time.
+    # The checkpoint is named after this run's inputs, so a resume never mixes two rule versions
+    checkpoint = f"analysis.score:{ctx.fingerprints['analysis.score'][:12]}"
+    source_db = ctx.sources['transactions'] if os.path.exists(ctx.sources['transactions']) else None
+    model_dir = anomaly_model.model_dir_for(ctx.db_path)
+    model = anomaly_model.load_model(model_dir=model_dir)
+    with ctx.writer() as conn:
+        rule_set = rule_engine.compile_rules(conn, ctx.rules_path)
+        rule_engine.create_rule_tables(conn, rule_set)
+        if model is not None:
+            anomaly_model.register_model(conn, model, model_dir)
+        after, rows_done, complete = etl.read_checkpoints(conn).get(checkpoint, (0, 0, False))
+        conn.execute(text("DELETE FROM EtlCheckpoints WHERE Stage LIKE 'analysis.score:%' AND Stage != :s"),
+                     {'s': checkpoint})
+    if after and not complete:
+        logger.info(f"   ⏩ Resuming the rescore after TransactionFactSK {after:,}")
+
+    rule_hits, warm = {}, bool(rows_done)
+    while not complete:
+        # Outside a write transaction: the source is attached and detached while reading
+        with ctx.engine.connect() as conn:
+            frames = list(rescore_analysis.read_trades(conn, where="WHERE ft.TransactionFactSK > :after",
+                                                       params={'after': after}, source_db=source_db,
+                                                       chunksize=SCORE_CHUNK, limit=SCORE_CHUNK))
+            if not frames or frames[0].empty:
+                break
+            chunk = frames[0]
+            if warm:
+                # Window rules carry the same state into a resumed rescore as an uninterrupted one
+                first_ts = chunk['TradeTimestampMs'].dropna()
+                if len(first_ts):
+                    _warm_rescore(conn, rule_set, source_db, after, int(first_ts.iloc[0]))
+                warm = False
+        sks = chunk['TransactionFactSK'].to_numpy()
+        with ctx.writer() as conn:
+            trans_df = chunk[['TradeTimestampMs']].rename(columns={'TradeTimestampMs': 'timestamp'})
+            trans_mapped = chunk.drop(columns=['TransactionFactSK', 'TradeTimestampMs'])
+            analysis, result = etl.score_trades(conn, rule_set, trans_df, trans_mapped, sks, model)
+            # Every loaded SK in the range is in this chunk
+            conn.execute(text("DELETE FROM TransactionAnalysis WHERE TransactionFactSK BETWEEN :a AND :b"),
+                         {'a': int(sks[0]), 'b': int(sks[-1])})
+            analysis.to_sql('TransactionAnalysis', conn, if_exists='append', index=False)
+            fact_cache.record_fact_write(conn)
+            rule_engine.record_stats(conn, rule_set, result, 'rescore')
+            after, rows_done = int(sks[-1]), rows_done + len(chunk)
+            etl.save_checkpoint(conn, checkpoint, after, rows_done)
+        for name, hits in result.rule_hits.items():
+            rule_hits[name] = rule_hits.get(name, 0) + hits
+        logger.info(f"   🧮 {rows_done:,} trades rescored (SK {after:,})")
+    with ctx.writer() as conn:
+        etl.save_checkpoint(conn, checkpoint, after, rows_done, complete=True)
+    ctx.data['rescored'] = True
+    for name, hits in rule_hits.items():
+        logger.info(f"   🚩 {name}: {hits:,} hits")
+    return rows_done
+
+
+def _changed_days(ctx):
+    """Days whose facts or scores changed in this run, or None to refresh every hot day"""
+    if ctx.data.get('rescored') or ctx.data.get('facts_from_empty') or 'facts_days' not in ctx.data:
+        return None
+    return sorted(ctx.data['facts_days'])
+
+
+def _aggregate_stage(refresh):
+    def run(ctx):
+        with ctx.writer() as conn:
+            return refresh(conn, _changed_days(ctx))
+    return run
+
+
+def _run_views(ctx):
+    with ctx._write_lock:
+        with ctx.engine.begin() as conn:
+            for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'view' AND name LIKE 'vw\\_%' ESCAPE '\\'")).fetchall():
+                conn.execute(text(f"DROP VIEW {name}"))
+        if not etl.create_analytical_views(ctx.engine):
+            raise RuntimeError("View creation failed")
+
+
+def _run_validate(ctx):
+    if not etl.validate_and_test(ctx.engine):
+        raise RuntimeError("Validation failed")
+    with ctx.writer() as conn:
+        etl.refresh_planner_stats(conn)
+
+
+def _run_fact_cache(ctx):
+    with ctx.engine.connect() as conn:
+        manifest = fact_cache.build_cache(conn, fact_cache.cache_dir_for(ctx.db_path))
+    logger.info(f"   ✅ Fact cache {manifest['version']} built ({manifest['rows']:,} rows)")
+    return manifest['rows']
+
+
+def _run_taint(ctx):
+    with ctx.writer() as conn:
+        taint = taint_propagation.run(conn, source_db=ctx.sources['transactions'])
+    logger.info(f"   ✅ Abuse exposure: {taint['exposed']:,} wallets within "
+                f"{taint_propagation.DEFAULT_MAX_HOPS} hops of {taint['seeds']:,} reported")
+    return taint['written']
+
+
+def build_stages():
+    """The pipeline DAG, in a valid topological order"""
+    return [
+        Stage('schema', _run_schema,
+              inputs=lambda ctx: {'ddl': _code_hash(etl.create_data_warehouse_with_your_schema),
+                                  'partition_grain': ctx.partition_grain}),
+        Stage('dim_time', _dimension_stage(
+                  'DimTime', lambda ctx: etl.extract_dim_time(ctx.sources['time'], ctx.time_limit),
+                  lambda conn, df: etl.transform_dim_time(df)),
+              deps=['schema'],
+              inputs=lambda ctx: {'source': _file_stamp(ctx.sources['time']), 'limit': ctx.time_limit}),
+        Stage('dim_market', _dimension_stage(
+                  'DimMarket', lambda ctx: etl.extract_dim_market(ctx.sources['market']),
+                  lambda conn, df: etl.transform_dim_market(df)),
+              deps=['schema'], inputs=lambda ctx: {'source': _file_stamp(ctx.sources['market'])}),
+        Stage('dim_wallet', _dimension_stage(
+                  'DimWallet', lambda ctx: etl.extract_dim_wallet(ctx.sources['wallet']), etl.transform_dim_wallet),
+              deps=['schema'], inputs=lambda ctx: {'source': _file_stamp(ctx.sources['wallet'])}),
+        Stage('facts.load', _run_facts_load, deps=['dim_time', 'dim_market', 'dim_wallet'],
+              inputs=lambda ctx: {'source': _file_stamp(ctx.sources['transactions']), 'limit': ctx.fact_limit}),
+        # The model may be trained by facts.load, so the recorded fingerprint is taken after the run
+        Stage('analysis.score', _run_analysis_score, deps=['facts.load'], refingerprint=True, follows_upstream=False,
+              inputs=lambda ctx: {'rules': _file_stamp(ctx.rules_path),
+                                  'watchlist': _file_stamp(wallet_screening.WATCHLIST_PATH),
+                                  'model': anomaly_model.latest_version(anomaly_model.model_dir_for(ctx.db_path))}),
+        Stage('daily_summary', _aggregate_stage(etl.refresh_daily_summary), deps=['facts.load', 'analysis.score']),
+        Stage('risk_cube', _aggregate_stage(risk_cube.refresh), deps=['facts.load', 'analysis.score']),
+        Stage('wallet_sketches', _aggregate_stage(wallet_sketches.refresh), deps=['facts.load']),
+        Stage('quantile_sketches', _aggregate_stage(quantile_sketches.refresh), deps=['facts.load', 'analysis.score']),
+        Stage('wallet_leaders', _aggregate_stage(wallet_leaders.refresh), deps=['facts.load']),
+        Stage('views', _run_views, deps=['schema'], inputs=lambda ctx: {'ddl': _code_hash(etl.create_analytical_views)}),
+        Stage('validate', _run_validate, deps=['views', 'daily_summary', 'risk_cube', 'wallet_sketches',
+                                                  'quantile_sketches', 'wallet_leaders']),
+        Stage('fact_cache', _run_fact_cache, deps=['validate'], refingerprint=True,
+              inputs=lambda ctx: {'cache': fact_cache.current_version(fact_cache.cache_dir_for(ctx.db_path))}),
+        Stage('taint', _run_taint, deps=['validate']),
+    ]
+
+
+# --- Scheduler ----------------------------------------------------------------
+
+def stored_fingerprints(db_path):
+    if not os.path.exists(db_path):
+        return {}
+    with create_engine(f'sqlite:///{db_path}').connect() as conn:
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'EtlStageState'")).fetchone()
+        if not exists:
+            return {}
+        return dict(conn.execute(text("SELECT StageName, Fingerprint FROM EtlStageState")).fetchall())
+
+
+def plan(stages, ctx, stored, force=()):
+    """(inputs, fingerprints, stages to run) for this run"""
+    by_name = {s.name: s for s in stages}
+    missing = [d for s in stages for d in s.deps if d not in by_name]
+    if missing:
+        raise ValueError(f"Unknown stage dependencies: {missing}")
+    inputs, fingerprints, runs = {}, {}, {}
+    for stage in stages:
+        inputs[stage.name] = stage.inputs(ctx)
+        fingerprints[stage.name] = _fingerprint(stage, inputs[stage.name], [fingerprints[d] for d in stage.deps])
+        upstream = stage.follows_upstream and any(runs[d] for d in stage.deps)
+        if stage.cached:
+            runs[stage.name] = (upstream or stage.name in force or 'all' in force
+                                or stored.get(stage.name) != fingerprints[stage.name])
+        else:
+            # Provisional: an in-memory stage only passes re-runs through until a dependent claims it
+            runs[stage.name] = upstream
+    # In-memory stages run when any dependent runs
+    for stage in reversed(stages):
+        if not stage.cached:
+            runs[stage.name] = any(runs[s.name] for s in stages if stage.name in s.deps)
+    return inputs, fingerprints, {name for name, run in runs.items() if run}
+
+
+def needs_rebuild(to_run, force=()):
+    """Whether a run must rebuild the warehouse in staging
+
+    Facts carry the keys of the dimensions they were loaded against and facts.load
+    only appends, so a dimension re-run or a forced fact load reloads everything.
+    """
+    return 'schema' in to_run or bool(DIMENSION_STAGES & to_run) or 'facts.load' in force
+
+
+def _record(ctx, stage, fingerprint, seconds, rows):
+    with ctx.writer() as conn:
+        conn.execute(text(STATE_SQL))
+        conn.execute(text(
+            "INSERT OR REPLACE INTO EtlStageState (StageName, Fingerprint, CompletedAt, Seconds, RowsOut) "
+            "VALUES (:n, :f, :at, :s, :r)"),
+            {'n': stage.name, 'f': fingerprint, 'at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+             's': round(seconds, 6), 'r': rows})
+
+
+def critical_path(stages, timings):
+    """Chain of executed stages, ending at the last to finish, each gated by its latest dependency"""
+    if not timings:
+        return []
+    deps = {s.name: [d for d in s.deps if d in timings] for s in stages}
+    path = [max(timings, key=lambda name: timings[name][1])]
+    while deps[path[-1]]:
+        path.append(max(deps[path[-1]], key=lambda name: timings[name][1]))
+    return list(reversed(path))
+
+
+def run_pipeline(ctx, stages, report, workers=DEFAULT_WORKERS, force=()):
+    """Run the DAG; returns (ok, summary)"""
+    stored = stored_fingerprints(ctx.db_path)
+    inputs, fingerprints, to_run = plan(stages, ctx, stored, force)
+    ctx.fingerprints = fingerprints
+    # Recorded fingerprints; they differ from the planned ones only downstream of a refingerprint stage
+    final = {}
+    timings = {}
+    done, failed = set(), []
+    t0 = time.perf_counter()
+
+    def execute(stage):
+        start = time.perf_counter() - t0
+        with report.stage(stage.name) as entry:
+            entry['rows_out'] = stage.run(ctx)
+        return start, time.perf_counter() - t0, entry['rows_out']
+
+    pending = list(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            ready = [s for s in pending if all(d in done for d in s.deps)]
+            while ready and not failed:
+                for stage in ready:
+                    pending.remove(stage)
+                    if stage.name not in to_run:
+                        final[stage.name] = fingerprints[stage.name]
+                        done.add(stage.name)
+                        with report.stage(stage.name) as entry:
+                            entry['status'] = 'skipped'
+                        logger.info(f"⏭️  {stage.name}: unchanged, skipped")
+                    else:
+                        logger.info(f"▶️  {stage.name}")
+                        running[pool.submit(execute, stage)] = stage
+                # Skipped stages complete at once and may unblock others
+                ready = [s for s in pending if all(d in done for d in s.deps)]
+            if not running:
+                # Nothing in flight: the rest are blocked behind a failure
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    start, end, rows = future.result()
+                except Exception as e:
+                    logger.error(f"❌ {stage.name} failed: {e}")
+                    failed.append(stage.name)
+                    continue
+                timings[stage.name] = (start, end)
+                stage_inputs = stage.inputs(ctx) if stage.refingerprint else inputs[stage.name]
+                final[stage.name] = _fingerprint(stage, stage_inputs, [final[d] for d in stage.deps])
+                if stage.cached:
+                    _record(ctx, stage, final[stage.name], end - start, rows)
+                done.add(stage.name)
+                logger.info(f"✅ {stage.name} done in {end - start:.2f}s")
+
+    path = critical_path(stages, timings)
+    summary = {
+        'ran': [s.name for s in stages if s.name in timings],
+        'skipped': [s.name for s in stages if s.name in done and s.name not in timings],
+        'failed': failed,
+        'critical_path': [{'stage': name, 'seconds': round(timings[name][1] - timings[name][0], 6)} for name in path],
+        'wall_seconds': round(time.perf_counter() - t0, 6),
+        'stage_seconds': round(sum(end - start for start, end in timings.values()), 6),
+    }
+    report.metadata['dag'] = summary
+    return not failed and len(done) == len(stages), summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ETL as a DAG of stages, skipping unchanged ones")
+    parser.add_argument('--db', default=etl.DW_PATH)
+    parser.add_argument('--rules', default=rule_engine.RULES_PATH)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Stages run at once')
+    parser.add_argument('--force', action='append', default=[],
+                        help="Re-run this stage and everything downstream (repeatable, or 'all')")
+    parser.add_argument('--partition-grain', choices=fact_partitions.GRAINS,
+                        help='Store FactTransactions in monthly or daily partitions')
+    parser.add_argument('--full', action='store_true', help='Load the full source tables (no extract limits)')
+    parser.add_argument('--dry-run', action='store_true', help='Show which stages would run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    stages = build_stages()
+    unknown = [name for name in args.force if name != 'all' and name not in {s.name for s in stages}]
+    if unknown:
+        print(f"❌ Unknown stage(s): {', '.join(unknown)}")
+        return 1
+
+    ctx = Context(args.db, dict(etl.SOURCE_DBS), None if args.full else etl.TIME_LIMIT,
+                  None if args.full else etl.FACT_LIMIT, args.partition_grain, args.rules)
+    # A rebuild recreates the warehouse file, so that run goes to the staging file
+    _, _, to_run = plan(stages, ctx, stored_fingerprints(args.db), args.force)
+    staged = needs_rebuild(to_run, args.force)
+    if staged:
+        ctx.db_path = warehouse_swap.staging_path(args.db)
+        ctx.connect()
+    if args.dry_run:
+        if staged:
+            print(f"   🟡 Full rebuild into {ctx.db_path}")
+            _, _, to_run = plan(stages, ctx, stored_fingerprints(ctx.db_path), args.force)
+        for stage in stages:
+            mark = '▶️ ' if stage.name in to_run else '⏭️ '
+            print(f"   {mark} {stage.name:<17} <- {', '.join(stage.deps) or '-'}")
+        return 0
+    if staged:
+        logger.info(f"🟡 Full rebuild: building into {ctx.db_path}; {args.db} stays live until publish")
+
+    print(f"🚀 Running the ETL DAG ({len(stages)} stages, {args.workers} at a time)...")
+    # Concurrent stages would blur each other's memory figures
+    report = RunReport('etl', trace_memory=args.workers == 1)
+    ok, summary = run_pipeline(ctx, stages, report, args.workers, args.force)
+    if staged and ok:
+        ctx.engine.dispose()
+        with report.stage('publish'):
+            try:
+                release = warehouse_swap.publish(args.db, ctx.db_path)
+                logger.info(f"✅ Build {release['version']} is live at {args.db}")
+            except ValueError as e:
+                logger.error(f"❌ {e}")
+                ok = False
+    if staged and not ok:
+        logger.error(f"   The live warehouse is unchanged; the next run resumes {ctx.db_path}")
+    etl.write_run_report(report, 'success' if ok else 'failed')
+
+    print(f"\n{'✅' if ok else '❌'} Ran {len(summary['ran'])} stage(s), skipped {len(summary['skipped'])}"
+          + (f", failed: {', '.join(summary['failed'])}" if summary['failed'] else '')
+          + f" in {summary['wall_seconds']:.2f}s ({summary['stage_seconds']:.2f}s of stage time)")
+    if summary['critical_path']:
+        print("🧭 Critical path: " + " → ".join(f"{p['stage']} ({p['seconds']:.2f}s)" for p in summary['critical_path']))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
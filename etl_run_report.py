@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+ETL run reports - per-stage wall time, row counts, throughput and memory
+Each ETL run writes one JSON report; the diff command flags regressions between two runs.
+
+Usage:
+    python etl_run_report.py show reports/etl_run_20240101_020000.json
+    python etl_run_report.py diff reports/base.json reports/new.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_DIR = 'reports'
+REPORT_VERSION = 1
+
+# Stages faster than this are too noisy to flag as regressions
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def _mb(num_bytes):
+    return round(num_bytes / (1024 * 1024), 3)
+
+
+def _process_peak_rss_mb():
+    """Peak resident set size of this process (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return _mb(peak if sys.platform == 'darwin' else peak * 1024)
+
+
+class RunReport:
+    """Collects stage metrics for one pipeline run"""
+
+    def __init__(self, name='etl', trace_memory=True):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.finished_at = None
+        self.status = 'running'
+        self.stages = []
+        self.metadata = {}
+        self._t0 = time.perf_counter()
+        self._owns_tracemalloc = False
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+
+    @contextmanager
+    def stage(self, name, rows_in=None, accumulate=False):
+        """Time a stage; set entry['rows_out'] (and optionally rows_in) inside the block
+
+        With accumulate=True repeated blocks of the same name (e.g. one per chunk)
+        are merged into a single stage entry.
+        """
+        entry = {
+            'name': name,
+            'status': 'success',
+            'seconds': None,
+            'rows_in': rows_in,
+            'rows_out': None,
+            'rows_per_sec': None,
+            'peak_memory_mb': None,
+            'memory_delta_mb': None,
+        }
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            mem_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        try:
+            yield entry
+        except Exception:
+            entry['status'] = 'failed'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            entry['seconds'] = round(elapsed, 6)
+
+            # Throughput is measured on the rows a stage consumed; extract stages only produce
+            rows = entry['rows_in'] if entry['rows_in'] is not None else entry['rows_out']
+            if rows is not None:
+                entry['rows_in'] = int(entry['rows_in']) if entry['rows_in'] is not None else None
+                entry['rows_out'] = int(entry['rows_out']) if entry['rows_out'] is not None else None
+                entry['rows_per_sec'] = round(rows / elapsed, 1) if elapsed > 0 else None
+
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                entry['peak_memory_mb'] = _mb(peak - mem_before)
+                entry['memory_delta_mb'] = _mb(current - mem_before)
+
+            previous = next((s for s in self.stages if s['name'] == name), None) if accumulate else None
+            if previous is None:
+                self.stages.append(entry)
+            else:
+                self._merge(previous, entry)
+
+    @staticmethod
+    def _merge(total, entry):
+        if entry['status'] != 'success':
+            total['status'] = entry['status']
+        total['seconds'] = round(total['seconds'] + entry['seconds'], 6)
+        for key in ('rows_in', 'rows_out'):
+            if entry[key] is not None:
+                total[key] = (total[key] or 0) + entry[key]
+        rows = total['rows_in'] if total['rows_in'] is not None else total['rows_out']
+        if rows is not None and total['seconds'] > 0:
+            total['rows_per_sec'] = round(rows / total['seconds'], 1)
+        if entry['peak_memory_mb'] is not None:
+            total['peak_memory_mb'] = max(total['peak_memory_mb'] or 0, entry['peak_memory_mb'])
+            total['memory_delta_mb'] = round((total['memory_delta_mb'] or 0) + entry['memory_delta_mb'], 3)
+
+    def finish(self, status='success'):
+        """Mark the run complete and stop memory tracing if we started it"""
+        self.status = status
+        self.finished_at = datetime.now().isoformat(timespec='seconds')
+        self.total_seconds = round(time.perf_counter() - self._t0, 6)
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
+
+    def to_dict(self):
+        if self.finished_at is None:
+            self.finish(self.status if self.status != 'running' else 'incomplete')
+        return {
+            'report_version': REPORT_VERSION,
+            'name': self.name,
+            'run_id': self.run_id,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'status': self.status,
+            'total_seconds': self.total_seconds,
+            'process_peak_rss_mb': _process_peak_rss_mb(),
+            'metadata': self.metadata,
+            'stages': self.stages,
+        }
+
+    def write(self, directory=REPORT_DIR):
+        """Write the report as JSON and return its path"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}_run_{self.run_id}.json")
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        return path
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def diff_reports(base, new, threshold=0.25, min_seconds=MIN_REGRESSION_SECONDS):
+    """Compare two reports stage by stage; returns a list of row dicts
+
+    A stage only one run has is marked in 'added'/'removed' rather than in
+    'regressions': with nothing to compare it against it is not a slowdown.
+    """
+    base_stages = {s['name']: s for s in base['stages']}
+    rows = []
+
+    for stage in new['stages']:
+        name = stage['name']
+        old = base_stages.get(name)
+        row = {'name': name, 'base_seconds': None, 'new_seconds': stage['seconds'],
+               'time_change': None, 'base_peak_mb': None, 'new_peak_mb': stage.get('peak_memory_mb'),
+               'memory_change': None, 'regressions': [], 'added': False, 'removed': False}
+
+        if old is None:
+            row['added'] = True
+            rows.append(row)
+            continue
+
+        row['base_seconds'] = old['seconds']
+        row['base_peak_mb'] = old.get('peak_memory_mb')
+
+        slower = stage['seconds'] - (old['seconds'] or 0) > min_seconds
+        if old['seconds']:
+            row['time_change'] = stage['seconds'] / old['seconds'] - 1
+
+        # Judge by throughput when both runs know their row counts, so a bigger
+        # load that takes proportionally longer is not reported as a regression
+        if old.get('rows_per_sec') and stage.get('rows_per_sec'):
+            throughput_change = stage['rows_per_sec'] / old['rows_per_sec'] - 1
+            if throughput_change < -threshold and slower:
+                row['regressions'].append('throughput')
+        elif row['time_change'] is not None and row['time_change'] > threshold and slower:
+            row['regressions'].append('time')
+
+        if old.get('peak_memory_mb') and stage.get('peak_memory_mb') is not None:
+            row['memory_change'] = stage['peak_memory_mb'] / old['peak_memory_mb'] - 1
+            if row['memory_change'] > threshold and stage['peak_memory_mb'] - old['peak_memory_mb'] > 1:
+                row['regressions'].append('memory')
+
+        if stage['status'] != 'success':
+            row['regressions'].append('failed')
+
+        rows.append(row)
+
+    for name in base_stages:
+        if name not in {s['name'] for s in new['stages']}:
+            rows.append({'name': name, 'base_seconds': base_stages[name]['seconds'], 'new_seconds': None,
+                         'time_change': None, 'base_peak_mb': base_stages[name].get('peak_memory_mb'),
+                         'new_peak_mb': None, 'memory_change': None, 'regressions': [],
+                         'added': False, 'removed': True})
+
+    return rows
+
+
+def _fmt_change(change):
+    return '' if change is None else f"{change * 100:+.1f}%"
+
+
+def _fmt_num(value, fmt='{:.3f}'):
+    return '-' if value is None else fmt.format(value)
+
+
+def print_report(report):
+    print(f"📋 {report['name']} run {report['run_id']} ({report['status']})")
+    print(f"   Total: {report['total_seconds']:.2f}s  Peak RSS: {_fmt_num(report.get('process_peak_rss_mb'), '{:.1f}')} MB")
+    print(f"\n{'Stage':<32} {'Seconds':>10} {'Rows in':>12} {'Rows out':>12} {'Rows/s':>12} {'Peak MB':>9} {'Δ MB':>9}")
+    print("-" * 100)
+    for s in report['stages']:
+        print(f"{s['name']:<32} {s['seconds']:>10.3f} {_fmt_num(s['rows_in'], '{:,}'):>12} "
+              f"{_fmt_num(s['rows_out'], '{:,}'):>12} {_fmt_num(s['rows_per_sec'], '{:,.0f}'):>12} "
+              f"{_fmt_num(s['peak_memory_mb'], '{:.1f}'):>9} {_fmt_num(s['memory_delta_mb'], '{:.1f}'):>9}")
+
+
+def print_diff(rows, base, new):
+    print(f"🔍 Comparing {base['run_id']} -> {new['run_id']}")
+    print(f"\n{'Stage':<32} {'Base s':>10} {'New s':>10} {'Δ time':>9} {'Base MB':>9} {'New MB':>9} {'Δ mem':>9}  Flags")
+    print("-" * 110)
+    for r in rows:
+        if r['regressions']:
+            flag = '❌ ' + ', '.join(r['regressions'])
+        elif r['added'] or r['removed']:
+            flag = '➕ new stage' if r['added'] else '➖ removed stage'
+        else:
+            flag = '✅'
+        print(f"{r['name']:<32} {_fmt_num(r['base_seconds']):>10} {_fmt_num(r['new_seconds']):>10} "
+              f"{_fmt_change(r['time_change']):>9} {_fmt_num(r['base_peak_mb'], '{:.1f}'):>9} "
+              f"{_fmt_num(r['new_peak_mb'], '{:.1f}'):>9} {_fmt_change(r['memory_change']):>9}  {flag}")
+
+    total_change = new['total_seconds'] / base['total_seconds'] - 1 if base['total_seconds'] else 0
+    print(f"\nTotal: {base['total_seconds']:.2f}s -> {new['total_seconds']:.2f}s ({_fmt_change(total_change)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and compare ETL run reports")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    show = sub.add_parser('show', help='Print a run report')
+    show.add_argument('report')
+
+    diff = sub.add_parser('diff', help='Compare two run reports and flag regressions')
+    diff.add_argument('base')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=0.25,
+                      help='Relative slowdown/memory growth that counts as a regression (default 0.25)')
+
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        print_report(load_report(args.report))
+        return 0
+
+    base, new = load_report(args.base), load_report(args.new)
+    rows = diff_reports(base, new, threshold=args.threshold)
+    print_diff(rows, base, new)
+
+    added = [r['name'] for r in rows if r['added']]
+    removed = [r['name'] for r in rows if r['removed']]
+    if added or removed:
+        print()
+    if added:
+        print(f"➕ {len(added)} stage(s) only in the new run: {', '.join(added)}")
+    if removed:
+        print(f"➖ {len(removed)} stage(s) only in the base run: {', '.join(removed)}")
+
+    regressions = [r for r in rows if r['regressions']]
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} stage(s) regressed")
+        return 1
+    print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Shared memory-mapped columnar fact cache
+The ETL writes one .npy file per fact column into a versioned build directory and
+atomically points manifest.json at it. Every dashboard worker opens the arrays with
+mmap_mode='r', so the pages live once in the OS page cache and are shared by all
+sessions and processes instead of each holding its own pandas copy.
+
+Every writer of FactTransactions or TransactionAnalysis (loads, stream batches,
+rescoring, archival, partition drops, dedup) bumps FactWriteState.Writes. The row
+also holds a random BuildId, created with the warehouse file, so a rebuilt
+warehouse published over the live one never shares a write count with it. A cache
+build records the BuildId and count it was read at, and current_version() given a
+warehouse connection ignores a build whose BuildId or count no longer matches, so
+readers fall back to SQL until the cache is rebuilt.
+
+Usage:
+    python fact_cache.py build
+    python fact_cache.py info
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fixed_point
+import warehouse_codes
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+CACHE_DIR = 'data/fact_cache'
+MANIFEST = 'manifest.json'
+
+BUILD_CHUNK = 500_000
+
+# Stand-in for NULL in the integer amount columns
+NULL_INT = np.iinfo(np.int64).min
+
+# Column name -> dtype of the cached array
+COLUMNS = {
+    'transaction_sk': np.int64,
+    'price_cents': np.int64,
+    'volume_quote_cents': np.int64,
+    'size_base_sat': np.int64,
+    'side_code': np.int8,       # warehouse SideCode, -1 when unknown
+    'time_key': np.int32,
+    'wallet_key': np.int32,
+    'day': np.int32,            # days since 1970-01-01
+    'anomaly_score': np.float32,
+    'risk_code': np.int8,       # warehouse RiskCode, -1 when unscored
+    'is_suspicious': np.int8,
+}
+
+FACT_WRITES_SQL = """CREATE TABLE IF NOT EXISTS FactWriteState (
+    Id INTEGER PRIMARY KEY CHECK (Id = 1),
+    BuildId VARCHAR(32) NOT NULL DEFAULT (lower(hex(randomblob(16)))),
+    Writes INTEGER NOT NULL,
+    UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+BUILD_SQL = """
+    SELECT ft.TransactionFactSK, ft.PriceCents, ft.VolumeQuoteCents, ft.SizeBaseSat, ft.SideCode,
+           ft.TimeKey, ft.WalletKey, dt.Date, ta.AnomalyScore, ta.RiskCode, ta.IsSuspicious
+    FROM FactTransactions ft
+    LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
+"""
+
+
+def record_fact_write(conn):
+    """Mark the facts as changed, so cache builds taken before now stop being used"""
+    conn.execute(text(FACT_WRITES_SQL))
+    conn.execute(text(
+        "INSERT INTO FactWriteState (Id, Writes) VALUES (1, 1) "
+        "ON CONFLICT(Id) DO UPDATE SET Writes = Writes + 1, UpdatedAt = CURRENT_TIMESTAMP"))
+
+
+def write_state(conn):
+    """(BuildId, fact writes) of the warehouse file, or (None, 0) before the first write"""
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FactWriteState'")).fetchone() is None:
+        return None, 0
+    row = conn.execute(text("SELECT BuildId, Writes FROM FactWriteState WHERE Id = 1")).fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def fact_writes(conn):
+    """How many fact writes the warehouse has recorded (0 before the first)"""
+    return write_state(conn)[1]
+
+
+def _encode_chunk(chunk):
+    """Map one SQL chunk to the cached column arrays"""
+    days = pd.to_datetime(chunk['Date'], errors='coerce').values.astype('datetime64[D]')
+    return {
+        'transaction_sk': chunk['TransactionFactSK'].to_numpy(),
+        'price_cents': chunk['PriceCents'].astype('Int64').to_numpy(dtype=np.int64, na_value=NULL_INT),
+        'volume_quote_cents': chunk['VolumeQuoteCents'].astype('Int64').to_numpy(dtype=np.int64, na_value=NULL_INT),
+        'size_base_sat': chunk['SizeBaseSat'].astype('Int64').to_numpy(dtype=np.int64, na_value=NULL_INT),
+        'side_code': chunk['SideCode'].fillna(-1).to_numpy(),
+        'time_key': chunk['TimeKey'].fillna(0).to_numpy(),
+        'wallet_key': chunk['WalletKey'].fillna(0).to_numpy(),
+        'day': np.where(np.isnat(days), np.datetime64('1970-01-01'), days).astype(np.int64),
+        'anomaly_score': chunk['AnomalyScore'].to_numpy(dtype=np.float64, na_value=np.nan),
+        'risk_code': chunk['RiskCode'].fillna(-1).to_numpy(),
+        'is_suspicious': chunk['IsSuspicious'].fillna(0).to_numpy(),
+    }
+
+
+def build_cache(conn, cache_dir=CACHE_DIR, chunk_size=BUILD_CHUNK):
+    """Write a new cache build from the warehouse and make it current; returns the manifest"""
+    build_id, writes = write_state(conn)
+    row_count = conn.execute(text("SELECT COUNT(*) FROM FactTransactions")).scalar()
+    version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    build_dir = os.path.join(cache_dir, version)
+    os.makedirs(build_dir, exist_ok=True)
+
+    arrays = {name: np.lib.format.open_memmap(os.path.join(build_dir, f"{name}.npy"), mode='w+',
+                                              dtype=dtype, shape=(row_count,))
+              for name, dtype in COLUMNS.items()}
+
+    # Stream the warehouse in chunks so memory stays bounded by chunk_size
+    offset = 0
+    for chunk in pd.read_sql(text(BUILD_SQL), conn, chunksize=chunk_size):
+        chunk = chunk.iloc[:row_count - offset]
+        for name, values in _encode_chunk(chunk).items():
+            arrays[name][offset:offset + len(chunk)] = values
+        offset += len(chunk)
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    manifest = {
+        'version': version,
+        'directory': version,
+        'rows': int(offset),
+        'warehouse_build': build_id,
+        'fact_writes': writes,
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'columns': {name: np.dtype(dtype).name for name, dtype in COLUMNS.items()},
+        # Names for the coded columns, indexed by code
+        'categories': {
+            'side_code': _code_names(conn, 'Side'),
+            'risk_code': _code_names(conn, 'RiskLevel'),
+        },
+    }
+    tmp_path = os.path.join(cache_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST))
+
+    _remove_old_builds(cache_dir, keep=version)
+    return manifest
+
+
+def _code_names(conn, name_column):
+    known = warehouse_codes.lookup_frame(conn, name_column)
+    names = [None] * (int(known['code'].max()) + 1 if len(known) else 0)
+    for code, name in known.itertuples(index=False):
+        names[code] = name
+    return names
+
+
+def _remove_old_builds(cache_dir, keep):
+    """Delete superseded builds; processes that still map them keep their open files on POSIX"""
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name != keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def cache_dir_for(db_path):
+    """Cache directory that belongs to a warehouse file"""
+    return os.path.join(os.path.dirname(db_path) or '.', 'fact_cache')
+
+
+def current_version(cache_dir=CACHE_DIR, conn=None):
+    """Version of the current build, or None when no cache has been built
+
+    Given a connection to the warehouse, a build taken from another warehouse file
+    or before its latest fact write is treated as missing too.
+    """
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+        version = manifest['version']
+    except (OSError, ValueError, KeyError):
+        return None
+    if conn is not None and [manifest.get('warehouse_build'), manifest.get('fact_writes')] != list(write_state(conn)):
+        return None
+    return version
+
+
+class FactCache:
+    """Read-only, zero-copy view over one cache build"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['version']
+        self.categories = self.manifest['categories']
+        build_dir = os.path.join(cache_dir, self.manifest['directory'])
+        self.columns = {name: np.load(os.path.join(build_dir, f"{name}.npy"), mmap_mode='r')
+                        for name in self.manifest['columns']}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def day_mask(self, start_date=None, end_date=None):
+        """Boolean mask for a date range, or None for everything"""
+        if start_date is None and end_date is None:
+            return None
+        day = self.columns['day']
+        mask = np.ones(len(day), dtype=bool)
+        if start_date is not None:
+            mask &= day >= np.datetime64(str(start_date)[:10], 'D').astype(np.int64)
+        if end_date is not None:
+            mask &= day <= np.datetime64(str(end_date)[:10], 'D').astype(np.int64)
+        return mask
+
+    def _col(self, name, mask):
+        return self.columns[name] if mask is None else self.columns[name][mask]
+
+    def summary_stats(self, start_date=None, end_date=None):
+        """KPI card values, matching the keys of the dashboard's SQL summary"""
+        mask = self.day_mask(start_date, end_date)
+        price = self._col('price_cents', mask)
+        volume = self._col('volume_quote_cents', mask)
+        valid_price = price[price != NULL_INT]
+        # Sums are exact in int64 cents; only the final division is floating point
+        cents = fixed_point.CENTS_PER_USD
+        return {
+            'total_transactions': int(len(price)),
+            'total_volume': int(volume[volume != NULL_INT].sum()) / cents,
+            'suspicious_transactions': int(np.count_nonzero(self._col('is_suspicious', mask) == 1)),
+            'min_price': int(valid_price.min()) / cents if len(valid_price) else 0,
+            'max_price': int(valid_price.max()) / cents if len(valid_price) else 0,
+            'avg_price': int(valid_price.sum()) / len(valid_price) / cents if len(valid_price) else 0,
+        }
+
+    def risk_level_counts(self, start_date=None, end_date=None):
+        """Trades per RiskLevel over the full population"""
+        levels = self.categories['risk_code']
+        codes = self._col('risk_code', self.day_mask(start_date, end_date))
+        counts = np.bincount(codes[codes >= 0], minlength=len(levels))
+        return pd.Series(counts, index=levels, name='Count')
+
+    def side_suspicious_counts(self, start_date=None, end_date=None):
+        """Trades per (Side, IsSuspicious), like groupby(['Side', 'IsSuspicious']).size()"""
+        sides = self.categories['side_code']
+        mask = self.day_mask(start_date, end_date)
+        side = self._col('side_code', mask).astype(np.int64)
+        suspicious = self._col('is_suspicious', mask).astype(np.int64)
+        keep = side >= 0
+        counts = np.bincount(side[keep] * 2 + suspicious[keep], minlength=len(sides) * 2)
+        rows = [(sides[i // 2], i % 2, int(c)) for i, c in enumerate(counts) if c]
+        return pd.DataFrame(rows, columns=['Side', 'IsSuspicious', 'Count'])
+
+    def price_histogram(self, bins=50, start_date=None, end_date=None):
+        """Histogram of trade prices in USD as (counts, bin_edges)"""
+        price = self._col('price_cents', self.day_mask(start_date, end_date))
+        return np.histogram(price[price != NULL_INT] / fixed_point.CENTS_PER_USD, bins=bins)
+
+    def distinct_wallets(self, start_date=None, end_date=None):
+        wallets = self._col('wallet_key', self.day_mask(start_date, end_date))
+        return int(np.count_nonzero(np.bincount(wallets))) if len(wallets) else 0
+
+
+def open_cache(cache_dir=CACHE_DIR):
+    """FactCache for the current build, or None when there is no usable cache"""
+    if current_version(cache_dir) is None:
+        return None
+    try:
+        return FactCache(cache_dir)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️ Fact cache unavailable: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped fact cache")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    parser.add_argument('--cache-dir', help='Cache directory (default: fact_cache next to the warehouse)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Rebuild the cache from the warehouse')
+    sub.add_parser('info', help='Show the current build and KPI aggregates')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cache_dir = args.cache_dir or cache_dir_for(args.db)
+
+    if args.command == 'build':
+        engine = create_engine(f'sqlite:///{args.db}')
+        start = time.perf_counter()
+        with engine.connect() as conn:
+            manifest = build_cache(conn, cache_dir)
+        print(f"✅ Fact cache {manifest['version']}: {manifest['rows']:,} rows in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    cache = open_cache(cache_dir)
+    if cache is None:
+        print(f"❌ No fact cache in {cache_dir}; run: python fact_cache.py build")
+        return 1
+    if os.path.exists(args.db):
+        with create_engine(f'sqlite:///{args.db}').connect() as conn:
+            if current_version(cache_dir, conn) is None:
+                print("⚠️ The warehouse's facts changed since this build; readers use SQL until it is rebuilt")
+
+    size_mb = sum(a.nbytes for a in cache.columns.values()) / (1024 * 1024)
+    print(f"📦 Fact cache {cache.version}: {len(cache):,} rows, {len(cache.columns)} columns, {size_mb:.1f} MB")
+    start = time.perf_counter()
+    stats = cache.summary_stats()
+    print(f"⏱️ KPI aggregates in {(time.perf_counter() - start) * 1000:.2f} ms")
+    for key, value in stats.items():
+        print(f"   {key}: {value:,.2f}" if isinstance(value, float) else f"   {key}: {value:,}")
+    print(cache.risk_level_counts().to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Time-partitioned FactTransactions
+Trades live in one table per month (or day) named FactTransactions_pYYYYMM[DD].
+FactTransactions itself becomes a UNION ALL view over the partitions, so existing
+views and dashboard queries keep working, while date-bounded queries are routed
+to only the partitions they need and retention is a DROP TABLE per partition.
+
+TransactionAnalysis is not partitioned: every scorer writes it by TransactionFactSK.
+Dropping a partition therefore also deletes its analysis rows through
+idx_analysis_factsk. That costs about as much as deleting that many rows, not a
+table drop, though nothing else is scanned.
+
+Every partition carries its own unique TradeID index, so TradeIDs are unique across
+partitions only while a trade's date, and so its partition, does not change.
+Replays keep the source timestamp. An on_conflict='update' correction that moves a
+trade to another period is handled by insert_facts: it deletes the old row and
+reuses its TransactionFactSK.
+
+Usage:
+    python fact_partitions.py migrate --grain month     # convert an existing warehouse
+    python fact_partitions.py list
+    python fact_partitions.py drop --before 2024-01-01  # drop whole partitions before a date
+"""
+
+import argparse
+import logging
+import re
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_cache
+import trade_dedup
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+FACT_TABLE = 'FactTransactions'
+TEMPLATE_TABLE = 'FactTransactions_template'
+PARTITION_PREFIX = 'FactTransactions_p'
+DEFAULT_PARTITION = 'FactTransactions_pdefault'
+
+GRAINS = ('month', 'day')
+
+CATALOG_SQL = [
+    """CREATE TABLE IF NOT EXISTS FactPartitions (
+        PartitionName VARCHAR(64) PRIMARY KEY,
+        Grain VARCHAR(10) NOT NULL,
+        PeriodStart DATE,
+        PeriodEnd DATE,
+        RowCount INTEGER DEFAULT 0,
+        CreatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS FactPartitionMeta (
+        MetaKey VARCHAR(32) PRIMARY KEY,
+        MetaValue VARCHAR(64)
+    )""",
+]
+
+
+def _parse_date(value):
+    """Accept date objects or ISO strings; everything that reaches SQL text goes through here"""
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def period_bounds(day, grain):
+    """First and last date of the period containing day"""
+    day = _parse_date(day)
+    if grain == 'day':
+        return day, day
+    start = day.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1)
+
+
+def partition_name(day, grain):
+    day = _parse_date(day)
+    suffix = day.strftime('%Y%m') if grain == 'month' else day.strftime('%Y%m%d')
+    return PARTITION_PREFIX + suffix
+
+
+def is_partitioned(conn):
+    row = conn.execute(text(
+        "SELECT type FROM sqlite_master WHERE name = :name"), {'name': FACT_TABLE}).fetchone()
+    return row is not None and row[0] == 'view'
+
+
+def get_grain(conn):
+    if not is_partitioned(conn):
+        return None
+    row = conn.execute(text("SELECT MetaValue FROM FactPartitionMeta WHERE MetaKey = 'grain'")).fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(conn):
+    return pd.read_sql(text("SELECT * FROM FactPartitions ORDER BY PeriodStart IS NULL, PeriodStart"), conn)
+
+
+def _fact_columns(conn):
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({TEMPLATE_TABLE})"))]
+
+
+def _create_partition_table(conn, name):
+    """Create a partition with the template's columns and indexes"""
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name = :t"),
+                       {'t': TEMPLATE_TABLE}).scalar()
+    # Surrogate keys are allocated by the router so they stay unique across partitions
+    ddl = ddl.replace(TEMPLATE_TABLE, name, 1).replace('AUTOINCREMENT', '')
+    conn.execute(text(ddl))
+
+    index_rows = conn.execute(text(
+        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name = :t AND sql IS NOT NULL"),
+        {'t': TEMPLATE_TABLE}).fetchall()
+    for index_name, index_sql in index_rows:
+        new_index = index_name.replace('_template', '') + '_' + name[len(PARTITION_PREFIX):]
+        index_sql = index_sql.replace(index_name, new_index, 1)
+        index_sql = re.sub(rf'\bON\s+{TEMPLATE_TABLE}\b', f'ON {name}', index_sql)
+        conn.execute(text(index_sql))
+
+
+def _rebuild_union_view(conn):
+    """Point the FactTransactions view at the current set of partitions"""
+    columns = ', '.join(_fact_columns(conn))
+    names = [row[0] for row in conn.execute(text("SELECT PartitionName FROM FactPartitions ORDER BY PartitionName"))]
+    arms = [f"SELECT {columns} FROM {name}" for name in names] or [f"SELECT {columns} FROM {TEMPLATE_TABLE}"]
+    conn.execute(text(f"DROP VIEW IF EXISTS {FACT_TABLE}"))
+    conn.execute(text(f"CREATE VIEW {FACT_TABLE} AS\n" + "\nUNION ALL\n".join(arms)))
+
+
+def _ensure_partition(conn, day, grain):
+    """Create the partition for a day (or the default partition for None) if missing"""
+    if day is None:
+        name, start, end = DEFAULT_PARTITION, None, None
+    else:
+        name = partition_name(day, grain)
+        start, end = period_bounds(day, grain)
+
+    exists = conn.execute(text("SELECT 1 FROM FactPartitions WHERE PartitionName = :n"), {'n': name}).fetchone()
+    if exists:
+        return name, False
+
+    _create_partition_table(conn, name)
+    conn.execute(text(
+        "INSERT INTO FactPartitions (PartitionName, Grain, PeriodStart, PeriodEnd, RowCount) "
+        "VALUES (:n, :g, :s, :e, 0)"),
+        {'n': name, 'g': grain, 's': start and start.isoformat(), 'e': end and end.isoformat()})
+    return name, True
+
+
+def enable_partitioning(conn, grain='month'):
+    """Convert FactTransactions from a table into routed partitions (idempotent)"""
+    if grain not in GRAINS:
+        raise ValueError(f"grain must be one of {GRAINS}")
+
+    for stmt in CATALOG_SQL:
+        conn.execute(text(stmt))
+
+    if is_partitioned(conn):
+        current = get_grain(conn)
+        if current != grain:
+            raise ValueError(f"Warehouse is already partitioned by {current}")
+        return 0
+
+    # Keep an empty copy of the fact table as the template for new partitions
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name = :t"),
+                       {'t': FACT_TABLE}).scalar()
+    conn.execute(text(re.sub(rf'\b{FACT_TABLE}\b', TEMPLATE_TABLE, ddl, count=1)))
+    for index_name, index_sql in conn.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name = :t AND sql IS NOT NULL"),
+            {'t': FACT_TABLE}).fetchall():
+        index_sql = index_sql.replace(index_name, index_name + '_template', 1)
+        conn.execute(text(re.sub(rf'\bON\s+{FACT_TABLE}\b', f'ON {TEMPLATE_TABLE}', index_sql)))
+
+    next_sk = conn.execute(text(f"SELECT COALESCE(MAX(TransactionFactSK), 0) + 1 FROM {FACT_TABLE}")).scalar()
+    conn.execute(text("INSERT OR REPLACE INTO FactPartitionMeta VALUES ('grain', :g)"), {'g': grain})
+    conn.execute(text("INSERT OR REPLACE INTO FactPartitionMeta VALUES ('next_sk', :v)"), {'v': str(next_sk)})
+
+    # Move existing rows, one partition at a time
+    columns = ', '.join(f"ft.{c}" for c in _fact_columns(conn))
+    days = [row[0] for row in conn.execute(text(
+        f"SELECT DISTINCT dt.Date FROM {FACT_TABLE} ft LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey"))]
+    periods = {}
+    for day in days:
+        key = None if day is None else period_bounds(day, grain)
+        periods.setdefault(key, []).append(day)
+
+    moved = 0
+    for key in periods:
+        name, _ = _ensure_partition(conn, key[0] if key else None, grain)
+        if key is None:
+            where = "dt.Date IS NULL"
+            params = {}
+        else:
+            where = "dt.Date BETWEEN :start AND :end"
+            params = {'start': key[0].isoformat(), 'end': key[1].isoformat()}
+        result = conn.execute(text(
+            f"INSERT INTO {name} SELECT {columns} FROM {FACT_TABLE} ft "
+            f"LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey WHERE {where}"), params)
+        conn.execute(text("UPDATE FactPartitions SET RowCount = RowCount + :n WHERE PartitionName = :p"),
+                     {'n': result.rowcount, 'p': name})
+        moved += result.rowcount
+
+    conn.execute(text(f"DROP TABLE {FACT_TABLE}"))
+    _rebuild_union_view(conn)
+    logger.info(f"   ✅ FactTransactions partitioned by {grain}: {moved:,} rows in {len(periods)} partitions")
+    return moved
+
+
+def insert_facts(conn, facts, trade_dates, on_conflict='ignore'):
+    """Append mapped fact rows, routing each row to its period's partition
+
+    facts is a FactTransactions-shaped DataFrame without TransactionFactSK;
+    trade_dates is aligned with it. Returns the TransactionFactSK of each row: 0 for
+    a TradeID that was already loaded (on_conflict='ignore'), or the existing SK of
+    the row it updated (on_conflict='update'). An update that changes a trade's
+    period moves it to the new partition under its existing SK.
+    """
+    grain = get_grain(conn)
+    if grain is None:
+        raise RuntimeError("FactTransactions is not partitioned; call enable_partitioning() first")
+
+    next_sk = int(conn.execute(text("SELECT MetaValue FROM FactPartitionMeta WHERE MetaKey = 'next_sk'")).scalar())
+    facts = facts.reset_index(drop=True).copy()
+    facts.insert(0, 'TransactionFactSK', range(next_sk, next_sk + len(facts)))
+
+    trade_dates = pd.to_datetime(pd.Series(list(trade_dates)), errors='coerce')
+    if grain == 'month':
+        keys = trade_dates.dt.strftime('%Y-%m-01')
+    else:
+        keys = trade_dates.dt.strftime('%Y-%m-%d')
+
+    if on_conflict == 'update':
+        targets = [partition_name(key, grain) if isinstance(key, str) else DEFAULT_PARTITION for key in keys]
+        moved = _take_moved_trades(conn, facts['TradeID'], targets)
+        facts['TransactionFactSK'] = np.where(moved > 0, moved, facts['TransactionFactSK'])
+
+    created = False
+    sks = facts['TransactionFactSK'].copy()
+    method = trade_dedup.insert_method(on_conflict)
+    for key, rows in facts.groupby(keys.fillna(''), sort=True):
+        name, new = _ensure_partition(conn, key or None, grain)
+        created = created or new
+        written = rows.to_sql(name, conn, if_exists='append', index=False, method=method)
+        # DO NOTHING counts only new rows; DO UPDATE also counts rows updated in place,
+        # which keep their existing SK instead of the one assigned here
+        added = written
+        if written != len(rows) or on_conflict == 'update':
+            found = trade_dedup.trade_sks(conn, name, rows['TradeID'])
+            assigned = rows['TransactionFactSK'].to_numpy()
+            sks.loc[rows.index] = found if on_conflict == 'update' else np.where(found == assigned, found, 0)
+            if on_conflict == 'update':
+                added = int((found == assigned).sum())
+        conn.execute(text("UPDATE FactPartitions SET RowCount = RowCount + :n WHERE PartitionName = :p"),
+                     {'n': added, 'p': name})
+
+    conn.execute(text("UPDATE FactPartitionMeta SET MetaValue = :v WHERE MetaKey = 'next_sk'"),
+                 {'v': str(next_sk + len(facts))})
+    if created:
+        _rebuild_union_view(conn)
+    return sks
+
+
+def _take_moved_trades(conn, trade_ids, targets):
+    """Delete loaded trades that now belong to another partition; returns their SKs (0 where not moved)
+
+    The target partition's unique index cannot see a row held by another partition,
+    so the old row is removed and the caller re-inserts the trade under its SK.
+    """
+    names = list(list_partitions(conn)['PartitionName'])
+    batch = pd.DataFrame({'TradeID': np.asarray(trade_ids, dtype=np.int64), 'Target': targets})
+    if not names or batch.empty:
+        return np.zeros(len(batch), dtype=np.int64)
+    batch[['TradeID']].to_sql('_moved_trade_ids', conn, if_exists='replace', index=False)
+    found = pd.read_sql(text(" UNION ALL ".join(
+        f"SELECT TradeID, TransactionFactSK, '{name}' AS PartitionName FROM {name} "
+        f"WHERE TradeID IN (SELECT TradeID FROM _moved_trade_ids)" for name in names)), conn)
+    conn.execute(text("DROP TABLE _moved_trade_ids"))
+
+    moved = found.merge(batch, on='TradeID')
+    moved = moved[moved['PartitionName'] != moved['Target']]
+    for name, rows in moved.groupby('PartitionName'):
+        sks = ','.join(str(int(sk)) for sk in rows['TransactionFactSK'])
+        deleted = conn.execute(text(f"DELETE FROM {name} WHERE TransactionFactSK IN ({sks})")).rowcount
+        conn.execute(text("UPDATE FactPartitions SET RowCount = RowCount - :n WHERE PartitionName = :p"),
+                     {'n': deleted, 'p': name})
+    if len(moved):
+        logger.info(f"   ↪️ {len(moved):,} corrected trade(s) moved to another partition")
+    return batch['TradeID'].map(moved.set_index('TradeID')['TransactionFactSK']).fillna(0).to_numpy(dtype=np.int64)
+
+
+def partitions_for_range(conn, start_date, end_date):
+    """Partitions overlapping [start_date, end_date], with whether each is fully covered"""
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    rows = conn.execute(text(
+        "SELECT PartitionName, PeriodStart, PeriodEnd FROM FactPartitions "
+        "WHERE PeriodStart <= :end AND PeriodEnd >= :start ORDER BY PeriodStart"),
+        {'start': start.isoformat(), 'end': end.isoformat()}).fetchall()
+    return [(name, _parse_date(p_start) >= start and _parse_date(p_end) <= end) for name, p_start, p_end in rows]
+
+
+def fact_range_sql(conn, start_date, end_date):
+    """A FactTransactions-shaped subquery restricted to a date range
+
+    On a partitioned warehouse only the overlapping partitions are read, and only the
+    edge partitions need the DimTime date filter. Works on unpartitioned warehouses too.
+    """
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    date_filter = (f"TimeKey IN (SELECT TimeKey FROM DimTime "
+                   f"WHERE Date BETWEEN '{start.isoformat()}' AND '{end.isoformat()}')")
+
+    if not is_partitioned(conn):
+        return f"(SELECT * FROM {FACT_TABLE} WHERE {date_filter})"
+
+    columns = ', '.join(_fact_columns(conn))
+    arms = []
+    for name, fully_covered in partitions_for_range(conn, start, end):
+        arm = f"SELECT {columns} FROM {name}"
+        arms.append(arm if fully_covered else f"{arm} WHERE {date_filter}")
+    if not arms:
+        arms = [f"SELECT {columns} FROM {TEMPLATE_TABLE}"]
+    return "(" + " UNION ALL ".join(arms) + ")"
+
+
+def range_view_sql(conn, view_name, start_date, end_date):
+    """The body of an analytical view with FactTransactions limited to a date range"""
+    body = conn.execute(text("SELECT sql FROM sqlite_master WHERE type='view' AND name = :v"),
+                        {'v': view_name}).scalar()
+    if body is None:
+        raise ValueError(f"Unknown view: {view_name}")
+    select = re.sub(r'^\s*CREATE\s+VIEW\s+\w+\s+AS\s+', '', body, flags=re.I | re.S)
+    return re.sub(rf'\b{FACT_TABLE}\b(?!_)', fact_range_sql(conn, start_date, end_date), select)
+
+
+def drop_partition(conn, name):
+    """Drop a partition and its analysis rows; aggregates such as DailySummary are kept
+
+    The partition itself is a DROP TABLE; its TransactionAnalysis rows are an indexed
+    delete, proportional to the partition's row count.
+    """
+    row = conn.execute(text("SELECT RowCount, PeriodStart, PeriodEnd FROM FactPartitions WHERE PartitionName = :n"),
+                       {'n': name}).fetchone()
+    if row is None:
+        raise ValueError(f"Unknown partition: {name}")
+    # Imported here: warehouse_validation imports this module
+    import warehouse_validation
+    warehouse_validation.forget_days(conn, row[1], row[2])
+    fact_cache.record_fact_write(conn)
+
+    conn.execute(text(
+        f"DELETE FROM TransactionAnalysis WHERE TransactionFactSK IN (SELECT TransactionFactSK FROM {name})"))
+    conn.execute(text("DELETE FROM FactPartitions WHERE PartitionName = :n"), {'n': name})
+    _rebuild_union_view(conn)
+    conn.execute(text(f"DROP TABLE {name}"))
+    logger.info(f"   🗑️ Dropped {name} ({row[0]:,} rows)")
+    return row[0]
+
+
+def drop_partitions_before(conn, cutoff):
+    """Drop every partition that ends before the cutoff date"""
+    cutoff = _parse_date(cutoff)
+    names = [r[0] for r in conn.execute(text(
+        "SELECT PartitionName FROM FactPartitions WHERE PeriodEnd < :c ORDER BY PeriodStart"),
+        {'c': cutoff.isoformat()})]
+    return {name: drop_partition(conn, name) for name in names}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage time partitions of FactTransactions")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    migrate = sub.add_parser('migrate', help='Partition an existing FactTransactions table')
+    migrate.add_argument('--grain', choices=GRAINS, default='month')
+    sub.add_parser('list', help='Show partitions and row counts')
+    drop = sub.add_parser('drop', help='Drop partitions')
+    drop.add_argument('--before', help='Drop partitions that end before this date (YYYY-MM-DD)')
+    drop.add_argument('--name', help='Drop a single partition by name')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    engine = create_engine(f'sqlite:///{args.db}')
+    with engine.begin() as conn:
+        if args.command == 'migrate':
+            print(f"🧱 Partitioning FactTransactions by {args.grain}...")
+            enable_partitioning(conn, args.grain)
+        elif args.command == 'drop':
+            if not is_partitioned(conn):
+                print("❌ FactTransactions is not partitioned")
+                return 1
+            if args.name:
+                drop_partition(conn, args.name)
+            elif args.before:
+                dropped = drop_partitions_before(conn, args.before)
+                print(f"🗑️ Dropped {len(dropped)} partitions ({sum(dropped.values()):,} rows)")
+            else:
+                parser.error('drop needs --before or --name')
+            # Imported here: the ETL imports this module
+            import schema_matched_etl
+            schema_matched_etl.refresh_planner_stats(conn)
+
+        if not is_partitioned(conn):
+            print("ℹ️ FactTransactions is not partitioned")
+            return 0
+        partitions = list_partitions(conn)
+        print(f"\n📦 {len(partitions)} partitions (grain: {get_grain(conn)})")
+        print(partitions.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
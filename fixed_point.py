@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Fixed-point integer amounts
+USD amounts are stored as integer cents and BTC amounts as integer satoshi, so
+storage, rollups and rule checks are exact int64 arithmetic instead of REAL.
+The analytical views divide back to decimals; loaders that read the tables
+directly use decode_amounts().
+
+Usage:
+    python fixed_point.py
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+CENTS_PER_USD = 100
+SAT_PER_BTC = 100_000_000
+
+# Decimal column -> (integer column, units per whole amount)
+FIXED_COLUMNS = {
+    'Price': ('PriceCents', CENTS_PER_USD),
+    'VolumeQuote': ('VolumeQuoteCents', CENTS_PER_USD),
+    'SizeBase': ('SizeBaseSat', SAT_PER_BTC),
+    'TotalVolumeUSD': ('TotalVolumeCents', CENTS_PER_USD),
+    'AvgPrice': ('AvgPriceCents', CENTS_PER_USD),
+    'MaxPrice': ('MaxPriceCents', CENTS_PER_USD),
+    'MinPrice': ('MinPriceCents', CENTS_PER_USD),
+}
+
+
+def to_fixed(values, scale):
+    """Round decimal amounts to integer units; missing values stay missing"""
+    values = pd.to_numeric(pd.Series(values), errors='coerce')
+    return pd.Series(np.rint(values.to_numpy(dtype=np.float64) * scale), index=values.index).astype('Int64')
+
+
+def to_cents(values):
+    return to_fixed(values, CENTS_PER_USD)
+
+
+def to_sat(values):
+    return to_fixed(values, SAT_PER_BTC)
+
+
+def cents(amount):
+    """Scalar USD amount as integer cents, for rule thresholds"""
+    return int(round(amount * CENTS_PER_USD))
+
+
+def decode_amounts(df):
+    """Add the decimal column for every fixed-point column present"""
+    for decimal_column, (fixed_column, scale) in FIXED_COLUMNS.items():
+        if fixed_column in df.columns and decimal_column not in df.columns:
+            df[decimal_column] = pd.to_numeric(df[fixed_column], errors='coerce') / scale
+    return df
+
+
+def main():
+    print("💱 Fixed-point amount columns")
+    for decimal_column, (fixed_column, scale) in FIXED_COLUMNS.items():
+        print(f"   {fixed_column:<18} -> {decimal_column:<15} (/ {scale:,})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Index advisor for the data warehouse
+Collects the real query workload (the warehouse views and the dashboard loader queries),
+runs EXPLAIN QUERY PLAN, flags full scans / temp B-trees / automatic indexes and
+proposes composite or covering indexes. Candidates are tried inside a transaction that
+is rolled back, so the warehouse is only changed when --apply is given.
+
+Both timing passes run inside that transaction after a fresh ANALYZE, so the before and
+after plans see the same statistics. Loader queries that only run in an except handler
+(fallbacks for older warehouses) are left out of the workload. A candidate only counts
+as faster when it saves at least MIN_SAVED_MS on top of MIN_SPEEDUP; sub-millisecond
+timings on small warehouses are noise.
+
+Usage:
+    python index_advisor.py                       # report only
+    python index_advisor.py --apply               # create the indexes that helped
+    python index_advisor.py --db benchmarks/data/1000000/bitcoin_unified_dw.db
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+DASHBOARD_PATH = 'updated_dashboard.py'
+REPORT_DIR = 'reports'
+
+# Covering indexes wider than this cost more on write than they save on read
+MAX_INDEX_COLUMNS = 6
+
+# A candidate must make at least one query this much faster; removing a plan issue alone is not enough
+MIN_SPEEDUP = 1.1
+
+# ...and saves at least this much wall time per run
+MIN_SAVED_MS = 1.0
+
+_CLAUSE_END = r'(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|$)'
+
+
+def collect_workload(conn, dashboard_path=DASHBOARD_PATH):
+    """Return [{'name', 'source', 'sql'}] for every view and dashboard loader query"""
+    workload = []
+
+    for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name"):
+        workload.append({'name': name, 'source': 'view', 'sql': f"SELECT * FROM {name}"})
+
+    if dashboard_path and os.path.exists(dashboard_path):
+        with open(dashboard_path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+
+        # read_sql calls inside an except handler are fallbacks for older schemas
+        fallbacks = {id(node) for handler in ast.walk(tree) if isinstance(handler, ast.ExceptHandler)
+                     for node in ast.walk(handler)}
+
+        for func in ast.walk(tree):
+            if not isinstance(func, ast.FunctionDef):
+                continue
+            count = 0
+            for node in ast.walk(func):
+                if id(node) in fallbacks:
+                    continue
+                if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr == 'read_sql' and node.args
+                        and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                    count += 1
+                    workload.append({
+                        'name': f"{func.name}#{count}",
+                        'source': 'dashboard',
+                        'sql': ' '.join(node.args[0].value.split()),
+                    })
+
+    return workload
+
+
+def explain(conn, sql):
+    """EXPLAIN QUERY PLAN detail strings, or None if the query does not compile here"""
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    except sqlite3.Error:
+        return None
+
+
+def plan_issues(plan):
+    """Full scans, temp B-trees and automatic indexes in a query plan
+
+    A scan through an index (covering or not) still reads every row, so it counts as a
+    full scan. Scans of a view's rows are left out: the view's own plan lines show how
+    its tables are read.
+    """
+    issues = []
+    for detail in plan or []:
+        scan = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if scan and not scan.group(1).startswith('vw_') and 'CONSTANT ROW' not in detail:
+            issues.append(('full_scan', detail))
+        elif 'USE TEMP B-TREE' in detail:
+            issues.append(('temp_btree', detail))
+        elif 'AUTOMATIC' in detail:
+            issues.append(('automatic_index', detail))
+    return issues
+
+
+def indexes_used(plan):
+    used = set()
+    for detail in plan or []:
+        match = re.search(r'USING (?:COVERING )?INDEX (\w+)', detail)
+        if match:
+            used.add(match.group(1))
+    return used
+
+
+def time_query(conn, sql, repeats=5):
+    """Best-of-N wall time for running a query to completion, after one untimed warm-up run"""
+    conn.execute(sql).fetchall()
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _table_columns(conn):
+    tables = {}
+    for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+        tables[name] = [row[1] for row in conn.execute(f"PRAGMA table_info({name})")]
+    return tables
+
+
+def _existing_indexes(conn):
+    """{table: [[col, ...], ...]} for every index, including the rowid primary key"""
+    existing = {}
+    for table, in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+        existing[table] = []
+        for row in conn.execute(f"PRAGMA index_list({table})"):
+            cols = [c[2] for c in conn.execute(f"PRAGMA index_info({row[1]})")]
+            existing[table].append(cols)
+    return existing
+
+
+def _expand_views(conn, sql):
+    """Query text plus the bodies of any views it references"""
+    views = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type='view'").fetchall())
+    texts, seen = [sql], set()
+    queue = [sql]
+    while queue:
+        text = queue.pop()
+        for name, body in views.items():
+            if name not in seen and re.search(rf'\b{name}\b', text):
+                seen.add(name)
+                select = re.sub(r'^\s*CREATE\s+VIEW\s+\w+\s+AS\s+', '', body, flags=re.I | re.S)
+                texts.append(select)
+                queue.append(select)
+    return texts
+
+
+def _column_usage(sql, tables):
+    """Per-table column usage: equality/join, range, group/order and referenced columns"""
+    sql = ' '.join(sql.split())
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|LEFT\b|JOIN\b|INNER\b|GROUP\b|ORDER\b|LIMIT\b)(\w+))?', sql, flags=re.I):
+        if table in tables:
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+
+    usage = {t: {'eq': [], 'range': [], 'group': [], 'order': [], 'refs': set()} for t in set(aliases.values())}
+    if not usage:
+        return usage
+
+    def resolve(token):
+        """Map 'alias.col' or a bare column (single-table queries) to (table, col)"""
+        if '.' in token:
+            alias, col = token.split('.', 1)
+            table = aliases.get(alias)
+            return (table, col) if table and col in tables[table] else None
+        owners = [t for t in usage if token in tables[t]]
+        return (owners[0], token) if len(owners) == 1 else None
+
+    def add(kind, token):
+        resolved = resolve(token)
+        if resolved and resolved[1] not in usage[resolved[0]][kind]:
+            usage[resolved[0]][kind].append(resolved[1])
+
+    ident = r'(\w+(?:\.\w+)?)'
+    for left, right in re.findall(rf'{ident}\s*=\s*{ident}', sql):
+        add('eq', left)
+        add('eq', right)
+
+    where = re.search(rf'\bWHERE\b(.*?){_CLAUSE_END}', sql, flags=re.I)
+    if where:
+        for col in re.findall(rf'{ident}\s*(?:>=|<=|>|<|\bBETWEEN\b)', where.group(1), flags=re.I):
+            add('range', col)
+        for col in re.findall(rf'{ident}\s*(?:\bIN\b|\bIS\b)', where.group(1), flags=re.I):
+            add('eq', col)
+
+    for kind, pattern in (('group', rf'\bGROUP\s+BY\b(.*?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|$)'),
+                          ('order', r'\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|$)')):
+        clause = re.search(pattern, sql, flags=re.I)
+        if clause:
+            for token in re.findall(ident, clause.group(1)):
+                add(kind, token)
+
+    for token in re.findall(ident, sql):
+        resolved = resolve(token)
+        if resolved:
+            usage[resolved[0]]['refs'].add(resolved[1])
+
+    return usage
+
+
+def _covered(existing, table, cols):
+    """True if an existing index already starts with cols (order matters for lookups)"""
+    return any(index[:len(cols)] == cols for index in existing.get(table, []))
+
+
+def propose_indexes(conn, workload):
+    """Candidate (table, columns) tuples derived from how each query uses each table"""
+    tables = _table_columns(conn)
+    existing = _existing_indexes(conn)
+    candidates = {}
+
+    def add(table, cols, reason, query):
+        cols = [c for i, c in enumerate(cols) if c not in cols[:i]][:MAX_INDEX_COLUMNS]
+        # The integer primary key is the rowid; indexing it is pointless
+        if not cols or _covered(existing, table, cols) or cols[0] == tables[table][0]:
+            return
+        key = (table, tuple(cols))
+        entry = candidates.setdefault(key, {'table': table, 'columns': cols, 'reasons': set(), 'queries': set()})
+        entry['reasons'].add(reason)
+        entry['queries'].add(query)
+
+    for item in workload:
+        for text in _expand_views(conn, item['sql']):
+            for table, use in _column_usage(text, tables).items():
+                pk = tables[table][0]
+                key_cols = [c for c in use['eq'] if c != pk]
+                for col in key_cols:
+                    add(table, [col], 'join/filter column', item['name'])
+                    # Covering: lookup column first, then everything else the query reads from the table
+                    others = sorted(c for c in use['refs'] if c not in (col, pk))
+                    if others and len(others) < MAX_INDEX_COLUMNS:
+                        add(table, [col] + others, 'covering join', item['name'])
+                if key_cols and use['range']:
+                    add(table, key_cols + use['range'], 'equality + range', item['name'])
+                for kind in ('group', 'order'):
+                    cols = [c for c in use[kind] if c != pk]
+                    if cols and len(cols) == len(use[kind]):
+                        add(table, cols, f'{kind} by', item['name'])
+
+    return list(candidates.values())
+
+
+def index_name(table, cols):
+    return 'idx_' + table.lower() + '_' + '_'.join(c.lower() for c in cols)
+
+
+def _faster(result):
+    saved = result['seconds_before'] - result['seconds_after']
+    return (result['seconds_after'] * MIN_SPEEDUP < result['seconds_before']
+            and saved * 1000 >= MIN_SAVED_MS)
+
+
+def evaluate(conn, workload, candidates, repeats=5):
+    """Measure every query before and with all candidates, inside a rolled-back transaction"""
+    results = []
+    conn.execute("BEGIN")
+    try:
+        # Same statistics for both passes: the after pass re-runs ANALYZE with the candidates
+        conn.execute("ANALYZE")
+        for item in workload:
+            plan = explain(conn, item['sql'])
+            if plan is None:
+                continue
+            results.append({
+                'name': item['name'],
+                'source': item['source'],
+                'sql': item['sql'],
+                'plan_before': plan,
+                'issues_before': plan_issues(plan),
+                'seconds_before': time_query(conn, item['sql'], repeats),
+            })
+
+        for cand in candidates:
+            cand['name'] = index_name(cand['table'], cand['columns'])
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {cand['name']} ON {cand['table']}({', '.join(cand['columns'])})")
+        conn.execute("ANALYZE")
+
+        for res in results:
+            plan = explain(conn, res['sql'])
+            res['plan_after'] = plan
+            res['issues_after'] = plan_issues(plan)
+            res['seconds_after'] = time_query(conn, res['sql'], repeats)
+            res['indexes_used'] = sorted(indexes_used(plan) & {c['name'] for c in candidates})
+    finally:
+        conn.execute("ROLLBACK")
+
+    for cand in candidates:
+        cand['used_by'] = [r['name'] for r in results if cand['name'] in r['indexes_used']]
+        improved = [r for r in results if cand['name'] in r['indexes_used'] and _faster(r)]
+        cand['recommended'] = bool(improved)
+
+    # A recommended index that is a prefix of another recommended one is redundant
+    for cand in candidates:
+        if cand['recommended'] and any(
+                other is not cand and other['recommended'] and other['table'] == cand['table']
+                and other['columns'][:len(cand['columns'])] == cand['columns']
+                for other in candidates):
+            cand['recommended'] = False
+            cand['superseded'] = True
+
+    return results
+
+
+def apply_indexes(conn, candidates):
+    created = []
+    for cand in candidates:
+        if cand['recommended']:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {cand['name']} ON {cand['table']}({', '.join(cand['columns'])})")
+            created.append(cand['name'])
+    conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+def print_results(results, candidates):
+    print(f"\n⏱️ QUERY LATENCY (best of runs)")
+    print("=" * 40)
+    print(f"{'Query':<36} {'Before ms':>10} {'After ms':>10} {'Speedup':>8}  Issues before -> after")
+    for r in results:
+        speedup = r['seconds_before'] / r['seconds_after'] if r['seconds_after'] else float('inf')
+        before = ', '.join(kind for kind, _ in r['issues_before']) or '-'
+        after = ', '.join(kind for kind, _ in r['issues_after']) or '-'
+        print(f"{r['name']:<36} {r['seconds_before'] * 1000:>10.2f} {r['seconds_after'] * 1000:>10.2f} "
+              f"{speedup:>7.1f}x  {before} -> {after}")
+
+    print(f"\n💡 INDEX PROPOSALS")
+    print("=" * 20)
+    for cand in sorted(candidates, key=lambda c: (not c['recommended'], c['name'])):
+        mark = '✅' if cand['recommended'] else '➖'
+        used_by = ', '.join(cand['used_by']) or 'not chosen by the planner'
+        if cand.get('superseded'):
+            used_by += ' (superseded by a wider index)'
+        print(f"{mark} CREATE INDEX {cand['name']} ON {cand['table']}({', '.join(cand['columns'])});")
+        print(f"     {', '.join(sorted(cand['reasons']))} | used by: {used_by}")
+
+
+def write_report(db_path, results, candidates, created):
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"index_advisor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    payload = {
+        'database': db_path,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'queries': results,
+        'candidates': [{**c, 'reasons': sorted(c['reasons']), 'queries': sorted(c['queries'])} for c in candidates],
+        'created_indexes': created,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, default=str)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose indexes for the warehouse query workload")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    parser.add_argument('--dashboard', default=DASHBOARD_PATH, help='Dashboard module to harvest loader queries from')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per query (after one warm-up run)')
+    parser.add_argument('--apply', action='store_true', help='Create the recommended indexes')
+    args = parser.parse_args()
+
+    print("🧭 WAREHOUSE INDEX ADVISOR")
+    print("=" * 30)
+
+    if not os.path.exists(args.db):
+        print(f"❌ Database file not found: {args.db}")
+        return 1
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    workload = collect_workload(conn, args.dashboard)
+    print(f"📋 Workload: {len(workload)} queries "
+          f"({sum(w['source'] == 'view' for w in workload)} views, "
+          f"{sum(w['source'] == 'dashboard' for w in workload)} dashboard loaders)")
+
+    candidates = propose_indexes(conn, workload)
+    print(f"🔎 {len(candidates)} candidate indexes")
+
+    results = evaluate(conn, workload, candidates, repeats=args.repeats)
+    print_results(results, candidates)
+
+    created = []
+    if args.apply:
+        created = apply_indexes(conn, candidates)
+        print(f"\n🛠️ Created {len(created)} indexes: {', '.join(created) or 'none'}")
+    conn.close()
+
+    path = write_report(args.db, results, candidates, created)
+    print(f"\n💾 Report written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Mergeable quantile sketches of trade amounts
+QuantileSketches holds, for each day and risk level, a sketch of the Price,
+VolumeQuote and SizeBase distributions. Each is a DDSketch: counts of trades per
+logarithmic bucket, with bucket i covering (GAMMA^(i-1), GAMMA^i] in stored integer
+units. Sketches merge by adding bucket counts. Any quantile read from a merged
+sketch is within RELATIVE_ACCURACY (1%) of the exact value, so p50/p95/p99 and
+histograms over any date range and set of risk levels never touch the facts.
+
+Days are rebuilt wherever the risk cube is: after the batch ETL and for the days
+rescoring or a dedup migration touched. A stream batch is folded into its days'
+stored sketches instead of re-reading them. As with DailySummary, days whose trades
+were archived or dropped keep their sketches, including through a full rebuild.
+
+Threshold rules can take their value from these sketches ("percentile" in
+config/suspicious_rules.json).
+
+Usage:
+    python quantile_sketches.py build
+    python quantile_sketches.py percentiles --measure VolumeQuote --start 2024-01-01 --end 2024-01-31 --exact
+"""
+
+import argparse
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_partitions
+import fixed_point
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Zero (and any non-positive amount) is counted in its own bucket, below every other
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+# Sketched measure -> stored integer column
+MEASURES = {name: fixed_point.FIXED_COLUMNS[name][0] for name in ('Price', 'VolumeQuote', 'SizeBase')}
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+# Full rebuilds read fact rows in chunks of this many trades
+READ_CHUNK = 1_000_000
+
+BUCKET_DTYPE = np.dtype([('bucket', '<i4'), ('count', '<i8')])
+
+SKETCH_SQL = [
+    """CREATE TABLE IF NOT EXISTS QuantileSketches (
+        Date DATE NOT NULL,
+        Measure VARCHAR(20) NOT NULL,
+        RiskCode TINYINT,
+        Trades BIGINT NOT NULL,
+        Buckets BLOB NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_quantilesketches_date ON QuantileSketches(Date)",
+]
+
+AMOUNTS_SQL = """
+    SELECT dt.Date, ta.RiskCode, ft.PriceCents, ft.VolumeQuoteCents, ft.SizeBaseSat
+    FROM {facts} ft
+    JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
+    {where}
+"""
+
+
+def bucket_of(values):
+    """Bucket index of each stored amount"""
+    values = np.asarray(values, dtype=np.float64)
+    buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+    positive = values > 0
+    buckets[positive] = np.ceil(np.log(values[positive]) / LOG_GAMMA).astype(np.int32)
+    return buckets
+
+
+def bucket_value(buckets):
+    """The amount reported for a bucket: within RELATIVE_ACCURACY of anything in it"""
+    buckets = np.asarray(buckets)
+    positive = buckets != ZERO_BUCKET
+    exponents = np.where(positive, buckets, 0).astype(np.float64)
+    return np.where(positive, 2 * np.power(GAMMA, exponents) / (GAMMA + 1), 0.0)
+
+
+class QuantileSketch:
+    """Trade counts per logarithmic bucket of one measure, in stored integer units"""
+
+    def __init__(self, buckets=None, counts=None):
+        self.buckets = np.empty(0, dtype=np.int32) if buckets is None else np.asarray(buckets, dtype=np.int32)
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values):
+        buckets, counts = np.unique(bucket_of(values), return_counts=True)
+        return cls(buckets, counts)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        pairs = np.frombuffer(blob, dtype=BUCKET_DTYPE)
+        return cls(pairs['bucket'], pairs['count'])
+
+    def to_bytes(self):
+        pairs = np.empty(len(self.buckets), dtype=BUCKET_DTYPE)
+        pairs['bucket'], pairs['count'] = self.buckets, self.counts
+        return pairs.tobytes()
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def merge(self, other):
+        buckets, positions = np.unique(np.concatenate([self.buckets, other.buckets]), return_inverse=True)
+        self.counts = np.bincount(positions, weights=np.concatenate([self.counts, other.counts]),
+                                  minlength=len(buckets)).astype(np.int64)
+        self.buckets = buckets.astype(np.int32)
+        return self
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """Amounts at each quantile (stored units), or None for an empty sketch"""
+        total = self.count
+        if not total:
+            return [None] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        # The bucket holding the floor(q * (n - 1))-th smallest amount
+        positions = np.searchsorted(cumulative, [q * (total - 1) for q in qs], side='right')
+        return [float(v) for v in bucket_value(self.buckets[positions])]
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def histogram(self, max_bins=50):
+        """(Lower, Upper, Trades) rows in stored units, merging neighbouring buckets down to max_bins"""
+        zero = self.buckets == ZERO_BUCKET
+        buckets, counts = self.buckets[~zero], self.counts[~zero]
+        rows = []
+        if zero.any():
+            rows.append(pd.DataFrame({'Lower': [0.0], 'Upper': [0.0], 'Trades': [int(self.counts[zero].sum())]}))
+        if len(buckets):
+            width = max(1, math.ceil((int(buckets.max()) - int(buckets.min()) + 1) / max_bins))
+            # Bins start at multiples of width, so histograms of equal width line up
+            groups = np.floor_divide(buckets.astype(np.int64), width)
+            first = int(groups.min())
+            trades = np.bincount(groups - first, weights=counts).astype(np.int64)
+            starts = (first + np.arange(len(trades))) * width
+            rows.append(pd.DataFrame({'Lower': np.power(GAMMA, starts - 1.0),
+                                      'Upper': np.power(GAMMA, starts + width - 1.0),
+                                      'Trades': trades}))
+        return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=['Lower', 'Upper', 'Trades'])
+
+
+def create_sketch_tables(conn):
+    for stmt in SKETCH_SQL:
+        conn.execute(text(stmt))
+
+
+def _fold(frame, sketches):
+    """Fold a chunk of fact amounts into per (Date, Measure, RiskCode) sketches"""
+    for measure, column in MEASURES.items():
+        valid = frame[column].notna()
+        part = pd.DataFrame({'Date': frame.loc[valid, 'Date'], 'RiskCode': frame.loc[valid, 'RiskCode'],
+                             'Bucket': bucket_of(frame.loc[valid, column].to_numpy(dtype=np.float64))})
+        counts = part.groupby(['Date', 'RiskCode', 'Bucket'], dropna=False).size()
+        for (day, risk), group in counts.groupby(level=[0, 1], dropna=False, sort=False):
+            key = (day, measure, None if pd.isna(risk) else int(risk))
+            sketch = QuantileSketch(group.index.get_level_values('Bucket'), group.to_numpy())
+            if key in sketches:
+                sketches[key].merge(sketch)
+            else:
+                sketches[key] = sketch
+    return sketches
+
+
+def _write_sketches(conn, sketches):
+    """Replace the stored sketches of every day in sketches"""
+    conn.execute(text("DELETE FROM QuantileSketches WHERE Date = :d"),
+                 [{'d': str(day)} for day in {day for day, _, _ in sketches}])
+    conn.execute(text("INSERT INTO QuantileSketches (Date, Measure, RiskCode, Trades, Buckets) "
+                      "VALUES (:d, :m, :r, :n, :b)"),
+                 [{'d': str(day), 'm': measure, 'r': risk, 'n': sketch.count, 'b': sketch.to_bytes()}
+                  for (day, measure, risk), sketch in sketches.items()])
+
+
+def record_batch(conn, facts, risk_codes):
+    """Merge newly loaded fact rows (TimeKey and amounts) and their RiskCodes into the stored day sketches"""
+    if facts.empty:
+        return 0
+    create_sketch_tables(conn)
+    time_keys = ','.join(str(int(k)) for k in facts['TimeKey'].dropna().unique())
+    dates = dict(conn.execute(text(f"SELECT TimeKey, Date FROM DimTime WHERE TimeKey IN ({time_keys})")).fetchall())
+    frame = facts[list(MEASURES.values())].assign(Date=facts['TimeKey'].map(dates),
+                                                  RiskCode=pd.Series(risk_codes).to_numpy())
+    frame = frame.dropna(subset=['Date'])
+    days = ','.join(f"'{day}'" for day in frame['Date'].unique())
+    stored = {(day, measure, risk): QuantileSketch.from_bytes(blob) for day, measure, risk, blob in conn.execute(
+        text(f"SELECT Date, Measure, RiskCode, Buckets FROM QuantileSketches WHERE Date IN ({days})"))}
+    sketches = _fold(frame, stored)
+    if sketches:
+        _write_sketches(conn, sketches)
+    return len(sketches)
+
+
+def refresh(conn, dates=None):
+    """Rebuild the sketches of every day, or only the given dates; returns the sketches written
+
+    A full rebuild replaces only the days that still have hot facts.
+    """
+    create_sketch_tables(conn)
+    if dates is None:
+        sketches = {}
+        query = text(AMOUNTS_SQL.format(facts='FactTransactions', where=''))
+        for frame in pd.read_sql(query, conn, chunksize=READ_CHUNK):
+            _fold(frame, sketches)
+        if sketches:
+            _write_sketches(conn, sketches)
+        return len(sketches)
+
+    written = 0
+    for day in sorted({pd.Timestamp(d).date().isoformat() for d in dates}):
+        conn.execute(text("DELETE FROM QuantileSketches WHERE Date = :d"), {'d': day})
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        frame = pd.read_sql(text(AMOUNTS_SQL.format(facts=facts, where="WHERE dt.Date = :d")), conn,
+                            params={'d': day})
+        sketches = _fold(frame, {})
+        if sketches:
+            _write_sketches(conn, sketches)
+        written += len(sketches)
+    return written
+
+
+def has_sketches(conn):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'QuantileSketches'")).fetchone() is not None
+
+
+def merged_sketches(conn, start_date=None, end_date=None, by_risk=False):
+    """Sketches merged over a date range: {measure: sketch}, or {(measure, RiskLevel): sketch} by risk level"""
+    clauses, params = [], {}
+    if start_date is not None:
+        clauses.append("qs.Date >= :start")
+        params['start'] = pd.Timestamp(start_date).date().isoformat()
+    if end_date is not None:
+        clauses.append("qs.Date <= :end")
+        params['end'] = pd.Timestamp(end_date).date().isoformat()
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    parts = {}
+    rows = conn.execute(text(f"SELECT qs.Measure, rl.RiskLevel, qs.Buckets FROM QuantileSketches qs "
+                             f"LEFT JOIN DimRiskLevel rl ON qs.RiskCode = rl.RiskCode {where}"), params)
+    for measure, risk_level, blob in rows:
+        key = (measure, risk_level) if by_risk else measure
+        parts.setdefault(key, []).append(np.frombuffer(blob, dtype=BUCKET_DTYPE))
+    # One merge per key over all its days, rather than one per day
+    merged = {}
+    for key, arrays in parts.items():
+        pairs = np.concatenate(arrays)
+        merged[key] = QuantileSketch().merge(QuantileSketch(pairs['bucket'], pairs['count']))
+    return merged
+
+
+def _scale(measure):
+    return fixed_point.FIXED_COLUMNS[measure][1]
+
+
+def percentiles(conn, measure, qs=DEFAULT_QUANTILES, start_date=None, end_date=None, risk_levels=None):
+    """{q: amount in decimal units} over a date range, optionally only some risk levels"""
+    if measure not in MEASURES:
+        raise ValueError(f"Unknown sketched measure: {measure} (known: {', '.join(MEASURES)})")
+    sketch = QuantileSketch()
+    for (name, risk_level), part in merged_sketches(conn, start_date, end_date, by_risk=True).items():
+        if name == measure and (risk_levels is None or risk_level in risk_levels):
+            sketch.merge(part)
+    values = sketch.quantiles(qs)
+    return {q: (v / _scale(measure) if v is not None else None) for q, v in zip(qs, values)}
+
+
+def percentile_table(sketches, qs=DEFAULT_QUANTILES):
+    """One row per measure and risk level (plus 'ALL') with trade counts and decimal percentiles"""
+    overall = {}
+    rows = []
+    for (measure, risk_level), sketch in sketches.items():
+        overall.setdefault(measure, QuantileSketch()).merge(sketch)
+        rows.append((measure, risk_level if risk_level is not None else 'UNSCORED', sketch))
+    rows += [(measure, 'ALL', sketch) for measure, sketch in overall.items()]
+    table = pd.DataFrame([
+        {'Measure': measure, 'RiskLevel': risk_level, 'Trades': sketch.count,
+         **{f'p{round(q * 100):g}': v / _scale(measure) for q, v in zip(qs, sketch.quantiles(qs))}}
+        for measure, risk_level, sketch in rows])
+    return table.sort_values(['Measure', 'RiskLevel'], ignore_index=True) if len(table) else table
+
+
+def histogram(sketch, measure, max_bins=50):
+    """A sketch's histogram in decimal units"""
+    hist = sketch.histogram(max_bins)
+    hist[['Lower', 'Upper']] = hist[['Lower', 'Upper']] / _scale(measure)
+    return hist
+
+
+def live_percentile(conn, measure, q, days=None):
+    """An amount percentile over the latest days of sketches, or None when there are none"""
+    if not has_sketches(conn):
+        return None
+    last = conn.execute(text("SELECT MAX(Date) FROM QuantileSketches")).scalar()
+    if last is None:
+        return None
+    start = (pd.Timestamp(last) - pd.Timedelta(days=days - 1)).date() if days else None
+    return percentiles(conn, measure, [q], start, last)[q]
+
+
+def exact_percentile(conn, measure, q, start_date=None, end_date=None):
+    """The same percentile by sorting the facts, for checking the sketches"""
+    column = MEASURES[measure]
+    facts = fact_partitions.fact_range_sql(conn, start_date or '0001-01-01', end_date or '9999-12-31')
+    total = conn.execute(text(f"SELECT COUNT({column}) FROM {facts} ft")).scalar()
+    if not total:
+        return None
+    value = conn.execute(text(f"SELECT {column} FROM {facts} ft WHERE {column} IS NOT NULL "
+                              f"ORDER BY {column} LIMIT 1 OFFSET :k"), {'k': int(q * (total - 1))}).scalar()
+    return value / _scale(measure)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the quantile sketches of trade amounts")
+    parser.add_argument('--db', default=DB_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Rebuild every daily sketch from the facts')
+    query = sub.add_parser('percentiles', help='Percentiles over a date range')
+    query.add_argument('--measure', choices=list(MEASURES), help='Only this measure')
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--exact', action='store_true', help='Also sort the facts to compare (needs --measure)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            written = refresh(conn)
+        print(f"✅ {written:,} quantile sketches built in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    with engine.connect() as conn:
+        if not has_sketches(conn):
+            print("❌ No quantile sketches; run: python quantile_sketches.py build")
+            return 1
+        start = time.perf_counter()
+        table = percentile_table(merged_sketches(conn, args.start, args.end, by_risk=True))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if args.measure:
+            table = table[table['Measure'] == args.measure]
+        print(table.to_string(index=False))
+        print(f"📏 Answered from sketches in {elapsed_ms:.1f} ms (±{RELATIVE_ACCURACY:.0%} per value)")
+        if args.exact and args.measure:
+            start = time.perf_counter()
+            exact = {q: exact_percentile(conn, args.measure, q, args.start, args.end) for q in DEFAULT_QUANTILES}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"🎯 Exact {args.measure}: " + ', '.join(f"p{round(q * 100):g}={v:,.2f}" for q, v in exact.items())
+                  + f" in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Multi-core rescoring of TransactionAnalysis
+Re-applies the compiled suspicious-transaction rules and the latest anomaly model
+to trades that are already loaded, e.g. after editing config/suspicious_rules.json
+or training a new model, without re-running the ETL.
+
+The selected fact columns are read once into shared-memory NumPy arrays. The rows
+are split into TransactionFactSK ranges that a process pool scores in parallel:
+workers attach to the shared arrays (no pickling of row data) and write their
+results into shared output arrays. Once every range is scored, the parent, the only
+writer to SQLite, replaces the TransactionAnalysis rows range by range in one
+transaction and refreshes the affected DailySummary days and the fact cache.
+Workers only read the warehouse, and finish before the write starts.
+
+Stateful window rules (velocity, rapid_succession) are warmed up on the trades
+just before each range, so range boundaries do not hide bursts. The warehouse keys
+trades by hour (TimeKey), so their exact timestamps are read from the source trades
+database by TradeID; without it window rules only see hour-grained timestamps.
+
+Usage:
+    python rescore_analysis.py --start 2024-03-01 --end 2024-03-31
+    python rescore_analysis.py --partition FactTransactions_p202403 --workers 8
+    python rescore_analysis.py --rules config/suspicious_rules.json --range-rows 200000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import anomaly_model
+import fact_cache
+import fact_partitions
+import quantile_sketches
+import risk_cube
+import rule_engine
+import schema_matched_etl as etl
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANGE_ROWS = 100_000
+READ_CHUNK = 500_000
+NULL_INT = fact_cache.NULL_INT
+
+# Shared input columns: name -> dtype (nullable integer columns use NULL_INT)
+INPUT_COLUMNS = {
+    'TransactionFactSK': np.int64,
+    'TradeID': np.int64,
+    'SideCode': np.int64,
+    'TimeKey': np.int64,
+    'MarketDateKey': np.int64,
+    'WalletKey': np.int64,
+    'PriceCents': np.int64,
+    'VolumeQuoteCents': np.int64,
+    'SizeBaseSat': np.int64,
+    'TradeTimestampMs': np.int64,
+}
+OUTPUT_COLUMNS = {
+    'IsSuspicious': np.int64,
+    'RuleHits': np.int64,
+    'RuleHitCount': np.int64,
+    'AnomalyScore': np.float64,
+    'RiskCode': np.int64,
+    'ModelVersion': np.int64,
+}
+
+HOUR_TIMESTAMP_SQL = "CAST(ROUND((julianday(dt.FullTimestamp) - 2440587.5) * 86400000) AS INTEGER)"
+
+SELECT_SQL = """
+    SELECT ft.TransactionFactSK, ft.TradeID, ft.SideCode, ft.TimeKey, ft.MarketDateKey, ft.WalletKey,
+           ft.PriceCents, ft.VolumeQuoteCents, ft.SizeBaseSat, {timestamp} AS TradeTimestampMs
+    FROM {facts} ft
+    LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    {source_join}
+    {where}
+    ORDER BY ft.TransactionFactSK
+    {limit}
+"""
+
+
+class SharedColumns:
+    """Named NumPy columns in shared memory; attach() maps them in another process"""
+
+    def __init__(self, rows, dtypes, specs=None):
+        self.rows = rows
+        self.blocks = {}
+        self.arrays = {}
+        for name, dtype in dtypes.items():
+            size = max(1, rows * np.dtype(dtype).itemsize)
+            if specs is None:
+                block = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                block = shared_memory.SharedMemory(name=specs[name])
+            self.blocks[name] = block
+            self.arrays[name] = np.ndarray((rows,), dtype=dtype, buffer=block.buf)
+
+    @classmethod
+    def attach(cls, rows, dtypes, specs):
+        return cls(rows, dtypes, specs)
+
+    def specs(self):
+        return {name: block.name for name, block in self.blocks.items()}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self, unlink=False):
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            if unlink:
+                block.unlink()
+
+
+def selection(conn, start_date=None, end_date=None, partitions=None):
+    """(facts SQL, WHERE clause, params) for the trades to rescore"""
+    if partitions:
+        known = set(fact_partitions.list_partitions(conn)['PartitionName']) if fact_partitions.is_partitioned(conn) else set()
+        unknown = [p for p in partitions if p not in known]
+        if unknown:
+            raise ValueError(f"Unknown partition(s): {', '.join(unknown)}")
+        columns = ', '.join(c for c in INPUT_COLUMNS if c != 'TradeTimestampMs')
+        facts = '(' + ' UNION ALL '.join(f"SELECT {columns} FROM {p}" for p in partitions) + ')'
+        return facts, '', {}
+    if start_date or end_date:
+        facts = fact_partitions.fact_range_sql(conn, start_date, end_date)
+        clauses, params = [], {}
+        if start_date:
+            clauses.append("dt.Date >= :start")
+            params['start'] = str(start_date)
+        if end_date:
+            clauses.append("dt.Date <= :end")
+            params['end'] = str(end_date)
+        return facts, 'WHERE ' + ' AND '.join(clauses), params
+    return 'FactTransactions', '', {}
+
+
+def read_trades(conn, facts='FactTransactions', where='', params=None, source_db=None, chunksize=READ_CHUNK,
+                limit=None):
+    """Yield the selected trades with TradeTimestampMs in TransactionFactSK order, chunk by chunk
+
+    where may filter on TradeTimestampMs; limit caps the rows read.
+    """
+    timestamp, source_join = HOUR_TIMESTAMP_SQL, ''
+    if source_db:
+        conn.execute(text("ATTACH DATABASE :path AS src"), {'path': source_db})
+        timestamp = f"COALESCE(st.timestamp, {HOUR_TIMESTAMP_SQL})"
+        source_join = "LEFT JOIN src.fact_transactions st ON st.trade_id = ft.TradeID"
+    try:
+        sql = SELECT_SQL.format(facts=facts, where=where, timestamp=timestamp, source_join=source_join,
+                                limit=f"LIMIT {int(limit)}" if limit else '')
+        yield from pd.read_sql(text(sql), conn, params=params or {}, chunksize=chunksize)
+    finally:
+        if source_db:
+            conn.execute(text("DETACH DATABASE src"))
+
+
+def load_columns(conn, facts, where, params, source_db=None):
+    """Read the selected trades into shared memory, in TransactionFactSK order"""
+    rows = conn.execute(text(f"SELECT COUNT(*) FROM {facts} ft LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey {where}"),
+                        params).scalar()
+    columns = SharedColumns(rows, INPUT_COLUMNS)
+    try:
+        offset = 0
+        for chunk in read_trades(conn, facts, where, params, source_db):
+            chunk = chunk.iloc[:rows - offset]
+            for name in INPUT_COLUMNS:
+                columns[name][offset:offset + len(chunk)] = (
+                    chunk[name].astype('Int64').to_numpy(dtype=np.int64, na_value=NULL_INT))
+            offset += len(chunk)
+    except Exception:
+        columns.close(unlink=True)
+        raise
+    return columns
+
+
+def warmup_ms(rule_set):
+    """Longest time window any compiled rule looks back over"""
+    windows = [spec['window_seconds'] for spec, _ in rule_set.rules if 'window_seconds' in spec]
+    return int(max(windows, default=0) * 1000)
+
+
+# Worker state, set once per process by _init_worker
+_worker = {}
+
+
+def _init_worker(db_path, rules_path, model_version, rows, input_specs, output_specs):
+    # Forked workers inherit the parent's random state; placeholder AnomalyScore draws must differ
+    np.random.seed()
+    _worker['model'] = (anomaly_model.load_model(model_version, anomaly_model.model_dir_for(db_path))
+                        if model_version else None)
+    engine = create_engine(f'sqlite:///{db_path}')
+    _worker['engine'] = engine
+    _worker['inputs'] = SharedColumns.attach(rows, INPUT_COLUMNS, input_specs)
+    _worker['outputs'] = SharedColumns.attach(rows, OUTPUT_COLUMNS, output_specs)
+    with engine.connect() as conn:
+        _worker['rule_set'] = rule_engine.compile_rules(conn, rules_path)
+    ts = _worker['inputs']['TradeTimestampMs']
+    # Running maximum makes "first row still inside the window" a binary search
+    _worker['ts_high'] = np.maximum.accumulate(np.where(ts == NULL_INT, np.iinfo(np.int64).min, ts))
+
+
+def _frame(inputs, lo, hi):
+    data = {}
+    for name in INPUT_COLUMNS:
+        values = inputs[name][lo:hi]
+        data[name] = pd.arrays.IntegerArray(values.copy(), values == NULL_INT)
+    return pd.DataFrame(data)
+
+
+def _score_range(bounds):
+    """Score rows [lo, hi) into the shared outputs; returns (lo, hi, rule_hits, rule_seconds, seconds)"""
+    lo, hi = bounds
+    start = time.perf_counter()
+    inputs, outputs = _worker['inputs'], _worker['outputs']
+    rule_set = _worker['rule_set']
+    # Ranges arrive in any order, so window rules start empty and are warmed up below
+    rule_set.reset()
+    with _worker['engine'].connect() as conn:
+        warm = lo
+        window = warmup_ms(rule_set)
+        if window and lo:
+            first_ts = inputs['TradeTimestampMs'][lo]
+            if first_ts != NULL_INT:
+                warm = int(np.searchsorted(_worker['ts_high'][:lo], first_ts - window, side='left'))
+
+        frame = _frame(inputs, warm, hi)
+        trans_df = pd.DataFrame({'timestamp': frame['TradeTimestampMs']})
+        trans_mapped = frame.drop(columns=['TransactionFactSK', 'TradeTimestampMs'])
+        analysis, result = etl.score_trades(conn, rule_set, trans_df, trans_mapped,
+                                            frame['TransactionFactSK'].to_numpy(), _worker['model'])
+
+    skip = lo - warm
+    for name in OUTPUT_COLUMNS:
+        values = analysis[name].iloc[skip:]
+        if name == 'RiskCode':
+            values = values.astype('Int64').fillna(0)
+        elif name == 'ModelVersion':
+            values = values.astype('Int64').fillna(NULL_INT)
+        outputs[name][lo:hi] = values.to_numpy(dtype=OUTPUT_COLUMNS[name])
+    # Warm-up rows were scored only to prime window state; count hits for the range itself
+    rule_hits = {spec['name']: int(((result.hits[skip:] >> spec['bit']) & 1).sum()) for spec, _ in rule_set.rules}
+    return lo, hi, rule_hits, result.rule_seconds, time.perf_counter() - start
+
+
+def write_range(conn, inputs, outputs, lo, hi):
+    """Replace TransactionAnalysis rows for one scored range"""
+    rows = pd.DataFrame({'TransactionFactSK': inputs['TransactionFactSK'][lo:hi]})
+    for name in OUTPUT_COLUMNS:
+        rows[name] = outputs[name][lo:hi]
+    rows['AnomalyScore'] = rows['AnomalyScore'].round(2)
+    rows['ModelVersion'] = pd.arrays.IntegerArray(rows['ModelVersion'].to_numpy(), rows['ModelVersion'].to_numpy() == NULL_INT)
+    first, last = int(rows['TransactionFactSK'].iloc[0]), int(rows['TransactionFactSK'].iloc[-1])
+    # Ranges are contiguous in SK order, but a date or partition selection may skip SKs inside one
+    rows[['TransactionFactSK']].to_sql('_rescore_sks', conn, if_exists='replace', index=False)
+    conn.execute(text(
+        "DELETE FROM TransactionAnalysis WHERE TransactionFactSK BETWEEN :a AND :b "
+        "AND TransactionFactSK IN (SELECT TransactionFactSK FROM _rescore_sks)"), {'a': first, 'b': last})
+    conn.execute(text("DROP TABLE _rescore_sks"))
+    rows.to_sql('TransactionAnalysis', conn, if_exists='append', index=False)
+    fact_cache.record_fact_write(conn)
+    return len(rows)
+
+
+def rescore(engine, db_path, rules_path=rule_engine.RULES_PATH, start_date=None, end_date=None,
+            partitions=None, workers=None, range_rows=DEFAULT_RANGE_ROWS, source_db=None):
+    """Rescore the selected trades; returns a run summary"""
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    # Every worker scores with the same model version, even if a new one is saved meanwhile
+    model_dir = anomaly_model.model_dir_for(db_path)
+    model = anomaly_model.load_model(model_dir=model_dir)
+    with engine.connect() as conn:
+        facts, where, params = selection(conn, start_date, end_date, partitions)
+        inputs = load_columns(conn, facts, where, params, source_db)
+        days = [row[0] for row in conn.execute(text(
+            f"SELECT DISTINCT dt.Date FROM {facts} ft JOIN DimTime dt ON ft.TimeKey = dt.TimeKey {where}"), params)]
+    rows = inputs.rows
+    load_seconds = time.perf_counter() - start
+
+    outputs = SharedColumns(rows, OUTPUT_COLUMNS)
+    ranges = [(lo, min(lo + range_rows, rows)) for lo in range(0, rows, range_rows)]
+    workers = min(workers, max(1, len(ranges)))
+    rule_hits, rule_seconds = {}, {}
+    try:
+        score_start = time.perf_counter()
+        if ranges:
+            with Pool(workers, initializer=_init_worker,
+                      initargs=(db_path, rules_path, model and model.version, rows, inputs.specs(), outputs.specs())) as pool:
+                done = 0
+                for lo, hi, hits, seconds, _ in pool.imap_unordered(_score_range, ranges):
+                    for name, n in hits.items():
+                        rule_hits[name] = rule_hits.get(name, 0) + n
+                        rule_seconds[name] = rule_seconds.get(name, 0.0) + seconds[name]
+                    done += hi - lo
+                    logger.info(f"   🧮 {done:,}/{rows:,} trades scored")
+        score_seconds = time.perf_counter() - score_start
+
+        write_start = time.perf_counter()
+        with engine.begin() as conn:
+            rule_set = rule_engine.compile_rules(conn, rules_path)
+            rule_engine.create_rule_tables(conn, rule_set)
+            anomaly_model.create_model_tables(conn)
+            if model is not None:
+                anomaly_model.register_model(conn, model, model_dir)
+            for lo, hi in ranges:
+                write_range(conn, inputs, outputs, lo, hi)
+
+            result = rule_engine.RuleResult(rows)
+            result.rule_hits = {spec['name']: rule_hits.get(spec['name'], 0) for spec, _ in rule_set.rules}
+            result.rule_seconds = {spec['name']: rule_seconds.get(spec['name'], 0.0) for spec, _ in rule_set.rules}
+            rule_engine.record_stats(conn, rule_set, result, 'rescore')
+            etl.refresh_daily_summary(conn, days)
+            risk_cube.refresh(conn, days)
+            quantile_sketches.refresh(conn, days)
+        write_seconds = time.perf_counter() - write_start
+        suspicious = int(outputs['IsSuspicious'].sum())
+    finally:
+        inputs.close(unlink=True)
+        outputs.close(unlink=True)
+
+    cache_dir = fact_cache.cache_dir_for(db_path)
+    if fact_cache.current_version(cache_dir) is not None:
+        with engine.connect() as conn:
+            fact_cache.build_cache(conn, cache_dir)
+
+    return {'rows': rows, 'ranges': len(ranges), 'workers': workers, 'days': len(days),
+            'model_version': model.version if model is not None else None,
+            'suspicious': suspicious, 'rule_hits': rule_hits, 'load_seconds': load_seconds,
+            'score_seconds': score_seconds, 'write_seconds': write_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore TransactionAnalysis in parallel")
+    parser.add_argument('--db', default=etl.DW_PATH)
+    parser.add_argument('--rules', default=rule_engine.RULES_PATH)
+    parser.add_argument('--source', default=etl.SOURCE_DBS['transactions'],
+                        help='Source trades database, for exact trade timestamps')
+    parser.add_argument('--start', help='First trade date to rescore (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last trade date to rescore (YYYY-MM-DD)')
+    parser.add_argument('--partition', action='append', help='Rescore only this partition (repeatable)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (default: all cores)')
+    parser.add_argument('--range-rows', type=int, default=DEFAULT_RANGE_ROWS, help='Trades per work unit')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.db):
+        print(f"❌ Warehouse not found: {args.db}")
+        return 1
+
+    source_db = args.source if os.path.exists(args.source) else None
+    if source_db is None:
+        print(f"⚠️ Source trades not found ({args.source}); window rules use hour-grained timestamps")
+
+    scope = (f"partitions {', '.join(args.partition)}" if args.partition
+             else f"{args.start or 'start'} to {args.end or 'end'}")
+    print(f"🔁 Rescoring trades from {scope} with {args.workers} worker(s)...")
+    try:
+        summary = rescore(create_engine(f'sqlite:///{args.db}'), args.db, args.rules, args.start, args.end,
+                          args.partition, args.workers, args.range_rows, source_db)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    rate = summary['rows'] / summary['score_seconds'] if summary['score_seconds'] else 0
+    print(f"   Loaded {summary['rows']:,} trades in {summary['load_seconds']:.2f}s; "
+          f"{summary['ranges']} ranges on {summary['workers']} worker(s)")
+    if summary['model_version'] is None:
+        print("   ⚠️ No anomaly model trained (python anomaly_model.py train); AnomalyScore is a placeholder")
+    else:
+        print(f"   🧠 AnomalyScore from model v{summary['model_version']}")
+    for name, hits in summary['rule_hits'].items():
+        print(f"   🚩 {name}: {hits:,} hits")
+    print(f"✅ Rescored {summary['rows']:,} trades ({summary['suspicious']:,} suspicious) in "
+          f"{summary['score_seconds']:.2f}s ({rate:,.0f} trades/sec); written back in {summary['write_seconds']:.2f}s, "
+          f"{summary['days']} day(s) of DailySummary refreshed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Tiered retention for FactTransactions
+Trades older than the retention window are written to compressed columnar archives
+(one NumPy .npz file per day, one array per column) and removed from the warehouse.
+DailySummary and the dimensions stay hot. read_transaction_analysis() answers a date
+range from the hot warehouse and the archive together, so callers never need to know
+where a day lives.
+
+Usage:
+    python retention_archiver.py archive --keep-days 90 [--dry-run] [--vacuum]
+    python retention_archiver.py list
+    python retention_archiver.py query --start 2024-01-01 --end 2024-01-31
+"""
+
+import argparse
+import logging
+import os
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_cache
+import fact_partitions
+import fixed_point
+import warehouse_codes
+import warehouse_validation
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+ARCHIVE_DIR = 'data/archive/facts'
+DEFAULT_KEEP_DAYS = 90
+
+# TransactionAnalysis columns carried into the archive alongside the fact columns
+ANALYSIS_COLUMNS = ['IsSuspicious', 'AnomalyScore', 'RiskCode']
+
+# Column order returned by read_transaction_analysis (matches vw_TransactionAnalysis)
+ANALYSIS_VIEW_COLUMNS = ['TradeID', 'Side', 'Date', 'Hour', 'DayOfWeekName', 'Price', 'VolumeQuote',
+                         'SizeBase', 'WalletAddress', 'EntityType', 'IsSuspicious', 'AnomalyScore', 'RiskLevel']
+
+CATALOG_SQL = """CREATE TABLE IF NOT EXISTS ArchivedFactDays (
+    ArchiveDate DATE PRIMARY KEY,
+    FilePath VARCHAR(255) NOT NULL,
+    RowCount INTEGER NOT NULL,
+    VolumeQuoteSum DECIMAL(20,8),
+    ArchivedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+
+def archive_path(day, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, day.strftime('%Y-%m'), f"facts_{day.isoformat()}.npz")
+
+
+def write_columnar(path, df):
+    """Write a DataFrame as one compressed array per column; strings are dictionary-encoded"""
+    arrays = {}
+    for col in df.columns:
+        values = df[col]
+        if col == 'Date':
+            arrays[col] = pd.to_datetime(values).values.astype('datetime64[D]')
+        elif not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values)):
+            cat = pd.Categorical(values.astype('string').fillna(''))
+            arrays[f"{col}__codes"] = cat.codes.astype(np.int16)
+            arrays[f"{col}__categories"] = np.asarray(cat.categories, dtype=str)
+        else:
+            arrays[col] = values.to_numpy()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path, columns=None):
+    """Read an archive file back into a DataFrame"""
+    with np.load(path, allow_pickle=False) as data:
+        names = [k for k in data.files if not k.endswith('__categories')]
+        out = {}
+        for key in names:
+            col = key[:-len('__codes')] if key.endswith('__codes') else key
+            if columns is not None and col not in columns:
+                continue
+            if key.endswith('__codes'):
+                categories = data[f"{col}__categories"]
+                values = pd.Categorical.from_codes(data[key], categories).astype(object)
+                out[col] = np.where(values == '', None, values)
+            else:
+                out[col] = data[key]
+    df = pd.DataFrame(out)
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
+    return df
+
+
+def _fact_rows_sql(fact_source):
+    analysis = ', '.join(f"ta.{c}" for c in ANALYSIS_COLUMNS)
+    return f"""
+        SELECT ft.*, dt.Date, dt.Hour, {analysis}
+        FROM {fact_source} ft
+        JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+        LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK"""
+
+
+def _months(start, end):
+    month = start.replace(day=1)
+    while month <= end:
+        yield month, min(fact_partitions.period_bounds(month, 'month')[1], end)
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _delete_hot_rows(conn, start, end):
+    """Remove archived days from the warehouse; whole partitions are dropped instead of deleted"""
+    removed = 0
+    warehouse_validation.forget_days(conn, start, end)
+    fact_cache.record_fact_write(conn)
+    date_filter = ("TimeKey IN (SELECT TimeKey FROM DimTime WHERE Date BETWEEN :start AND :end)")
+    params = {'start': start.isoformat(), 'end': end.isoformat()}
+
+    if fact_partitions.is_partitioned(conn):
+        for name, fully_covered in fact_partitions.partitions_for_range(conn, start, end):
+            if fully_covered:
+                removed += fact_partitions.drop_partition(conn, name)
+                continue
+            conn.execute(text(f"DELETE FROM TransactionAnalysis WHERE TransactionFactSK IN "
+                              f"(SELECT TransactionFactSK FROM {name} WHERE {date_filter})"), params)
+            count = conn.execute(text(f"DELETE FROM {name} WHERE {date_filter}"), params).rowcount
+            conn.execute(text("UPDATE FactPartitions SET RowCount = RowCount - :n WHERE PartitionName = :p"),
+                         {'n': count, 'p': name})
+            removed += count
+        return removed
+
+    conn.execute(text(f"DELETE FROM TransactionAnalysis WHERE TransactionFactSK IN "
+                      f"(SELECT TransactionFactSK FROM FactTransactions WHERE {date_filter})"), params)
+    return conn.execute(text(f"DELETE FROM FactTransactions WHERE {date_filter}"), params).rowcount
+
+
+def archive_old_facts(conn, keep_days=DEFAULT_KEEP_DAYS, as_of=None, archive_dir=ARCHIVE_DIR, dry_run=False):
+    """Move every day older than the retention window to the archive; returns {date: rows}"""
+    conn.execute(text(CATALOG_SQL))
+    as_of = as_of or date.today()
+    cutoff = as_of - timedelta(days=keep_days)
+
+    oldest = conn.execute(text(
+        "SELECT MIN(dt.Date) FROM FactTransactions ft JOIN DimTime dt ON ft.TimeKey = dt.TimeKey")).scalar()
+    if oldest is None or fact_partitions._parse_date(oldest) >= cutoff:
+        logger.info(f"   Nothing older than {cutoff} to archive")
+        return {}
+
+    start, end = fact_partitions._parse_date(oldest), cutoff - timedelta(days=1)
+    archived = {}
+
+    # Read a month at a time so memory stays bounded by the largest month
+    for month_start, month_end in _months(start, end):
+        source = fact_partitions.fact_range_sql(conn, month_start, month_end)
+        rows = pd.read_sql(text(_fact_rows_sql(source)), conn)
+        for day, day_rows in rows.groupby('Date', sort=True):
+            day = fact_partitions._parse_date(day)
+            archived[day] = len(day_rows)
+            if dry_run:
+                continue
+
+            path = archive_path(day, archive_dir)
+            existing = read_columnar(path) if os.path.exists(path) else None
+            if existing is not None:
+                # Days can be archived in more than one pass; keep earlier rows
+                day_rows = pd.concat([existing, day_rows.reset_index(drop=True)], ignore_index=True)
+                day_rows = day_rows.drop_duplicates('TransactionFactSK', keep='last')
+            write_columnar(path, day_rows.reset_index(drop=True))
+
+            # Verify before anything is deleted from the warehouse
+            check = read_columnar(path, columns=['TransactionFactSK'])
+            if len(check) != len(day_rows):
+                raise RuntimeError(f"Archive verification failed for {day}")
+
+            conn.execute(text(
+                "INSERT OR REPLACE INTO ArchivedFactDays (ArchiveDate, FilePath, RowCount, VolumeQuoteSum) "
+                "VALUES (:d, :p, :n, :v)"),
+                {'d': day.isoformat(), 'p': path, 'n': len(day_rows),
+                 'v': int(day_rows['VolumeQuoteCents'].sum()) / fixed_point.CENTS_PER_USD})
+
+    if not dry_run and archived:
+        removed = _delete_hot_rows(conn, start, end)
+        logger.info(f"   🧊 Archived {sum(archived.values()):,} trades over {len(archived)} days; "
+                    f"removed {removed:,} hot rows")
+    return archived
+
+
+def archived_days(conn, start_date, end_date):
+    exists = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='ArchivedFactDays'")).fetchone()
+    if not exists:
+        return []
+    return conn.execute(text(
+        "SELECT ArchiveDate, FilePath FROM ArchivedFactDays WHERE ArchiveDate BETWEEN :s AND :e ORDER BY ArchiveDate"),
+        {'s': fact_partitions._parse_date(start_date).isoformat(),
+         'e': fact_partitions._parse_date(end_date).isoformat()}).fetchall()
+
+
+def read_transaction_analysis(conn, start_date, end_date, limit=None):
+    """vw_TransactionAnalysis rows for a date range, from the archive and the hot warehouse
+
+    Archived days are always older than hot ones, so rows come back in date order.
+    """
+    frames, have = [], 0
+    for _, path in archived_days(conn, start_date, end_date):
+        if limit and have >= limit:
+            break
+        if not os.path.exists(path):
+            logger.warning(f"⚠️ Archive file missing: {path}")
+            continue
+        frames.append(read_columnar(path))
+        have += len(frames[-1])
+
+    if frames:
+        archived = pd.concat(frames, ignore_index=True)
+        # Dimension attributes stay hot; join them back onto the archived facts and decode the codes
+        wallets = pd.read_sql(text("SELECT WalletKey, WalletAddress, EntityTypeCode FROM DimWallet"), conn)
+        times = pd.read_sql(text("SELECT TimeKey, DayOfWeekNumber FROM DimTime"), conn)
+        archived = archived.merge(wallets, on='WalletKey', how='left').merge(times, on='TimeKey', how='left')
+        archived = fixed_point.decode_amounts(warehouse_codes.decode(conn, archived))
+        frames = [archived[ANALYSIS_VIEW_COLUMNS]]
+
+    if not limit or have < limit:
+        hot_sql = fact_partitions.range_view_sql(conn, 'vw_TransactionAnalysis', start_date, end_date)
+        hot_sql = f"SELECT * FROM ({hot_sql})" + (f" LIMIT {int(limit - have)}" if limit else "")
+        frames.append(pd.read_sql(text(hot_sql), conn))
+
+    result = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return result.head(limit) if limit else result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old trades to compressed columnar files")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    archive = sub.add_parser('archive', help='Move trades older than the retention window to the archive')
+    archive.add_argument('--keep-days', type=int, default=DEFAULT_KEEP_DAYS,
+                         help=f'Days of trades kept in the warehouse (default {DEFAULT_KEEP_DAYS})')
+    archive.add_argument('--as-of', help='Reference date for the window (default today)')
+    archive.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+    archive.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to shrink the warehouse file')
+
+    sub.add_parser('list', help='Show archived days')
+    query = sub.add_parser('query', help='Read a date range across hot and archived tiers')
+    query.add_argument('--start', required=True)
+    query.add_argument('--end', required=True)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    if args.command == 'archive':
+        as_of = fact_partitions._parse_date(args.as_of) if args.as_of else None
+        size_before = os.path.getsize(args.db)
+        print(f"🧊 Archiving trades older than {args.keep_days} days...")
+        with engine.begin() as conn:
+            archived = archive_old_facts(conn, args.keep_days, as_of, args.archive_dir, args.dry_run)
+            if archived and not args.dry_run:
+                # Imported here: the dashboard imports this module and does not need the ETL
+                import schema_matched_etl
+                schema_matched_etl.refresh_planner_stats(conn)
+        verb = 'Would archive' if args.dry_run else 'Archived'
+        print(f"✅ {verb} {sum(archived.values()):,} trades from {len(archived)} days")
+
+        if args.vacuum and not args.dry_run:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+            print(f"📦 Warehouse size: {size_before / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+
+    elif args.command == 'list':
+        with engine.connect() as conn:
+            conn.execute(text(CATALOG_SQL))
+            days = pd.read_sql(text("SELECT * FROM ArchivedFactDays ORDER BY ArchiveDate"), conn)
+        print(f"🧊 {len(days)} archived days, {int(days['RowCount'].sum()) if len(days) else 0:,} trades")
+        if len(days):
+            print(days.to_string(index=False))
+
+    elif args.command == 'query':
+        with engine.connect() as conn:
+            result = read_transaction_analysis(conn, args.start, args.end)
+        print(f"📋 {len(result):,} trades between {args.start} and {args.end}")
+        if len(result):
+            print(result.groupby('Date').agg(Trades=('TradeID', 'size'), Volume=('VolumeQuote', 'sum')).to_string())
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
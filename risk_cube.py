@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Pre-aggregated risk cube
+RiskCube holds trade counts and quote volume for every combination of
+Date x Side x RiskLevel x IsSuspicious x Hour x DayOfWeek x EntityType. Loads keep it
+current the same way as DailySummary: a full build after the batch ETL, and a
+refresh of just the touched days after stream batches and rescoring. Like
+DailySummary, it keeps days whose trades were archived or dropped.
+
+A day is at most a few thousand cells however many trades it holds. The dashboard
+therefore loads the whole cube once per version and answers every risk chart with
+slice() and rollup() over the full population, in milliseconds.
+
+Usage:
+    python risk_cube.py build
+    python risk_cube.py show --by RiskLevel IsSuspicious --start 2024-01-01 --end 2024-01-31
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_partitions
+import fixed_point
+import warehouse_codes
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+# Cube dimension -> stored code column (names are decoded through warehouse_codes)
+DIMENSIONS = {
+    'Date': 'Date',
+    'Side': 'SideCode',
+    'RiskLevel': 'RiskCode',
+    'IsSuspicious': 'IsSuspicious',
+    'Hour': 'Hour',
+    'DayOfWeek': 'DayOfWeekNumber',
+    'EntityType': 'EntityTypeCode',
+}
+MEASURES = ['Trades', 'VolumeQuote']
+
+CUBE_SQL = [
+    """CREATE TABLE IF NOT EXISTS RiskCube (
+        Date DATE NOT NULL,
+        SideCode TINYINT,
+        RiskCode TINYINT,
+        IsSuspicious BOOLEAN,
+        Hour INTEGER,
+        DayOfWeekNumber INTEGER,
+        EntityTypeCode SMALLINT,
+        Trades BIGINT NOT NULL,
+        VolumeQuoteCents BIGINT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_riskcube_date ON RiskCube(Date)",
+    # Bumped on every refresh, so readers can tell when to reload the cube
+    """CREATE TABLE IF NOT EXISTS RiskCubeState (
+        Id INTEGER PRIMARY KEY CHECK (Id = 1),
+        Version INTEGER NOT NULL,
+        RefreshedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+CUBE_INSERT_SQL = """
+    INSERT INTO {target} (Date, SideCode, RiskCode, IsSuspicious, Hour, DayOfWeekNumber, EntityTypeCode,
+                          Trades, VolumeQuoteCents)
+    SELECT dt.Date, ft.SideCode, ta.RiskCode, ta.IsSuspicious, dt.Hour, dt.DayOfWeekNumber, dw.EntityTypeCode,
+           COUNT(*), SUM(ft.VolumeQuoteCents)
+    FROM {facts} ft
+    JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
+    LEFT JOIN DimWallet dw ON ft.WalletKey = dw.WalletKey
+    {where}
+    GROUP BY dt.Date, ft.SideCode, ta.RiskCode, ta.IsSuspicious, dt.Hour, dt.DayOfWeekNumber, dw.EntityTypeCode
+"""
+
+
+def create_cube_tables(conn):
+    for stmt in CUBE_SQL:
+        conn.execute(text(stmt))
+
+
+def _bump_version(conn):
+    conn.execute(text(
+        "INSERT INTO RiskCubeState (Id, Version) VALUES (1, 1) "
+        "ON CONFLICT(Id) DO UPDATE SET Version = Version + 1, RefreshedAt = CURRENT_TIMESTAMP"))
+
+
+def refresh(conn, dates=None):
+    """Rebuild the cube, or only the given dates; returns the cells written
+
+    A full rebuild replaces only the days that still have hot facts, so the cells of
+    archived or dropped days survive it.
+    """
+    create_cube_tables(conn)
+    if dates is None:
+        conn.execute(text("DROP TABLE IF EXISTS temp.RiskCubeBuild"))
+        conn.execute(text("CREATE TEMP TABLE RiskCubeBuild AS SELECT * FROM RiskCube WHERE 0"))
+        conn.execute(text(CUBE_INSERT_SQL.format(target='temp.RiskCubeBuild', facts='FactTransactions', where='')))
+        conn.execute(text("DELETE FROM RiskCube WHERE Date IN (SELECT DISTINCT Date FROM temp.RiskCubeBuild)"))
+        written = conn.execute(text("INSERT INTO RiskCube SELECT * FROM temp.RiskCubeBuild")).rowcount
+        conn.execute(text("DROP TABLE temp.RiskCubeBuild"))
+    else:
+        written = 0
+        for day in sorted({pd.Timestamp(d).date().isoformat() for d in dates}):
+            conn.execute(text("DELETE FROM RiskCube WHERE Date = :d"), {'d': day})
+            facts = fact_partitions.fact_range_sql(conn, day, day)
+            written += conn.execute(text(CUBE_INSERT_SQL.format(target='RiskCube', facts=facts, where="WHERE dt.Date = :d")),
+                                    {'d': day}).rowcount
+    _bump_version(conn)
+    return written
+
+
+def cube_version(conn):
+    """Current cube version, or None when the warehouse has no cube"""
+    try:
+        return conn.execute(text("SELECT Version FROM RiskCubeState WHERE Id = 1")).scalar()
+    except Exception:
+        return None
+
+
+class RiskCube:
+    """The cube as a DataFrame of decoded cells; slices and roll-ups never touch the warehouse"""
+
+    def __init__(self, cells):
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.cells)
+
+    def slice(self, start_date=None, end_date=None, **members):
+        """Cells within a date range whose dimensions take the given member (or list of members)"""
+        mask = pd.Series(True, index=self.cells.index)
+        if start_date is not None:
+            mask &= self.cells['Date'] >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= self.cells['Date'] <= pd.Timestamp(end_date)
+        for dimension, member in members.items():
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown cube dimension: {dimension}")
+            values = member if isinstance(member, (list, tuple, set)) else [member]
+            mask &= self.cells[dimension].isin(values)
+        return RiskCube(self.cells[mask])
+
+    def rollup(self, *dimensions, measures=MEASURES):
+        """Measures summed over every dimension not listed; one row per member combination"""
+        for dimension in dimensions:
+            if dimension not in DIMENSIONS:
+                raise ValueError(f"Unknown cube dimension: {dimension}")
+        if not dimensions:
+            return self.cells[list(measures)].sum().to_frame().T
+        rolled = self.cells.groupby(list(dimensions), observed=True, dropna=False)[list(measures)].sum()
+        return rolled.reset_index()
+
+
+def load_cube(conn):
+    """The whole cube with names decoded (Date as a Timestamp, VolumeQuote in USD)"""
+    columns = ', '.join(DIMENSIONS.values())
+    cells = pd.read_sql(text(f"SELECT {columns}, Trades, VolumeQuoteCents FROM RiskCube"), conn)
+    cells = warehouse_codes.decode(conn, fixed_point.decode_amounts(cells))
+    cells['Date'] = pd.to_datetime(cells['Date'])
+    cells['IsSuspicious'] = cells['IsSuspicious'].astype('Int8')
+    cells['Hour'] = cells['Hour'].astype('Int8')
+    cells = cells.rename(columns={'DayOfWeekName': 'DayOfWeek'})
+    return RiskCube(cells[list(DIMENSIONS) + MEASURES])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the pre-aggregated risk cube")
+    parser.add_argument('--db', default=DB_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Rebuild the cube from the warehouse')
+    show = sub.add_parser('show', help='Roll the cube up by some dimensions')
+    show.add_argument('--by', nargs='+', default=['RiskLevel'], choices=list(DIMENSIONS))
+    show.add_argument('--start')
+    show.add_argument('--end')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            cells = refresh(conn)
+        print(f"✅ Risk cube built: {cells:,} cells in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    with engine.connect() as conn:
+        if cube_version(conn) is None:
+            print("❌ No risk cube; run: python risk_cube.py build")
+            return 1
+        cube = load_cube(conn)
+    start = time.perf_counter()
+    rolled = cube.slice(args.start, args.end).rollup(*args.by)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(rolled.to_string(index=False))
+    print(f"🧊 {len(cube):,} cells, rolled up in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
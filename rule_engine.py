@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Vectorized rule engine for suspicious-transaction detection
+Rules are declared in config/suspicious_rules.json and compiled once into NumPy
+mask functions over a fact chunk. The batch ETL and the streaming micro-batch path
+evaluate the same compiled rules; each trade gets a RuleHits bitmask and a
+RuleHitCount, and every evaluation logs per-rule hits and timing to RuleStats.
+
+A fact chunk is a DataFrame with PriceCents, VolumeQuoteCents, SizeBaseSat,
+WalletKey and TradeTimestampMs columns, and optionally WalletAddress (only the
+columns the rules use are needed).
+
+A threshold rule may also give "percentile" (and "percentile_days"). Its value is
+then that percentile of the column over the latest days of quantile sketches, read
+when the rules are compiled; "value" is used until the sketches exist.
+
+Usage:
+    python rule_engine.py show
+    python rule_engine.py bench --rows 1000000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fixed_point
+import quantile_sketches
+import velocity_detector
+import wallet_screening
+import warehouse_codes
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+RULES_PATH = 'config/suspicious_rules.json'
+MAX_RULE_BIT = 62
+
+RULE_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS DimRule (
+        RuleBit INTEGER PRIMARY KEY,
+        RuleName VARCHAR(50) NOT NULL UNIQUE,
+        RuleType VARCHAR(50) NOT NULL,
+        Description TEXT,
+        IsSuspicious BOOLEAN DEFAULT 1
+    )""",
+    """CREATE TABLE IF NOT EXISTS RuleStats (
+        RuleStatKey INTEGER PRIMARY KEY AUTOINCREMENT,
+        EvaluatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        Source VARCHAR(20),
+        RuleName VARCHAR(50) NOT NULL,
+        RuleBit INTEGER,
+        RowsEvaluated INTEGER,
+        Hits INTEGER,
+        Seconds REAL,
+        RowsPerSec REAL
+    )""",
+]
+
+COMPARISONS = {'>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal, '==': np.equal}
+
+
+def _int_column(frame, column):
+    """(values, valid) for an integer column; missing values are reported as invalid"""
+    if column not in frame.columns:
+        raise ValueError(f"Rule input column missing from fact chunk: {column}")
+    series = frame[column]
+    return series.fillna(0).to_numpy(dtype=np.int64), series.notna().to_numpy()
+
+
+def _fixed(column, amount):
+    """Storage column and integer units for an amount given in decimal units"""
+    if column in fixed_point.FIXED_COLUMNS:
+        fixed_column, scale = fixed_point.FIXED_COLUMNS[column]
+        return fixed_column, int(round(amount * scale))
+    return column, amount
+
+
+def _threshold_amount(spec, conn):
+    """The configured value, or a live percentile of the column when the rule asks for one"""
+    if 'percentile' in spec and conn is not None:
+        live = quantile_sketches.live_percentile(conn, spec['column'], spec['percentile'], spec.get('percentile_days'))
+        if live is not None:
+            logger.info(f"   📏 {spec['name']}: {spec['column']} p{spec['percentile'] * 100:g} = {live:,.2f}")
+            return live
+    if spec.get('value') is None:
+        raise ValueError(f"Rule {spec['name']}: needs a value to use until quantile sketches exist")
+    return spec['value']
+
+
+def _compile_threshold(spec, conn):
+    column, value = _fixed(spec['column'], _threshold_amount(spec, conn))
+    compare = COMPARISONS[spec.get('op', '>')]
+
+    def evaluate(frame):
+        values, valid = _int_column(frame, column)
+        return compare(values, value) & valid
+    return evaluate
+
+
+def _compile_round_amount(spec, conn):
+    column, multiple = _fixed(spec['column'], spec['multiple'])
+    if multiple <= 0:
+        raise ValueError(f"Rule {spec['name']}: multiple must be positive")
+
+    def evaluate(frame):
+        values, valid = _int_column(frame, column)
+        return (values % multiple == 0) & valid
+    return evaluate
+
+
+def _compile_rapid_succession(spec, conn):
+    window_ms = int(spec['window_seconds'] * 1000)
+    min_trades = int(spec['min_trades'])
+
+    def evaluate(frame):
+        wallet, wallet_valid = _int_column(frame, 'WalletKey')
+        ts, ts_valid = _int_column(frame, 'TradeTimestampMs')
+        mask = np.zeros(len(frame), dtype=bool)
+        if len(frame) < min_trades:
+            return mask
+
+        # Sort by (wallet, time) and fold both into one monotone key so a single
+        # searchsorted finds the start of each trade's window within its wallet
+        order = np.lexsort((ts, wallet))
+        w, t = wallet[order], ts[order] - ts.min()
+        span = int(t.max()) + window_ms + 1
+        if int(w.max()) >= (2 ** 62) // span or int(w.min()) < 0:
+            raise ValueError(f"Rule {spec['name']}: wallet keys or time range too large for one chunk")
+        key = w * span + t
+        window_start = np.searchsorted(key, key - window_ms, side='left')
+        in_window = np.arange(len(key)) - window_start + 1
+        mask[order] = in_window >= min_trades
+        return mask & wallet_valid & ts_valid
+    return evaluate
+
+
+def _compile_velocity(spec, conn):
+    min_volume = spec.get('min_volume')
+    detector = velocity_detector.VelocityDetector(
+        window_seconds=spec['window_seconds'],
+        min_trades=spec.get('min_trades'),
+        min_volume_cents=fixed_point.cents(min_volume) if min_volume is not None else None,
+        buckets=spec.get('buckets', velocity_detector.DEFAULT_BUCKETS),
+        max_wallets=spec.get('max_wallets', velocity_detector.DEFAULT_MAX_WALLETS))
+
+    # The detector lives as long as the compiled rule set, so state carries across stream batches
+    def evaluate(frame):
+        wallet, wallet_valid = _int_column(frame, 'WalletKey')
+        ts, ts_valid = _int_column(frame, 'TradeTimestampMs')
+        volume = _int_column(frame, 'VolumeQuoteCents')[0] if 'VolumeQuoteCents' in frame.columns else None
+        valid = wallet_valid & ts_valid
+        mask = np.zeros(len(frame), dtype=bool)
+        mask[valid] = detector.observe_batch(wallet[valid], ts[valid], volume[valid] if volume is not None else None)
+        return mask
+    evaluate.detector = detector
+    return evaluate
+
+
+def _compile_wallet_in(spec, conn):
+    attribute = spec['attribute']
+    if conn is None:
+        logger.warning(f"⚠️ Rule {spec['name']} needs the warehouse; it will not fire")
+        flagged = np.zeros(0, dtype=bool)
+    else:
+        values = spec['values']
+        if attribute in warehouse_codes.LOOKUP_BY_NAME:
+            lookup = warehouse_codes.LOOKUP_BY_NAME[attribute]
+            known = warehouse_codes.lookup_frame(conn, attribute)
+            values = known.loc[known['name'].isin(values), 'code'].tolist()
+            attribute = lookup.code_column
+        wallets = pd.read_sql(text(f"SELECT WalletKey, {attribute} AS value FROM DimWallet"), conn)
+        keys = wallets['WalletKey'].to_numpy(dtype=np.int64)
+        flagged = np.zeros(int(keys.max()) + 1 if len(keys) else 0, dtype=bool)
+        flagged[keys] = wallets['value'].isin(values).to_numpy()
+
+    def evaluate(frame):
+        wallet, valid = _int_column(frame, 'WalletKey')
+        in_range = valid & (wallet >= 0) & (wallet < len(flagged))
+        mask = np.zeros(len(frame), dtype=bool)
+        mask[in_range] = flagged[wallet[in_range]]
+        return mask
+    return evaluate
+
+
+def _wallet_addresses(conn):
+    """WalletAddress indexed by WalletKey"""
+    wallets = pd.read_sql(text("SELECT WalletKey, WalletAddress FROM DimWallet"), conn)
+    keys = wallets['WalletKey'].to_numpy(dtype=np.int64)
+    addresses = np.full(int(keys.max()) + 1 if len(keys) else 0, None, dtype=object)
+    addresses[keys] = wallets['WalletAddress'].to_numpy(dtype=object)
+    return addresses
+
+
+def _compile_watchlist(spec, conn):
+    screen = wallet_screening.WatchlistScreen(
+        conn, spec.get('path', wallet_screening.WATCHLIST_PATH),
+        include_reported=spec.get('include_reported', True),
+        error_rate=spec.get('error_rate', wallet_screening.DEFAULT_ERROR_RATE),
+        refresh_seconds=spec.get('refresh_seconds', wallet_screening.DEFAULT_REFRESH_SECONDS))
+    state = {'addresses': _wallet_addresses(conn) if conn is not None else np.empty(0, dtype=object)}
+
+    def evaluate(frame):
+        # Streamed trades may carry their address; warehouse chunks resolve it from WalletKey
+        if 'WalletAddress' in frame.columns:
+            addresses = frame['WalletAddress'].to_numpy(dtype=object)
+        else:
+            wallet, valid = _int_column(frame, 'WalletKey')
+            known = state['addresses']
+            in_range = valid & (wallet >= 0) & (wallet < len(known))
+            addresses = np.full(len(frame), None, dtype=object)
+            addresses[in_range] = known[wallet[in_range]]
+        return screen.screen_batch(addresses)
+
+    def refresh(conn):
+        if screen.refresh(conn):
+            state['addresses'] = _wallet_addresses(conn)
+    evaluate.screen = screen
+    evaluate.refresh = refresh
+    return evaluate
+
+
+# Rule type -> compiler(spec, conn) returning evaluate(frame) -> bool mask
+RULE_TYPES = {
+    'threshold': _compile_threshold,
+    'round_amount': _compile_round_amount,
+    'rapid_succession': _compile_rapid_succession,
+    'velocity': _compile_velocity,
+    'wallet_in': _compile_wallet_in,
+    'watchlist': _compile_watchlist,
+}
+
+
+class RuleResult:
+    """Outcome of evaluating a rule set over one chunk"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.hits = np.zeros(rows, dtype=np.int64)
+        self.hit_count = np.zeros(rows, dtype=np.int64)
+        self.suspicious = np.zeros(rows, dtype=bool)
+        self.rule_hits = {}
+        self.rule_seconds = {}
+
+
+class RuleSet:
+    """Compiled rules, ready to evaluate fact chunks"""
+
+    def __init__(self, specs, conn=None):
+        self.specs = specs
+        self.rules = []
+        bits = set()
+        for spec in specs:
+            if spec.get('enabled', True) is False:
+                continue
+            kind = spec.get('type')
+            if kind not in RULE_TYPES:
+                raise ValueError(f"Rule {spec.get('name')}: unknown type {kind!r} (known: {', '.join(RULE_TYPES)})")
+            bit = int(spec['bit'])
+            if bit in bits or not 0 <= bit <= MAX_RULE_BIT:
+                raise ValueError(f"Rule {spec['name']}: bit {bit} is duplicated or outside 0..{MAX_RULE_BIT}")
+            bits.add(bit)
+            self.rules.append((spec, RULE_TYPES[kind](spec, conn)))
+
+    def reset(self):
+        """Start stateful window rules (velocity) from empty, e.g. before an unrelated range of trades"""
+        self.rules = [(spec, RULE_TYPES[spec['type']](spec, None) if hasattr(evaluate, 'detector') else evaluate)
+                      for spec, evaluate in self.rules]
+
+    def refresh(self, conn):
+        """Let rules with external sources (watchlists) pick up changes between batches"""
+        for _, evaluate in self.rules:
+            if hasattr(evaluate, 'refresh'):
+                evaluate.refresh(conn)
+
+    def evaluate(self, frame):
+        result = RuleResult(len(frame))
+        for spec, evaluate in self.rules:
+            start = time.perf_counter()
+            mask = np.asarray(evaluate(frame), dtype=bool)
+            result.rule_seconds[spec['name']] = time.perf_counter() - start
+            result.rule_hits[spec['name']] = int(mask.sum())
+            result.hits |= mask.astype(np.int64) << spec['bit']
+            result.hit_count += mask
+            if spec.get('suspicious', True):
+                result.suspicious |= mask
+        return result
+
+
+def load_rules(path=RULES_PATH):
+    """Rule specs from the config file"""
+    with open(path) as f:
+        return json.load(f)['rules']
+
+
+def compile_rules(conn=None, path=RULES_PATH):
+    """Load and compile the configured rules; conn is needed for wallet attribute rules"""
+    return RuleSet(load_rules(path), conn)
+
+
+def create_rule_tables(conn, rule_set=None):
+    """Create DimRule / RuleStats and register the rule definitions"""
+    for stmt in RULE_TABLES_SQL:
+        conn.execute(text(stmt))
+    if rule_set is not None:
+        conn.execute(text("DELETE FROM DimRule"))
+        conn.execute(text(
+            "INSERT INTO DimRule (RuleBit, RuleName, RuleType, Description, IsSuspicious) "
+            "VALUES (:bit, :name, :type, :description, :suspicious)"),
+            [{'bit': spec['bit'], 'name': spec['name'], 'type': spec['type'],
+              'description': spec.get('description'), 'suspicious': int(spec.get('suspicious', True))}
+             for spec, _ in rule_set.rules])
+
+
+def record_stats(conn, rule_set, result, source):
+    """Append per-rule hit counts and timing for one evaluation to RuleStats"""
+    evaluated_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+    rows = []
+    for spec, _ in rule_set.rules:
+        seconds = result.rule_seconds[spec['name']]
+        rows.append({'at': evaluated_at, 'source': source, 'name': spec['name'], 'bit': spec['bit'],
+                     'rows': result.rows, 'hits': result.rule_hits[spec['name']], 'seconds': seconds,
+                     'rps': result.rows / seconds if seconds > 0 else None})
+    if rows:
+        conn.execute(text(
+            "INSERT INTO RuleStats (EvaluatedAt, Source, RuleName, RuleBit, RowsEvaluated, Hits, Seconds, RowsPerSec) "
+            "VALUES (:at, :source, :name, :bit, :rows, :hits, :seconds, :rps)"), rows)
+
+
+def synthetic_chunk(rows, wallets=5000, seed=42):
+    """Fact chunk with realistic value ranges for benchmarking"""
+    rng = np.random.default_rng(seed)
+    price = rng.normal(40000, 3000, rows)
+    size = rng.exponential(0.5, rows)
+    return pd.DataFrame({
+        'PriceCents': fixed_point.to_cents(np.round(price, 2)),
+        'VolumeQuoteCents': fixed_point.to_cents(np.round(price * size, 2)),
+        'SizeBaseSat': fixed_point.to_sat(size),
+        'WalletKey': rng.integers(1, wallets + 1, rows),
+        'TradeTimestampMs': np.sort(rng.integers(0, 30 * 86400 * 1000, rows)),
+    })
+
+
+def benchmark(make_rule_set, rows, repeats=3):
+    """Best-of-N rows/sec per rule over a synthetic chunk
+
+    make_rule_set() is called for every repeat so stateful rules (velocity) start empty.
+    """
+    frame = synthetic_chunk(rows)
+    best = {}
+    for _ in range(repeats):
+        result = make_rule_set().evaluate(frame)
+        for name, seconds in result.rule_seconds.items():
+            best[name] = min(best.get(name, float('inf')), seconds)
+    return {name: {'seconds': s, 'rows_per_sec': rows / s if s > 0 else None, 'hits': result.rule_hits[name]}
+            for name, s in best.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suspicious-transaction rule engine")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    parser.add_argument('--rules', default=RULES_PATH, help=f'Rule config (default {RULES_PATH})')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('show', help='List the configured rules and their recent stats')
+    bench = sub.add_parser('bench', help='Benchmark per-rule throughput on a synthetic chunk')
+    bench.add_argument('--rows', type=int, default=1_000_000)
+    bench.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}') if os.path.exists(args.db) else None
+
+    if args.command == 'show':
+        specs = load_rules(args.rules)
+        print(f"📜 {len(specs)} rules in {args.rules}")
+        for spec in specs:
+            flag = '🚩' if spec.get('suspicious', True) else 'ℹ️'
+            print(f"   {flag} bit {spec['bit']:>2}  {spec['name']:<18} {spec['type']:<17} {spec.get('description', '')}")
+        if engine is not None:
+            try:
+                stats = pd.read_sql(text(
+                    "SELECT Source, RuleName, SUM(RowsEvaluated) AS RowsEvaluated, SUM(Hits) AS Hits, "
+                    "SUM(RowsEvaluated) / SUM(Seconds) AS RowsPerSec FROM RuleStats "
+                    "GROUP BY Source, RuleName ORDER BY Source, RuleName"), engine)
+                print("\n📊 RuleStats:")
+                print(stats.to_string(index=False))
+            except Exception:
+                pass
+        return 0
+
+    def make_rule_set():
+        if engine is None:
+            return compile_rules(None, args.rules)
+        with engine.connect() as conn:
+            return compile_rules(conn, args.rules)
+
+    print(f"⏱️ Benchmarking {len(load_rules(args.rules))} rules on {args.rows:,} rows (best of {args.repeats})")
+    results = benchmark(make_rule_set, args.rows, args.repeats)
+    for name, r in results.items():
+        print(f"   {name:<18} {r['seconds'] * 1000:>9.2f} ms  {r['rows_per_sec'] or 0:>16,.0f} rows/sec  {r['hits']:>9,} hits")
+    total = sum(r['seconds'] for r in results.values())
+    print(f"   {'all rules':<18} {total * 1000:>9.2f} ms  {args.rows / total if total else 0:>16,.0f} rows/sec")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,22 +9,59 @@ import sqlite3
 import numpy as np
 from sqlalchemy import create_engine, text
 import logging
+import argparse
+import os
+import re
+
+from etl_run_report import RunReport
+import fact_partitions
+import fact_cache
+import warehouse_codes
+import fixed_point
+import rule_engine
+import anomaly_model
+import taint_propagation
+import trade_dedup
+import warehouse_swap
+import warehouse_validation
+import risk_cube
+import wallet_sketches
+import quantile_sketches
+import wallet_leaders
+import retention_archiver
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def create_data_warehouse_with_your_schema():
+# Warehouse and source locations (overridable for benchmarks and tests)
+DW_PATH = 'data/bitcoin_unified_dw.db'
+SOURCE_DBS = {
+    'time': 'data/time_data.db',
+    'market': 'data/dim_market.db',
+    'wallet': 'data/dim_wallet.db',
+    'transactions': 'data/bitcoin_dw.db',
+}
+
+# Default extract limits; pass None to load the full source tables
+TIME_LIMIT = 20000
+FACT_LIMIT = 10000
+
+# Source trades loaded, scored and committed per transaction
+FACT_CHUNK_SIZE = 100000
+
+def _limit_clause(limit):
+    return f" LIMIT {int(limit)}" if limit is not None else ""
+
+def create_data_warehouse_with_your_schema(dw_path=DW_PATH):
     """Create data warehouse matching your exact schema"""
     logger.info("🏗️ Creating data warehouse with your exact schema...")
     
-    dw_path = 'data/bitcoin_unified_dw.db'
     dw_engine = create_engine(f'sqlite:///{dw_path}')
     
     # Remove existing database for clean start
-    import os
     if os.path.exists(dw_path):
         os.remove(dw_path)
-        logger.info("   Removed existing data warehouse")
+        logger.info(f"   Removed existing {os.path.basename(dw_path)}")
     
     # Create schema matching your exact structure
     schema_sql = [
@@ -36,10 +73,8 @@ def create_data_warehouse_with_your_schema():
             Year INTEGER,
             Quarter INTEGER,
             Month INTEGER,
-            MonthName VARCHAR(20),
             Day INTEGER,
             DayOfWeekNumber INTEGER,
-            DayOfWeekName VARCHAR(20),
             Hour INTEGER,
             Minute INTEGER,
             Second INTEGER,
@@ -69,24 +104,27 @@ def create_data_warehouse_with_your_schema():
             FinalBalanceSatoshi BIGINT,
             LabelSource VARCHAR(100),
             EntityTag VARCHAR(100),
-            EntityType VARCHAR(100),
+            EntityTypeCode SMALLINT,
             IsReportedAbuse BOOLEAN,
-            AbuseCategory VARCHAR(100)
+            AbuseCategoryCode SMALLINT,
+            FOREIGN KEY (EntityTypeCode) REFERENCES DimEntityType(EntityTypeCode),
+            FOREIGN KEY (AbuseCategoryCode) REFERENCES DimAbuseCategory(AbuseCategoryCode)
         )""",
         
         # FactTransactions - matches your schema exactly
         """CREATE TABLE FactTransactions (
             TransactionFactSK INTEGER PRIMARY KEY AUTOINCREMENT,
             TradeID BIGINT NOT NULL,
-            Side VARCHAR(10),
+            SideCode TINYINT,
             TimeKey INTEGER,
             MarketDateKey INTEGER,
             WalletKey INTEGER,
-            Price DECIMAL(15,2),
-            VolumeQuote DECIMAL(20,8),
-            SizeBase DECIMAL(20,8),
+            PriceCents BIGINT,
+            VolumeQuoteCents BIGINT,
+            SizeBaseSat BIGINT,
             FOREIGN KEY (TimeKey) REFERENCES DimTime(TimeKey),
             FOREIGN KEY (MarketDateKey) REFERENCES DimMarket(MarketDateKey),
+            FOREIGN KEY (SideCode) REFERENCES DimSide(SideCode),
             FOREIGN KEY (WalletKey) REFERENCES DimWallet(WalletKey)
         )""",
         
@@ -96,9 +134,13 @@ def create_data_warehouse_with_your_schema():
             TransactionFactSK INTEGER,
             IsSuspicious BOOLEAN DEFAULT 0,
             AnomalyScore DECIMAL(5,2) DEFAULT 0,
-            RiskLevel VARCHAR(20) DEFAULT 'LOW',
+            RiskCode TINYINT DEFAULT 0,
+            RuleHits INTEGER DEFAULT 0,
+            RuleHitCount INTEGER DEFAULT 0,
+            ModelVersion INTEGER,
             AnalysisDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (TransactionFactSK) REFERENCES FactTransactions(TransactionFactSK)
+            FOREIGN KEY (TransactionFactSK) REFERENCES FactTransactions(TransactionFactSK),
+            FOREIGN KEY (RiskCode) REFERENCES DimRiskLevel(RiskCode)
         )""",
         
         # Daily summary table
@@ -106,20 +148,21 @@ def create_data_warehouse_with_your_schema():
             SummaryKey INTEGER PRIMARY KEY AUTOINCREMENT,
             SummaryDate DATE NOT NULL UNIQUE,
             TotalTransactions INTEGER,
-            TotalVolumeUSD DECIMAL(20,2),
-            AvgPrice DECIMAL(15,2),
-            MaxPrice DECIMAL(15,2),
-            MinPrice DECIMAL(15,2),
+            TotalVolumeCents BIGINT,
+            AvgPriceCents BIGINT,
+            MaxPriceCents BIGINT,
+            MinPriceCents BIGINT,
             SuspiciousTransactions INTEGER,
             HighRiskTransactions INTEGER
         )""",
         
         # Indexes for performance
-        "CREATE INDEX idx_fact_tradeid ON FactTransactions(TradeID)",
+        "CREATE UNIQUE INDEX idx_fact_tradeid ON FactTransactions(TradeID)",
         "CREATE INDEX idx_fact_timekey ON FactTransactions(TimeKey)",
         "CREATE INDEX idx_fact_marketkey ON FactTransactions(MarketDateKey)",
         "CREATE INDEX idx_fact_walletkey ON FactTransactions(WalletKey)",
-        "CREATE INDEX idx_fact_price ON FactTransactions(Price)",
+        "CREATE INDEX idx_fact_price ON FactTransactions(PriceCents)",
+        "CREATE INDEX idx_analysis_factsk ON TransactionAnalysis(TransactionFactSK)",
         "CREATE INDEX idx_dimtime_date ON DimTime(Date)",
         "CREATE INDEX idx_dimmarket_date ON DimMarket(MarketDate)",
         "CREATE INDEX idx_dimwallet_address ON DimWallet(WalletAddress)"
@@ -131,6 +174,17 @@ def create_data_warehouse_with_your_schema():
                 conn.execute(text(stmt))
                 logger.info(f"   ✅ Schema statement {i+1}/{len(schema_sql)} executed")
             
+            # Lookup dimensions for the dictionary-encoded columns
+            warehouse_codes.create_lookup_tables(conn)
+            taint_propagation.create_taint_tables(conn)
+            anomaly_model.create_model_tables(conn)
+            conn.execute(text(CHECKPOINT_SQL))
+            warehouse_validation.create_stats_table(conn)
+            risk_cube.create_cube_tables(conn)
+            wallet_sketches.create_sketch_tables(conn)
+            quantile_sketches.create_sketch_tables(conn)
+            wallet_leaders.create_leader_tables(conn)
+            
             conn.commit()
             logger.info("✅ Schema created successfully")
         
@@ -140,188 +194,465 @@ def create_data_warehouse_with_your_schema():
         logger.error(f"❌ Schema creation failed: {e}")
         return None
 
-def load_your_data(dw_engine):
-    """Load data from your existing databases"""
+def _read_source(path, sql):
+    source = sqlite3.connect(path)
+    try:
+        return pd.read_sql(sql, source)
+    finally:
+        source.close()
+
+def extract_dim_time(source, limit=TIME_LIMIT):
+    return _read_source(source, "SELECT * FROM dim_time" + _limit_clause(limit))
+
+def transform_dim_time(time_df):
+    """Map source time rows to DimTime columns"""
+    time_mapped = pd.DataFrame()
+    time_mapped['FullTimestamp'] = pd.to_datetime(time_df['timestamp'])
+    time_mapped['Date'] = time_mapped['FullTimestamp'].dt.date
+    time_mapped['Year'] = time_df['year']
+    time_mapped['Quarter'] = time_mapped['FullTimestamp'].dt.quarter
+    time_mapped['Month'] = time_df['month']
+    time_mapped['Day'] = time_df['day']
+    # MonthName / DayOfWeekName live in DimMonth / DimDayOfWeek
+    time_mapped['DayOfWeekNumber'] = time_mapped['FullTimestamp'].dt.dayofweek
+    time_mapped['Hour'] = time_df['hour']
+    time_mapped['Minute'] = time_mapped['FullTimestamp'].dt.minute
+    time_mapped['Second'] = time_mapped['FullTimestamp'].dt.second
+    time_mapped['IsWeekend'] = (time_mapped['FullTimestamp'].dt.dayofweek >= 5).astype(int)
+    time_mapped['WeekOfYear'] = time_mapped['FullTimestamp'].dt.isocalendar().week
+    return time_mapped
+
+def extract_dim_market(source):
+    return _read_source(source, "SELECT * FROM dim_market")
+
+def transform_dim_market(market_df):
+    """Map source market rows to DimMarket columns"""
+    market_mapped = pd.DataFrame()
+    market_mapped['MarketDate'] = pd.to_datetime(market_df['date']).dt.date
+    market_mapped['btc_usd_price_open'] = market_df['btc_usd_price_open']
+    market_mapped['btc_usd_price_close'] = market_df['btc_usd_price_close']
+    market_mapped['volume_usd'] = market_df['volume_usd']
+    market_mapped['market_cap_usd'] = market_df['market_cap_usd']
+    return market_mapped
+
+def extract_dim_wallet(source):
+    return _read_source(source, "SELECT * FROM dim_wallet")
+
+def transform_dim_wallet(conn, wallet_df):
+    """Map source wallet rows to DimWallet columns (registers new entity types / abuse categories)"""
+    wallet_mapped = pd.DataFrame()
+    wallet_mapped['WalletAddress'] = wallet_df['wallet_address']
+    wallet_mapped['FirstSeenTimestamp'] = pd.to_datetime(wallet_df['first_seen_timestamp'], errors='coerce')
+    wallet_mapped['LastSeenTimestamp'] = pd.to_datetime(wallet_df['last_seen_timestamp'], errors='coerce')
+    wallet_mapped['TransactionCount'] = wallet_df['transaction_count']
+    wallet_mapped['TotalReceivedSatoshi'] = wallet_df['total_received_satoshi']
+    wallet_mapped['TotalSentSatoshi'] = wallet_df['total_sent_satoshi']
+    wallet_mapped['FinalBalanceSatoshi'] = wallet_df['final_balance_satoshi']
+    wallet_mapped['LabelSource'] = wallet_df['label_source']
+    wallet_mapped['EntityTag'] = wallet_df['entity_tag']
+    wallet_mapped['EntityTypeCode'] = warehouse_codes.encode(conn, 'EntityType', wallet_df['entity_type'])
+    wallet_mapped['IsReportedAbuse'] = wallet_df['is_reported_abuse']
+    wallet_mapped['AbuseCategoryCode'] = warehouse_codes.encode(conn, 'AbuseCategory', wallet_df['abuse_category'])
+    return wallet_mapped
+
+def extract_trades(source, limit=FACT_LIMIT, after=0):
+    """Source trades in rowid order after a source rowid; SourceRowID is the resume key"""
+    return _read_source(source, f"SELECT rowid AS SourceRowID, * FROM fact_transactions WHERE rowid > {int(after)} "
+                                "ORDER BY rowid" + _limit_clause(limit))
+
+def transform_trades(conn, trans_df):
+    """Map source trades to FactTransactions columns (keys are added by map_trade_keys)"""
+    trans_mapped = pd.DataFrame()
+    trans_mapped['TradeID'] = trans_df['trade_id']
+    trans_mapped['SideCode'] = warehouse_codes.encode(conn, 'Side', trans_df['side'])
+    # Amounts are stored as integer cents / satoshi
+    trans_mapped['PriceCents'] = fixed_point.to_cents(trans_df['price'])
+    trans_mapped['VolumeQuoteCents'] = fixed_point.to_cents(trans_df['volume(quote)'])
+    trans_mapped['SizeBaseSat'] = fixed_point.to_sat(trans_df['size(base)'])
+    return trans_mapped
+
+def map_trade_keys(conn, trans_df, trans_mapped):
+    """Add TimeKey, MarketDateKey and WalletKey to trans_mapped; returns the trade dates"""
+    # Get foreign key mappings
+    time_keys = pd.read_sql("SELECT TimeKey, FullTimestamp, Date FROM DimTime ORDER BY TimeKey", conn)
+    market_keys = pd.read_sql("SELECT MarketDateKey, MarketDate FROM DimMarket", conn)
+    wallet_keys = pd.read_sql("SELECT WalletKey FROM DimWallet", conn)
+    
+    # For TimeKey - match the trade's hour; DimTime is hour grain
+    trans_timestamps = pd.to_datetime(trans_df['timestamp'], unit='ms')
+    trans_dates = trans_timestamps.dt.date
+    
+    # Create lookups for time keys (timestamps and dates come back from SQLite as ISO strings)
+    time_keys['Hour'] = pd.to_datetime(time_keys['FullTimestamp']).dt.floor('h')
+    time_keys['Date'] = pd.to_datetime(time_keys['Date']).dt.date
+    hour_lookup = time_keys.drop_duplicates('Hour').set_index('Hour')['TimeKey']
+    # Trades in an hour DimTime lacks fall back to the first TimeKey of their date
+    date_lookup = time_keys.drop_duplicates('Date').set_index('Date')['TimeKey']
+    trans_mapped['TimeKey'] = trans_timestamps.dt.floor('h').map(hour_lookup).fillna(trans_dates.map(date_lookup))
+    
+    # For MarketDateKey - match by date
+    market_keys['MarketDate'] = pd.to_datetime(market_keys['MarketDate']).dt.date
+    market_lookup = market_keys.set_index('MarketDate')['MarketDateKey'].to_dict()
+    trans_mapped['MarketDateKey'] = trans_dates.map(market_lookup)
+    
+    # For WalletKey - random assignment (since we don't have transaction->wallet mapping)
+    if len(wallet_keys) > 0:
+        trans_mapped['WalletKey'] = np.random.choice(wallet_keys['WalletKey'], size=len(trans_df), replace=True)
+    
+    # Clean up NaN values
+    trans_mapped['TimeKey'] = trans_mapped['TimeKey'].fillna(1)
+    trans_mapped['MarketDateKey'] = trans_mapped['MarketDateKey'].fillna(1)
+    trans_mapped['WalletKey'] = trans_mapped['WalletKey'].fillna(1)
+    return trans_dates
+
+def insert_trades(conn, trans_mapped, trans_dates, on_conflict='ignore'):
+    """Append mapped trades to FactTransactions (or its partitions); returns their TransactionFactSKs
+    
+    TradeIDs that are already loaded get SK 0 (on_conflict='ignore') or are updated
+    in place and keep their existing SK (on_conflict='update').
+    """
+    fact_cache.record_fact_write(conn)
+    if fact_partitions.is_partitioned(conn):
+        return fact_partitions.insert_facts(conn, trans_mapped, trans_dates, on_conflict).to_numpy()
+    # Single writer inside the transaction, so every SK above the old maximum is ours
+    before = conn.execute(text("SELECT COALESCE(MAX(TransactionFactSK), 0) FROM FactTransactions")).scalar()
+    written = trans_mapped.to_sql('FactTransactions', conn, if_exists='append', index=False,
+                                  method=trade_dedup.insert_method(on_conflict))
+    if on_conflict == 'ignore' and written == len(trans_mapped):
+        return pd.read_sql(text("SELECT TransactionFactSK FROM FactTransactions WHERE TransactionFactSK > :sk "
+                                "ORDER BY TransactionFactSK"), conn, params={'sk': before})['TransactionFactSK'].to_numpy()
+    sks = trade_dedup.trade_sks(conn, 'FactTransactions', trans_mapped['TradeID'])
+    return sks if on_conflict == 'update' else np.where(sks > before, sks, 0)
+
+def score_trades(conn, rule_set, trans_df, trans_mapped, fact_sks, model=None):
+    """TransactionAnalysis rows for freshly inserted trades, plus the rule evaluation result
+
+    model is an anomaly_model.AnomalyModel; without one AnomalyScore is a random placeholder.
+    """
+    chunk = trans_mapped.reset_index(drop=True).copy()
+    chunk['TradeTimestampMs'] = trans_df['timestamp'].to_numpy()
+    rule_result = rule_set.evaluate(chunk)
+    
+    analysis_data = pd.DataFrame()
+    analysis_data['TransactionFactSK'] = fact_sks
+    analysis_data['IsSuspicious'] = rule_result.suspicious.astype(int)
+    analysis_data['RuleHits'] = rule_result.hits
+    analysis_data['RuleHitCount'] = rule_result.hit_count
+    
+    # Anomaly score (model scores can be exactly 0, hence include_lowest)
+    analysis_data['AnomalyScore'], analysis_data['ModelVersion'] = anomaly_model.anomaly_scores(
+        conn, model, chunk, rule_result.suspicious)
+    
+    # Risk level
+    risk_level = pd.cut(
+        analysis_data['AnomalyScore'], 
+        bins=[0, 25, 50, 75, 100], 
+        labels=warehouse_codes.RISK_LEVELS,
+        include_lowest=True
+    )
+    analysis_data['RiskCode'] = warehouse_codes.encode(conn, 'RiskLevel', risk_level)
+    return analysis_data, rule_result
+
+DAILY_SUMMARY_SQL = """
+    INSERT OR REPLACE INTO DailySummary (
+        SummaryDate, TotalTransactions, TotalVolumeCents, AvgPriceCents, 
+        MaxPriceCents, MinPriceCents, SuspiciousTransactions, HighRiskTransactions
+    )
+    SELECT 
+        dt.Date as SummaryDate,
+        COUNT(*) as TotalTransactions,
+        SUM(ft.VolumeQuoteCents) as TotalVolumeCents,
+        CAST(ROUND(AVG(ft.PriceCents)) AS INTEGER) as AvgPriceCents,
+        MAX(ft.PriceCents) as MaxPriceCents,
+        MIN(ft.PriceCents) as MinPriceCents,
+        SUM(CASE WHEN ta.IsSuspicious = 1 THEN 1 ELSE 0 END) as SuspiciousTransactions,
+        SUM(CASE WHEN rl.RiskLevel IN ('HIGH', 'CRITICAL') THEN 1 ELSE 0 END) as HighRiskTransactions
+    FROM {facts} ft
+    JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
+    LEFT JOIN DimRiskLevel rl ON ta.RiskCode = rl.RiskCode
+    {where}
+    GROUP BY dt.Date
+    ORDER BY dt.Date
+"""
+
+def refresh_daily_summary(conn, dates=None):
+    """Rebuild DailySummary, or only the given dates; returns the rows written
+    
+    A full rebuild replaces the rows of days that still have hot facts and keeps the
+    rows of archived or dropped days.
+    """
+    if dates is None:
+        return conn.execute(text(DAILY_SUMMARY_SQL.format(facts='FactTransactions', where=''))).rowcount
+    
+    written = 0
+    for day in sorted({pd.Timestamp(d).date().isoformat() for d in dates}):
+        conn.execute(text("DELETE FROM DailySummary WHERE SummaryDate = :d"), {'d': day})
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        written += conn.execute(text(DAILY_SUMMARY_SQL.format(facts=facts, where="WHERE dt.Date = :d")),
+                                {'d': day}).rowcount
+    return written
+
+CHECKPOINT_SQL = """CREATE TABLE IF NOT EXISTS EtlCheckpoints (
+    Stage VARCHAR(50) PRIMARY KEY,
+    LastSourceKey BIGINT,
+    RowsDone BIGINT,
+    IsComplete BOOLEAN DEFAULT 0,
+    UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)"""
+
+def read_checkpoints(conn):
+    """Stage -> (LastSourceKey, RowsDone, IsComplete) from earlier, interrupted loads"""
+    conn.execute(text(CHECKPOINT_SQL))
+    rows = conn.execute(text("SELECT Stage, LastSourceKey, RowsDone, IsComplete FROM EtlCheckpoints")).fetchall()
+    return {stage: (last_key, rows_done, bool(complete)) for stage, last_key, rows_done, complete in rows}
+
+def save_checkpoint(conn, stage, last_key, rows_done, complete=False):
+    """Record progress inside the transaction that made it, so both commit together"""
+    conn.execute(text(
+        "INSERT OR REPLACE INTO EtlCheckpoints (Stage, LastSourceKey, RowsDone, IsComplete, UpdatedAt) "
+        "VALUES (:stage, :key, :rows, :complete, CURRENT_TIMESTAMP)"),
+        {'stage': stage, 'key': last_key, 'rows': rows_done, 'complete': int(complete)})
+
+def warm_window_rules(conn, rule_set, source_db, last_key):
+    """Replay trades loaded shortly before source row last_key through the rules, discarding the result
+
+    Window rules (velocity) then carry the same state into a resumed load as an uninterrupted one.
+    """
+    # Imported here: rescore_analysis imports this module
+    import rescore_analysis
+    window = rescore_analysis.warmup_ms(rule_set)
+    if not window or not last_key:
+        return 0
+    last_ts = _read_source(source_db, f"SELECT timestamp FROM fact_transactions WHERE rowid = {int(last_key)}")
+    if last_ts.empty:
+        return 0
+    where = ("WHERE ft.TradeID IN (SELECT trade_id FROM src.fact_transactions "
+             "WHERE rowid <= :last AND timestamp >= :since)")
+    replayed = 0
+    for frame in rescore_analysis.read_trades(conn, where=where, source_db=source_db,
+                                              params={'last': last_key, 'since': int(last_ts['timestamp'].iloc[0]) - window}):
+        rule_set.evaluate(frame)
+        replayed += len(frame)
+    return replayed
+
+def _load_dimension(dw_engine, report, checkpoints, stage_name, table, extract, transform):
+    """Load one dimension in its own transaction, unless a checkpoint says it is done"""
+    if checkpoints.get(stage_name, (None, None, False))[2]:
+        logger.info(f"   ⏭️ {table}: already loaded (checkpoint)")
+        return
+    with dw_engine.begin() as conn:
+        with report.stage(f'{stage_name}.extract') as stage:
+            source_df = extract()
+            stage['rows_out'] = len(source_df)
+        
+        # Map to your schema
+        with report.stage(f'{stage_name}.transform', rows_in=len(source_df)) as stage:
+            mapped = transform(conn, source_df)
+            stage['rows_out'] = len(mapped)
+        
+        with report.stage(f'{stage_name}.load', rows_in=len(mapped)) as stage:
+            mapped.to_sql(table, conn, if_exists='append', index=False)
+            stage['rows_out'] = len(mapped)
+        save_checkpoint(conn, stage_name, len(source_df), len(mapped), complete=True)
+    logger.info(f"   ✅ {table}: {len(mapped)} records")
+
+def _fact_days(conn, time_keys):
+    """DimTime date of each TimeKey, the day summaries and the archive are keyed by"""
+    keys = ','.join(str(int(k)) for k in time_keys.unique())
+    dates = dict(conn.execute(text(f"SELECT TimeKey, Date FROM DimTime WHERE TimeKey IN ({keys})")).fetchall())
+    return time_keys.astype('int64').map(dates)
+
+def _load_trade_chunk(conn, report, trans_df, rule_set, model, model_dir):
+    """Dedupe, map, insert and score one chunk of source trades
+    
+    Returns (trades inserted, model, rule hits, dates that received trades).
+    """
+    # Repeated TradeIDs in the source would be skipped by the unique index anyway
+    with report.stage('facts.dedupe', rows_in=len(trans_df), accumulate=True) as stage:
+        trans_df, duplicates = trade_dedup.drop_duplicates(trans_df)
+        trans_df = trans_df.reset_index(drop=True)
+        stage['rows_out'] = len(trans_df)
+    if duplicates['in_batch']:
+        logger.info(f"   🔁 Dropped {duplicates['in_batch']:,} duplicate TradeIDs")
+    
+    # Map transactions to your schema
+    with report.stage('facts.transform', rows_in=len(trans_df), accumulate=True) as stage:
+        trans_mapped = transform_trades(conn, trans_df)
+        stage['rows_out'] = len(trans_mapped)
+    
+    # Map foreign keys
+    with report.stage('facts.key_mapping', rows_in=len(trans_mapped), accumulate=True) as stage:
+        trans_dates = map_trade_keys(conn, trans_df, trans_mapped)
+        stage['rows_out'] = len(trans_mapped)
+    if trans_mapped.empty:
+        return 0, model, {}, set()
+    
+    # Archived days stay archived: loading their trades again would count them twice
+    fact_days = _fact_days(conn, trans_mapped['TimeKey'])
+    archived = {day for day, _ in retention_archiver.archived_days(conn, fact_days.min(), fact_days.max())}
+    if archived:
+        hot = ~fact_days.isin(archived).to_numpy()
+        logger.info(f"   🧊 Skipped {int((~hot).sum()):,} trades on archived days")
+        trans_df, trans_mapped, trans_dates, fact_days = (
+            part[hot].reset_index(drop=True) for part in (trans_df, trans_mapped, trans_dates, fact_days))
+        if trans_mapped.empty:
+            return 0, model, {}, set()
+    
+    with report.stage('facts.load', rows_in=len(trans_mapped), accumulate=True) as stage:
+        fact_sks = insert_trades(conn, trans_mapped, trans_dates)
+        # Trades already loaded by an earlier chunk are skipped by the unique TradeID index
+        inserted = fact_sks > 0
+        if not inserted.all():
+            trans_df = trans_df[inserted].reset_index(drop=True)
+            trans_mapped = trans_mapped[inserted].reset_index(drop=True)
+            fact_days = fact_days[inserted].reset_index(drop=True)
+            fact_sks = fact_sks[inserted]
+        # Per-day counts and sums, committed with the rows, for warehouse_validation
+        warehouse_validation.record_load(conn, trans_df, trans_mapped)
+        stage['rows_out'] = len(fact_sks)
+    if trans_mapped.empty:
+        return 0, model, {}, set()
+    
+    # The anomaly model is trained offline; a first build fits one on the first chunk loaded
+    if model is None:
+        with report.stage('analysis.model') as stage:
+            model = anomaly_model.train(conn)
+            anomaly_model.save_model(model, model_dir)
+            anomaly_model.register_model(conn, model, model_dir)
+            stage['rows_out'] = model.training_rows
+        logger.info(f"   🧠 Trained anomaly model v{model.version} on {model.training_rows:,} trades")
+    
+    with report.stage('analysis.score', rows_in=len(trans_mapped), accumulate=True) as stage:
+        analysis_data, rule_result = score_trades(conn, rule_set, trans_df, trans_mapped, fact_sks, model)
+        rule_engine.record_stats(conn, rule_set, rule_result, 'batch')
+        stage['rows_out'] = len(analysis_data)
+    
+    with report.stage('analysis.load', rows_in=len(analysis_data), accumulate=True) as stage:
+        analysis_data.to_sql('TransactionAnalysis', conn, if_exists='append', index=False)
+        stage['rows_out'] = len(analysis_data)
+    return len(trans_mapped), model, rule_result.rule_hits, set(fact_days)
+
+def load_facts(dw_engine, report=None, source_db=SOURCE_DBS['transactions'], fact_limit=FACT_LIMIT,
+               partition_grain=None, chunk_size=FACT_CHUNK_SIZE, rules_path=rule_engine.RULES_PATH, append=False):
+    """Load and score source trades after the 'facts' checkpoint, one committed chunk at a time
+    
+    A completed checkpoint ends the load unless append is set, which picks up the
+    source rows added since. Returns a summary: trades loaded, source rows done, rule
+    hits, the dates that received trades, and from_empty when the warehouse held no
+    facts before (so every hot trade was scored by this load).
+    """
+    report = report or RunReport(trace_memory=False)
+    model_dir = anomaly_model.model_dir_for(dw_engine.url.database)
+    with dw_engine.begin() as conn:
+        last_key, rows_done, complete = read_checkpoints(conn).get('facts', (0, 0, False))
+        complete = complete and not append
+        if partition_grain:
+            # Route each trade to its month/day partition
+            fact_partitions.enable_partitioning(conn, partition_grain)
+        rule_set = rule_engine.compile_rules(conn, rules_path)
+        rule_engine.create_rule_tables(conn, rule_set)
+        model = anomaly_model.load_model(model_dir=model_dir)
+        if model is not None:
+            anomaly_model.register_model(conn, model, model_dir)
+        from_empty = conn.execute(text("SELECT 1 FROM FactTransactions LIMIT 1")).fetchone() is None
+    if rows_done and not complete:
+        # Outside a write transaction: the source is attached and detached while reading
+        with dw_engine.connect() as conn:
+            replayed = warm_window_rules(conn, rule_set, source_db, last_key)
+        logger.info(f"   🔥 Window rules warmed up on {replayed:,} already loaded trades")
+    
+    loaded, rule_hits, days = 0, {}, set()
+    while not complete:
+        limit = chunk_size if fact_limit is None else min(chunk_size, fact_limit - rows_done)
+        if limit <= 0:
+            break
+        with report.stage('facts.extract', accumulate=True) as stage:
+            trans_df = extract_trades(source_db, limit, after=last_key)
+            stage['rows_out'] = len(trans_df)
+        if trans_df.empty:
+            break
+        with dw_engine.begin() as conn:
+            inserted, model, chunk_hits, chunk_days = _load_trade_chunk(conn, report, trans_df, rule_set, model, model_dir)
+            last_key = int(trans_df['SourceRowID'].max())
+            rows_done += len(trans_df)
+            save_checkpoint(conn, 'facts', last_key, rows_done)
+        loaded += inserted
+        days |= chunk_days
+        for name, hits in chunk_hits.items():
+            rule_hits[name] = rule_hits.get(name, 0) + hits
+        logger.info(f"   ✅ Chunk committed: {rows_done:,} source trades done (row {last_key:,})")
+    with dw_engine.begin() as conn:
+        save_checkpoint(conn, 'facts', last_key, rows_done, complete=True)
+    return {'loaded': loaded, 'rows_done': rows_done, 'rule_hits': rule_hits, 'days': days,
+            'from_empty': from_empty}
+
+def load_your_data(dw_engine, report=None, sources=None, time_limit=TIME_LIMIT, fact_limit=FACT_LIMIT,
+                   partition_grain=None, chunk_size=FACT_CHUNK_SIZE):
+    """Load data from your existing databases (partition_grain='month'/'day' routes facts to partitions)
+    
+    Each dimension, and each chunk of chunk_size source trades, commits in its own
+    transaction together with its EtlCheckpoints row. Calling this again on the same
+    warehouse after a failure resumes after the last committed chunk.
+    """
     logger.info("📥 Loading data from your existing databases...")
     
+    # Stage metrics are collected even when the caller doesn't keep the report
+    report = report or RunReport(trace_memory=False)
+    sources = {**SOURCE_DBS, **(sources or {})}
+    
     try:
         with dw_engine.begin() as conn:
-            
-            # 1. Load DimTime
-            logger.info("📅 Loading DimTime...")
-            time_conn = sqlite3.connect('data/time_data.db')
-            time_df = pd.read_sql("SELECT * FROM dim_time LIMIT 20000", time_conn)
-            time_conn.close()
-            
-            # Map to your schema
-            time_mapped = pd.DataFrame()
-            time_mapped['FullTimestamp'] = pd.to_datetime(time_df['timestamp'])
-            time_mapped['Date'] = time_mapped['FullTimestamp'].dt.date
-            time_mapped['Year'] = time_df['year']
-            time_mapped['Quarter'] = time_mapped['FullTimestamp'].dt.quarter
-            time_mapped['Month'] = time_df['month']
-            time_mapped['MonthName'] = time_mapped['FullTimestamp'].dt.strftime('%B')
-            time_mapped['Day'] = time_df['day']
-            time_mapped['DayOfWeekNumber'] = time_mapped['FullTimestamp'].dt.dayofweek
-            time_mapped['DayOfWeekName'] = time_df['weekday']
-            time_mapped['Hour'] = time_df['hour']
-            time_mapped['Minute'] = time_mapped['FullTimestamp'].dt.minute
-            time_mapped['Second'] = time_mapped['FullTimestamp'].dt.second
-            time_mapped['IsWeekend'] = (time_mapped['FullTimestamp'].dt.dayofweek >= 5).astype(int)
-            time_mapped['WeekOfYear'] = time_mapped['FullTimestamp'].dt.isocalendar().week
-            
-            time_mapped.to_sql('DimTime', conn, if_exists='append', index=False)
-            logger.info(f"   ✅ DimTime: {len(time_mapped)} records")
-            
-            # 2. Load DimMarket
-            logger.info("📊 Loading DimMarket...")
-            market_conn = sqlite3.connect('data/dim_market.db')
-            market_df = pd.read_sql("SELECT * FROM dim_market", market_conn)
-            market_conn.close()
-            
-            # Map to your schema
-            market_mapped = pd.DataFrame()
-            market_mapped['MarketDate'] = pd.to_datetime(market_df['date']).dt.date
-            market_mapped['btc_usd_price_open'] = market_df['btc_usd_price_open']
-            market_mapped['btc_usd_price_close'] = market_df['btc_usd_price_close']
-            market_mapped['volume_usd'] = market_df['volume_usd']
-            market_mapped['market_cap_usd'] = market_df['market_cap_usd']
-            
-            market_mapped.to_sql('DimMarket', conn, if_exists='append', index=False)
-            logger.info(f"   ✅ DimMarket: {len(market_mapped)} records")
-            
-            # 3. Load DimWallet
-            logger.info("💳 Loading DimWallet...")
-            wallet_conn = sqlite3.connect('data/dim_wallet.db')
-            wallet_df = pd.read_sql("SELECT * FROM dim_wallet", wallet_conn)
-            wallet_conn.close()
-            
-            # Map to your schema exactly
-            wallet_mapped = pd.DataFrame()
-            wallet_mapped['WalletAddress'] = wallet_df['wallet_address']
-            wallet_mapped['FirstSeenTimestamp'] = pd.to_datetime(wallet_df['first_seen_timestamp'], errors='coerce')
-            wallet_mapped['LastSeenTimestamp'] = pd.to_datetime(wallet_df['last_seen_timestamp'], errors='coerce')
-            wallet_mapped['TransactionCount'] = wallet_df['transaction_count']
-            wallet_mapped['TotalReceivedSatoshi'] = wallet_df['total_received_satoshi']
-            wallet_mapped['TotalSentSatoshi'] = wallet_df['total_sent_satoshi']
-            wallet_mapped['FinalBalanceSatoshi'] = wallet_df['final_balance_satoshi']
-            wallet_mapped['LabelSource'] = wallet_df['label_source']
-            wallet_mapped['EntityTag'] = wallet_df['entity_tag']
-            wallet_mapped['EntityType'] = wallet_df['entity_type']
-            wallet_mapped['IsReportedAbuse'] = wallet_df['is_reported_abuse']
-            wallet_mapped['AbuseCategory'] = wallet_df['abuse_category']
-            
-            wallet_mapped.to_sql('DimWallet', conn, if_exists='append', index=False)
-            logger.info(f"   ✅ DimWallet: {len(wallet_mapped)} records")
-            
-            # 4. Load FactTransactions
-            logger.info("₿ Loading FactTransactions...")
-            btc_conn = sqlite3.connect('data/bitcoin_dw.db')
-            trans_df = pd.read_sql("SELECT * FROM fact_transactions LIMIT 10000", btc_conn)
-            btc_conn.close()
-            
-            # Get foreign key mappings
-            time_keys = pd.read_sql("SELECT TimeKey, Date FROM DimTime", conn)
-            market_keys = pd.read_sql("SELECT MarketDateKey, MarketDate FROM DimMarket", conn)
-            wallet_keys = pd.read_sql("SELECT WalletKey FROM DimWallet", conn)
-            
-            # Map transactions to your schema
-            trans_mapped = pd.DataFrame()
-            trans_mapped['TradeID'] = trans_df['trade_id']
-            trans_mapped['Side'] = trans_df['side']
-            trans_mapped['Price'] = trans_df['price']
-            trans_mapped['VolumeQuote'] = trans_df['volume(quote)']
-            trans_mapped['SizeBase'] = trans_df['size(base)']
-            
-            # Map foreign keys
-            # For TimeKey - match by extracting date from timestamp
-            trans_timestamps = pd.to_datetime(trans_df['timestamp'], unit='ms')
-            trans_dates = trans_timestamps.dt.date
-            
-            # Create a lookup for time keys
-            time_lookup = time_keys.set_index('Date')['TimeKey'].to_dict()
-            trans_mapped['TimeKey'] = trans_dates.map(time_lookup)
-            
-            # For MarketDateKey - match by date
-            market_lookup = market_keys.set_index('MarketDate')['MarketDateKey'].to_dict()
-            trans_mapped['MarketDateKey'] = trans_dates.map(market_lookup)
-            
-            # For WalletKey - random assignment (since we don't have transaction->wallet mapping)
-            if len(wallet_keys) > 0:
-                trans_mapped['WalletKey'] = np.random.choice(wallet_keys['WalletKey'], size=len(trans_df), replace=True)
-            
-            # Clean up NaN values
-            trans_mapped['TimeKey'] = trans_mapped['TimeKey'].fillna(1)
-            trans_mapped['MarketDateKey'] = trans_mapped['MarketDateKey'].fillna(1)
-            trans_mapped['WalletKey'] = trans_mapped['WalletKey'].fillna(1)
-            
-            trans_mapped.to_sql('FactTransactions', conn, if_exists='append', index=False)
-            logger.info(f"   ✅ FactTransactions: {len(trans_mapped)} records")
-            
-            # 5. Create Transaction Analysis
-            logger.info("🔍 Creating transaction analysis...")
-            
-            # Get all transaction keys
-            fact_keys = pd.read_sql("SELECT TransactionFactSK, Price, VolumeQuote FROM FactTransactions", conn)
-            
-            analysis_data = pd.DataFrame()
-            analysis_data['TransactionFactSK'] = fact_keys['TransactionFactSK']
-            
-            # Risk analysis based on patterns
-            analysis_data['IsSuspicious'] = (
-                (fact_keys['VolumeQuote'] % 1000 == 0) |  # Round amounts
-                (fact_keys['VolumeQuote'] > 100000) |      # Large amounts
-                (fact_keys['Price'] % 100 == 0)           # Round prices
-            ).astype(int)
-            
-            # Anomaly score
-            analysis_data['AnomalyScore'] = np.where(
-                analysis_data['IsSuspicious'] == 1,
-                50 + np.random.uniform(0, 50, len(fact_keys)),  # 50-100 for suspicious
-                np.random.uniform(0, 30, len(fact_keys))        # 0-30 for normal
-            )
-            
-            # Risk level
-            analysis_data['RiskLevel'] = pd.cut(
-                analysis_data['AnomalyScore'], 
-                bins=[0, 25, 50, 75, 100], 
-                labels=['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
-            )
-            
-            analysis_data.to_sql('TransactionAnalysis', conn, if_exists='append', index=False)
-            logger.info(f"   ✅ TransactionAnalysis: {len(analysis_data)} records")
-            
-            # 6. Create Daily Summary
-            logger.info("📊 Creating daily summary...")
-            
-            daily_sql = """
-            INSERT INTO DailySummary (
-                SummaryDate, TotalTransactions, TotalVolumeUSD, AvgPrice, 
-                MaxPrice, MinPrice, SuspiciousTransactions, HighRiskTransactions
-            )
-            SELECT 
-                dt.Date as SummaryDate,
-                COUNT(*) as TotalTransactions,
-                SUM(ft.VolumeQuote) as TotalVolumeUSD,
-                AVG(ft.Price) as AvgPrice,
-                MAX(ft.Price) as MaxPrice,
-                MIN(ft.Price) as MinPrice,
-                SUM(CASE WHEN ta.IsSuspicious = 1 THEN 1 ELSE 0 END) as SuspiciousTransactions,
-                SUM(CASE WHEN ta.RiskLevel IN ('HIGH', 'CRITICAL') THEN 1 ELSE 0 END) as HighRiskTransactions
-            FROM FactTransactions ft
-            JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
-            LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
-            GROUP BY dt.Date
-            ORDER BY dt.Date
-            """
-            
-            conn.execute(text(daily_sql))
-            logger.info("   ✅ DailySummary created")
-            
-            logger.info("✅ All data loaded successfully")
-            
+            checkpoints = read_checkpoints(conn)
+        if checkpoints:
+            logger.info(f"⏩ Resuming from checkpoints: {', '.join(sorted(checkpoints))}")
+        
+        # 1. Load DimTime
+        logger.info("📅 Loading DimTime...")
+        _load_dimension(dw_engine, report, checkpoints, 'dim_time', 'DimTime',
+                        lambda: extract_dim_time(sources['time'], time_limit),
+                        lambda conn, df: transform_dim_time(df))
+        
+        # 2. Load DimMarket
+        logger.info("📊 Loading DimMarket...")
+        _load_dimension(dw_engine, report, checkpoints, 'dim_market', 'DimMarket',
+                        lambda: extract_dim_market(sources['market']),
+                        lambda conn, df: transform_dim_market(df))
+        
+        # 3. Load DimWallet
+        logger.info("💳 Loading DimWallet...")
+        _load_dimension(dw_engine, report, checkpoints, 'dim_wallet', 'DimWallet',
+                        lambda: extract_dim_wallet(sources['wallet']), transform_dim_wallet)
+        
+        # 4. Load FactTransactions and 5. score them, one committed chunk at a time
+        logger.info("₿ Loading FactTransactions...")
+        facts = load_facts(dw_engine, report, sources['transactions'], fact_limit, partition_grain, chunk_size)
+        rows_done = facts['rows_done']
+        logger.info(f"   ✅ FactTransactions: {facts['loaded']} records" + (" (resumed)" if checkpoints else ""))
+        for name, hits in facts['rule_hits'].items():
+            logger.info(f"   🚩 {name}: {hits:,} hits")
+        
+        # 6. Create Daily Summary (rebuilt from every hot day, so it is the same after a resume)
+        logger.info("📊 Creating daily summary...")
+        
+        with dw_engine.begin() as conn:
+            with report.stage('daily_summary', rows_in=rows_done) as stage:
+                stage['rows_out'] = refresh_daily_summary(conn)
+            with report.stage('risk_cube', rows_in=rows_done) as stage:
+                stage['rows_out'] = risk_cube.refresh(conn)
+            with report.stage('wallet_sketches', rows_in=rows_done) as stage:
+                stage['rows_out'] = wallet_sketches.refresh(conn)
+            with report.stage('quantile_sketches', rows_in=rows_done) as stage:
+                stage['rows_out'] = quantile_sketches.refresh(conn)
+            with report.stage('wallet_leaders', rows_in=rows_done) as stage:
+                stage['rows_out'] = wallet_leaders.refresh(conn)
+        logger.info("   ✅ DailySummary, RiskCube, sketches and wallet leaderboards created")
+        
+        logger.info("✅ All data loaded successfully")
+        
     except Exception as e:
         logger.error(f"❌ Data loading failed: {e}")
+        logger.error("   Committed chunks are kept; rerun with --resume to continue")
         return False
     
     return True
@@ -335,32 +666,36 @@ def create_analytical_views(dw_engine):
         """CREATE VIEW vw_TransactionAnalysis AS
         SELECT 
             ft.TradeID,
-            ft.Side,
+            ds.Side,
             dt.Date,
             dt.Hour,
-            dt.DayOfWeekName,
-            ft.Price,
-            ft.VolumeQuote,
-            ft.SizeBase,
+            dd.DayOfWeekName,
+            ft.PriceCents / 100.0 as Price,
+            ft.VolumeQuoteCents / 100.0 as VolumeQuote,
+            ft.SizeBaseSat / 100000000.0 as SizeBase,
             dw.WalletAddress,
-            dw.EntityType,
+            de.EntityType,
             ta.IsSuspicious,
             ta.AnomalyScore,
-            ta.RiskLevel
+            rl.RiskLevel
         FROM FactTransactions ft
+        LEFT JOIN DimSide ds ON ft.SideCode = ds.SideCode
         LEFT JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+        LEFT JOIN DimDayOfWeek dd ON dt.DayOfWeekNumber = dd.DayOfWeekNumber
         LEFT JOIN DimWallet dw ON ft.WalletKey = dw.WalletKey
-        LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK""",
+        LEFT JOIN DimEntityType de ON dw.EntityTypeCode = de.EntityTypeCode
+        LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
+        LEFT JOIN DimRiskLevel rl ON ta.RiskCode = rl.RiskCode""",
         
         # Daily Summary View
         """CREATE VIEW vw_DailySummary AS
         SELECT 
             SummaryDate,
             TotalTransactions,
-            ROUND(TotalVolumeUSD, 2) as TotalVolumeUSD,
-            ROUND(AvgPrice, 2) as AvgPrice,
-            ROUND(MaxPrice, 2) as MaxPrice,
-            ROUND(MinPrice, 2) as MinPrice,
+            TotalVolumeCents / 100.0 as TotalVolumeUSD,
+            AvgPriceCents / 100.0 as AvgPrice,
+            MaxPriceCents / 100.0 as MaxPrice,
+            MinPriceCents / 100.0 as MinPrice,
             SuspiciousTransactions,
             HighRiskTransactions,
             ROUND(SuspiciousTransactions * 100.0 / TotalTransactions, 2) as SuspiciousRate
@@ -371,19 +706,25 @@ def create_analytical_views(dw_engine):
         """CREATE VIEW vw_WalletRisk AS
         SELECT 
             dw.WalletAddress,
-            dw.EntityType,
+            de.EntityType,
             dw.IsReportedAbuse,
-            dw.AbuseCategory,
+            da.AbuseCategory,
             dw.TransactionCount,
             ROUND(dw.TotalReceivedSatoshi / 100000000.0, 8) as TotalReceivedBTC,
             COUNT(ft.TransactionFactSK) as RecentTransactions,
             AVG(ta.AnomalyScore) as AvgAnomalyScore,
-            SUM(CASE WHEN ta.IsSuspicious = 1 THEN 1 ELSE 0 END) as SuspiciousTransactions
+            SUM(CASE WHEN ta.IsSuspicious = 1 THEN 1 ELSE 0 END) as SuspiciousTransactions,
+            COALESCE(we.ExposureScore, 0) as ExposureScore,
+            we.Hops as ExposureHops
         FROM DimWallet dw
+        LEFT JOIN DimEntityType de ON dw.EntityTypeCode = de.EntityTypeCode
+        LEFT JOIN DimAbuseCategory da ON dw.AbuseCategoryCode = da.AbuseCategoryCode
+        LEFT JOIN WalletExposure we ON dw.WalletKey = we.WalletKey
         LEFT JOIN FactTransactions ft ON dw.WalletKey = ft.WalletKey
         LEFT JOIN TransactionAnalysis ta ON ft.TransactionFactSK = ta.TransactionFactSK
-        GROUP BY dw.WalletKey, dw.WalletAddress, dw.EntityType, dw.IsReportedAbuse, 
-                 dw.AbuseCategory, dw.TransactionCount, dw.TotalReceivedSatoshi
+        GROUP BY dw.WalletKey, dw.WalletAddress, de.EntityType, dw.IsReportedAbuse, 
+                 da.AbuseCategory, dw.TransactionCount, dw.TotalReceivedSatoshi,
+                 we.ExposureScore, we.Hops
         ORDER BY AvgAnomalyScore DESC""",
         
         # Market Performance View
@@ -406,6 +747,9 @@ def create_analytical_views(dw_engine):
     try:
         with dw_engine.connect() as conn:
             for i, view in enumerate(views):
+                # Views are replaced, so a resumed run can create them again
+                name = re.search(r'CREATE VIEW (\w+)', view).group(1)
+                conn.execute(text(f"DROP VIEW IF EXISTS {name}"))
                 conn.execute(text(view))
                 logger.info(f"   ✅ View {i+1}/{len(views)} created")
             
@@ -419,23 +763,20 @@ def create_analytical_views(dw_engine):
         return False
 
 def validate_and_test(dw_engine):
-    """Validate the data warehouse and run test queries"""
+    """Validate the data warehouse against its load statistics and run test queries"""
     logger.info("🔍 Validating data warehouse...")
     
     try:
         with dw_engine.connect() as conn:
             
-            # Check table counts
-            tables = ['DimTime', 'DimMarket', 'DimWallet', 'FactTransactions', 
-                     'TransactionAnalysis', 'DailySummary']
-            
             print("\n" + "="*60)
             print("📊 BITCOIN DECISION SUPPORT SYSTEM - DATA VALIDATION")
             print("="*60)
             
-            for table in tables:
-                count = pd.read_sql(f"SELECT COUNT(*) as count FROM {table}", conn).iloc[0]['count']
-                print(f"   {table}: {count:,} records")
+            # Reconciliation and sampled checks instead of a COUNT(*) per table
+            result = warehouse_validation.validate(conn)
+            warehouse_validation.print_report(result)
+            logger.info(f"📋 Validation report written to {warehouse_validation.write_report(result)}")
             
             # Test analytics
             print("\n📈 SAMPLE ANALYTICS:")
@@ -455,18 +796,9 @@ def validate_and_test(dw_engine):
             print("\nTransaction Analysis (Sample 10):")
             print(trans_sample.to_string(index=False))
             
-            # Risk summary
-            risk_summary = pd.read_sql("""
-                SELECT 
-                    RiskLevel,
-                    COUNT(*) as Count,
-                    ROUND(COUNT(*) * 100.0 / (SELECT COUNT(*) FROM TransactionAnalysis), 2) as Percentage
-                FROM TransactionAnalysis 
-                GROUP BY RiskLevel 
-                ORDER BY Count DESC
-            """, conn)
-            print("\nRisk Level Distribution:")
-            print(risk_summary.to_string(index=False))
+            if result['status'] != 'pass':
+                logger.error("❌ Validation checks failed")
+                return False
             
             print("\n" + "="*60)
             print("🎉 SUCCESS! Your Bitcoin DSS is fully operational!")
@@ -478,30 +810,106 @@ def validate_and_test(dw_engine):
     
     return True
 
+# Rows ANALYZE reads per index; keeps it to milliseconds at any warehouse size
+ANALYSIS_LIMIT = 1000
+
+def refresh_planner_stats(conn):
+    """Sampled ANALYZE: query planner statistics and the row estimates check_database_schema.py --fast reads"""
+    conn.execute(text(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}"))
+    conn.execute(text("ANALYZE"))
+
+def write_run_report(report, status):
+    """Finish the run report and write it to the reports directory"""
+    report.finish(status)
+    path = report.write()
+    logger.info(f"📋 Run report written to {path}")
+    return path
+
 def main():
     """Main function to create the complete data warehouse"""
+    parser = argparse.ArgumentParser(description="Build the unified Bitcoin data warehouse")
+    parser.add_argument('--partition-grain', choices=fact_partitions.GRAINS,
+                        help='Store FactTransactions in monthly or daily partitions')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted staging build from its checkpoints instead of rebuilding')
+    parser.add_argument('--chunk-size', type=int, default=FACT_CHUNK_SIZE,
+                        help=f'Source trades committed per chunk (default {FACT_CHUNK_SIZE:,})')
+    args = parser.parse_args()
+    
     print("🚀 BITCOIN DECISION SUPPORT SYSTEM")
     print("Schema-Matched Implementation")
     print("=" * 60)
     
-    # Step 1: Create schema
-    dw_engine = create_data_warehouse_with_your_schema()
+    report = RunReport('etl')
+    
+    # Step 1: Create schema. The build goes to a staging file that replaces the live
+    # warehouse only once it validates; a resumed load keeps the staging file and its checkpoints
+    staging = warehouse_swap.staging_path(DW_PATH)
+    with report.stage('schema'):
+        if args.resume and os.path.exists(staging):
+            logger.info("⏩ Resuming the load into the existing staging build")
+            dw_engine = create_engine(f'sqlite:///{staging}')
+        else:
+            dw_engine = create_data_warehouse_with_your_schema(staging)
     if not dw_engine:
         print("❌ Schema creation failed")
+        write_run_report(report, 'failed')
         return
     
     # Step 2: Load data
-    if not load_your_data(dw_engine):
+    if not load_your_data(dw_engine, report, partition_grain=args.partition_grain, chunk_size=args.chunk_size):
         print("❌ Data loading failed")
+        write_run_report(report, 'failed')
         return
     
     # Step 3: Create views
-    if not create_analytical_views(dw_engine):
+    with report.stage('views'):
+        views_ok = create_analytical_views(dw_engine)
+    if not views_ok:
         print("❌ View creation failed")
+        write_run_report(report, 'failed')
         return
     
     # Step 4: Validate and test
-    if validate_and_test(dw_engine):
+    with report.stage('validate'):
+        valid = validate_and_test(dw_engine)
+    
+    if valid:
+        # Step 5: Propagate abuse exposure to wallets trading with reported ones
+        with report.stage('taint') as stage:
+            with dw_engine.begin() as conn:
+                taint = taint_propagation.run(conn, source_db=SOURCE_DBS['transactions'])
+            stage['rows_out'] = taint['written']
+        logger.info(f"✅ Abuse exposure: {taint['exposed']:,} wallets within "
+                    f"{taint_propagation.DEFAULT_MAX_HOPS} hops of {taint['seeds']:,} reported")
+        
+        with report.stage('analyze'):
+            with dw_engine.begin() as conn:
+                refresh_planner_stats(conn)
+        
+        # Step 6: Swap the staging build in for the live warehouse
+        with report.stage('publish'):
+            dw_engine.dispose()
+            try:
+                release = warehouse_swap.publish(DW_PATH, staging)
+            except ValueError as e:
+                logger.error(f"❌ {e}")
+                logger.error("   The live warehouse is unchanged; rerun with --resume once fixed")
+                valid = False
+    
+    if valid:
+        logger.info(f"✅ Build {release['version']} is live at {DW_PATH}")
+        dw_engine = create_engine(f'sqlite:///{DW_PATH}')
+        
+        # Step 7: Refresh the memory-mapped fact cache the dashboard reads
+        with report.stage('fact_cache') as stage:
+            with dw_engine.connect() as conn:
+                manifest = fact_cache.build_cache(conn, fact_cache.cache_dir_for(DW_PATH))
+            stage['rows_out'] = manifest['rows']
+        logger.info(f"✅ Fact cache {manifest['version']} built ({manifest['rows']:,} rows)")
+    write_run_report(report, 'success' if valid else 'failed')
+    
+    if valid:
         print("\n🎯 NEXT STEPS:")
         print("1. Launch dashboard: streamlit run dashboard_app.py")
         print("2. Explore database: sqlite3 data/bitcoin_unified_dw.db")
@@ -510,8 +918,9 @@ def main():
         print("   SELECT * FROM vw_TransactionAnalysis LIMIT 20;")
         print("   SELECT * FROM vw_WalletRisk WHERE IsReportedAbuse = 1;")
         print("   SELECT * FROM vw_MarketPerformance LIMIT 10;")
+        print("4. Compare run reports: python etl_run_report.py diff <old.json> <new.json>")
     else:
         print("❌ Validation failed")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Streaming micro-batch ingestion
+Appends new trades to the warehouse in small batches. Each batch goes through the
+same transform, key mapping, compiled suspicious-transaction rules and anomaly
+model as the batch ETL, and only the DailySummary days it touched are refreshed.
+
+Ingestion is idempotent: TradeIDs already loaded are dropped by an in-memory
+pre-filter or skipped by the unique TradeID index, so replaying a window (for
+example with a lower --after-trade-id) does not duplicate trades.
+
+Usage:
+    python stream_ingest.py --batch-size 1000 --max-batches 10
+    python stream_ingest.py --after-trade-id 50000 --interval 1
+    python stream_ingest.py --after-trade-id 0 --on-conflict update   # replay corrections
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import anomaly_model
+import risk_cube
+import quantile_sketches
+import rule_engine
+import schema_matched_etl as etl
+import trade_dedup
+import wallet_leaders
+import wallet_sketches
+import warehouse_validation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def ingest_batch(conn, trades, rule_set, recent=None, on_conflict='ignore', model=None):
+    """Load one batch of source trades (fact_transactions rows); returns a batch summary
+
+    recent is a trade_dedup.RecentTradeIds pre-filter and model the loaded
+    anomaly_model.AnomalyModel. The summary's trade_ids are
+    in the warehouse once the transaction commits; add them to recent only then.
+    """
+    rows = len(trades)
+    # Updates must reach the upsert, so only the ignore policy uses the pre-filter
+    trades, duplicates = trade_dedup.drop_duplicates(
+        trades, recent if on_conflict == 'ignore' else None, keep='first' if on_conflict == 'ignore' else 'last')
+    duplicates['conflicts'] = 0
+    summary = {'rows': rows, 'inserted': 0, 'suspicious': 0, 'days': 0, 'rule_hits': {},
+               'duplicates': duplicates, 'trade_ids': trades['trade_id'].to_numpy()}
+    if trades.empty:
+        return summary
+
+    trades = trades.reset_index(drop=True)
+    # Pick up watchlist / reported-abuse changes before screening this batch
+    rule_set.refresh(conn)
+    trans_mapped = etl.transform_trades(conn, trades)
+    trade_dates = etl.map_trade_keys(conn, trades, trans_mapped)
+    previous = None
+    if on_conflict == 'update':
+        # Corrected trades leave LoadStats with their old values and come back with the new ones
+        previous = warehouse_validation.loaded_facts(conn, trades['trade_id'])
+        warehouse_validation.record_removal(conn, previous)
+    fact_sks = etl.insert_trades(conn, trans_mapped, trade_dates, on_conflict)
+
+    # Conflicts are TradeIDs the pre-filter did not know about (older than its window)
+    inserted = fact_sks > 0
+    duplicates['conflicts'] = int((~inserted).sum())
+    if on_conflict == 'update':
+        # Updated trades already had an analysis row; they are re-scored below
+        duplicates['conflicts'] = trade_dedup.clear_analysis(conn, fact_sks)
+    elif not inserted.all():
+        trades = trades[inserted].reset_index(drop=True)
+        trans_mapped = trans_mapped[inserted].reset_index(drop=True)
+        fact_sks = fact_sks[inserted]
+    if trades.empty:
+        return summary
+    warehouse_validation.record_load(conn, trades, trans_mapped)
+
+    analysis_data, rule_result = etl.score_trades(conn, rule_set, trades, trans_mapped, fact_sks, model)
+    analysis_data.to_sql('TransactionAnalysis', conn, if_exists='append', index=False)
+    rule_engine.record_stats(conn, rule_set, rule_result, 'stream')
+
+    # Summaries are keyed by the DimTime date each trade was mapped to; a correction may also leave its old day
+    time_keys = trans_mapped['TimeKey'] if previous is None else pd.concat([trans_mapped['TimeKey'], previous['TimeKey']])
+    time_keys = ','.join(str(int(k)) for k in time_keys.dropna().unique())
+    days = [row[0] for row in conn.execute(text(f"SELECT DISTINCT Date FROM DimTime WHERE TimeKey IN ({time_keys})"))]
+    etl.refresh_daily_summary(conn, days)
+    risk_cube.refresh(conn, days)
+    if on_conflict == 'update':
+        # Sketches and leaderboards cannot take back a corrected trade's old values, so its days are rebuilt
+        wallet_sketches.refresh(conn, days)
+        quantile_sketches.refresh(conn, days)
+        wallet_leaders.refresh(conn, days)
+    else:
+        # New trades only add to their days: fold them into the stored sketches
+        wallet_sketches.record_batch(conn, trans_mapped)
+        quantile_sketches.record_batch(conn, trans_mapped, analysis_data['RiskCode'])
+        wallet_leaders.record_batch(conn, trans_mapped)
+
+    summary.update({'inserted': len(trades), 'suspicious': int(rule_result.suspicious.sum()), 'days': len(days),
+                    'rule_hits': rule_result.rule_hits})
+    return summary
+
+
+def source_batches(source_path, after_trade_id, batch_size):
+    """Replay trades from a source database in trade_id order, batch by batch"""
+    while True:
+        source = sqlite3.connect(source_path)
+        batch = pd.read_sql("SELECT * FROM fact_transactions WHERE trade_id > ? ORDER BY trade_id LIMIT ?",
+                            source, params=(after_trade_id, batch_size))
+        source.close()
+        if batch.empty:
+            return
+        after_trade_id = int(batch['trade_id'].max())
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream new trades into the warehouse in micro-batches")
+    parser.add_argument('--db', default=etl.DW_PATH, help=f'Warehouse path (default {etl.DW_PATH})')
+    parser.add_argument('--source', default=etl.SOURCE_DBS['transactions'], help='Source trades database')
+    parser.add_argument('--rules', default=rule_engine.RULES_PATH)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+    parser.add_argument('--after-trade-id', type=int,
+                        help='Start after this trade_id (default: the warehouse MAX(TradeID))')
+    parser.add_argument('--interval', type=float, default=0, help='Seconds to wait between batches')
+    parser.add_argument('--on-conflict', choices=trade_dedup.CONFLICT_MODES, default='ignore',
+                        help='Skip already-loaded TradeIDs, or update them in place')
+    parser.add_argument('--dedup-window', type=int, default=trade_dedup.DEFAULT_WINDOW,
+                        help='Recent TradeIDs held in the in-memory duplicate pre-filter')
+    args = parser.parse_args()
+
+    engine = create_engine(f'sqlite:///{args.db}')
+    with engine.begin() as conn:
+        rule_set = rule_engine.compile_rules(conn, args.rules)
+        rule_engine.create_rule_tables(conn, rule_set)
+        anomaly_model.create_model_tables(conn)
+        warehouse_validation.create_stats_table(conn)
+        # Loaded once; retrained models are picked up on the next run
+        model_dir = anomaly_model.model_dir_for(args.db)
+        model = anomaly_model.load_model(model_dir=model_dir)
+        if model is not None:
+            anomaly_model.register_model(conn, model, model_dir)
+        recent = trade_dedup.RecentTradeIds(args.dedup_window)
+        recent.prime(conn)
+        after = args.after_trade_id
+        if after is None:
+            after = conn.execute(text("SELECT COALESCE(MAX(TradeID), 0) FROM FactTransactions")).scalar()
+
+    print(f"📡 Streaming trades after trade_id {after:,} in batches of {args.batch_size:,}...")
+    if model is None:
+        print("⚠️ No anomaly model trained (python anomaly_model.py train); AnomalyScore is a placeholder")
+    total = suspicious = duplicate_total = 0
+    for i, trades in enumerate(source_batches(args.source, after, args.batch_size), start=1):
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            summary = ingest_batch(conn, trades, rule_set, recent, args.on_conflict, model)
+            # Sampled ANALYZE takes milliseconds and keeps check_database_schema.py --fast counts current
+            etl.refresh_planner_stats(conn)
+        recent.add(summary['trade_ids'])
+        elapsed = time.perf_counter() - start
+        duplicates = summary['duplicates']
+        duplicate_count = duplicates['in_batch'] + duplicates['prefilter'] + duplicates['conflicts']
+        total += summary['inserted']
+        suspicious += summary['suspicious']
+        duplicate_total += duplicate_count
+        print(f"   ✅ Batch {i}: {summary['inserted']:,}/{summary['rows']:,} trades loaded, "
+              f"{summary['suspicious']:,} suspicious, {summary['days']} day(s) refreshed in {elapsed * 1000:.0f} ms "
+              f"({summary['rows'] / elapsed if elapsed else 0:,.0f} trades/sec)")
+        if duplicate_count:
+            print(f"      🔁 {duplicate_count:,} duplicates: {duplicates['in_batch']:,} within the batch, "
+                  f"{duplicates['prefilter']:,} pre-filtered, {duplicates['conflicts']:,} "
+                  f"{'updated' if args.on_conflict == 'update' else 'skipped'} by the TradeID index")
+        if args.max_batches and i >= args.max_batches:
+            break
+        if args.interval:
+            time.sleep(args.interval)
+
+    print(f"🎯 Streamed {total:,} trades ({suspicious:,} suspicious, {duplicate_total:,} duplicates)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
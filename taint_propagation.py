@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Abuse taint propagation over the wallet graph
+Wallets reported for abuse (DimWallet.IsReportedAbuse) are seeds; exposure flows to
+every wallet within max_hops of a seed and decays by `decay` per hop, so a wallet's
+ExposureScore is decay ** (hops to the nearest reported wallet). Scores are persisted
+in WalletExposure together with that nearest reported wallet.
+
+The graph is held as compressed sparse row (CSR) adjacency and expanded one BFS
+level at a time with NumPy, so a level costs one gather over its frontier's edges.
+Edges come from one of two sources:
+  trades  consecutive trades on opposite sides whose source timestamps fall in the
+          same second are treated as counterparties, linked in both directions.
+          TimeKey is only hour grain, so the timestamps are read from the source
+          trades database (fact_transactions); trades missing there are not linked
+  bridge  input -> output addresses of each on-chain transaction
+          (bridge_transaction_inputs/outputs from schema.sql, matched to DimWallet
+          by address)
+
+Incremental runs only re-propagate from newly reported wallets and from wallets that
+gained edges since the last run. Un-reporting a wallet triggers a full run, since
+exposure cannot be withdrawn incrementally.
+
+Usage:
+    python taint_propagation.py run
+    python taint_propagation.py run --incremental
+    python taint_propagation.py run --trades-db data/bitcoin_dw.db
+    python taint_propagation.py run --source bridge --max-hops 4 --decay 0.5
+    python taint_propagation.py top --limit 20
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+SOURCE_DB = 'data/bitcoin_dw.db'
+DEFAULT_DECAY = 0.5
+DEFAULT_MAX_HOPS = 3
+CHUNK_SIZE = 1_000_000
+
+UNREACHED = np.iinfo(np.int16).max
+
+TAINT_TABLES_SQL = [
+    """CREATE TABLE IF NOT EXISTS WalletExposure (
+        WalletKey INTEGER PRIMARY KEY,
+        Hops SMALLINT NOT NULL,
+        ExposureScore REAL NOT NULL,
+        SourceWalletKey INTEGER,
+        UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (WalletKey) REFERENCES DimWallet(WalletKey),
+        FOREIGN KEY (SourceWalletKey) REFERENCES DimWallet(WalletKey)
+    )""",
+    """CREATE TABLE IF NOT EXISTS TaintState (
+        GraphSource VARCHAR(20) PRIMARY KEY,
+        LastEdgeKey INTEGER,
+        Decay REAL,
+        MaxHops INTEGER,
+        UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+]
+
+# Trades in load order with the second of their source timestamp (NULL when not in the source)
+TRADE_EDGES_SQL = """
+    SELECT ft.TransactionFactSK, st.timestamp / 1000 AS Second, ft.SideCode, ft.WalletKey
+    FROM FactTransactions ft
+    LEFT JOIN src.fact_transactions st ON st.trade_id = ft.TradeID
+    ORDER BY ft.TransactionFactSK
+"""
+
+BRIDGE_EDGES_SQL = """
+    SELECT i.transaction_key AS EdgeKey, wi.WalletKey AS Src, wo.WalletKey AS Dst
+    FROM bridge_transaction_inputs i
+    JOIN bridge_transaction_outputs o ON o.transaction_key = i.transaction_key
+    JOIN dim_address ai ON ai.address_key = i.address_key
+    JOIN dim_address ao ON ao.address_key = o.address_key
+    JOIN DimWallet wi ON wi.WalletAddress = ai.address_hash
+    JOIN DimWallet wo ON wo.WalletAddress = ao.address_hash
+    WHERE wi.WalletKey != wo.WalletKey
+"""
+
+
+def create_taint_tables(conn):
+    for stmt in TAINT_TABLES_SQL:
+        conn.execute(text(stmt))
+
+
+def trade_edges(conn, source_db, chunk_size=CHUNK_SIZE):
+    """Counterparty links between consecutive opposite-side trades in the same second
+
+    Seconds come from the source trades' timestamps in source_db. Yields (edge_key,
+    src, dst) arrays; edge_key is the later trade's TransactionFactSK.
+    """
+    carry = None
+    conn.execute(text("ATTACH DATABASE :path AS src"), {'path': source_db})
+    try:
+        for chunk in pd.read_sql(text(TRADE_EDGES_SQL), conn, chunksize=chunk_size):
+            if carry is not None:
+                chunk = pd.concat([carry, chunk], ignore_index=True)
+            yield _linked_trades(chunk)
+            carry = chunk.iloc[[-1]]
+    finally:
+        conn.execute(text("DETACH DATABASE src"))
+
+
+def _linked_trades(chunk):
+    columns = {c: chunk[c].fillna(-1).to_numpy(dtype=np.int64) for c in chunk.columns}
+    linked = ((columns['Second'][1:] == columns['Second'][:-1]) & (columns['Second'][1:] >= 0) &
+              (columns['SideCode'][1:] != columns['SideCode'][:-1]) &
+              (columns['WalletKey'][1:] != columns['WalletKey'][:-1]) &
+              (columns['WalletKey'][1:] > 0) & (columns['WalletKey'][:-1] > 0))
+    return (columns['TransactionFactSK'][1:][linked], columns['WalletKey'][:-1][linked],
+            columns['WalletKey'][1:][linked])
+
+
+def bridge_edges(conn, source_db=None, chunk_size=CHUNK_SIZE):
+    """Fund flows from input to output wallets; edge_key is the transaction_key"""
+    for chunk in pd.read_sql(text(BRIDGE_EDGES_SQL), conn, chunksize=chunk_size):
+        yield (chunk['EdgeKey'].to_numpy(dtype=np.int64), chunk['Src'].to_numpy(dtype=np.int64),
+               chunk['Dst'].to_numpy(dtype=np.int64))
+
+
+# Graph source -> (edge loader, links are undirected, tables it needs)
+EDGE_SOURCES = {
+    'trades': (trade_edges, True, ('FactTransactions',)),
+    'bridge': (bridge_edges, False, ('bridge_transaction_inputs', 'bridge_transaction_outputs', 'dim_address')),
+}
+
+
+def build_graph(conn, source, num_nodes, after_edge_key=None, source_db=None):
+    """CSR adjacency (indptr, indices) for a graph source (trades need source_db)
+
+    Returns (indptr, indices, touched, last_edge_key); touched holds the origin nodes
+    of edges newer than after_edge_key.
+    """
+    loader, undirected, _ = EDGE_SOURCES[source]
+    pairs, touched, last_key = [], [], after_edge_key
+    for keys, src, dst in loader(conn, source_db):
+        if not len(keys):
+            continue
+        if undirected:
+            src, dst, keys = np.r_[src, dst], np.r_[dst, src], np.r_[keys, keys]
+        # One int64 per edge (src, dst) keeps de-duplication and sorting cheap
+        pairs.append(np.unique(src * num_nodes + dst))
+        if after_edge_key is not None:
+            touched.append(np.unique(src[keys > after_edge_key]))
+        last_key = max(last_key or 0, int(keys.max()))
+
+    pairs = np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+    src, indices = np.divmod(pairs, num_nodes)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=num_nodes), out=indptr[1:])
+    touched = np.unique(np.concatenate(touched)) if touched else np.empty(0, dtype=np.int64)
+    return indptr, indices.astype(np.int32), touched, last_key
+
+
+def propagate(indptr, indices, hops, source, frontier, max_hops):
+    """Bounded-hop BFS from frontier, lowering hops/source in place; returns levels expanded
+
+    Nodes only re-enter the frontier when their hop count drops, so starting from a
+    frontier of mixed depths (an incremental run) still converges to shortest hops.
+    """
+    frontier = np.unique(np.asarray(frontier, dtype=np.int64))
+    levels = 0
+    while len(frontier):
+        frontier = frontier[hops[frontier] < max_hops]
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            break
+        origin = np.repeat(frontier, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        targets = indices[np.repeat(starts, counts) + offsets].astype(np.int64)
+        candidate = hops[origin] + 1
+
+        better = candidate < hops[targets]
+        origin, targets, candidate = origin[better], targets[better], candidate[better]
+        # Several frontier nodes can reach one target: keep the fewest hops
+        order = np.lexsort((candidate, targets))
+        targets, origin, candidate = targets[order], origin[order], candidate[order]
+        first = np.r_[True, targets[1:] != targets[:-1]] if len(targets) else np.empty(0, dtype=bool)
+        targets, origin, candidate = targets[first], origin[first], candidate[first]
+
+        hops[targets] = candidate
+        source[targets] = source[origin]
+        frontier = targets
+        levels += 1
+    return levels
+
+
+def _load_state(conn, source):
+    row = conn.execute(text("SELECT LastEdgeKey, Decay, MaxHops FROM TaintState WHERE GraphSource = :s"),
+                       {'s': source}).fetchone()
+    return None if row is None else {'last_edge_key': row[0], 'decay': row[1], 'max_hops': row[2]}
+
+
+def _save_state(conn, source, last_edge_key, decay, max_hops):
+    conn.execute(text("DELETE FROM TaintState"))
+    conn.execute(text("INSERT INTO TaintState (GraphSource, LastEdgeKey, Decay, MaxHops) VALUES (:s, :k, :d, :h)"),
+                 {'s': source, 'k': last_edge_key, 'd': decay, 'h': max_hops})
+
+
+def _write_exposure(conn, keys, hops, source, decay, replace_all):
+    rows = pd.DataFrame({
+        'WalletKey': keys,
+        'Hops': hops[keys].astype(np.int64),
+        'ExposureScore': np.power(decay, hops[keys].astype(np.float64)),
+        'SourceWalletKey': source[keys],
+    })
+    if replace_all:
+        conn.execute(text("DELETE FROM WalletExposure"))
+        rows.to_sql('WalletExposure', conn, if_exists='append', index=False, chunksize=CHUNK_SIZE)
+        return len(rows)
+    rows.to_sql('WalletExposure_stage', conn, if_exists='replace', index=False, chunksize=CHUNK_SIZE)
+    conn.execute(text("""
+        INSERT OR REPLACE INTO WalletExposure (WalletKey, Hops, ExposureScore, SourceWalletKey)
+        SELECT WalletKey, Hops, ExposureScore, SourceWalletKey FROM WalletExposure_stage"""))
+    conn.execute(text("DROP TABLE WalletExposure_stage"))
+    return len(rows)
+
+
+def run(conn, source='trades', decay=DEFAULT_DECAY, max_hops=DEFAULT_MAX_HOPS, incremental=False,
+        source_db=SOURCE_DB):
+    """Propagate abuse exposure and persist it; returns a run summary
+
+    source_db is the source trades database the trades graph reads timestamps from.
+    """
+    tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"))}
+    missing = [t for t in EDGE_SOURCES[source][2] if t not in tables]
+    if missing:
+        raise RuntimeError(f"{source} graph needs {', '.join(missing)}")
+    if source == 'trades' and not (source_db and os.path.exists(source_db)):
+        raise RuntimeError(f"trades graph needs the source trades database for trade timestamps "
+                           f"(not found: {source_db})")
+    create_taint_tables(conn)
+
+    num_nodes = int(conn.execute(text("SELECT COALESCE(MAX(WalletKey), 0) FROM DimWallet")).scalar()) + 1
+    seeds = pd.read_sql(text("SELECT WalletKey FROM DimWallet WHERE IsReportedAbuse = 1"), conn)['WalletKey']
+    seeds = seeds.to_numpy(dtype=np.int64)
+
+    hops = np.full(num_nodes, UNREACHED, dtype=np.int16)
+    source_keys = np.full(num_nodes, -1, dtype=np.int64)
+    state = _load_state(conn, source) if incremental else None
+    mode = 'incremental'
+    if state is None or state['decay'] != decay or state['max_hops'] != max_hops:
+        mode = 'full'
+    else:
+        stored = pd.read_sql(text("SELECT WalletKey, Hops, SourceWalletKey FROM WalletExposure"), conn)
+        stored = stored[stored['WalletKey'] < num_nodes]
+        hops[stored['WalletKey'].to_numpy()] = stored['Hops'].to_numpy(dtype=np.int16)
+        source_keys[stored['WalletKey'].to_numpy()] = stored['SourceWalletKey'].to_numpy(dtype=np.int64)
+        unreported = np.setdiff1d(stored.loc[stored['Hops'] == 0, 'WalletKey'].to_numpy(), seeds)
+        if len(unreported):
+            logger.info(f"   {len(unreported):,} wallet(s) no longer reported; recomputing all exposure")
+            hops[:] = UNREACHED
+            source_keys[:] = -1
+            mode = 'full'
+    previous = hops.copy()
+
+    start = time.perf_counter()
+    after = state['last_edge_key'] if mode == 'incremental' else None
+    indptr, indices, touched, last_key = build_graph(conn, source, num_nodes, after, source_db)
+    graph_seconds = time.perf_counter() - start
+
+    new_seeds = seeds[hops[seeds] != 0]
+    hops[new_seeds] = 0
+    source_keys[new_seeds] = new_seeds
+    frontier = new_seeds if mode == 'full' else np.r_[new_seeds, touched[hops[touched] < UNREACHED]]
+
+    start = time.perf_counter()
+    levels = propagate(indptr, indices, hops, source_keys, frontier, max_hops)
+    propagate_seconds = time.perf_counter() - start
+
+    if mode == 'full':
+        written = _write_exposure(conn, np.nonzero(hops < UNREACHED)[0], hops, source_keys, decay, True)
+    else:
+        written = _write_exposure(conn, np.nonzero(hops != previous)[0], hops, source_keys, decay, False)
+    _save_state(conn, source, last_key, decay, max_hops)
+
+    return {'mode': mode, 'wallets': num_nodes - 1, 'edges': len(indices), 'seeds': len(seeds),
+            'frontier': len(frontier), 'levels': levels, 'exposed': int((hops < UNREACHED).sum()),
+            'written': written, 'graph_seconds': graph_seconds, 'propagate_seconds': propagate_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propagate abuse exposure from reported wallets")
+    parser.add_argument('--db', default=DB_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='Compute WalletExposure')
+    run_parser.add_argument('--source', choices=sorted(EDGE_SOURCES), default='trades')
+    run_parser.add_argument('--trades-db', default=SOURCE_DB,
+                            help='Source trades database, for trade timestamps (trades graph)')
+    run_parser.add_argument('--decay', type=float, default=DEFAULT_DECAY, help='Exposure kept per hop')
+    run_parser.add_argument('--max-hops', type=int, default=DEFAULT_MAX_HOPS)
+    run_parser.add_argument('--incremental', action='store_true',
+                            help='Only propagate from new reports and newly connected wallets')
+    top = sub.add_parser('top', help='Most exposed wallets that are not reported themselves')
+    top.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    if args.command == 'run':
+        print(f"🧪 Propagating abuse exposure over the {args.source} graph "
+              f"(decay {args.decay:g}, max {args.max_hops} hops)...")
+        try:
+            with engine.begin() as conn:
+                summary = run(conn, args.source, args.decay, args.max_hops, args.incremental, args.trades_db)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"   Graph: {summary['wallets']:,} wallets, {summary['edges']:,} edges "
+              f"({summary['graph_seconds']:.2f}s)")
+        print(f"   {summary['mode'].title()} run from {summary['frontier']:,} wallet(s), "
+              f"{summary['levels']} level(s) in {summary['propagate_seconds'] * 1000:.0f} ms")
+        print(f"✅ {summary['exposed']:,} wallets exposed to {summary['seeds']:,} reported; "
+              f"{summary['written']:,} rows written")
+        return 0
+
+    with engine.connect() as conn:
+        exposed = pd.read_sql(text("""
+            SELECT w.WalletAddress, e.Hops, ROUND(e.ExposureScore, 4) AS ExposureScore,
+                   s.WalletAddress AS NearestReported
+            FROM WalletExposure e
+            JOIN DimWallet w ON w.WalletKey = e.WalletKey
+            LEFT JOIN DimWallet s ON s.WalletKey = e.SourceWalletKey
+            WHERE e.Hops > 0
+            ORDER BY e.Hops, e.WalletKey
+            LIMIT :n"""), conn, params={'n': args.limit})
+    print(exposed.to_string(index=False) if not exposed.empty else "No exposed wallets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
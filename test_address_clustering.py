@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Tests for address_clustering: the memory-mapped UnionFind
+
+Usage:
+    python -m pytest -q test_address_clustering.py
+"""
+
+import numpy as np
+
+import address_clustering
+
+
+def test_union_pairs_star_raises_rank_once(tmp_path):
+    """A 300-input transaction links 299 singleton roots to one parent in a single round"""
+    uf = address_clustering.UnionFind(str(tmp_path), 300)
+    assert uf.union_pairs(np.zeros(299), np.arange(1, 300)) == 299
+    assert (uf.find(np.arange(300)) == 0).all()
+    assert uf.rank[0] == 1
+
+
+def test_union_pairs_rank_stays_logarithmic(tmp_path):
+    size = 4_096
+    uf = address_clustering.UnionFind(str(tmp_path), size)
+    rng = np.random.default_rng(1)
+    merged = 0
+    # Wide transactions on top of pairwise merges: every address ends up in one set
+    for width in (2, 300, 2, 300):
+        order = rng.permutation(size)
+        anchors = np.repeat(order[::width], width)[:size]
+        merged += uf.union_pairs(anchors, order)
+    assert merged == size - 1
+    assert len(np.unique(uf.find(np.arange(size)))) == 1
+    assert uf.rank.max() <= np.log2(size)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Tests for the mergeable sketches: Space-Saving leaderboards (wallet_leaders),
+HyperLogLog distinct wallets (wallet_sketches) and DDSketch quantiles
+(quantile_sketches)
+
+Usage:
+    python -m pytest -q test_sketches.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import quantile_sketches
+import schema_matched_etl as etl
+import wallet_leaders
+import wallet_sketches
+
+
+def _zipf_batches(rng, batches=20, size=2_000, wallets=5_000):
+    """Skewed (wallet, weight) batches so a few wallets dominate"""
+    return [((rng.zipf(1.3, size) % wallets).astype(np.int64), rng.integers(1, 1_000, size))
+            for _ in range(batches)]
+
+
+def _assert_brackets(summary, truth):
+    """Estimate >= true total >= Estimate - Error for kept keys; unlisted keys are under the floor"""
+    kept = truth.reindex(summary.estimates.index, fill_value=0)
+    assert (summary.estimates >= kept).all()
+    assert (kept >= summary.estimates - summary.errors).all()
+    assert (summary.errors >= 0).all()
+    unlisted = truth.drop(summary.estimates.index, errors='ignore')
+    assert (unlisted <= summary.floor).all()
+    assert summary.total == int(truth.sum())
+
+
+def test_space_saving_brackets_after_merge_and_truncation():
+    rng = np.random.default_rng(7)
+    batches = _zipf_batches(rng)
+    truth = pd.concat([pd.Series(w, index=k) for k, w in batches]).groupby(level=0).sum()
+
+    summary = wallet_leaders.SpaceSaving(capacity=50)
+    for keys, weights in batches:
+        summary.merge(wallet_leaders.SpaceSaving.exact(keys, weights))
+        assert len(summary.estimates) <= 50
+    assert len(truth) > 50 and summary.floor > 0 and summary.errors.any()
+    _assert_brackets(summary, truth)
+
+    # The true heaviest wallets are guaranteed a place
+    assert set(truth.nlargest(5).index) <= set(summary.estimates.index)
+
+
+def test_space_saving_merging_two_truncated_summaries_keeps_brackets():
+    rng = np.random.default_rng(11)
+    batches = _zipf_batches(rng)
+    halves = batches[:10], batches[10:]
+    summaries = []
+    for half in halves:
+        summary = wallet_leaders.SpaceSaving(capacity=40)
+        for keys, weights in half:
+            summary.merge(wallet_leaders.SpaceSaving.exact(keys, weights))
+        summaries.append(summary)
+    truth = pd.concat([pd.Series(w, index=k) for k, w in batches]).groupby(level=0).sum()
+
+    merged = summaries[0].merge(summaries[1])
+    assert len(merged.estimates) == 40 and merged.floor > 0
+    _assert_brackets(merged, truth)
+
+    board = merged.top(10)
+    assert board['Rank'].tolist() == list(range(1, 11))
+    assert (board['Guaranteed'] <= truth.reindex(board['WalletKey']).to_numpy()).all()
+
+
+def test_space_saving_is_exact_below_capacity():
+    keys = np.array([3, 1, 3, 2, 3, 1])
+    summary = wallet_leaders.SpaceSaving(capacity=10).merge(wallet_leaders.SpaceSaving.exact(keys, np.ones(6)))
+    assert summary.floor == 0
+    assert summary.estimates.to_dict() == {1: 2, 2: 1, 3: 3}
+    assert (summary.errors == 0).all()
+
+
+@pytest.mark.parametrize('n', [100, 5_000, 200_000])
+def test_hyperloglog_error_within_bounds(n):
+    keys = np.random.default_rng(n).choice(10 * n, size=n, replace=False)
+    sketch = wallet_sketches.HyperLogLog().add(keys)
+    # Four standard errors; the hash is deterministic, so this cannot flake
+    assert abs(sketch.estimate() - n) <= max(2, 4 * wallet_sketches.RELATIVE_ERROR * n)
+
+
+def test_hyperloglog_merge_is_the_union():
+    rng = np.random.default_rng(3)
+    keys = rng.choice(1_000_000, size=60_000, replace=False)
+    left, right = keys[:40_000], keys[20_000:]
+    merged = wallet_sketches.HyperLogLog().add(left).merge(wallet_sketches.HyperLogLog().add(right))
+    whole = wallet_sketches.HyperLogLog().add(keys)
+    assert np.array_equal(merged.registers, whole.registers)
+    assert abs(merged.estimate() - 60_000) <= 4 * wallet_sketches.RELATIVE_ERROR * 60_000
+
+    # Duplicates and re-merges do not change the sketch
+    again = wallet_sketches.HyperLogLog.from_bytes(merged.to_bytes()).add(left).merge(whole)
+    assert again.estimate() == merged.estimate()
+
+
+def test_ddsketch_quantiles_within_one_percent():
+    rng = np.random.default_rng(5)
+    values = np.round(rng.lognormal(mean=12, sigma=2, size=200_000))
+    values = values[values > 0]
+    qs = (0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 0.999)
+    estimates = quantile_sketches.QuantileSketch.from_values(values).quantiles(qs)
+
+    ordered = np.sort(values)
+    for q, estimate in zip(qs, estimates):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(estimate - exact) <= quantile_sketches.RELATIVE_ACCURACY * exact + 1e-9, q
+
+
+def test_ddsketch_merge_matches_one_sketch_and_keeps_zeros():
+    rng = np.random.default_rng(9)
+    values = np.concatenate([np.zeros(1_000), rng.pareto(1.5, 50_000) * 1_000 + 1])
+    rng.shuffle(values)
+    merged = quantile_sketches.QuantileSketch.from_values(values[:20_000])
+    merged.merge(quantile_sketches.QuantileSketch.from_bytes(
+        quantile_sketches.QuantileSketch.from_values(values[20_000:]).to_bytes()))
+    whole = quantile_sketches.QuantileSketch.from_values(values)
+
+    assert merged.count == len(values)
+    assert np.array_equal(merged.buckets, whole.buckets)
+    assert np.array_equal(merged.counts, whole.counts)
+    assert merged.quantile(0.001) == 0.0
+    assert merged.histogram()['Trades'].sum() == len(values)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Warehouse with one DimTime row per day for the first week of March 2024"""
+    engine = etl.create_data_warehouse_with_your_schema(str(tmp_path / 'dw.db'))
+    days = pd.date_range('2024-03-01', '2024-03-07', freq='D')
+    with engine.begin() as conn:
+        pd.DataFrame({'FullTimestamp': days.strftime('%Y-%m-%d %H:%M:%S'),
+                      'Date': days.strftime('%Y-%m-%d')}).to_sql('DimTime', conn, if_exists='append', index=False)
+    yield engine
+    engine.dispose()
+
+
+def _load(conn, rng, first_id, size, risk_code):
+    """Insert random facts over the first three days and their analysis rows"""
+    facts = pd.DataFrame({
+        'TradeID': np.arange(first_id, first_id + size, dtype=np.int64),
+        'SideCode': 1,
+        'TimeKey': rng.integers(1, 4, size),
+        'MarketDateKey': 1,
+        'WalletKey': rng.integers(1, 500, size),
+        'PriceCents': rng.integers(1, 10_000_000, size),
+        'VolumeQuoteCents': rng.integers(0, 10_000_000, size),
+        'SizeBaseSat': rng.integers(1, 100_000_000, size),
+    })
+    facts.to_sql('FactTransactions', conn, if_exists='append', index=False)
+    conn.execute(text("INSERT INTO TransactionAnalysis (TransactionFactSK, RiskCode) "
+                      "SELECT TransactionFactSK, :r FROM FactTransactions WHERE TradeID >= :first"),
+                 {'r': risk_code, 'first': first_id})
+    return facts
+
+
+def _stored(conn):
+    return {'wallets': conn.execute(text("SELECT Date, Wallets, Registers FROM WalletSketches ORDER BY Date")).fetchall(),
+            'amounts': conn.execute(text("SELECT Date, Measure, RiskCode, Trades, Buckets FROM QuantileSketches "
+                                         "ORDER BY Date, Measure, RiskCode")).fetchall()}
+
+
+def test_record_batch_matches_a_rebuild(engine):
+    rng = np.random.default_rng(13)
+    with engine.begin() as conn:
+        _load(conn, rng, 0, 3_000, risk_code=1)
+        wallet_sketches.refresh(conn)
+        quantile_sketches.refresh(conn)
+        batch = _load(conn, rng, 3_000, 1_000, risk_code=2)
+        wallet_sketches.record_batch(conn, batch)
+        quantile_sketches.record_batch(conn, batch, np.full(len(batch), 2))
+        folded = _stored(conn)
+        wallet_sketches.refresh(conn)
+        quantile_sketches.refresh(conn)
+        rebuilt = _stored(conn)
+    assert folded['wallets'] and folded['amounts']
+    assert folded == rebuilt
+
+
+def test_full_rebuild_keeps_days_without_hot_facts(engine):
+    """An archived day's sketches have no facts behind them and must survive a rebuild"""
+    rng = np.random.default_rng(17)
+    archived = wallet_sketches.HyperLogLog().add(np.arange(100))
+    with engine.begin() as conn:
+        _load(conn, rng, 0, 500, risk_code=1)
+        wallet_sketches.create_sketch_tables(conn)
+        quantile_sketches.create_sketch_tables(conn)
+        conn.execute(text("INSERT INTO WalletSketches VALUES ('2024-03-06', 100, :r)"), {'r': archived.to_bytes()})
+        conn.execute(text("INSERT INTO QuantileSketches VALUES ('2024-03-06', 'Price', 1, 3, :b)"),
+                     {'b': quantile_sketches.QuantileSketch.from_values([1, 2, 3]).to_bytes()})
+        wallet_leaders.create_leader_tables(conn)
+        conn.execute(text("INSERT INTO WalletLeaders VALUES ('2024-03-06', :m, 7, 50, 0)"), {'m': wallet_leaders.METRICS[0]})
+        wallet_sketches.refresh(conn)
+        quantile_sketches.refresh(conn)
+        wallet_leaders.refresh(conn)
+        leaders = dict(conn.execute(text("SELECT WindowStart, COUNT(*) FROM WalletLeaders GROUP BY WindowStart")).fetchall())
+        wallets = dict(conn.execute(text("SELECT Date, Wallets FROM WalletSketches")).fetchall())
+        trades = dict(conn.execute(text("SELECT Date, SUM(Trades) FROM QuantileSketches "
+                                        "WHERE Measure = 'Price' GROUP BY Date")).fetchall())
+    assert wallets['2024-03-06'] == 100 and len(wallets) == 4
+    assert trades['2024-03-06'] == 3 and sum(trades.values()) == 503
+    assert leaders['2024-03-06'] == 1 and len(leaders) == 4
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for trade_dedup: the RecentTradeIds pre-filter, the ON CONFLICT insert
+method and migrate() on a partitioned warehouse
+
+Usage:
+    python -m pytest -q test_trade_dedup.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import fact_partitions
+import schema_matched_etl as etl
+import trade_dedup
+
+
+def _facts(trade_ids, price=100, time_key=1):
+    trade_ids = np.asarray(trade_ids, dtype=np.int64)
+    return pd.DataFrame({
+        'TradeID': trade_ids,
+        'SideCode': 1,
+        'TimeKey': time_key,
+        'MarketDateKey': 1,
+        'WalletKey': 1,
+        'PriceCents': price,
+        'VolumeQuoteCents': trade_ids * 10,
+        'SizeBaseSat': 1000,
+    })
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """Empty warehouse with one DimTime row per day for March and April 2024"""
+    engine = etl.create_data_warehouse_with_your_schema(str(tmp_path / 'dw.db'))
+    days = pd.date_range('2024-03-01', '2024-04-30', freq='D')
+    with engine.begin() as conn:
+        pd.DataFrame({'FullTimestamp': days.strftime('%Y-%m-%d %H:%M:%S'),
+                      'Date': days.strftime('%Y-%m-%d')}).to_sql('DimTime', conn, if_exists='append', index=False)
+    yield engine
+    engine.dispose()
+
+
+def _time_key(conn, day):
+    return conn.execute(text("SELECT TimeKey FROM DimTime WHERE Date = :d"), {'d': day}).scalar()
+
+
+def test_recent_trade_ids_slides_forward():
+    recent = trade_dedup.RecentTradeIds(window=128)
+    assert recent.window == 128
+    recent.add(range(0, 10))
+    assert recent.seen([0, 9, 10, 127]).tolist() == [True, True, False, False]
+
+    # 200 is past the window: it slides two words and everything before 128 drops out
+    recent.add([200])
+    assert recent.base == 128
+    assert recent.seen([5, 200, 201]).tolist() == [False, True, False]
+
+    recent.add([130])
+    assert recent.seen([130]).tolist() == [True]
+
+    # One more word: 130 leaves the window, 200 stays
+    recent.add([260])
+    assert recent.base == 192
+    assert recent.seen([130, 200, 260]).tolist() == [False, True, True]
+
+
+def test_recent_trade_ids_ignores_ids_below_the_window():
+    recent = trade_dedup.RecentTradeIds(window=64)
+    recent.add([1000])
+    recent.add([3])
+    assert recent.seen([3, 1000]).tolist() == [False, True]
+
+
+def test_drop_duplicates_counts_in_batch_and_prefiltered():
+    recent = trade_dedup.RecentTradeIds(window=64)
+    recent.add([10, 11])
+    trades = pd.DataFrame({'trade_id': [10, 12, 12, 13, 11]})
+    kept, counts = trade_dedup.drop_duplicates(trades, recent)
+    assert kept['trade_id'].tolist() == [12, 13]
+    assert counts == {'in_batch': 1, 'prefilter': 2}
+
+
+def test_overlapping_batches_load_each_trade_once(engine):
+    """A window smaller than the overlap: older replays fall through to the unique index"""
+    recent = trade_dedup.RecentTradeIds(window=64)
+    batches = [np.arange(0, 100), np.arange(50, 150), np.arange(0, 150)]
+    prefiltered = 0
+    with engine.begin() as conn:
+        for ids in batches:
+            trades = pd.DataFrame({'trade_id': ids})
+            trades, counts = trade_dedup.drop_duplicates(trades, recent)
+            prefiltered += counts['prefilter']
+            _facts(trades['trade_id']).to_sql('FactTransactions', conn, if_exists='append', index=False,
+                                              method=trade_dedup.insert_method('ignore'))
+            recent.add(trades['trade_id'])
+        rows, distinct = conn.execute(text("SELECT COUNT(*), COUNT(DISTINCT TradeID) FROM FactTransactions")).one()
+    # 200 replays in all: some caught by the pre-filter, the rest by ON CONFLICT DO NOTHING
+    assert rows == distinct == 150
+    assert 0 < prefiltered < 200
+
+
+def test_insert_method_ignore_keeps_the_first_row(engine):
+    method = trade_dedup.insert_method('ignore')
+    with engine.begin() as conn:
+        assert _facts([1, 2, 3]).to_sql('FactTransactions', conn, if_exists='append', index=False, method=method) == 3
+        written = _facts([2, 3, 4], price=999).to_sql('FactTransactions', conn, if_exists='append',
+                                                      index=False, method=method)
+        prices = dict(conn.execute(text("SELECT TradeID, PriceCents FROM FactTransactions")).fetchall())
+    assert written == 1
+    assert prices == {1: 100, 2: 100, 3: 100, 4: 999}
+
+
+def test_insert_method_update_applies_corrections_in_place(engine):
+    with engine.begin() as conn:
+        _facts([1, 2]).to_sql('FactTransactions', conn, if_exists='append', index=False,
+                              method=trade_dedup.insert_method('ignore'))
+        sks_before = trade_dedup.trade_sks(conn, 'FactTransactions', [1, 2])
+        _facts([2, 3], price=250).to_sql('FactTransactions', conn, if_exists='append', index=False,
+                                         method=trade_dedup.insert_method('update'))
+        rows = conn.execute(text("SELECT TradeID, PriceCents FROM FactTransactions ORDER BY TradeID")).fetchall()
+        sks_after = trade_dedup.trade_sks(conn, 'FactTransactions', [1, 2, 3, 99])
+    assert [tuple(r) for r in rows] == [(1, 100), (2, 250), (3, 250)]
+    # The corrected trade keeps its surrogate key; trade_sks reports 0 for unknown TradeIDs
+    assert sks_after[:2].tolist() == sks_before.tolist()
+    assert sks_after[2] > 0 and sks_after[3] == 0
+
+
+def test_insert_method_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        trade_dedup.insert_method('replace')
+
+
+def test_migrate_removes_duplicates_across_partitions(engine):
+    with engine.begin() as conn:
+        # A legacy warehouse: non-unique TradeID index and replayed trades
+        conn.execute(text(f"DROP INDEX {trade_dedup.TRADE_ID_INDEX}"))
+        conn.execute(text(f"CREATE INDEX {trade_dedup.TRADE_ID_INDEX} ON FactTransactions(TradeID)"))
+        march, april = _time_key(conn, '2024-03-15'), _time_key(conn, '2024-04-15')
+        facts = pd.concat([_facts([1, 2, 3], time_key=march),
+                           _facts([2, 3], time_key=march),    # replayed in the same month
+                           _facts([3, 4], time_key=april)])   # replayed into the next month
+        facts.to_sql('FactTransactions', conn, if_exists='append', index=False)
+        conn.execute(text("INSERT INTO TransactionAnalysis (TransactionFactSK) SELECT TransactionFactSK FROM FactTransactions"))
+        fact_partitions.enable_partitioning(conn, 'month')
+        first_sks = dict(conn.execute(text(
+            "SELECT TradeID, MIN(TransactionFactSK) FROM FactTransactions GROUP BY TradeID")).fetchall())
+        assert int(trade_dedup.duplicate_report(conn)['ExtraRows']) == 3
+        assert trade_dedup.duplicate_days(conn) == ['2024-03-15', '2024-04-15']
+
+        assert trade_dedup.migrate(conn) == 3
+
+        rows = dict(conn.execute(text("SELECT TradeID, TransactionFactSK FROM FactTransactions")).fetchall())
+        counts = dict(conn.execute(text("SELECT PartitionName, RowCount FROM FactPartitions")).fetchall())
+        actual = {name: conn.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar() for name in counts}
+        analysis = conn.execute(text("SELECT COUNT(*) FROM TransactionAnalysis")).scalar()
+        index_sql = conn.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE :p"),
+            {'p': trade_dedup.TRADE_ID_INDEX + '%'}).fetchall()
+
+        # The next load of a TradeID already in a partition is ignored
+        sks = fact_partitions.insert_facts(conn, _facts([4, 5], time_key=april),
+                                           ['2024-04-15', '2024-04-16'])
+        total = conn.execute(text("SELECT COUNT(*) FROM FactTransactions")).scalar()
+
+    assert rows == first_sks
+    assert counts == actual == {'FactTransactions_p202403': 3, 'FactTransactions_p202404': 1}
+    assert analysis == 4
+    assert index_sql and all('UNIQUE' in sql.upper() for _, sql in index_sql)
+    assert sks[0] == 0 and sks[1] > 0
+    assert total == 5
+
+
+def test_insert_facts_keeps_partition_row_counts(engine):
+    with engine.begin() as conn:
+        fact_partitions.enable_partitioning(conn, 'month')
+        march, april = _time_key(conn, '2024-03-15'), _time_key(conn, '2024-04-15')
+        fact_partitions.insert_facts(conn, _facts([1, 2, 3], time_key=march), ['2024-03-15'] * 3)
+        fact_partitions.insert_facts(conn, _facts([3, 4], time_key=march), ['2024-03-15'] * 2)
+        # 2 moves to April, 3 is corrected in place, 5 is new
+        fact_partitions.insert_facts(conn, pd.concat([_facts([2], time_key=april), _facts([3, 5], time_key=march)]),
+                                     ['2024-04-15', '2024-03-15', '2024-03-15'], on_conflict='update')
+        counts = dict(conn.execute(text("SELECT PartitionName, RowCount FROM FactPartitions")).fetchall())
+        actual = {name: conn.execute(text(f"SELECT COUNT(*) FROM {name}")).scalar() for name in counts}
+    assert counts == actual == {'FactTransactions_p202403': 4, 'FactTransactions_p202404': 1}
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Idempotent trade ingestion
+FactTransactions.TradeID is unique (idx_fact_tradeid), and trades are appended with
+INSERT ... ON CONFLICT(TradeID) DO NOTHING (or DO UPDATE to apply corrections), so
+replays and overlapping ingestion windows cannot double-count trades.
+
+Most duplicates never reach SQLite: each batch is de-duplicated on its own, then
+checked against RecentTradeIds, a bitmap over the most recent `window` TradeIDs.
+TradeIDs older than the window fall through to the unique index. Partitioned
+warehouses carry the unique index on every partition, so uniqueness across them
+relies on a trade's timestamp not changing. A replayed trade keeps its timestamp and
+lands in the partition that already holds it. A correction (on_conflict='update')
+that moves a trade's date is moved between partitions by
+fact_partitions.insert_facts.
+
+Usage:
+    python trade_dedup.py check
+    python trade_dedup.py migrate     # drop existing duplicates and make the index unique
+"""
+
+import argparse
+import logging
+import sys
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_cache
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+DEFAULT_WINDOW = 10_000_000
+CONFLICT_MODES = ('ignore', 'update')
+
+TRADE_ID_INDEX = 'idx_fact_tradeid'
+
+
+class RecentTradeIds:
+    """Sliding bitmap over the most recent `window` TradeIDs
+
+    Bits cover [base, base + window); adding a higher TradeID slides the window
+    forward a whole 64-bit word at a time. Only add TradeIDs once they are committed,
+    otherwise a rolled-back batch would be dropped as a duplicate when retried.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.words = np.zeros((int(window) + 63) // 64, dtype=np.uint64)
+        self.window = len(self.words) * 64
+        self.base = None
+
+    def _slide(self, high):
+        if self.base is None:
+            self.base = max(0, (high - self.window + 1) // 64 * 64)
+        overflow = high - (self.base + self.window) + 1
+        if overflow <= 0:
+            return
+        shift = (overflow + 63) // 64
+        if shift >= len(self.words):
+            self.words[:] = 0
+        else:
+            self.words[:-shift] = self.words[shift:]
+            self.words[-shift:] = 0
+        self.base += shift * 64
+
+    def _offsets(self, trade_ids):
+        trade_ids = np.asarray(trade_ids, dtype=np.int64)
+        if self.base is None:
+            return np.zeros(len(trade_ids), dtype=bool), trade_ids
+        offsets = trade_ids - self.base
+        return (offsets >= 0) & (offsets < self.window), offsets
+
+    def add(self, trade_ids):
+        trade_ids = np.asarray(trade_ids, dtype=np.int64)
+        if not len(trade_ids):
+            return
+        self._slide(int(trade_ids.max()))
+        in_window, offsets = self._offsets(trade_ids)
+        offsets = offsets[in_window].astype(np.uint64)
+        np.bitwise_or.at(self.words, offsets >> np.uint64(6), np.uint64(1) << (offsets & np.uint64(63)))
+
+    def seen(self, trade_ids):
+        """Bool mask of TradeIDs known to be loaded already"""
+        in_window, offsets = self._offsets(trade_ids)
+        mask = np.zeros(len(in_window), dtype=bool)
+        offsets = offsets[in_window].astype(np.uint64)
+        mask[in_window] = ((self.words[offsets >> np.uint64(6)] >> (offsets & np.uint64(63))) & np.uint64(1)).astype(bool)
+        return mask
+
+    def prime(self, conn, table='FactTransactions'):
+        """Load the newest window of TradeIDs already in the warehouse"""
+        high = conn.execute(text(f"SELECT MAX(TradeID) FROM {table}")).scalar()
+        if high is None:
+            return 0
+        ids = pd.read_sql(text(f"SELECT TradeID FROM {table} WHERE TradeID > :low"), conn,
+                          params={'low': int(high) - self.window})['TradeID']
+        self.add(ids.to_numpy(dtype=np.int64))
+        return len(ids)
+
+
+def drop_duplicates(trades, recent=None, column='trade_id', keep='first'):
+    """Drop repeated TradeIDs within a batch and ones the pre-filter has seen
+
+    Returns (trades, counts) with counts {'in_batch': n, 'prefilter': n}.
+    """
+    repeated = trades[column].duplicated(keep=keep).to_numpy()
+    known = np.zeros(len(trades), dtype=bool)
+    if recent is not None:
+        known = recent.seen(trades[column].to_numpy(dtype=np.int64)) & ~repeated
+    counts = {'in_batch': int(repeated.sum()), 'prefilter': int(known.sum())}
+    return trades[~(repeated | known)], counts
+
+
+def insert_method(on_conflict='ignore', key='TradeID'):
+    """pandas to_sql method that appends with ON CONFLICT(key) DO NOTHING / DO UPDATE"""
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f"on_conflict must be one of {CONFLICT_MODES}")
+
+    def insert(table, conn, keys, data_iter):
+        columns = ', '.join(keys)
+        values = ', '.join(f':{k}' for k in keys)
+        if on_conflict == 'ignore':
+            action = 'DO NOTHING'
+        else:
+            updates = ', '.join(f'{k} = excluded.{k}' for k in keys if k not in (key, 'TransactionFactSK'))
+            action = f'DO UPDATE SET {updates}'
+        sql = f"INSERT INTO {table.name} ({columns}) VALUES ({values}) ON CONFLICT({key}) {action}"
+        result = conn.execute(text(sql), [dict(zip(keys, row)) for row in data_iter])
+        return result.rowcount
+    return insert
+
+
+def trade_sks(conn, table, trade_ids):
+    """TransactionFactSK for each TradeID (0 where absent), aligned with trade_ids"""
+    trade_ids = pd.Series(np.asarray(trade_ids, dtype=np.int64), name='TradeID')
+    trade_ids.to_frame().to_sql('_batch_trade_ids', conn, if_exists='replace', index=False)
+    found = pd.read_sql(text(
+        f"SELECT b.TradeID, f.TransactionFactSK FROM _batch_trade_ids b "
+        f"JOIN {table} f ON f.TradeID = b.TradeID"), conn)
+    conn.execute(text("DROP TABLE _batch_trade_ids"))
+    lookup = found.set_index('TradeID')['TransactionFactSK']
+    return trade_ids.map(lookup).fillna(0).to_numpy(dtype=np.int64)
+
+
+def clear_analysis(conn, fact_sks):
+    """Remove TransactionAnalysis rows for trades about to be re-scored; returns how many trades had one"""
+    sks = [int(sk) for sk in fact_sks if sk > 0]
+    cleared = 0
+    for start in range(0, len(sks), 500):
+        chunk = ','.join(map(str, sks[start:start + 500]))
+        cleared += conn.execute(text(f"DELETE FROM TransactionAnalysis WHERE TransactionFactSK IN ({chunk})")).rowcount
+    return cleared
+
+
+def _fact_tables(conn):
+    """Physical tables holding fact rows (the table itself, or its partitions and template)"""
+    return [row[0] for row in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND "
+        "(name = 'FactTransactions' OR name LIKE 'FactTransactions\\_%' ESCAPE '\\')"))]
+
+
+def duplicate_report(conn):
+    return pd.read_sql(text("""
+        SELECT COUNT(*) AS DuplicatedTradeIDs, COALESCE(SUM(n - 1), 0) AS ExtraRows
+        FROM (SELECT COUNT(*) AS n FROM FactTransactions GROUP BY TradeID HAVING COUNT(*) > 1)"""), conn).iloc[0]
+
+
+def duplicate_days(conn):
+    """DimTime dates of the rows migrate() would delete, the days whose summaries change"""
+    return [row[0] for row in conn.execute(text("""
+        SELECT DISTINCT dt.Date FROM FactTransactions ft
+        JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+        WHERE ft.TransactionFactSK NOT IN (SELECT MIN(TransactionFactSK) FROM FactTransactions GROUP BY TradeID)
+        ORDER BY dt.Date"""))]
+
+
+def migrate(conn):
+    """Delete duplicate trades (keeping the first SK) and make the TradeID index unique; returns rows removed"""
+    conn.execute(text("DROP TABLE IF EXISTS _duplicate_sks"))
+    conn.execute(text("""
+        CREATE TEMP TABLE _duplicate_sks AS
+        SELECT TransactionFactSK FROM FactTransactions
+        WHERE TransactionFactSK NOT IN (SELECT MIN(TransactionFactSK) FROM FactTransactions GROUP BY TradeID)"""))
+    partitioned = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FactPartitions'")).fetchone() is not None
+    removed = 0
+    for table in _fact_tables(conn):
+        deleted = conn.execute(text(
+            f"DELETE FROM {table} WHERE TransactionFactSK IN (SELECT TransactionFactSK FROM _duplicate_sks)")).rowcount
+        if deleted and partitioned:
+            conn.execute(text("UPDATE FactPartitions SET RowCount = RowCount - :n WHERE PartitionName = :t"),
+                         {'n': deleted, 't': table})
+        removed += deleted
+        for name, sql in conn.execute(text(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"),
+                {'t': table}).fetchall():
+            if name.startswith(TRADE_ID_INDEX) and 'UNIQUE' not in sql.upper():
+                conn.execute(text(f"DROP INDEX {name}"))
+                conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table}(TradeID)"))
+    conn.execute(text(
+        "DELETE FROM TransactionAnalysis WHERE TransactionFactSK IN (SELECT TransactionFactSK FROM _duplicate_sks)"))
+    conn.execute(text("DROP TABLE _duplicate_sks"))
+    if removed:
+        fact_cache.record_fact_write(conn)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and enforce TradeID uniqueness")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('command', choices=['check', 'migrate'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    with engine.begin() as conn:
+        report = duplicate_report(conn)
+        print(f"🔁 {int(report['DuplicatedTradeIDs']):,} duplicated TradeIDs "
+              f"({int(report['ExtraRows']):,} extra rows)")
+        if args.command == 'migrate':
+            days = duplicate_days(conn)
+            removed = migrate(conn)
+            if removed:
+                # Imported here: the ETL (and, through fact_partitions, the cube and sketches) import this module
+                import quantile_sketches
+                import risk_cube
+                import schema_matched_etl
+                import wallet_leaders
+                import wallet_sketches
+                # Only the days that lost rows change; other days, archived ones included, are kept
+                schema_matched_etl.refresh_daily_summary(conn, days)
+                risk_cube.refresh(conn, days)
+                wallet_sketches.refresh(conn, days)
+                quantile_sketches.refresh(conn, days)
+                wallet_leaders.refresh(conn, days)
+                schema_matched_etl.refresh_planner_stats(conn)
+            print(f"✅ Removed {removed:,} duplicate rows over {len(days):,} day(s); TradeID index is unique")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
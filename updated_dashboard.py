@@ -5,6 +5,7 @@ Updated to work with your exact schema
 Run with: streamlit run updated_dashboard.py
 """
 
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -13,6 +14,16 @@ from plotly.subplots import make_subplots
 from sqlalchemy import create_engine
 from datetime import datetime
 
+import retention_archiver
+import fact_cache
+import warehouse_codes
+import fixed_point
+import warehouse_swap
+import risk_cube
+import wallet_sketches
+import quantile_sketches
+import wallet_leaders
+
 # Page configuration
 st.set_page_config(
     page_title="Bitcoin Decision Support System",
@@ -21,21 +32,92 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Database connection
-@st.cache_resource
+# Database connection (BITCOIN_DW_PATH points the dashboard at another warehouse)
+DW_PATH = os.environ.get('BITCOIN_DW_PATH', 'data/bitcoin_unified_dw.db')
+
+FACT_CACHE_DIR = fact_cache.cache_dir_for(DW_PATH)
+
+RISK_COLORS = {
+    'LOW': '#28a745',
+    'MEDIUM': '#ffc107',
+    'HIGH': '#fd7e14',
+    'CRITICAL': '#dc3545'
+}
+
+@st.cache_resource(max_entries=1)
+def _open_engine(version):
+    """One engine per published warehouse build; a swapped-in build gets fresh connections"""
+    return create_engine(f'sqlite:///{DW_PATH}')
+
 def get_database_connection():
     """Get database connection with caching"""
-    return create_engine('sqlite:///data/bitcoin_unified_dw.db')
+    return _open_engine(warehouse_swap.current_version(DW_PATH))
+
+@st.cache_resource
+def _seen_warehouse():
+    return {}
+
+def check_warehouse_version():
+    """Drop cached query results once a rebuild has been swapped in"""
+    version = warehouse_swap.current_version(DW_PATH)
+    seen = _seen_warehouse()
+    if seen.get('version', version) != version:
+        st.cache_data.clear()
+    seen['version'] = version
+
+@st.cache_resource(max_entries=1)
+def get_fact_cache(version):
+    """Memory-mapped fact columns, opened once per process and shared by all sessions"""
+    return fact_cache.open_cache(FACT_CACHE_DIR)
+
+def fact_cache_state():
+    """(current fact cache version, warehouse fact writes); the version is None when
+    no build matches the warehouse's facts, e.g. after a stream batch or archival"""
+    try:
+        with get_database_connection().connect() as conn:
+            return fact_cache.current_version(FACT_CACHE_DIR, conn), fact_cache.fact_writes(conn)
+    except Exception:
+        return None, None
+
+def load_fact_cache():
+    """Current fact cache build, or None to fall back to SQL"""
+    version, _ = fact_cache_state()
+    return get_fact_cache(version) if version else None
 
-@st.cache_data
 def load_summary_stats():
     """Get summary statistics for KPI cards"""
+    return _load_summary_stats(*fact_cache_state())
+
+@st.cache_data
+def _load_summary_stats(cache_version, fact_writes):
+    """Summary statistics from the fact cache when it is current, otherwise from SQL
+
+    fact_writes only keys the result, so new fact writes are not served from an old entry.
+    """
     try:
         engine = get_database_connection()
 
         with engine.connect() as conn:
             # Basic stats
             stats = {}
+            
+            # Unique wallets merged from the daily sketches, without a distinct scan
+            try:
+                stats['total_wallets'] = wallet_sketches.distinct_wallets(conn)
+            except Exception:
+                stats['total_wallets'] = None
+
+            # Fact aggregates straight off the memory-mapped columns
+            cache = get_fact_cache(cache_version) if cache_version else None
+            if cache is not None:
+                stats.update(cache.summary_stats())
+                try:
+                    stats['high_risk_wallets'] = pd.read_sql(
+                        "SELECT COUNT(*) as count FROM DimWallet WHERE IsReportedAbuse = 1", conn
+                    ).iloc[0]['count']
+                except Exception:
+                    stats['high_risk_wallets'] = cache.distinct_wallets()
+                return stats
 
             # Total transactions
             try:
@@ -48,7 +130,7 @@ def load_summary_stats():
             # Total volume
             try:
                 stats['total_volume'] = pd.read_sql(
-                    "SELECT SUM(VolumeQuote) as volume FROM FactTransactions WHERE VolumeQuote IS NOT NULL", conn
+                    "SELECT SUM(VolumeQuoteCents) / 100.0 as volume FROM FactTransactions WHERE VolumeQuoteCents IS NOT NULL", conn
                 ).iloc[0]['volume'] or 0
             except Exception:
                 stats['total_volume'] = 0
@@ -62,7 +144,8 @@ def load_summary_stats():
                 try:
                     # Alternative: check if column exists in FactTransactions
                     stats['suspicious_transactions'] = pd.read_sql(
-                        "SELECT COUNT(*) as count FROM FactTransactions WHERE Side = 'SUSPICIOUS'", conn
+                        "SELECT COUNT(*) as count FROM FactTransactions ft JOIN DimSide ds ON ft.SideCode = ds.SideCode "
+                        "WHERE ds.Side = 'SUSPICIOUS'", conn
                     ).iloc[0]['count']
                 except Exception:
                     stats['suspicious_transactions'] = 0
@@ -73,18 +156,14 @@ def load_summary_stats():
                     "SELECT COUNT(*) as count FROM DimWallet WHERE IsReportedAbuse = 1", conn
                 ).iloc[0]['count']
             except Exception:
-                try:
-                    # Alternative: check for any risk indicators
-                    stats['high_risk_wallets'] = pd.read_sql(
-                        "SELECT COUNT(DISTINCT WalletKey) as count FROM FactTransactions", conn
-                    ).iloc[0]['count']
-                except Exception:
-                    stats['high_risk_wallets'] = 0
+                # Alternative: wallets seen trading
+                stats['high_risk_wallets'] = stats['total_wallets'] or 0
 
             # Price range
             try:
                 price_stats = pd.read_sql(
-                    "SELECT MIN(Price) as min_price, MAX(Price) as max_price, AVG(Price) as avg_price FROM FactTransactions WHERE Price IS NOT NULL", conn
+                    "SELECT MIN(PriceCents) / 100.0 as min_price, MAX(PriceCents) / 100.0 as max_price, "
+                    "AVG(PriceCents) / 100.0 as avg_price FROM FactTransactions WHERE PriceCents IS NOT NULL", conn
                 ).iloc[0]
                 stats.update(price_stats.to_dict())
             except Exception:
@@ -106,43 +185,76 @@ def load_daily_summary():
             return pd.read_sql("SELECT * FROM vw_DailySummary ORDER BY SummaryDate DESC", engine)
         except Exception:
             # Fallback to DailySummary table
-            return pd.read_sql("SELECT * FROM DailySummary ORDER BY SummaryDate DESC", engine)
+            return fixed_point.decode_amounts(pd.read_sql("SELECT * FROM DailySummary ORDER BY SummaryDate DESC", engine))
     except Exception as e:
         st.warning(f"No daily summary data available: {e}")
         return pd.DataFrame()
 
+def with_categories(df):
+    """Decode lookup codes and fixed-point amounts; low-cardinality names become Categoricals"""
+    try:
+        with get_database_connection().connect() as conn:
+            return warehouse_codes.categorize(conn, warehouse_codes.decode(conn, fixed_point.decode_amounts(df)))
+    except Exception:
+        # Warehouse built before the lookup dimensions existed
+        return df
+
 @st.cache_data
-def load_transaction_analysis():
-    """Load transaction analysis data"""
+def load_transaction_analysis(start_date=None, end_date=None):
+    """Load transaction analysis data, optionally limited to a date range"""
     try:
         engine = get_database_connection()
         # Try the view first, then fallback to table or FactTransactions
         try:
-            return pd.read_sql("SELECT * FROM vw_TransactionAnalysis LIMIT 1000", engine)
+            if start_date and end_date:
+                # Only the fact partitions overlapping the range are read; archived days come from the archive
+                with engine.connect() as conn:
+                    return with_categories(
+                        retention_archiver.read_transaction_analysis(conn, start_date, end_date, limit=1000))
+            return with_categories(pd.read_sql("SELECT * FROM vw_TransactionAnalysis LIMIT 1000", engine))
         except Exception:
             try:
-                return pd.read_sql("SELECT * FROM TransactionAnalysis LIMIT 1000", engine)
+                return with_categories(pd.read_sql("SELECT * FROM TransactionAnalysis LIMIT 1000", engine))
             except Exception:
                 # Fallback to FactTransactions with basic columns
-                return pd.read_sql("SELECT TradeID, Side, Price, VolumeQuote, SizeBase FROM FactTransactions LIMIT 1000", engine)
+                return with_categories(pd.read_sql(
+                    "SELECT TradeID, SideCode, PriceCents, VolumeQuoteCents, SizeBaseSat FROM FactTransactions LIMIT 1000", engine))
     except Exception as e:
         st.warning(f"No transaction analysis data available: {e}")
         return pd.DataFrame()
 
 @st.cache_data
-def load_wallet_risk():
-    """Load wallet risk data"""
+def load_wallet_counts():
+    """Wallet counts by entity type, abuse reporting and exposure distance, over every wallet"""
     try:
         engine = get_database_connection()
-        # Try the view first, then fallback to basic wallet data
+        entity = with_categories(pd.read_sql(
+            "SELECT EntityTypeCode, COUNT(*) AS Wallets FROM DimWallet GROUP BY EntityTypeCode", engine))
+        abuse = pd.read_sql("SELECT IsReportedAbuse, COUNT(*) AS Wallets FROM DimWallet GROUP BY IsReportedAbuse", engine)
         try:
-            return pd.read_sql("SELECT * FROM vw_WalletRisk WHERE RecentTransactions > 0 LIMIT 500", engine)
+            hops = pd.read_sql("SELECT Hops, COUNT(*) AS Wallets FROM WalletExposure GROUP BY Hops ORDER BY Hops", engine)
         except Exception:
-            # Fallback to DimWallet
-            return pd.read_sql("SELECT * FROM DimWallet LIMIT 500", engine)
+            # Warehouse built before taint propagation
+            hops = pd.DataFrame()
+        return {'entity': entity, 'abuse': abuse, 'hops': hops}
     except Exception as e:
         st.warning(f"No wallet risk data available: {e}")
-        return pd.DataFrame()
+        return {}
+
+@st.cache_data
+def load_distinct_wallets(start_date=None, end_date=None):
+    """Estimated unique wallets trading in a date range, or None without wallet sketches"""
+    try:
+        with get_database_connection().connect() as conn:
+            return wallet_sketches.distinct_wallets(conn, start_date, end_date)
+    except Exception:
+        return None
+
+def format_wallets(wallets):
+    """A sketch estimate with its standard error"""
+    if wallets is None:
+        return "n/a"
+    return f"~{wallets:,} (±{wallet_sketches.RELATIVE_ERROR:.1%})"
 
 def create_kpi_cards():
     """Create KPI cards for the dashboard"""
@@ -267,42 +379,100 @@ def create_daily_volume_chart():
     
     st.plotly_chart(fig, use_container_width=True)
 
-def create_risk_analysis():
+def select_date_range():
+    """Sidebar date range filter bounded by the loaded days"""
+    daily_data = load_daily_summary()
+    if daily_data.empty or 'SummaryDate' not in daily_data.columns:
+        return None, None
+    
+    dates = pd.to_datetime(daily_data['SummaryDate']).dt.date
+    selected = st.sidebar.date_input(
+        "📅 Date range:",
+        value=(dates.min(), dates.max()),
+        min_value=dates.min(),
+        max_value=dates.max()
+    )
+    if isinstance(selected, (list, tuple)) and len(selected) == 2:
+        return selected[0], selected[1]
+    return None, None
+
+@st.cache_resource(max_entries=1)
+def get_risk_cube(warehouse_version, cube_version):
+    """The risk cube, loaded once per refresh and shared by all sessions"""
+    with get_database_connection().connect() as conn:
+        return risk_cube.load_cube(conn)
+
+def load_risk_cube():
+    """Current risk cube, or None for a warehouse built before it existed"""
+    try:
+        with get_database_connection().connect() as conn:
+            version = risk_cube.cube_version(conn)
+    except Exception:
+        return None
+    return get_risk_cube(warehouse_swap.current_version(DW_PATH), version) if version else None
+
+def load_cached_risk_counts(start_date=None, end_date=None):
+    """Full-population risk aggregates from the fact cache, or None to chart the loaded sample"""
+    cache = load_fact_cache()
+    if cache is None:
+        return None
+    # The cache only covers the hot warehouse; archived days need the sample path
+    if start_date is not None and end_date is not None:
+        with get_database_connection().connect() as conn:
+            if retention_archiver.archived_days(conn, start_date, end_date):
+                return None
+    risk_dist = cache.risk_level_counts(start_date, end_date)
+    return risk_dist[risk_dist > 0], cache.side_suspicious_counts(start_date, end_date)
+
+def load_sampled_risk_counts(start_date=None, end_date=None):
+    """Risk aggregates of the loaded transaction sample; either part is None when its columns are missing"""
+    trans_data = load_transaction_analysis(start_date, end_date)
+    if trans_data.empty:
+        return None
+    risk_dist = suspicious_by_side = None
+    if 'RiskLevel' in trans_data.columns:
+        risk_dist = trans_data['RiskLevel'].value_counts()
+        risk_dist = risk_dist[risk_dist > 0]
+    if 'Side' in trans_data.columns and 'IsSuspicious' in trans_data.columns:
+        suspicious_by_side = trans_data.groupby(['Side', 'IsSuspicious'], observed=True).size().reset_index(name='Count')
+    return risk_dist, suspicious_by_side
+
+def create_risk_analysis(start_date=None, end_date=None):
     """Create risk analysis visualizations"""
     st.subheader("⚠️ Risk Analysis Dashboard")
     
-    trans_data = load_transaction_analysis()
-    wallet_data = load_wallet_risk()
-    
-    if trans_data.empty:
-        st.warning("No transaction analysis data available")
-        return
+    # The risk cube covers every trade, archived days included; older warehouses fall back
+    cube = load_risk_cube()
+    if cube is not None:
+        cube = cube.slice(start_date, end_date)
+        risk_dist = cube.rollup('RiskLevel', measures=['Trades']).dropna().set_index('RiskLevel')['Trades']
+        risk_dist = risk_dist[risk_dist > 0]
+        suspicious_by_side = cube.rollup('Side', 'IsSuspicious', measures=['Trades']).dropna()
+        suspicious_by_side = suspicious_by_side.rename(columns={'Trades': 'Count'})
+    else:
+        counts = load_cached_risk_counts(start_date, end_date) or load_sampled_risk_counts(start_date, end_date)
+        if counts is None:
+            st.warning("No transaction analysis data available")
+            return
+        risk_dist, suspicious_by_side = counts
     
     col1, col2 = st.columns(2)
     
     with col1:
         # Risk level distribution
-        if 'RiskLevel' in trans_data.columns:
-            risk_dist = trans_data['RiskLevel'].value_counts()
-            
+        if risk_dist is not None:
             fig = px.pie(
                 values=risk_dist.values,
                 names=risk_dist.index,
                 title='Transaction Risk Level Distribution',
-                color_discrete_map={
-                    'LOW': '#28a745',
-                    'MEDIUM': '#ffc107', 
-                    'HIGH': '#fd7e14',
-                    'CRITICAL': '#dc3545'
-                }
+                color=risk_dist.index,
+                color_discrete_map=RISK_COLORS
             )
             st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         # Suspicious transactions by side
-        if 'Side' in trans_data.columns and 'IsSuspicious' in trans_data.columns:
-            suspicious_by_side = trans_data.groupby(['Side', 'IsSuspicious']).size().reset_index(name='Count')
-            
+        if suspicious_by_side is not None:
             fig = px.bar(
                 suspicious_by_side,
                 x='Side',
@@ -314,20 +484,58 @@ def create_risk_analysis():
             )
             st.plotly_chart(fig, use_container_width=True)
     
+    if cube is not None:
+        col5, col6 = st.columns(2)
+        
+        with col5:
+            # When suspicious trades happen
+            heat = cube.slice(IsSuspicious=1).rollup('DayOfWeek', 'Hour', measures=['Trades']).pivot_table(
+                index='DayOfWeek', columns='Hour', values='Trades', aggfunc='sum', observed=False, fill_value=0)
+            heat = heat.reindex(columns=range(24), fill_value=0)
+            fig = px.imshow(
+                heat,
+                title='Suspicious Trades by Weekday and Hour',
+                labels={'x': 'Hour', 'y': 'Day of Week', 'color': 'Suspicious Trades'},
+                color_continuous_scale='Reds',
+                aspect='auto'
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        
+        with col6:
+            # Where the volume at each risk level comes from
+            volume = cube.rollup('EntityType', 'RiskLevel', measures=['VolumeQuote']).dropna(subset=['RiskLevel'])
+            volume['EntityType'] = volume['EntityType'].cat.add_categories('unknown').fillna('unknown')
+            fig = px.bar(
+                volume,
+                x='EntityType',
+                y='VolumeQuote',
+                color='RiskLevel',
+                title='Trade Volume by Wallet Entity Type and Risk Level',
+                color_discrete_map=RISK_COLORS,
+                labels={'EntityType': 'Entity Type', 'VolumeQuote': 'Volume (USD)'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+    
     # Wallet risk analysis
-    if not wallet_data.empty:
+    wallet_counts = load_wallet_counts()
+    if wallet_counts:
         st.subheader("🏦 Wallet Risk Analysis")
         
+        active_wallets = load_distinct_wallets(start_date, end_date)
+        if active_wallets is not None:
+            st.metric(label="👛 Wallets Trading in Range", value=format_wallets(active_wallets))
+        
         col3, col4 = st.columns(2)
         
         with col3:
             # Entity type distribution
-            if 'EntityType' in wallet_data.columns:
-                entity_dist = wallet_data['EntityType'].value_counts().head(10)
+            entity_dist = wallet_counts['entity']
+            if 'EntityType' in entity_dist.columns:
+                entity_dist = entity_dist.dropna(subset=['EntityType']).nlargest(10, 'Wallets')
                 
                 fig = px.bar(
-                    x=entity_dist.index,
-                    y=entity_dist.values,
+                    x=entity_dist['EntityType'].astype(str),
+                    y=entity_dist['Wallets'],
                     title='Top 10 Wallet Entity Types',
                     labels={'x': 'Entity Type', 'y': 'Count'}
                 )
@@ -336,25 +544,94 @@ def create_risk_analysis():
         
         with col4:
             # Abuse reporting
-            if 'IsReportedAbuse' in wallet_data.columns:
-                abuse_stats = wallet_data['IsReportedAbuse'].value_counts()
-                
-                fig = px.pie(
-                    values=abuse_stats.values,
-                    names=['Clean', 'Reported Abuse'] if 0 in abuse_stats.index else ['Reported Abuse'],
-                    title='Wallet Abuse Reporting Status',
-                    color_discrete_map={
-                        'Clean': '#28a745',
-                        'Reported Abuse': '#dc3545'
-                    }
-                )
-                st.plotly_chart(fig, use_container_width=True)
+            abuse_stats = wallet_counts['abuse']
+            fig = px.pie(
+                values=abuse_stats['Wallets'],
+                names=abuse_stats['IsReportedAbuse'].map({0: 'Clean', 1: 'Reported Abuse'}),
+                title='Wallet Abuse Reporting Status',
+                color=abuse_stats['IsReportedAbuse'].map({0: 'Clean', 1: 'Reported Abuse'}),
+                color_discrete_map={
+                    'Clean': '#28a745',
+                    'Reported Abuse': '#dc3545'
+                }
+            )
+            st.plotly_chart(fig, use_container_width=True)
+        
+        # Exposure propagated from reported wallets (WalletExposure)
+        hops = wallet_counts['hops']
+        if not hops.empty:
+            fig = px.bar(
+                x=[('Reported' if h == 0 else f'{h} hop' + ('s' if h > 1 else '')) for h in hops['Hops'].astype(int)],
+                y=hops['Wallets'],
+                title='Wallets by Distance to a Reported Wallet',
+                labels={'x': 'Distance', 'y': 'Wallets'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+@st.cache_data
+def load_quantile_sketches(start_date=None, end_date=None):
+    """Amount sketches merged over a date range, keyed by (measure, risk level); None without sketches"""
+    try:
+        with get_database_connection().connect() as conn:
+            if not quantile_sketches.has_sketches(conn):
+                return None
+            return quantile_sketches.merged_sketches(conn, start_date, end_date, by_risk=True)
+    except Exception:
+        return None
+
+def create_sketched_price_analysis(sketches):
+    """Distributions and percentiles over every trade in the range, read from the quantile sketches"""
+    table = quantile_sketches.percentile_table(sketches)
+    price = quantile_sketches.QuantileSketch()
+    for (measure, _), sketch in sketches.items():
+        if measure == 'Price':
+            price.merge(sketch)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Price distribution
+        hist = quantile_sketches.histogram(price, 'Price')
+        fig = px.bar(
+            x=(hist['Lower'] + hist['Upper']) / 2,
+            y=hist['Trades'],
+            title='BTC Price Distribution',
+            labels={'x': 'BTC Price (USD)', 'y': 'Frequency'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        # Trade size percentiles per risk level
+        volume = table[(table['Measure'] == 'VolumeQuote') & (table['RiskLevel'] != 'ALL')]
+        volume = volume.melt(id_vars='RiskLevel', value_vars=['p50', 'p95', 'p99'],
+                             var_name='Percentile', value_name='VolumeQuote')
+        fig = px.bar(
+            volume,
+            x='Percentile',
+            y='VolumeQuote',
+            color='RiskLevel',
+            barmode='group',
+            log_y=True,
+            title='Trade Volume Percentiles by Risk Level',
+            color_discrete_map=RISK_COLORS,
+            labels={'VolumeQuote': 'Volume (USD)'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    st.caption(f"Percentiles over all {price.count:,} trades in the range, "
+               f"each within ±{quantile_sketches.RELATIVE_ACCURACY:.0%} of the exact value")
 
-def create_price_analysis():
+def create_price_analysis(start_date=None, end_date=None):
     """Create price analysis charts"""
     st.subheader("💰 Price Analysis")
     
-    trans_data = load_transaction_analysis()
+    sketches = load_quantile_sketches(start_date, end_date)
+    if sketches:
+        create_sketched_price_analysis(sketches)
+        return
+    
+    trans_data = load_transaction_analysis(start_date, end_date)
     
     if trans_data.empty or 'Price' not in trans_data.columns:
         st.warning("No price data available")
@@ -390,6 +667,78 @@ def create_price_analysis():
             )
             st.plotly_chart(fig, use_container_width=True)
 
+def load_live_leaderboards(n=10):
+    """Top wallets of the latest day window, read uncached so streamed batches show up; None without leaderboards"""
+    try:
+        with get_database_connection().connect() as conn:
+            if not wallet_leaders.has_leaders(conn):
+                return None
+            window = wallet_leaders.latest_window(conn)
+            return window, {metric: wallet_leaders.leaderboard(conn, metric, window, window, n)
+                            for metric in wallet_leaders.METRICS}
+    except Exception:
+        return None
+
+@st.cache_data
+def load_leaderboards(start_date=None, end_date=None, n=10):
+    """Top wallets over a date range, merged from the day windows; None without leaderboards"""
+    try:
+        with get_database_connection().connect() as conn:
+            if not wallet_leaders.has_leaders(conn):
+                return None
+            return {metric: wallet_leaders.leaderboard(conn, metric, start_date, end_date, n)
+                    for metric in wallet_leaders.METRICS}
+    except Exception:
+        return None
+
+def show_leaderboard(board, metric):
+    """One leaderboard as a bar chart of estimates and a table with their error bounds"""
+    if board.empty:
+        st.info("No trades in this window")
+        return
+    label = 'Volume (USD)' if metric == 'volume' else 'Trades'
+    board = board.assign(Wallet=board['WalletAddress'].fillna(board['WalletKey'].astype(str)).str[:12])
+    fig = px.bar(
+        board,
+        x='Estimate',
+        y='Wallet',
+        color='EntityType',
+        orientation='h',
+        error_x=board['Error'].where(board['Error'] > 0),
+        labels={'Estimate': label, 'Wallet': 'Wallet'}
+    )
+    fig.update_yaxes(categoryorder='total ascending')
+    st.plotly_chart(fig, use_container_width=True)
+    table = board[['Rank', 'WalletAddress', 'EntityType', 'Estimate', 'Guaranteed']].assign(
+        **{'Share %': (board['Share'] * 100).round(2)})
+    st.dataframe(table, use_container_width=True, hide_index=True)
+
+def create_wallet_leaderboards(start_date=None, end_date=None):
+    """Live and historical top-wallet leaderboards from the Space-Saving windows"""
+    st.subheader("🏆 Top Wallets")
+    
+    live = load_live_leaderboards()
+    boards = load_leaderboards(start_date, end_date)
+    if live is None or boards is None:
+        st.info("No wallet leaderboards; run: python wallet_leaders.py build")
+        return
+    window, live_boards = live
+    
+    col1, col2 = st.columns(2)
+    
+    for col, title, shown in ((col1, f"Live: {window}", live_boards),
+                              (col2, f"{start_date or 'All'} to {end_date or 'latest'}", boards)):
+        with col:
+            st.markdown(f"**{title}**")
+            volume_tab, trades_tab = st.tabs(["By Volume", "By Trades"])
+            with volume_tab:
+                show_leaderboard(shown['volume'], 'volume')
+            with trades_tab:
+                show_leaderboard(shown['trades'], 'trades')
+    
+    st.caption(f"Each day keeps {wallet_leaders.CAPACITY} counters per metric. Estimates never understate a "
+               f"wallet's total; Guaranteed is the least it can be")
+
 def create_data_explorer():
     """Create data explorer section"""
     st.subheader("🔍 Data Explorer")
@@ -442,6 +791,7 @@ def main():
     st.sidebar.title("🧭 Navigation")
     
     # Check database connection
+    check_warehouse_version()
     try:
         stats = load_summary_stats()
         if not stats or stats.get('total_transactions', 0) == 0:
@@ -462,6 +812,7 @@ def main():
     ]
     
     selected_page = st.sidebar.selectbox("Select Dashboard:", page_options)
+    start_date, end_date = select_date_range()
     
     # Display selected page
     if selected_page == "📊 Overview":
@@ -486,13 +837,14 @@ def main():
         
     elif selected_page == "📈 Trading Analysis":
         create_daily_volume_chart()
-        create_price_analysis()
+        create_price_analysis(start_date, end_date)
+        create_wallet_leaderboards(start_date, end_date)
         
     elif selected_page == "⚠️ Risk Management":
-        create_risk_analysis()
+        create_risk_analysis(start_date, end_date)
         
     elif selected_page == "💰 Price Analysis":
-        create_price_analysis()
+        create_price_analysis(start_date, end_date)
         
     elif selected_page == "🔍 Data Explorer":
         create_data_explorer()
@@ -505,7 +857,7 @@ def main():
     st.sidebar.info(f"""
     **Database**: bitcoin_unified_dw.db  
     **Transactions**: {stats.get('total_transactions', 0):,}  
-    **Wallets**: {stats.get('total_wallets', 8506):,}  
+    **Wallets**: {format_wallets(stats.get('total_wallets'))}  
     **Last Updated**: {datetime.now().strftime('%Y-%m-%d %H:%M')}
     """)
     
@@ -68,16 +68,14 @@ def check_database():
         cursor = conn.cursor()
         
         # Check tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
         tables = [row[0] for row in cursor.fetchall()]
         
         expected_tables = ['FactTransactions', 'DimTime', 'DimMarket', 'DimWallet']
         
         for table in expected_tables:
             if table in tables:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                print(f"✅ {table}: {count:,} records")
+                print(f"✅ {table}: Available")
             else:
                 print(f"❌ {table}: Missing")
                 return False
@@ -95,7 +93,14 @@ def check_database():
                 print(f"⚠️ {view}: Missing (optional)")
         
         conn.close()
-        return True
+        
+        # Row counts and data checks come from the load statistics, not full scans
+        import warehouse_validation
+        from sqlalchemy import create_engine
+        with create_engine(f'sqlite:///{db_path}').connect() as engine_conn:
+            report = warehouse_validation.validate(engine_conn)
+        warehouse_validation.print_report(report)
+        return report['status'] == 'pass'
         
     except Exception as e:
         print(f"❌ Database error: {e}")
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Sliding-window velocity detection per wallet
+Each wallet keeps a ring buffer of time buckets (trade count and quote volume)
+covering the last window_seconds. A trade advances its wallet's ring, adds itself
+and is flagged as a burst when the window holds at least min_trades trades or
+min_volume_cents of volume. Advancing clears at most one ring's worth of buckets,
+so each trade costs amortized O(1) and no self-join over FactTransactions is needed.
+
+Each observe_batch ends by dropping wallets whose whole window is older than the
+batch's latest trade, so a long-running stream only holds wallets that are still
+active. max_wallets is the hard bound on top of that: the least recently seen wallet
+is evicted when a new one arrives, which only loses state if that wallet was still
+inside its window.
+The window is bucketed, so it spans between window_seconds - bucket and window_seconds.
+
+Usage:
+    python velocity_detector.py --trades 1000000 --wallets 50000
+"""
+
+import argparse
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_BUCKETS = 12
+DEFAULT_MAX_WALLETS = 100_000
+
+# Per-wallet state list layout
+_HEAD, _COUNT, _VOLUME, _COUNTS, _VOLUMES = range(5)
+
+
+class VelocityDetector:
+    """Streaming burst detector keyed by WalletKey"""
+
+    def __init__(self, window_seconds=60, min_trades=None, min_volume_cents=None,
+                 buckets=DEFAULT_BUCKETS, max_wallets=DEFAULT_MAX_WALLETS):
+        if min_trades is None and min_volume_cents is None:
+            raise ValueError("VelocityDetector needs min_trades and/or min_volume_cents")
+        self.window_ms = int(window_seconds * 1000)
+        self.buckets = int(buckets)
+        self.bucket_ms = max(1, self.window_ms // self.buckets)
+        self.min_trades = min_trades
+        self.min_volume = min_volume_cents
+        self.max_wallets = int(max_wallets)
+        self._wallets = OrderedDict()
+        self.observed = 0
+        self.flagged = 0
+        self.late = 0
+        self.evictions = 0
+        self.evicted_active = 0
+        self.idle_evictions = 0
+
+    def _advance(self, state, bucket):
+        """Move a wallet's ring forward to bucket, dropping buckets that left the window"""
+        steps = bucket - state[_HEAD]
+        counts, volumes = state[_COUNTS], state[_VOLUMES]
+        if steps >= self.buckets:
+            counts[:] = [0] * self.buckets
+            volumes[:] = [0] * self.buckets
+            state[_COUNT] = state[_VOLUME] = 0
+        else:
+            for b in range(state[_HEAD] + 1, bucket + 1):
+                i = b % self.buckets
+                state[_COUNT] -= counts[i]
+                state[_VOLUME] -= volumes[i]
+                counts[i] = volumes[i] = 0
+        state[_HEAD] = bucket
+
+    def _new_state(self, wallet, bucket):
+        if len(self._wallets) >= self.max_wallets:
+            _, evicted = self._wallets.popitem(last=False)
+            self.evictions += 1
+            if evicted[_COUNT] and evicted[_HEAD] > bucket - self.buckets:
+                self.evicted_active += 1
+        state = [bucket, 0, 0, [0] * self.buckets, [0] * self.buckets]
+        self._wallets[wallet] = state
+        return state
+
+    def observe(self, wallet, ts_ms, volume_cents=0):
+        """Record one trade; returns True when its wallet is bursting"""
+        self.observed += 1
+        bucket = ts_ms // self.bucket_ms
+        state = self._wallets.get(wallet)
+        if state is None:
+            state = self._new_state(wallet, bucket)
+        else:
+            self._wallets.move_to_end(wallet)
+
+        if bucket > state[_HEAD]:
+            self._advance(state, bucket)
+        elif bucket <= state[_HEAD] - self.buckets:
+            # Arrived after its whole window had passed
+            self.late += 1
+            return False
+
+        i = bucket % self.buckets
+        state[_COUNTS][i] += 1
+        state[_VOLUMES][i] += volume_cents
+        state[_COUNT] += 1
+        state[_VOLUME] += volume_cents
+
+        burst = ((self.min_trades is not None and state[_COUNT] >= self.min_trades) or
+                 (self.min_volume is not None and state[_VOLUME] >= self.min_volume))
+        self.flagged += burst
+        return burst
+
+    def observe_batch(self, wallets, timestamps_ms, volumes_cents=None):
+        """Record a batch (e.g. a backfill) in time order; returns a burst mask aligned with the input
+
+        Wallets that went idle before the batch's latest trade are dropped afterwards.
+        """
+        wallets = np.asarray(wallets, dtype=np.int64)
+        timestamps_ms = np.asarray(timestamps_ms, dtype=np.int64)
+        volumes_cents = (np.zeros(len(wallets), dtype=np.int64) if volumes_cents is None
+                         else np.asarray(volumes_cents, dtype=np.int64))
+
+        if len(timestamps_ms) > 1 and np.any(np.diff(timestamps_ms) < 0):
+            order = np.argsort(timestamps_ms, kind='stable')
+        else:
+            order = np.arange(len(timestamps_ms))
+
+        observe = self.observe
+        flags = [observe(w, t, v) for w, t, v in zip(wallets[order].tolist(), timestamps_ms[order].tolist(),
+                                                     volumes_cents[order].tolist())]
+        mask = np.zeros(len(wallets), dtype=bool)
+        mask[order] = flags
+        if len(timestamps_ms):
+            self.evict_idle(int(timestamps_ms.max()))
+        return mask
+
+    def evict_idle(self, now_ms):
+        """Drop wallets whose whole window is older than now_ms; returns how many were dropped"""
+        oldest_live = now_ms // self.bucket_ms - self.buckets
+        dropped = 0
+        # Least recently seen wallets are at the front of the OrderedDict
+        while self._wallets:
+            wallet, state = next(iter(self._wallets.items()))
+            if state[_HEAD] > oldest_live:
+                break
+            del self._wallets[wallet]
+            dropped += 1
+        self.idle_evictions += dropped
+        return dropped
+
+    def stats(self):
+        return {
+            'wallets_tracked': len(self._wallets),
+            'observed': self.observed,
+            'flagged': self.flagged,
+            'late': self.late,
+            'evictions': self.evictions,
+            'evicted_active': self.evicted_active,
+            'idle_evictions': self.idle_evictions,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-wallet velocity detector on a synthetic stream")
+    parser.add_argument('--trades', type=int, default=1_000_000)
+    parser.add_argument('--wallets', type=int, default=50_000)
+    parser.add_argument('--window-seconds', type=float, default=60)
+    parser.add_argument('--min-trades', type=int, default=3)
+    parser.add_argument('--max-wallets', type=int, default=DEFAULT_MAX_WALLETS)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    # One day of trades with a skewed wallet distribution so some wallets burst
+    wallets = (rng.zipf(1.3, args.trades) % args.wallets).astype(np.int64)
+    timestamps = np.sort(rng.integers(0, 86_400_000, args.trades))
+    volumes = rng.integers(100, 5_000_000, args.trades)
+
+    detector = VelocityDetector(args.window_seconds, min_trades=args.min_trades, max_wallets=args.max_wallets)
+    print(f"⏱️ {args.trades:,} trades over {args.wallets:,} wallets, window {args.window_seconds:g}s, "
+          f"burst at {args.min_trades}+ trades")
+    start = time.perf_counter()
+    for i in range(0, args.trades, args.batch_size):
+        end = i + args.batch_size
+        detector.observe_batch(wallets[i:end], timestamps[i:end], volumes[i:end])
+    elapsed = time.perf_counter() - start
+
+    stats = detector.stats()
+    print(f"✅ {args.trades / elapsed:,.0f} trades/sec ({elapsed:.2f}s)")
+    for key, value in stats.items():
+        print(f"   {key}: {value:,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
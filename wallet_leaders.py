@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Streaming top-K wallet leaderboards
+WalletLeaders keeps a Space-Saving summary of at most CAPACITY wallets per day
+window, for two metrics: quote volume ('volume', in cents) and trade count
+('trades'). Each counter has an Estimate, which is never below the wallet's true
+total, and an Error, the most it can overstate it. Any wallet holding more than
+1/CAPACITY of a window's total is guaranteed to have a counter. Summaries merge,
+so a week or month leaderboard is the merge of its days. Reading one is a few
+hundred rows whatever the number of trades.
+
+Stream ingestion merges each batch into the windows it touched. Update-mode
+replays rebuild those days instead, because a summary cannot take a trade back.
+The batch ETL and dedup migration rebuild every window from the facts. As with
+DailySummary, windows of archived or dropped days are kept as history.
+
+Usage:
+    python wallet_leaders.py build
+    python wallet_leaders.py show --metric volume --start 2024-01-01 --end 2024-01-31 --top 10
+"""
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_partitions
+import fixed_point
+import warehouse_codes
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+CAPACITY = 100
+METRICS = ('volume', 'trades')
+
+# Full rebuilds read fact rows in chunks of this many trades
+READ_CHUNK = 1_000_000
+
+LEADER_SQL = [
+    """CREATE TABLE IF NOT EXISTS WalletLeaders (
+        WindowStart DATE NOT NULL,
+        Metric VARCHAR(10) NOT NULL,
+        WalletKey INTEGER NOT NULL,
+        Estimate BIGINT NOT NULL,
+        Error BIGINT NOT NULL,
+        PRIMARY KEY (WindowStart, Metric, WalletKey)
+    )""",
+    # Per window and metric: the total summarised and the capacity it was kept at
+    """CREATE TABLE IF NOT EXISTS WalletLeaderWindows (
+        WindowStart DATE NOT NULL,
+        Metric VARCHAR(10) NOT NULL,
+        Total BIGINT NOT NULL,
+        Capacity INTEGER NOT NULL,
+        UpdatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (WindowStart, Metric)
+    )""",
+]
+
+WALLET_AMOUNTS_SQL = """
+    SELECT dt.Date, ft.WalletKey, ft.VolumeQuoteCents
+    FROM {facts} ft
+    JOIN DimTime dt ON ft.TimeKey = dt.TimeKey
+    WHERE ft.WalletKey IS NOT NULL {where}
+"""
+
+
+class SpaceSaving:
+    """Heavy-hitter counters: Estimate >= true total >= Estimate - Error for every kept key
+
+    capacity=None is an exact, unbounded summary (e.g. one batch), which merges into
+    a bounded one like any other summary.
+    """
+
+    def __init__(self, capacity=CAPACITY, estimates=None, errors=None, total=0):
+        self.capacity = capacity
+        self.estimates = estimates if estimates is not None else pd.Series(dtype=np.int64)
+        self.errors = errors if errors is not None else pd.Series(dtype=np.int64)
+        self.total = int(total)
+
+    @classmethod
+    def exact(cls, keys, weights):
+        """An exact summary of (key, weight) pairs"""
+        estimates = pd.Series(np.asarray(weights, dtype=np.int64)).groupby(np.asarray(keys, dtype=np.int64)).sum()
+        return cls(None, estimates, pd.Series(0, index=estimates.index, dtype=np.int64), estimates.sum())
+
+    @property
+    def floor(self):
+        """The most an unlisted key can have; zero until the counters have filled up"""
+        if self.capacity is None or len(self.estimates) < self.capacity:
+            return 0
+        return int(self.estimates.min())
+
+    def merge(self, other):
+        """Fold another summary in; keys missing from one side are charged that side's floor"""
+        keys = self.estimates.index.union(other.estimates.index)
+        estimates = (self.estimates.reindex(keys, fill_value=self.floor)
+                     + other.estimates.reindex(keys, fill_value=other.floor))
+        errors = self.errors.reindex(keys, fill_value=self.floor) + other.errors.reindex(keys, fill_value=other.floor)
+        if self.capacity is not None and len(keys) > self.capacity:
+            keys = estimates.sort_values(ascending=False, kind='stable').index[:self.capacity]
+            estimates, errors = estimates[keys], errors[keys]
+        self.estimates, self.errors = estimates.astype(np.int64), errors.astype(np.int64)
+        self.total += other.total
+        return self
+
+    def top(self, n=10):
+        """The n largest counters: WalletKey, Estimate, Error and Guaranteed (Estimate - Error)"""
+        board = pd.DataFrame({'Estimate': self.estimates, 'Error': self.errors}).rename_axis('WalletKey')
+        board = board.sort_values(['Estimate', 'Error'], ascending=[False, True], kind='stable').head(n).reset_index()
+        board['Guaranteed'] = board['Estimate'] - board['Error']
+        board.insert(0, 'Rank', np.arange(1, len(board) + 1))
+        return board
+
+
+def create_leader_tables(conn):
+    for stmt in LEADER_SQL:
+        conn.execute(text(stmt))
+
+
+def _weights(frame, metric):
+    if metric == 'volume':
+        return frame['VolumeQuoteCents'].fillna(0).to_numpy(dtype=np.int64)
+    return np.ones(len(frame), dtype=np.int64)
+
+
+def _fold(frame, summaries):
+    """Merge a chunk of (Date, WalletKey, VolumeQuoteCents) rows into per (window, metric) summaries"""
+    for day, rows in frame.groupby('Date', sort=False):
+        for metric in METRICS:
+            batch = SpaceSaving.exact(rows['WalletKey'], _weights(rows, metric))
+            summaries.setdefault((str(day), metric), SpaceSaving()).merge(batch)
+    return summaries
+
+
+def _read_windows(conn, windows):
+    """Stored summaries for (window, metric) pairs; windows not yet stored start empty"""
+    summaries = {}
+    for window, metric in windows:
+        state = conn.execute(text("SELECT Total, Capacity FROM WalletLeaderWindows WHERE WindowStart = :w AND Metric = :m"),
+                             {'w': window, 'm': metric}).fetchone()
+        counters = pd.read_sql(text("SELECT WalletKey, Estimate, Error FROM WalletLeaders "
+                                    "WHERE WindowStart = :w AND Metric = :m"), conn,
+                               params={'w': window, 'm': metric}, index_col='WalletKey')
+        summaries[(window, metric)] = SpaceSaving(state[1] if state else CAPACITY, counters['Estimate'],
+                                                  counters['Error'], state[0] if state else 0)
+    return summaries
+
+
+def _write_windows(conn, summaries):
+    for (window, metric), summary in summaries.items():
+        params = {'w': window, 'm': metric}
+        conn.execute(text("DELETE FROM WalletLeaders WHERE WindowStart = :w AND Metric = :m"), params)
+        if len(summary.estimates):
+            conn.execute(text("INSERT INTO WalletLeaders (WindowStart, Metric, WalletKey, Estimate, Error) "
+                              "VALUES (:w, :m, :k, :e, :r)"),
+                         [{**params, 'k': int(k), 'e': int(e), 'r': int(r)}
+                          for k, e, r in zip(summary.estimates.index, summary.estimates, summary.errors)])
+        conn.execute(text("INSERT OR REPLACE INTO WalletLeaderWindows (WindowStart, Metric, Total, Capacity, UpdatedAt) "
+                          "VALUES (:w, :m, :t, :c, CURRENT_TIMESTAMP)"),
+                     {**params, 't': summary.total, 'c': summary.capacity})
+
+
+def record_batch(conn, facts):
+    """Merge newly loaded fact rows (TimeKey, WalletKey, VolumeQuoteCents) into their day windows"""
+    facts = facts[facts['WalletKey'].notna()]
+    if facts.empty:
+        return 0
+    create_leader_tables(conn)
+    time_keys = ','.join(str(int(k)) for k in facts['TimeKey'].unique())
+    dates = dict(conn.execute(text(f"SELECT TimeKey, Date FROM DimTime WHERE TimeKey IN ({time_keys})")).fetchall())
+    frame = pd.DataFrame({'Date': facts['TimeKey'].map(dates), 'WalletKey': facts['WalletKey'],
+                          'VolumeQuoteCents': facts['VolumeQuoteCents']}).dropna(subset=['Date'])
+    summaries = _read_windows(conn, [(str(day), metric) for day in frame['Date'].unique() for metric in METRICS])
+    _write_windows(conn, _fold(frame, summaries))
+    return frame['Date'].nunique()
+
+
+def refresh(conn, dates=None):
+    """Rebuild every day window from the facts, or only the given dates; returns the windows written
+
+    A full rebuild replaces only the windows of days that still have hot facts.
+    """
+    create_leader_tables(conn)
+    if dates is None:
+        summaries = {}
+        query = text(WALLET_AMOUNTS_SQL.format(facts='FactTransactions', where=''))
+        for frame in pd.read_sql(query, conn, chunksize=READ_CHUNK):
+            _fold(frame, summaries)
+        windows = [{'d': day} for day in sorted({window for window, _ in summaries})]
+        if windows:
+            conn.execute(text("DELETE FROM WalletLeaders WHERE WindowStart = :d"), windows)
+            conn.execute(text("DELETE FROM WalletLeaderWindows WHERE WindowStart = :d"), windows)
+        _write_windows(conn, summaries)
+        return len(summaries)
+
+    written = 0
+    for day in sorted({pd.Timestamp(d).date().isoformat() for d in dates}):
+        conn.execute(text("DELETE FROM WalletLeaders WHERE WindowStart = :d"), {'d': day})
+        conn.execute(text("DELETE FROM WalletLeaderWindows WHERE WindowStart = :d"), {'d': day})
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        frame = pd.read_sql(text(WALLET_AMOUNTS_SQL.format(facts=facts, where="AND dt.Date = :d")), conn,
+                            params={'d': day})
+        summaries = _fold(frame, {})
+        _write_windows(conn, summaries)
+        written += len(summaries)
+    return written
+
+
+def has_leaders(conn):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'WalletLeaderWindows'")).fetchone() is not None
+
+
+def latest_window(conn):
+    """The most recent day window, the live one while trades are streaming in"""
+    return conn.execute(text("SELECT MAX(WindowStart) FROM WalletLeaderWindows")).scalar()
+
+
+def merged_summary(conn, metric, start_date=None, end_date=None):
+    """The merge of a metric's day windows in a date range (all windows when unbounded)"""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown leaderboard metric: {metric} (known: {', '.join(METRICS)})")
+    clauses, params = ["Metric = :m"], {'m': metric}
+    if start_date is not None:
+        clauses.append("WindowStart >= :start")
+        params['start'] = pd.Timestamp(str(start_date)).date().isoformat()
+    if end_date is not None:
+        clauses.append("WindowStart <= :end")
+        params['end'] = pd.Timestamp(str(end_date)).date().isoformat()
+    where = ' AND '.join(clauses)
+    states = pd.read_sql(text(f"SELECT WindowStart, Total, Capacity FROM WalletLeaderWindows WHERE {where} "
+                              f"ORDER BY WindowStart"), conn, params=params)
+    counters = pd.read_sql(text(f"SELECT WindowStart, WalletKey, Estimate, Error FROM WalletLeaders WHERE {where}"),
+                           conn, params=params)
+    by_window = dict(tuple(counters.groupby('WindowStart', sort=False)))
+    merged = SpaceSaving()
+    for window, total, capacity in states.itertuples(index=False):
+        rows = by_window.get(window, counters.iloc[:0]).set_index('WalletKey')
+        merged.merge(SpaceSaving(capacity, rows['Estimate'], rows['Error'], total))
+    return merged
+
+
+def leaderboard(conn, metric, start_date=None, end_date=None, n=10):
+    """Top n wallets over a date range with their addresses and entity types; volumes in USD"""
+    summary = merged_summary(conn, metric, start_date, end_date)
+    board = summary.top(n)
+    if board.empty:
+        return board
+    keys = ','.join(str(int(k)) for k in board['WalletKey'])
+    wallets = pd.read_sql(text(f"SELECT WalletKey, WalletAddress, EntityTypeCode FROM DimWallet "
+                               f"WHERE WalletKey IN ({keys})"), conn)
+    board = board.merge(warehouse_codes.decode(conn, wallets).drop(columns='EntityTypeCode'), on='WalletKey', how='left')
+    if metric == 'volume':
+        for column in ('Estimate', 'Error', 'Guaranteed'):
+            board[column] = board[column] / fixed_point.CENTS_PER_USD
+    board['Share'] = board['Estimate'] / (summary.total / (fixed_point.CENTS_PER_USD if metric == 'volume' else 1))
+    return board
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or show the top-K wallet leaderboards")
+    parser.add_argument('--db', default=DB_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Rebuild every day window from the facts')
+    show = sub.add_parser('show', help='Top wallets over a date range (the latest window by default)')
+    show.add_argument('--metric', choices=METRICS, default='volume')
+    show.add_argument('--start')
+    show.add_argument('--end')
+    show.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    engine = create_engine(f'sqlite:///{args.db}')
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            windows = refresh(conn)
+        print(f"✅ {windows:,} leaderboard windows built in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    with engine.connect() as conn:
+        if not has_leaders(conn):
+            print("❌ No leaderboards; run: python wallet_leaders.py build")
+            return 1
+        start_date, end_date = args.start, args.end
+        if start_date is None and end_date is None:
+            start_date = end_date = latest_window(conn)
+        start = time.perf_counter()
+        board = leaderboard(conn, args.metric, start_date, end_date, args.top)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    print(board.to_string(index=False))
+    print(f"🏆 Top {len(board)} by {args.metric}, {start_date} to {end_date}, in {elapsed_ms:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
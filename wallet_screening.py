@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+In-memory wallet screening index
+Flagged addresses (DimWallet.IsReportedAbuse and an optional external watchlist
+file) are held in a Bloom filter backed by an exact dict of address -> reason.
+Almost every screened address is clean, so the Bloom filter answers most queries
+on its own, and batches are screened with a few vectorized NumPy probes per
+address; only Bloom positives reach the exact dict, which removes false positives.
+
+WatchlistScreen owns the current index and rebuilds it on refresh() when DimWallet
+or the watchlist file has changed. The new index is built off to the side and
+swapped in with one reference assignment, so readers never see a half-built index.
+
+Watchlist files hold one address per line, optionally followed by a comma and a
+reason; blank lines and lines starting with # are ignored.
+
+Usage:
+    python wallet_screening.py check 1Addr000034 1Addr000035
+    python wallet_screening.py bench --queries 1000000
+"""
+
+import argparse
+import logging
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+WATCHLIST_PATH = 'config/watchlist.txt'
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_REFRESH_SECONDS = 30
+
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def address_hashes(addresses):
+    """64-bit hashes for a sequence of addresses
+
+    The builtin str hash is cached on each string object, so re-screening the same
+    address objects costs no rehashing. It is salted per process, which is fine for
+    an index that only lives in memory.
+    """
+    return np.fromiter((hash(a) for a in addresses), dtype=np.int64, count=len(addresses)).view(np.uint64)
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit hashes with double hashing (h1 + i * h2)"""
+
+    def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+        capacity = max(int(capacity), 1)
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_bits = max(64, (bits + 63) // 64 * 64)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.words = np.zeros(self.num_bits // 64, dtype=np.uint64)
+
+    def _positions(self, hashes, i):
+        h1 = hashes & _MASK32
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        return (h1 + np.uint64(i) * h2) % np.uint64(self.num_bits)
+
+    def add(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        for i in range(self.num_hashes):
+            positions = self._positions(hashes, i)
+            np.bitwise_or.at(self.words, positions >> np.uint64(6), np.uint64(1) << (positions & np.uint64(63)))
+
+    def might_contain(self, hashes):
+        """Bool mask; False is definite, True may be a false positive"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        result = np.ones(len(hashes), dtype=bool)
+        for i in range(self.num_hashes):
+            candidates = np.nonzero(result)[0]
+            if not len(candidates):
+                break
+            positions = self._positions(hashes[candidates], i)
+            present = (self.words[positions >> np.uint64(6)] >> (positions & np.uint64(63))) & np.uint64(1)
+            result[candidates] = present.astype(bool)
+        return result
+
+    def size_bytes(self):
+        return self.words.nbytes
+
+
+class ScreeningIndex:
+    """Immutable snapshot: Bloom filter front, exact address -> reason dict behind it"""
+
+    def __init__(self, flagged, error_rate=DEFAULT_ERROR_RATE, version=None):
+        self.flagged = dict(flagged)
+        self.version = version
+        self.bloom = BloomFilter(len(self.flagged), error_rate)
+        self.bloom.add(address_hashes(list(self.flagged)))
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.flagged)
+
+    def screen(self, address):
+        """Reason an address is flagged, or None"""
+        return self.flagged.get(address)
+
+    def screen_batch(self, addresses):
+        """Bool mask of flagged addresses; the exact dict only sees Bloom positives"""
+        addresses = np.asarray(addresses, dtype=object)
+        mask = self.bloom.might_contain(address_hashes(addresses))
+        candidates = np.nonzero(mask)[0]
+        flagged = self.flagged
+        mask[candidates] = [addresses[i] in flagged for i in candidates.tolist()]
+        return mask
+
+
+def load_watchlist(path):
+    """Address -> reason from a watchlist file"""
+    flagged = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            address, _, reason = line.partition(',')
+            flagged[address.strip()] = reason.strip() or 'watchlist'
+    return flagged
+
+
+def reported_wallets(conn):
+    """Address -> reason for wallets reported for abuse in DimWallet"""
+    wallets = pd.read_sql(text("""
+        SELECT dw.WalletAddress, da.AbuseCategory
+        FROM DimWallet dw
+        LEFT JOIN DimAbuseCategory da ON dw.AbuseCategoryCode = da.AbuseCategoryCode
+        WHERE dw.IsReportedAbuse = 1"""), conn)
+    reasons = 'reported_abuse:' + wallets['AbuseCategory'].fillna('unknown').astype(str)
+    return dict(zip(wallets['WalletAddress'], reasons))
+
+
+def source_version(conn, watchlist_path):
+    """Cheap fingerprint of both sources; a change means the index is stale
+
+    DimWallet is fingerprinted by a hash of its flagged rows, so a flag moved from
+    one wallet to another or a changed abuse category is seen, not just new wallets.
+    """
+    version = []
+    if conn is not None:
+        flagged = pd.read_sql(text("""
+            SELECT dw.WalletKey, dw.WalletAddress, da.AbuseCategory
+            FROM DimWallet dw
+            LEFT JOIN DimAbuseCategory da ON dw.AbuseCategoryCode = da.AbuseCategoryCode
+            WHERE dw.IsReportedAbuse = 1"""), conn)
+        # Summed row hashes do not depend on row order
+        version.extend([len(flagged), int(pd.util.hash_pandas_object(flagged, index=False).sum())])
+    if watchlist_path and os.path.exists(watchlist_path):
+        stat = os.stat(watchlist_path)
+        version.extend([stat.st_mtime_ns, stat.st_size])
+    return tuple(version)
+
+
+def build_index(conn, watchlist_path=WATCHLIST_PATH, include_reported=True, error_rate=DEFAULT_ERROR_RATE):
+    version = source_version(conn, watchlist_path)
+    flagged = {}
+    if watchlist_path and os.path.exists(watchlist_path):
+        flagged.update(load_watchlist(watchlist_path))
+    if include_reported and conn is not None:
+        # Reported-abuse reasons win over watchlist reasons for the same address
+        flagged.update(reported_wallets(conn))
+    return ScreeningIndex(flagged, error_rate, version)
+
+
+class WatchlistScreen:
+    """Holds the current ScreeningIndex and hot-swaps it when the sources change"""
+
+    def __init__(self, conn=None, watchlist_path=WATCHLIST_PATH, include_reported=True,
+                 error_rate=DEFAULT_ERROR_RATE, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        self.watchlist_path = watchlist_path
+        self.include_reported = include_reported
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self._checked_at = time.monotonic()
+        self.swaps = 0
+        self.index = build_index(conn, watchlist_path, include_reported, error_rate)
+
+    def refresh(self, conn=None, force=False):
+        """Rebuild and swap in a new index if a source changed; returns True when swapped
+
+        Sources are checked at most every refresh_seconds. Pass the caller's connection
+        so rows it has written but not yet committed are included.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_seconds:
+            return False
+        self._checked_at = now
+        if not force and source_version(conn, self.watchlist_path) == self.index.version:
+            return False
+        index = build_index(conn, self.watchlist_path, self.include_reported, self.error_rate)
+        # Readers holding the old index finish with it; the next read sees the new one
+        self.index = index
+        self.swaps += 1
+        logger.info(f"   🔄 Screening index swapped: {len(index):,} flagged addresses")
+        return True
+
+    def screen(self, address):
+        return self.index.screen(address)
+
+    def screen_batch(self, addresses):
+        return self.index.screen_batch(addresses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen wallet addresses against reported abuse and a watchlist")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--watchlist', default=WATCHLIST_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    check = sub.add_parser('check', help='Screen addresses')
+    check.add_argument('addresses', nargs='+')
+    bench = sub.add_parser('bench', help='Time scalar and batch screening')
+    bench.add_argument('--queries', type=int, default=1_000_000)
+    bench.add_argument('--flagged', type=int, default=100_000, help='Synthetic flagged addresses when --synthetic')
+    bench.add_argument('--synthetic', action='store_true', help='Benchmark without the warehouse')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'check':
+        if os.path.exists(args.db):
+            with create_engine(f'sqlite:///{args.db}').connect() as conn:
+                screen = WatchlistScreen(conn, args.watchlist)
+        else:
+            screen = WatchlistScreen(None, args.watchlist)
+        print(f"🔎 {len(screen.index):,} flagged addresses")
+        for address in args.addresses:
+            reason = screen.screen(address)
+            print(f"   {'🚩' if reason else '✅'} {address}" + (f"  ({reason})" if reason else ''))
+        return 0
+
+    if args.synthetic or not os.path.exists(args.db):
+        index = ScreeningIndex({f'1Flagged{i:09d}': 'synthetic' for i in range(args.flagged)})
+    else:
+        with create_engine(f'sqlite:///{args.db}').connect() as conn:
+            index = build_index(conn, args.watchlist)
+    flagged = list(index.flagged)
+    rng = np.random.default_rng(42)
+    # Mostly clean traffic with 1% flagged addresses
+    clean = [f'1Clean{i:09d}' for i in range(args.queries)]
+    queries = np.array(clean, dtype=object)
+    if flagged:
+        hit_rows = rng.choice(args.queries, size=max(1, args.queries // 100), replace=False)
+        queries[hit_rows] = rng.choice(np.array(flagged, dtype=object), size=len(hit_rows))
+    address_hashes(queries)  # warm the per-string hash cache, as long-lived wallet strings are
+
+    print(f"⏱️ {args.queries:,} queries against {len(index):,} flagged addresses "
+          f"(Bloom {index.bloom.size_bytes() / 1024:,.0f} KB, k={index.bloom.num_hashes})")
+    start = time.perf_counter()
+    mask = index.screen_batch(queries)
+    batch = time.perf_counter() - start
+    start = time.perf_counter()
+    screen = index.screen
+    scalar_hits = sum(1 for q in queries.tolist() if screen(q) is not None)
+    scalar = time.perf_counter() - start
+    bloom_positive = int(index.bloom.might_contain(address_hashes(queries)).sum())
+    false_positives = bloom_positive - int(mask.sum())
+
+    print(f"   batch : {batch / args.queries * 1e9:8.1f} ns/query  ({args.queries / batch:,.0f} queries/sec)")
+    print(f"   scalar: {scalar / args.queries * 1e9:8.1f} ns/query  ({args.queries / scalar:,.0f} queries/sec)")
+    print(f"✅ {int(mask.sum()):,} flagged (scalar agrees: {scalar_hits == int(mask.sum())}); "
+          f"Bloom false positive rate {false_positives / max(1, args.queries - int(mask.sum())):.4%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Dictionary encoding for low-cardinality warehouse columns
+Side, RiskLevel, EntityType, AbuseCategory, MonthName and DayOfWeekName are stored
+as small integer codes on every row, with the names kept once in lookup dimensions.
+The analytical views join the names back, and loaders turn the codes (or names)
+into pandas Categoricals whose categories follow code order.
+
+Usage:
+    python warehouse_codes.py
+"""
+
+import argparse
+import calendar
+import logging
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+SIDES = ['buy', 'sell']
+RISK_LEVELS = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+MONTH_NAMES = list(calendar.month_name)[1:]   # Month 1..12
+DAY_NAMES = list(calendar.day_name)           # DayOfWeekNumber 0 (Monday)..6
+
+# closed lookups never grow; open ones append a code for every new name they see
+Lookup = namedtuple('Lookup', 'table code_column name_column seed first_code closed')
+
+LOOKUPS = [
+    Lookup('DimSide', 'SideCode', 'Side', SIDES, 0, False),
+    Lookup('DimRiskLevel', 'RiskCode', 'RiskLevel', RISK_LEVELS, 0, True),
+    Lookup('DimEntityType', 'EntityTypeCode', 'EntityType', [], 0, False),
+    Lookup('DimAbuseCategory', 'AbuseCategoryCode', 'AbuseCategory', [], 0, False),
+    Lookup('DimMonth', 'Month', 'MonthName', MONTH_NAMES, 1, True),
+    Lookup('DimDayOfWeek', 'DayOfWeekNumber', 'DayOfWeekName', DAY_NAMES, 0, True),
+]
+LOOKUP_BY_NAME = {lookup.name_column: lookup for lookup in LOOKUPS}
+
+
+def create_lookup_tables(conn):
+    """Create and seed every lookup dimension"""
+    for lookup in LOOKUPS:
+        conn.execute(text(f"""CREATE TABLE IF NOT EXISTS {lookup.table} (
+            {lookup.code_column} SMALLINT PRIMARY KEY,
+            {lookup.name_column} VARCHAR(100) NOT NULL UNIQUE
+        )"""))
+        if lookup.seed:
+            conn.execute(text(f"INSERT OR IGNORE INTO {lookup.table} VALUES (:code, :name)"),
+                         [{'code': lookup.first_code + i, 'name': name} for i, name in enumerate(lookup.seed)])
+
+
+def lookup_frame(conn, name_column):
+    """(code, name) rows of one lookup, in code order"""
+    lookup = LOOKUP_BY_NAME[name_column]
+    return pd.read_sql(text(f"SELECT {lookup.code_column} AS code, {lookup.name_column} AS name "
+                            f"FROM {lookup.table} ORDER BY {lookup.code_column}"), conn)
+
+
+def encode(conn, name_column, values):
+    """Integer codes for a column of names; open lookups register names they have not seen"""
+    lookup = LOOKUP_BY_NAME[name_column]
+    values = pd.Series(values).astype('string')
+    positions, uniques = pd.factorize(values)
+    known = lookup_frame(conn, name_column)
+    mapping = dict(zip(known['name'], known['code']))
+
+    new = [name for name in uniques if name not in mapping]
+    if new and lookup.closed:
+        logger.warning(f"⚠️ {len(new)} unknown {name_column} value(s) stored as NULL: {new[:5]}")
+    elif new:
+        next_code = int(known['code'].max()) + 1 if len(known) else lookup.first_code
+        rows = [{'code': next_code + i, 'name': name} for i, name in enumerate(new)]
+        conn.execute(text(f"INSERT INTO {lookup.table} VALUES (:code, :name)"), rows)
+        mapping.update((row['name'], row['code']) for row in rows)
+
+    unique_codes = np.array([mapping.get(name, -1) for name in uniques] + [-1], dtype=np.int64)
+    codes = unique_codes[positions]   # factorize marks missing values with -1, the sentinel slot
+    return pd.Series(codes, index=values.index, dtype='Int16').mask(codes < 0)
+
+
+def decode(conn, df):
+    """Add a Categorical name column for every code column of a known lookup"""
+    for lookup in LOOKUPS:
+        if lookup.code_column not in df.columns or lookup.name_column in df.columns:
+            continue
+        known = lookup_frame(conn, lookup.name_column)
+        index = pd.Index(known['code'])
+        positions = index.get_indexer(pd.to_numeric(df[lookup.code_column], errors='coerce'))
+        df[lookup.name_column] = pd.Categorical.from_codes(positions, categories=known['name'])
+    return df
+
+
+def categorize(conn, df):
+    """Turn decoded name columns into Categoricals ordered like their codes"""
+    for name_column in LOOKUP_BY_NAME:
+        if name_column not in df.columns or isinstance(df[name_column].dtype, pd.CategoricalDtype):
+            continue
+        categories = list(lookup_frame(conn, name_column)['name'])
+        extra = sorted(set(df[name_column].dropna()) - set(categories))
+        df[name_column] = pd.Categorical(df[name_column], categories=categories + extra)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the warehouse lookup dimensions")
+    parser.add_argument('--db', default=DB_PATH, help=f'Warehouse path (default {DB_PATH})')
+    args = parser.parse_args()
+
+    engine = create_engine(f'sqlite:///{args.db}')
+    with engine.connect() as conn:
+        for lookup in LOOKUPS:
+            try:
+                known = lookup_frame(conn, lookup.name_column)
+            except Exception:
+                print(f"❌ {lookup.table} missing - rebuild with schema_matched_etl.py")
+                continue
+            print(f"📖 {lookup.table} ({lookup.code_column} -> {lookup.name_column}): {len(known)} values")
+            for code, name in known.itertuples(index=False):
+                print(f"   {code:>3}  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
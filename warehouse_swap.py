@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Blue/green warehouse rebuilds
+A full rebuild loads into a staging file next to the live warehouse
+(bitcoin_unified_dw.db.staging) while readers keep using the live one. Once the
+staging build passes check_build(), publish() renames it over the live file in one
+atomic step and then bumps the version file (bitcoin_unified_dw.db.version).
+Connections already open on the old file keep reading it until they close; the
+dashboard keys its engine on the version and re-opens on the next rerun. A failed
+or interrupted rebuild never touches the live warehouse.
+
+The replaced build is kept as bitcoin_unified_dw.db.previous (a hard link, so no
+copy) for rollback. A rollback also rebuilds the fact cache, if there is one, from
+the restored build. Trades streamed into the live warehouse while a rebuild runs
+are not in the staging build; stop stream_ingest.py for the rebuild, or replay them.
+
+Usage:
+    python warehouse_swap.py status
+    python warehouse_swap.py publish      # check and swap in a finished staging build
+    python warehouse_swap.py rollback     # swap the previous build back in
+    python warehouse_swap.py discard      # delete an unfinished staging build
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import fact_cache
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+
+
+def staging_path(db_path=DB_PATH):
+    return db_path + '.staging'
+
+
+def live_path(path):
+    """The live warehouse a staging build belongs to (any other path is returned as is)"""
+    suffix = staging_path('')
+    return path[:-len(suffix)] if path.endswith(suffix) else path
+
+
+def previous_path(db_path=DB_PATH):
+    return db_path + '.previous'
+
+
+def version_path(db_path=DB_PATH):
+    return db_path + '.version'
+
+
+def read_version(db_path=DB_PATH):
+    """Version file contents for the live warehouse, or None before the first publish"""
+    try:
+        with open(version_path(db_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def current_version(db_path=DB_PATH):
+    """Version of the live build, or None when none has been published"""
+    release = read_version(db_path)
+    return release.get('version') if release else None
+
+
+def check_build(conn):
+    """Problems that make a build unfit to go live; an empty list means it can be published"""
+    problems = []
+    result = conn.execute(text("PRAGMA quick_check")).scalar()
+    if result != 'ok':
+        problems.append(f"quick_check: {result}")
+
+    tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')"))}
+    for required in ('FactTransactions', 'TransactionAnalysis', 'DailySummary', 'vw_TransactionAnalysis'):
+        if required not in tables:
+            problems.append(f"{required} is missing")
+    if problems:
+        return problems
+
+    if 'EtlCheckpoints' in tables:
+        for (stage,) in conn.execute(text("SELECT Stage FROM EtlCheckpoints WHERE IsComplete = 0")):
+            problems.append(f"load stage {stage} did not finish")
+    if conn.execute(text("SELECT 1 FROM FactTransactions LIMIT 1")).fetchone() is None:
+        problems.append("FactTransactions is empty")
+    if conn.execute(text("SELECT 1 FROM DailySummary LIMIT 1")).fetchone() is None:
+        problems.append("DailySummary is empty")
+    return problems
+
+
+def _fsync(path, directory=False):
+    fd = os.open(path, os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_version(db_path, release):
+    tmp_path = version_path(db_path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(release, f, indent=2)
+    os.replace(tmp_path, version_path(db_path))
+
+
+def _swap_in(source, db_path, keep_previous):
+    """Atomically rename source over db_path, hard-linking the old build to .previous first"""
+    previous = None
+    if keep_previous and os.path.exists(db_path):
+        previous = previous_path(db_path)
+        if os.path.exists(previous):
+            os.remove(previous)
+        try:
+            os.link(db_path, previous)
+        except OSError as e:
+            logger.warning(f"⚠️ Previous build not kept for rollback: {e}")
+            previous = None
+    _fsync(source)
+    os.replace(source, db_path)
+    _fsync(os.path.dirname(os.path.abspath(db_path)), directory=True)
+    return previous
+
+
+def publish(db_path=DB_PATH, staging=None, keep_previous=True):
+    """Check the staging build and swap it in; returns the new version file contents
+
+    Close every connection to the staging file first (engine.dispose()), so no
+    journal is left behind. Raises ValueError when the build fails its checks.
+    """
+    staging = staging or staging_path(db_path)
+    if not os.path.exists(staging):
+        raise ValueError(f"No staging build at {staging}")
+    if os.path.exists(staging + '-journal') or os.path.exists(staging + '-wal'):
+        raise ValueError(f"{staging} still has an open journal; close its connections first")
+
+    engine = create_engine(f'sqlite:///{staging}')
+    try:
+        with engine.connect() as conn:
+            problems = check_build(conn)
+    finally:
+        engine.dispose()
+    if problems:
+        raise ValueError(f"Staging build failed its checks: {'; '.join(problems)}")
+
+    replaced = current_version(db_path)
+    previous = _swap_in(staging, db_path, keep_previous)
+    release = {
+        'version': datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+        'published_at': datetime.now().isoformat(timespec='seconds'),
+        'replaced': replaced,
+        'previous': os.path.basename(previous) if previous else None,
+    }
+    _write_version(db_path, release)
+    return release
+
+
+def rollback(db_path=DB_PATH):
+    """Swap the previous build back in and rebuild its fact cache; returns the new version file contents"""
+    previous = previous_path(db_path)
+    if not os.path.exists(previous):
+        raise ValueError(f"No previous build at {previous}")
+    replaced = current_version(db_path)
+    _swap_in(previous, db_path, keep_previous=False)
+    # The cache was taken from the build just replaced, so readers would fall back to SQL until a rebuild
+    cache_dir = fact_cache.cache_dir_for(db_path)
+    if fact_cache.current_version(cache_dir) is not None:
+        engine = create_engine(f'sqlite:///{db_path}')
+        try:
+            with engine.connect() as conn:
+                fact_cache.build_cache(conn, cache_dir)
+        finally:
+            engine.dispose()
+    release = {
+        'version': datetime.now().strftime('%Y%m%d_%H%M%S_%f'),
+        'published_at': datetime.now().isoformat(timespec='seconds'),
+        'replaced': replaced,
+        'previous': None,
+        'rollback': True,
+    }
+    _write_version(db_path, release)
+    return release
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish, roll back or inspect blue/green warehouse builds")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('command', choices=['status', 'publish', 'rollback', 'discard'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    staging = staging_path(args.db)
+
+    if args.command == 'status':
+        release = read_version(args.db)
+        if release:
+            print(f"🟢 Live build {release['version']} (published {release['published_at']})")
+        else:
+            print(f"🟢 Live build: {'unversioned' if os.path.exists(args.db) else 'none'}")
+        print(f"🟡 Staging build: {'present' if os.path.exists(staging) else 'none'}")
+        print(f"⏪ Previous build: {'kept' if os.path.exists(previous_path(args.db)) else 'none'}")
+        return 0
+
+    if args.command == 'discard':
+        if os.path.exists(staging):
+            os.remove(staging)
+        print("🗑️ Staging build discarded")
+        return 0
+
+    try:
+        release = publish(args.db) if args.command == 'publish' else rollback(args.db)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Build {release['version']} is live")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Fast statistical warehouse validation
+Loads keep per-day row counts and column sums in LoadStats as they write, in the
+same transaction as the rows:
+  - 'source' stats come from the source trades as extracted (source timestamp date,
+    source amounts);
+  - 'loaded' stats come from the fact rows as written (the DimTime date each trade
+    was keyed to, stored amounts).
+Days are the finest partition grain, so month and day partitions roll up from them.
+
+validate() compares the two sides for every day and checks DailySummary against the
+loaded side. It then recounts a few sampled days from the facts (rows and sums,
+distinct wallets, medians and top wallets against their sketches), and samples random fact
+rows for FK resolution, null ratios and analysis coverage. Nothing scans a whole
+table, so it finishes in seconds at any warehouse size. It returns a structured
+pass/fail report.
+
+Usage:
+    python warehouse_validation.py
+    python warehouse_validation.py --sample 50000 --days 7 --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+import fact_partitions
+import fixed_point
+import quantile_sketches
+import wallet_leaders
+import wallet_sketches
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'data/bitcoin_unified_dw.db'
+REPORT_DIR = 'reports'
+
+DEFAULT_SAMPLE = 10_000
+DEFAULT_DAYS = 3
+MIN_FK_RESOLUTION = 0.999
+MIN_ANALYSIS_COVERAGE = 0.999
+MAX_NULL_RATIO = 0.001
+# Sampled days' wallet estimates may be off by this many standard errors (or 2 wallets)
+MAX_SKETCH_SIGMAS = 4
+
+STAT_COLUMNS = ['Rows', 'TradeIdSum', 'PriceCents', 'VolumeQuoteCents', 'SizeBaseSat']
+
+STATS_SQL = """CREATE TABLE IF NOT EXISTS LoadStats (
+    Side VARCHAR(10) NOT NULL,
+    Date DATE NOT NULL,
+    Rows BIGINT NOT NULL DEFAULT 0,
+    TradeIdSum BIGINT NOT NULL DEFAULT 0,
+    PriceCents BIGINT NOT NULL DEFAULT 0,
+    VolumeQuoteCents BIGINT NOT NULL DEFAULT 0,
+    SizeBaseSat BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (Side, Date)
+)"""
+
+# Fact foreign keys and the dimension key each must resolve to
+FOREIGN_KEYS = {
+    'SideCode': ('DimSide', 'SideCode'),
+    'TimeKey': ('DimTime', 'TimeKey'),
+    'MarketDateKey': ('DimMarket', 'MarketDateKey'),
+    'WalletKey': ('DimWallet', 'WalletKey'),
+}
+
+
+def create_stats_table(conn):
+    conn.execute(text(STATS_SQL))
+
+
+def reset_stats(conn):
+    """Forget every day, e.g. before all facts are reloaded"""
+    create_stats_table(conn)
+    conn.execute(text("DELETE FROM LoadStats"))
+
+
+def forget_days(conn, start_date, end_date):
+    """Drop both sides for days whose facts left the warehouse (archived or dropped partitions)"""
+    create_stats_table(conn)
+    conn.execute(text("DELETE FROM LoadStats WHERE Date BETWEEN :start AND :end"),
+                 {'start': str(start_date), 'end': str(end_date)})
+
+
+def _day_sums(dates, trade_ids, price, volume, size):
+    frame = pd.DataFrame({
+        'Date': dates, 'Rows': 1,
+        'TradeIdSum': np.asarray(trade_ids, dtype=np.int64),
+        'PriceCents': pd.array(price, dtype='Int64'),
+        'VolumeQuoteCents': pd.array(volume, dtype='Int64'),
+        'SizeBaseSat': pd.array(size, dtype='Int64'),
+    })
+    return frame.groupby('Date', sort=True)[STAT_COLUMNS].sum()
+
+
+def _add(conn, side, sums, sign):
+    updates = ', '.join(f"{c} = {c} + excluded.{c}" for c in STAT_COLUMNS)
+    rows = [{'side': side, 'date': str(day), **{c: sign * int(v) for c, v in row.items()}}
+            for day, row in sums.iterrows()]
+    if rows:
+        conn.execute(text(
+            f"INSERT INTO LoadStats (Side, Date, {', '.join(STAT_COLUMNS)}) "
+            f"VALUES (:side, :date, {', '.join(':' + c for c in STAT_COLUMNS)}) "
+            f"ON CONFLICT(Side, Date) DO UPDATE SET {updates}"), rows)
+
+
+def record_load(conn, trades, facts, sign=1):
+    """Add a batch to both sides of LoadStats (sign=-1 takes it back out)
+
+    trades are the source rows (fact_transactions columns) and facts the
+    FactTransactions rows written for them, aligned row for row.
+    """
+    if trades.empty:
+        return
+    source_dates = pd.to_datetime(trades['timestamp'], unit='ms').dt.strftime('%Y-%m-%d')
+    _add(conn, 'source', _day_sums(
+        source_dates.to_numpy(), trades['trade_id'],
+        fixed_point.to_cents(trades['price']), fixed_point.to_cents(trades['volume(quote)']),
+        fixed_point.to_sat(trades['size(base)'])), sign)
+
+    _add(conn, 'loaded', _fact_day_sums(conn, facts), sign)
+
+
+def _fact_day_sums(conn, facts):
+    """Fact rows summed by the DimTime date of their TimeKey"""
+    time_keys = facts['TimeKey'].astype('int64')
+    key_list = ','.join(str(k) for k in time_keys.unique())
+    key_dates = dict(conn.execute(text(f"SELECT TimeKey, Date FROM DimTime WHERE TimeKey IN ({key_list})")).fetchall())
+    return _day_sums(time_keys.map(key_dates).fillna('unknown').to_numpy(), facts['TradeID'],
+                     facts['PriceCents'], facts['VolumeQuoteCents'], facts['SizeBaseSat'])
+
+
+def loaded_facts(conn, trade_ids):
+    """FactTransactions rows already loaded for these TradeIDs"""
+    pd.Series(list(trade_ids), name='TradeID', dtype='int64').to_frame().to_sql(
+        '_stats_trade_ids', conn, if_exists='replace', index=False)
+    facts = pd.read_sql(text(
+        "SELECT f.* FROM _stats_trade_ids b JOIN FactTransactions f ON f.TradeID = b.TradeID"), conn)
+    conn.execute(text("DROP TABLE _stats_trade_ids"))
+    return facts
+
+
+def record_removal(conn, facts):
+    """Take loaded fact rows back out of both sides, e.g. before they are updated in place"""
+    if facts.empty:
+        return
+    sums = _fact_day_sums(conn, facts)
+    _add(conn, 'source', sums, -1)
+    _add(conn, 'loaded', sums, -1)
+
+
+def read_stats(conn, side):
+    return pd.read_sql(text(f"SELECT Date, {', '.join(STAT_COLUMNS)} FROM LoadStats WHERE Side = :side"),
+                       conn, params={'side': side}).set_index('Date')
+
+
+# --- Checks ------------------------------------------------------------------
+# Each returns (status, detail, metrics) with status 'pass', 'fail' or 'skip'
+
+def _mismatches(left, right, columns):
+    joined = left[columns].join(right[columns], how='outer', lsuffix='_a', rsuffix='_b').fillna(0)
+    differs = np.zeros(len(joined), dtype=bool)
+    for column in columns:
+        differs |= (joined[f'{column}_a'] != joined[f'{column}_b']).to_numpy()
+    return joined.index[differs].tolist()
+
+
+def check_source_vs_loaded(conn, source, loaded):
+    """Every day's source counts and sums equal what was written for it"""
+    bad = _mismatches(source, loaded, STAT_COLUMNS)
+    metrics = {'days': len(source.index.union(loaded.index)),
+               'source_rows': int(source['Rows'].sum()), 'loaded_rows': int(loaded['Rows'].sum())}
+    if bad:
+        return 'fail', f"{len(bad)} day(s) differ, e.g. {', '.join(map(str, bad[:5]))}", metrics
+    return 'pass', f"{metrics['days']:,} days, {metrics['loaded_rows']:,} trades reconciled", metrics
+
+
+def check_daily_summary(conn, loaded):
+    """DailySummary agrees with the loaded stats for every day the warehouse holds"""
+    summary = pd.read_sql(text(
+        "SELECT SummaryDate AS Date, TotalTransactions AS Rows, TotalVolumeCents AS VolumeQuoteCents "
+        "FROM DailySummary"), conn).set_index('Date')
+    # Archived or dropped days keep their summaries; only days with stats are compared
+    summary = summary[summary.index.isin(loaded.index)]
+    bad = _mismatches(loaded[loaded['Rows'] > 0], summary, ['Rows', 'VolumeQuoteCents'])
+    if bad:
+        return 'fail', f"{len(bad)} day(s) differ, e.g. {', '.join(map(str, bad[:5]))}", {'days': len(bad)}
+    return 'pass', f"{len(summary):,} days match", {'days': len(summary)}
+
+
+def check_risk_cube(conn):
+    """RiskCube rolls up to the same daily trades, volume and suspicious counts as DailySummary"""
+    if not conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'RiskCube'")).fetchone():
+        return 'skip', "no RiskCube; run: python risk_cube.py build", {}
+    cube = pd.read_sql(text(
+        "SELECT Date, SUM(Trades) AS Rows, COALESCE(SUM(VolumeQuoteCents), 0) AS VolumeQuoteCents, "
+        "SUM(CASE WHEN IsSuspicious = 1 THEN Trades ELSE 0 END) AS Suspicious FROM RiskCube GROUP BY Date"),
+        conn).set_index('Date')
+    summary = pd.read_sql(text(
+        "SELECT SummaryDate AS Date, TotalTransactions AS Rows, COALESCE(TotalVolumeCents, 0) AS VolumeQuoteCents, "
+        "SuspiciousTransactions AS Suspicious FROM DailySummary"), conn).set_index('Date')
+    bad = _mismatches(summary, cube, ['Rows', 'VolumeQuoteCents', 'Suspicious'])
+    if bad:
+        return 'fail', f"{len(bad)} day(s) differ, e.g. {', '.join(map(str, bad[:5]))}", {'days': len(bad)}
+    return 'pass', f"{len(cube):,} days match DailySummary", {'days': len(cube)}
+
+
+def check_wallet_sketches(conn, loaded, days=DEFAULT_DAYS, rng=None):
+    """Every summary day has a wallet sketch, and a few sampled days estimate their exact distinct count"""
+    if not wallet_sketches.has_sketches(conn):
+        return 'skip', "no WalletSketches; run: python wallet_sketches.py build", {}
+    sketches = pd.read_sql(text("SELECT Date, Wallets FROM WalletSketches"), conn).set_index('Date')['Wallets']
+    summary_days = [row[0] for row in conn.execute(text("SELECT SummaryDate FROM DailySummary WHERE TotalTransactions > 0"))]
+    missing = sorted(set(summary_days) - set(sketches.index))
+    if missing:
+        return 'fail', f"{len(missing)} day(s) have no sketch, e.g. {', '.join(map(str, missing[:5]))}", {'days': len(missing)}
+
+    candidates = [day for day in loaded.index[loaded['Rows'] > 0] if day in sketches.index]
+    if not candidates:
+        return 'pass', f"{len(sketches):,} days sketched", {'days': len(sketches)}
+    rng = rng or np.random.default_rng()
+    picked = sorted(rng.choice(candidates, size=min(days, len(candidates)), replace=False))
+    errors = {}
+    for day in picked:
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        exact = conn.execute(text(f"SELECT COUNT(DISTINCT WalletKey) FROM {facts} ft")).scalar()
+        errors[str(day)] = (int(sketches[day]) - exact, exact)
+    bad = [day for day, (error, exact) in errors.items()
+           if abs(error) > max(2, MAX_SKETCH_SIGMAS * wallet_sketches.RELATIVE_ERROR * exact)]
+    metrics = {'days': list(errors), 'errors': {day: error for day, (error, _) in errors.items()}}
+    if bad:
+        return 'fail', f"estimate off for {', '.join(bad)}", metrics
+    return 'pass', f"{len(sketches):,} days sketched; estimates within bounds on {', '.join(errors)}", metrics
+
+
+def check_quantile_sketches(conn, loaded, days=DEFAULT_DAYS, rng=None):
+    """Every summary day has quantile sketches; sampled days match exact counts and medians"""
+    if not quantile_sketches.has_sketches(conn):
+        return 'skip', "no QuantileSketches; run: python quantile_sketches.py build", {}
+    sketched = {row[0] for row in conn.execute(text("SELECT DISTINCT Date FROM QuantileSketches"))}
+    summary_days = {row[0] for row in conn.execute(text("SELECT SummaryDate FROM DailySummary WHERE TotalTransactions > 0"))}
+    missing = sorted(summary_days - sketched)
+    if missing:
+        return 'fail', f"{len(missing)} day(s) have no sketch, e.g. {', '.join(map(str, missing[:5]))}", {'days': len(missing)}
+
+    candidates = [day for day in loaded.index[loaded['Rows'] > 0] if day in sketched]
+    if not candidates:
+        return 'pass', f"{len(sketched):,} days sketched", {'days': len(sketched)}
+    rng = rng or np.random.default_rng()
+    picked = sorted(str(day) for day in rng.choice(candidates, size=min(days, len(candidates)), replace=False))
+    bad = []
+    for day in picked:
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        sketches = quantile_sketches.merged_sketches(conn, day, day)
+        for measure, column in quantile_sketches.MEASURES.items():
+            counted = conn.execute(text(f"SELECT COUNT({column}) FROM {facts} ft")).scalar()
+            trades = sketches[measure].count if measure in sketches else 0
+            median = quantile_sketches.percentiles(conn, measure, [0.5], day, day)[0.5]
+            exact = quantile_sketches.exact_percentile(conn, measure, 0.5, day, day)
+            if exact is None or median is None:
+                off = median is not exact
+            else:
+                off = abs(median - exact) > quantile_sketches.RELATIVE_ACCURACY * abs(exact) + 1e-9
+            if trades != counted or off:
+                bad.append(f"{day} {measure}")
+    metrics = {'days': picked}
+    if bad:
+        return 'fail', f"sketches differ for {', '.join(bad)}", metrics
+    return 'pass', f"{len(sketched):,} days sketched; counts and medians match on {', '.join(picked)}", metrics
+
+
+def check_wallet_leaders(conn, loaded, days=DEFAULT_DAYS, rng=None):
+    """On sampled days every leaderboard counter brackets the wallet's exact total, and no heavy hitter is missing"""
+    if not wallet_leaders.has_leaders(conn):
+        return 'skip', "no WalletLeaders; run: python wallet_leaders.py build", {}
+    windows = {row[0] for row in conn.execute(text("SELECT DISTINCT WindowStart FROM WalletLeaderWindows"))}
+    candidates = [day for day in loaded.index[loaded['Rows'] > 0] if day in windows]
+    if not candidates:
+        return 'pass', f"{len(windows):,} windows", {'windows': len(windows)}
+    rng = rng or np.random.default_rng()
+    picked = sorted(str(day) for day in rng.choice(candidates, size=min(days, len(candidates)), replace=False))
+    bad = []
+    for day in picked:
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        exact = pd.read_sql(text(f"SELECT WalletKey, COALESCE(SUM(VolumeQuoteCents), 0) AS volume, COUNT(*) AS trades "
+                                 f"FROM {facts} ft WHERE WalletKey IS NOT NULL GROUP BY WalletKey"),
+                            conn).set_index('WalletKey')
+        for metric in wallet_leaders.METRICS:
+            summary = wallet_leaders.merged_summary(conn, metric, day, day)
+            true = exact[metric].reindex(summary.estimates.index, fill_value=0)
+            bracketed = (true <= summary.estimates) & (true >= summary.estimates - summary.errors)
+            heavy = exact.index[exact[metric] > summary.total / summary.capacity]
+            if summary.total != exact[metric].sum() or not bracketed.all() or not heavy.isin(summary.estimates.index).all():
+                bad.append(f"{day} {metric}")
+    metrics = {'days': picked}
+    if bad:
+        return 'fail', f"leaderboards differ for {', '.join(bad)}", metrics
+    return 'pass', f"{len(windows):,} windows; counters bracket exact totals on {', '.join(picked)}", metrics
+
+
+def check_sampled_days(conn, loaded, days=DEFAULT_DAYS, rng=None):
+    """Recount a few random days from the facts and compare with the loaded stats"""
+    candidates = loaded.index[loaded['Rows'] > 0]
+    if not len(candidates):
+        return 'skip', "no loaded days", {}
+    rng = rng or np.random.default_rng()
+    picked = sorted(rng.choice(candidates, size=min(days, len(candidates)), replace=False))
+    bad = []
+    for day in picked:
+        facts = fact_partitions.fact_range_sql(conn, day, day)
+        counted = conn.execute(text(
+            f"SELECT COUNT(*), COALESCE(SUM(TradeID), 0), COALESCE(SUM(PriceCents), 0), "
+            f"COALESCE(SUM(VolumeQuoteCents), 0), COALESCE(SUM(SizeBaseSat), 0) FROM {facts} ft")).fetchone()
+        if list(counted) != [int(v) for v in loaded.loc[day, STAT_COLUMNS]]:
+            bad.append(day)
+    metrics = {'days': [str(d) for d in picked]}
+    if bad:
+        return 'fail', f"recount differs for {', '.join(map(str, bad))}", metrics
+    return 'pass', f"recounted {', '.join(map(str, picked))}", metrics
+
+
+def sample_facts(conn, size=DEFAULT_SAMPLE, rng=None):
+    """Random fact rows picked by TransactionFactSK (primary-key lookups, no scan)"""
+    high = conn.execute(text("SELECT MAX(TransactionFactSK) FROM FactTransactions")).scalar()
+    if not high:
+        return pd.DataFrame()
+    rng = rng or np.random.default_rng()
+    sks = np.unique(rng.integers(1, int(high) + 1, size=min(size, int(high))))
+    conn.execute(text("DROP TABLE IF EXISTS temp._sample_sks"))
+    conn.execute(text("CREATE TEMP TABLE _sample_sks (TransactionFactSK INTEGER PRIMARY KEY)"))
+    conn.execute(text("INSERT INTO _sample_sks VALUES (:sk)"), [{'sk': int(sk)} for sk in sks])
+    joins = ' '.join(f"LEFT JOIN {table} d_{column} ON d_{column}.{key} = ft.{column}"
+                     for column, (table, key) in FOREIGN_KEYS.items())
+    resolved = ', '.join(f"d_{column}.{key} IS NOT NULL AS {column}Resolved"
+                         for column, (table, key) in FOREIGN_KEYS.items())
+    sample = pd.read_sql(text(f"""
+        SELECT ft.*, {resolved}, ta.TransactionFactSK IS NOT NULL AS HasAnalysis,
+               ta.IsSuspicious, ta.AnomalyScore, ta.RiskCode
+        FROM _sample_sks s
+        JOIN FactTransactions ft ON ft.TransactionFactSK = s.TransactionFactSK
+        {joins}
+        LEFT JOIN TransactionAnalysis ta ON ta.TransactionFactSK = ft.TransactionFactSK"""), conn)
+    conn.execute(text("DROP TABLE temp._sample_sks"))
+    return sample
+
+
+def check_fk_resolution(sample):
+    if sample.empty:
+        return 'skip', "no fact rows sampled", {}
+    rates = {column: float(sample[f'{column}Resolved'].mean()) for column in FOREIGN_KEYS}
+    low = {column: rate for column, rate in rates.items() if rate < MIN_FK_RESOLUTION}
+    if low:
+        return 'fail', ', '.join(f"{c} {r:.2%}" for c, r in low.items()) + " resolved", rates
+    return 'pass', f"all keys resolve in {len(sample):,} sampled rows", rates
+
+
+def check_null_ratios(sample):
+    if sample.empty:
+        return 'skip', "no fact rows sampled", {}
+    columns = ['TradeID', *FOREIGN_KEYS, 'PriceCents', 'VolumeQuoteCents', 'SizeBaseSat']
+    analysed = sample[sample['HasAnalysis'] == 1]
+    ratios = {c: float(sample[c].isna().mean()) for c in columns}
+    ratios.update({c: float(analysed[c].isna().mean()) for c in ('IsSuspicious', 'AnomalyScore', 'RiskCode')
+                   if len(analysed)})
+    high = {c: r for c, r in ratios.items() if r > MAX_NULL_RATIO}
+    if high:
+        return 'fail', ', '.join(f"{c} {r:.2%}" for c, r in high.items()) + " null", ratios
+    return 'pass', f"null ratios within {MAX_NULL_RATIO:.1%}", ratios
+
+
+def check_analysis_coverage(sample):
+    if sample.empty:
+        return 'skip', "no fact rows sampled", {}
+    coverage = float(sample['HasAnalysis'].mean())
+    status = 'pass' if coverage >= MIN_ANALYSIS_COVERAGE else 'fail'
+    return status, f"{coverage:.2%} of sampled trades are scored", {'coverage': coverage}
+
+
+def validate(conn, sample_size=DEFAULT_SAMPLE, days=DEFAULT_DAYS, seed=None):
+    """Run every check; returns {'status': 'pass'|'fail', 'checks': [...], ...}"""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    checks = []
+
+    def run(name, check, *args):
+        start = time.perf_counter()
+        try:
+            status, detail, metrics = check(*args)
+        except Exception as e:
+            status, detail, metrics = 'fail', f"{type(e).__name__}: {e}", {}
+        checks.append({'name': name, 'status': status, 'detail': detail, 'metrics': metrics,
+                       'seconds': round(time.perf_counter() - start, 6)})
+
+    has_stats = conn.execute(text("SELECT name FROM sqlite_master WHERE name = 'LoadStats'")).fetchone()
+    source = read_stats(conn, 'source') if has_stats else pd.DataFrame(columns=STAT_COLUMNS)
+    loaded = read_stats(conn, 'loaded') if has_stats else pd.DataFrame(columns=STAT_COLUMNS)
+    if loaded.empty:
+        no_stats = lambda: ('skip', "no LoadStats; rebuild the warehouse with schema_matched_etl.py", {})
+        for name in ('source_vs_loaded', 'daily_summary', 'sampled_days', 'wallet_sketches', 'quantile_sketches',
+                     'wallet_leaders'):
+            run(name, no_stats)
+    else:
+        run('source_vs_loaded', check_source_vs_loaded, conn, source, loaded)
+        run('daily_summary', check_daily_summary, conn, loaded)
+        run('sampled_days', check_sampled_days, conn, loaded, days, rng)
+        run('wallet_sketches', check_wallet_sketches, conn, loaded, days, rng)
+        run('quantile_sketches', check_quantile_sketches, conn, loaded, days, rng)
+        run('wallet_leaders', check_wallet_leaders, conn, loaded, days, rng)
+    run('risk_cube', check_risk_cube, conn)
+
+    sample = pd.DataFrame()
+    try:
+        sample = sample_facts(conn, sample_size, rng)
+    except Exception as e:
+        run('sample', lambda: ('fail', f"{type(e).__name__}: {e}", {}))
+    run('fk_resolution', check_fk_resolution, sample)
+    run('null_ratios', check_null_ratios, sample)
+    run('analysis_coverage', check_analysis_coverage, sample)
+
+    return {
+        'status': 'fail' if any(c['status'] == 'fail' for c in checks) else 'pass',
+        'checked_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(time.perf_counter() - started, 6),
+        'rows': int(loaded['Rows'].sum()) if len(loaded) else None,
+        'sampled_rows': len(sample),
+        'checks': checks,
+    }
+
+
+def print_report(report):
+    icons = {'pass': '✅', 'fail': '❌', 'skip': '⏭️'}
+    for check in report['checks']:
+        print(f"   {icons[check['status']]} {check['name']:<18} {check['detail']} ({check['seconds']:.3f}s)")
+    verdict = 'PASS' if report['status'] == 'pass' else 'FAIL'
+    print(f"🔍 Validation {verdict} in {report['seconds']:.2f}s")
+
+
+def write_report(report, directory=REPORT_DIR):
+    """Write the report as JSON and return its path"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"validation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate the warehouse against its load statistics")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--sample', type=int, default=DEFAULT_SAMPLE, help='Fact rows sampled for row-level checks')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help='Days recounted from the facts')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.exists(args.db):
+        print(f"❌ Database not found: {args.db}")
+        return 1
+    engine = create_engine(f'sqlite:///{args.db}')
+    with engine.connect() as conn:
+        report = validate(conn, args.sample, args.days, args.seed)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+        print(f"📋 Report written to {write_report(report)}")
+    return 0 if report['status'] == 'pass' else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())